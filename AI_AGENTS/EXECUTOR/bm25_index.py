@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BM25 Index
+==========
+
+Índice invertido persistente con ranking BM25 para la búsqueda por
+palabras del KnowledgeManager (productos, documentación y conversaciones).
+
+- Tokenización para español: minúsculas, sin acentos (NFKD), sin palabras
+  vacías y con un stemmer liviano de sufijos ("paneles" y "panel" comparten
+  raíz, igual que "techos" y "techo").
+- Cada documento guarda una firma opcional (p. ej. mtime y tamaño del
+  archivo) para reindexar solo lo que cambió.
+- Se persiste con pickle y reemplazo atómico.
+- fusionar_rrf combina rankings (BM25 y vectorial) por Reciprocal Rank
+  Fusion.
+"""
+
+import heapq
+import math
+import os
+import pickle
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+VERSION_FORMATO = 1
+
+Filtro = Union[None, Dict[str, Any], Callable[[Dict[str, Any]], bool]]
+
+PALABRAS_VACIAS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo bien cada
+como con contra cual cuales cuando de del desde donde dos e el ella ellas ellos en
+entre era eran es esa esas ese eso esos esta estan estas este esto estos fue fueron
+ha han hasta hay la las le les lo los mas me mi mis muy nada ni no nos o otra otras
+otro otros para pero poco por porque que quien se segun ser si sin sobre su sus
+tambien tan te tiene tienen todo todos tu tus un una unas uno unos usted ustedes y ya
+yo
+""".split())
+
+# Sufijos en orden de prueba (más largos primero); se quita el primero que
+# deje una raíz de al menos 3 caracteres
+_SUFIJOS = (
+    "amientos", "imientos", "amiento", "imiento", "aciones", "uciones",
+    "adoras", "adores", "ancias", "idades", "mente", "acion", "ucion",
+    "adora", "ador", "ancia", "idad", "ables", "ibles", "able", "ible",
+    "istas", "ista", "osos", "osas", "ivos", "ivas", "oso", "osa", "ivo", "iva",
+    "es", "os", "as", "s", "a", "o", "e",
+)
+
+_PATRON_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas y sin acentos"""
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+@lru_cache(maxsize=65536)
+def raiz(palabra: str) -> str:
+    """Stemmer liviano de sufijos para español"""
+    if palabra.isdigit() or len(palabra) <= 3:
+        return palabra
+    for sufijo in _SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            return palabra[: -len(sufijo)]
+    return palabra
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Términos indexables de un texto"""
+    return [
+        raiz(palabra)
+        for palabra in _PATRON_TOKEN.findall(normalizar_texto(texto))
+        if palabra not in PALABRAS_VACIAS
+    ]
+
+
+def fusionar_rrf(rankings: Sequence[Sequence[Hashable]], k: int = 60) -> List[Tuple[Hashable, float]]:
+    """
+    Reciprocal Rank Fusion: cada ranking aporta 1 / (k + posición) a sus
+    elementos. Devuelve [(clave, score)] ordenado por score descendente.
+    """
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for posicion, clave in enumerate(ranking, start=1):
+            scores[clave] = scores.get(clave, 0.0) + 1.0 / (k + posicion)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class IndiceBM25:
+    """Índice invertido término -> {doc_id: frecuencia} con ranking BM25"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._longitudes: Dict[str, int] = {}
+        self._terminos: Dict[str, Tuple[str, ...]] = {}
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self._firmas: Dict[str, Any] = {}
+        self._longitud_total = 0
+        # k1 * (1 - b + b * longitud / promedio) por documento; se recalcula
+        # perezosamente tras cada alta o baja
+        self._normas: Optional[Dict[str, float]] = None
+
+    def __len__(self) -> int:
+        return len(self._longitudes)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._longitudes
+
+    def ids(self) -> List[str]:
+        return list(self._longitudes)
+
+    def firma(self, doc_id: str) -> Any:
+        """Firma guardada al indexar el documento (None si no existe)"""
+        return self._firmas.get(doc_id)
+
+    def metadata(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self._metadata.get(doc_id)
+
+    # ------------------------------------------------------------------
+    # Altas y bajas
+    # ------------------------------------------------------------------
+
+    def agregar(
+        self,
+        doc_id: str,
+        texto: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        firma: Any = None,
+    ):
+        """Indexa (o reindexa) un documento"""
+        if doc_id in self._longitudes:
+            self.eliminar(doc_id)
+        frecuencias: Dict[str, int] = {}
+        tokens = tokenizar(texto)
+        for termino in tokens:
+            frecuencias[termino] = frecuencias.get(termino, 0) + 1
+        for termino, frecuencia in frecuencias.items():
+            self._postings.setdefault(termino, {})[doc_id] = frecuencia
+        self._longitudes[doc_id] = len(tokens)
+        self._terminos[doc_id] = tuple(frecuencias)
+        self._metadata[doc_id] = dict(metadata or {})
+        self._firmas[doc_id] = firma
+        self._longitud_total += len(tokens)
+        self._normas = None
+
+    def eliminar(self, doc_id: str) -> bool:
+        """Quita un documento; devuelve False si no existía"""
+        longitud = self._longitudes.pop(doc_id, None)
+        if longitud is None:
+            return False
+        for termino in self._terminos.pop(doc_id):
+            postings = self._postings[termino]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[termino]
+        self._metadata.pop(doc_id, None)
+        self._firmas.pop(doc_id, None)
+        self._longitud_total -= longitud
+        self._normas = None
+        return True
+
+    # ------------------------------------------------------------------
+    # Búsqueda
+    # ------------------------------------------------------------------
+
+    def buscar(self, consulta: str, k: int = 10, filtro: Filtro = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Top-k documentos por score BM25
+
+        Args:
+            filtro: dict de igualdades sobre la metadata o función
+                metadata -> bool
+
+        Returns:
+            [(doc_id, score, metadata)] ordenado por score descendente
+        """
+        total = len(self._longitudes)
+        if not total:
+            return []
+        normas = self._calcular_normas()
+
+        scores: Dict[str, float] = {}
+        obtener = scores.get
+        for termino in set(tokenizar(consulta)):
+            postings = self._postings.get(termino)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            peso = idf * (self.k1 + 1)
+            for doc_id, frecuencia in postings.items():
+                scores[doc_id] = obtener(doc_id, 0.0) + peso * frecuencia / (frecuencia + normas[doc_id])
+
+        if filtro is not None:
+            predicado = filtro if callable(filtro) else (
+                lambda meta: all(meta.get(c) == v for c, v in filtro.items())
+            )
+            scores = {d: s for d, s in scores.items() if predicado(self._metadata[d])}
+
+        mejores = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(doc_id, score, self._metadata[doc_id]) for doc_id, score in mejores]
+
+    def _calcular_normas(self) -> Dict[str, float]:
+        if self._normas is None:
+            promedio = self._longitud_total / len(self._longitudes) or 1.0
+            k1, b = self.k1, self.b
+            self._normas = {
+                doc_id: k1 * (1 - b + b * longitud / promedio)
+                for doc_id, longitud in self._longitudes.items()
+            }
+        return self._normas
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+
+    def guardar(self, ruta: Union[str, Path]):
+        """Escribe el índice a un temporal y lo reemplaza de forma atómica"""
+        ruta = Path(ruta)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = ruta.with_name(ruta.name + ".tmp")
+        estado = {
+            "version": VERSION_FORMATO,
+            "k1": self.k1,
+            "b": self.b,
+            "postings": self._postings,
+            "longitudes": self._longitudes,
+            "metadata": self._metadata,
+            "firmas": self._firmas,
+        }
+        with open(temporal, "wb") as f:
+            pickle.dump(estado, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta: Union[str, Path]) -> Optional["IndiceBM25"]:
+        """Abre un índice guardado; None si no existe o es de otra versión"""
+        try:
+            with open(ruta, "rb") as f:
+                estado = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if not isinstance(estado, dict) or estado.get("version") != VERSION_FORMATO:
+            return None
+
+        indice = cls(estado["k1"], estado["b"])
+        indice._postings = estado["postings"]
+        indice._longitudes = estado["longitudes"]
+        indice._metadata = estado["metadata"]
+        indice._firmas = estado["firmas"]
+        indice._longitud_total = sum(indice._longitudes.values())
+        terminos: Dict[str, List[str]] = {doc_id: [] for doc_id in indice._longitudes}
+        for termino, postings in indice._postings.items():
+            for doc_id in postings:
+                terminos[doc_id].append(termino)
+        indice._terminos = {doc_id: tuple(t) for doc_id, t in terminos.items()}
+        return indice
@@ -11,8 +11,10 @@ Gestiona la carga y acceso a:
 - Indexación para búsqueda rápida
 """
 
+import hashlib
 import json
 import os
+import time
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 from datetime import datetime
@@ -33,19 +35,79 @@ sys.path.insert(0, str(_project_root))
 
 try:
     from mongodb_service import MongoDBService
+    from mongodb_service import report_failure as reportar_fallo_mongodb
     MONGODB_AVAILABLE = True
 except ImportError:
     MONGODB_AVAILABLE = False
 
+    def reportar_fallo_mongodb(error, uri=None):
+        return False
+
+try:
+    try:
+        from AI_AGENTS.EXECUTOR.vector_index import IndiceVectorial
+    except ImportError:
+        from vector_index import IndiceVectorial
+    VECTOR_INDEX_AVAILABLE = True
+except ImportError:
+    VECTOR_INDEX_AVAILABLE = False
+
+try:
+    from AI_AGENTS.EXECUTOR.bm25_index import IndiceBM25, fusionar_rrf, normalizar_texto
+except ImportError:
+    from bm25_index import IndiceBM25, fusionar_rrf, normalizar_texto
+
+from utils.embedding_service import EmbeddingService, OpenAIEmbedder
+
+# Documentación indexada y directorios que no se recorren
+EXTENSIONES_DOCUMENTACION = ('.md', '.txt', '.rst')
+DIRECTORIOS_IGNORADOS = ('node_modules', '.git', '__pycache__', '.cursor')
+
+# Backends de búsqueda semántica: Atlas $vectorSearch, índice local o ninguno
+BACKENDS_VECTORIALES = ("atlas", "local", "none")
+
 
 class KnowledgeManager:
     """Gestiona todo el conocimiento disponible para el bot"""
     
-    def __init__(self, project_root: Optional[Path] = None):
+    def __init__(
+        self,
+        project_root: Optional[Path] = None,
+        vector_backend: Optional[str] = None,
+        vector_index_dir: Optional[Path] = None,
+        embedding_service: Optional[EmbeddingService] = None,
+    ):
         self.project_root = project_root or _project_root
         self.knowledge_cache = {}
         self.documentation_cache = {}
         self.conversations_cache = []
+        self.mongodb_service = None
+        
+        # Búsqueda semántica: "atlas", "local" (índice NumPy en disco) o "none".
+        # Sin valor explícito se usa Atlas si hay MongoDB, o el índice local
+        # si ya fue construido.
+        self.vector_backend = vector_backend or os.getenv("KNOWLEDGE_VECTOR_BACKEND")
+        if self.vector_backend and self.vector_backend not in BACKENDS_VECTORIALES:
+            raise ValueError(f"Backend vectorial desconocido: {self.vector_backend}")
+        self.vector_index_dir = Path(
+            vector_index_dir
+            or os.getenv("KNOWLEDGE_VECTOR_INDEX_DIR")
+            or self.project_root / ".knowledge_cache" / "vector_index"
+        )
+        self.vector_nprobe = int(os.getenv("KNOWLEDGE_VECTOR_NPROBE", "8"))
+        self._indice_vectorial = None
+        
+        # Índice BM25 persistente de productos, documentación y conversaciones
+        self.bm25_path = Path(
+            os.getenv("KNOWLEDGE_BM25_INDEX")
+            or self.project_root / ".knowledge_cache" / "bm25_index.pkl"
+        )
+        self._indice_bm25 = None
+        self._bm25_sincronizado_en: Optional[float] = None
+        # Cada cuántos segundos se vuelven a revisar firmas y conversaciones
+        self.bm25_ttl = float(os.getenv("KNOWLEDGE_BM25_TTL", "60"))
+        # Conversaciones indexadas como máximo (se quitan las más viejas)
+        self.bm25_max_conversaciones = int(os.getenv("KNOWLEDGE_BM25_MAX_CONVERSACIONES", "5000"))
         
         if MONGODB_AVAILABLE:
             try:
@@ -62,20 +124,170 @@ class KnowledgeManager:
                 self.openai_client = OpenAI()
             except Exception as e:
                  print(f"[WARNING] OpenAI client init failed: {e}")
+        
+        # Embeddings con caché en disco y peticiones agrupadas
+        self.embedding_service = embedding_service
+        if self.embedding_service is None and self.openai_client:
+            self.embedding_service = EmbeddingService(
+                OpenAIEmbedder(self.openai_client),
+                cache_path=os.getenv("KNOWLEDGE_EMBEDDING_CACHE")
+                or str(self.project_root / ".knowledge_cache" / "embeddings.sqlite"),
+            )
 
     def generate_embedding(self, text: str) -> List[float]:
-        """Generates embedding for given text using OpenAI"""
-        if not self.openai_client:
+        """Generates embedding for given text (cached, batched with concurrent calls)"""
+        if not self.embedding_service:
             return []
         try:
-            text = text.replace("\n", " ")
-            return self.openai_client.embeddings.create(input=[text], model="text-embedding-3-small").data[0].embedding
+            return self.embedding_service.embed(text)
         except Exception as e:
             print(f"[ERROR] Embedding generation failed: {e}")
             return []
 
-    def buscar_informacion_relevante(self, query: str, max_results: int = 5) -> Dict:
-        """Busca información relevante usando Vector Search (si disponible) o Fallback"""
+    def _backend_vectorial(self) -> str:
+        """Backend efectivo de búsqueda semántica"""
+        if self.vector_backend:
+            return self.vector_backend
+        if self.mongodb_service:
+            return "atlas"
+        if VECTOR_INDEX_AVAILABLE and (self.vector_index_dir / "meta.json").exists():
+            return "local"
+        return "none"
+
+    def obtener_indice_vectorial(self):
+        """Índice vectorial local (se abre con mmap la primera vez)"""
+        if self._indice_vectorial is None and VECTOR_INDEX_AVAILABLE:
+            if (self.vector_index_dir / "meta.json").exists():
+                self._indice_vectorial = IndiceVectorial.cargar(self.vector_index_dir)
+        return self._indice_vectorial
+
+    def construir_indice_vectorial(self, n_listas: Optional[int] = None, batch_size: int = 1000) -> int:
+        """
+        Construye el índice local a partir de los embeddings de kb_interactions
+        y lo guarda en vector_index_dir. Con n_listas se entrena además el
+        particionado IVF. Devuelve la cantidad de vectores indexados.
+        """
+        if not VECTOR_INDEX_AVAILABLE:
+            raise RuntimeError("numpy no está instalado")
+        if not self.mongodb_service:
+            raise RuntimeError("MongoDB no disponible")
+        
+        col = self.mongodb_service.get_database()["kb_interactions"]
+        cursor = col.find(
+            {"embedding": {"$exists": True, "$ne": []}},
+            {"embedding": 1, "mensaje_cliente": 1, "respuesta_agente": 1,
+             "respuesta_bot": 1, "intencion": 1},
+            batch_size=batch_size,
+        )
+        indice = None
+        lote = []
+        
+        def _volcar():
+            nonlocal indice
+            if indice is None:
+                indice = IndiceVectorial(len(lote[0]["embedding"]))
+            indice.agregar(
+                [str(doc["_id"]) for doc in lote],
+                [doc["embedding"] for doc in lote],
+                [{
+                    "mensaje_cliente": doc.get("mensaje_cliente"),
+                    "respuesta_bot": doc.get("respuesta_agente") or doc.get("respuesta_bot"),
+                    "intencion": doc.get("intencion"),
+                } for doc in lote],
+            )
+            lote.clear()
+        
+        for doc in cursor:
+            lote.append(doc)
+            if len(lote) >= batch_size:
+                _volcar()
+        if lote:
+            _volcar()
+        if indice is None:
+            return 0
+        
+        if n_listas and len(indice) >= n_listas:
+            indice.entrenar_ivf(n_listas)
+        indice.guardar(self.vector_index_dir)
+        self._indice_vectorial = IndiceVectorial.cargar(self.vector_index_dir)
+        return len(indice)
+
+    def _buscar_conversaciones_semanticas(
+        self, query: str, max_results: int, filtros: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """Conversaciones similares a la consulta según el backend configurado"""
+        backend = self._backend_vectorial()
+        if backend == "none" or not self.embedding_service:
+            return []
+        
+        vector = self.generate_embedding(query)
+        if not vector:
+            return []
+        
+        if backend == "local":
+            indice = self.obtener_indice_vectorial()
+            if indice is None:
+                return []
+            encontrados = indice.buscar(
+                vector, k=max_results, filtro=filtros,
+                nprobe=self.vector_nprobe if indice.tiene_ivf else None,
+            )
+            return [
+                {
+                    'mensaje_cliente': meta.get('mensaje_cliente'),
+                    'respuesta_bot': meta.get('respuesta_bot'),
+                    'score': score,
+                }
+                for _, score, meta in encontrados
+            ]
+        
+        db = self.mongodb_service.get_database()
+        col = db["kb_interactions"] 
+        
+        # Atlas Vector Search Pipeline
+        vector_search = {
+            "index": "vector_index",
+            "path": "embedding",
+            "queryVector": vector,
+            "numCandidates": max_results * 10,
+            "limit": max_results
+        }
+        if filtros:
+            vector_search["filter"] = filtros
+        pipeline = [
+            {"$vectorSearch": vector_search},
+            {
+                "$project": {
+                    "_id": 1,
+                    "mensaje_cliente": 1,
+                    "respuesta_agente": 1, # Normalizado name
+                    "respuesta_bot": 1, # Legacy name
+                    "intencion": 1,
+                    "score": { "$meta": "vectorSearchScore" }
+                }
+            }
+        ]
+        
+        # Normalize results
+        return [
+            {
+                'mensaje_cliente': res.get('mensaje_cliente'),
+                'respuesta_bot': res.get('respuesta_agente') or res.get('respuesta_bot'),
+                'score': res.get('score')
+            }
+            for res in col.aggregate(pipeline)
+        ]
+
+    def buscar_informacion_relevante(
+        self, query: str, max_results: int = 5, filtros: Optional[Dict[str, Any]] = None
+    ) -> Dict:
+        """
+        Busca información relevante usando Vector Search (si disponible) o Fallback
+
+        Args:
+            filtros: igualdades sobre los campos de kb_interactions (por
+                ejemplo {"intencion": "cotizacion"}) para la búsqueda semántica
+        """
         resultados = {
             'productos': [],
             'documentacion': [],
@@ -83,90 +295,172 @@ class KnowledgeManager:
         }
         
         # 1. Try Vector Search first
-        if self.mongodb_service and self.openai_client:
-            try:
-                vector = self.generate_embedding(query)
-                if vector:
-                    db = self.mongodb_service.get_database()
-                    col = db["kb_interactions"] 
-                    
-                    # Atlas Vector Search Pipeline
-                    pipeline = [
-                        {
-                            "$vectorSearch": {
-                                "index": "vector_index",
-                                "path": "embedding",
-                                "queryVector": vector,
-                                "numCandidates": max_results * 10,
-                                "limit": max_results
-                            }
-                        },
-                        {
-                            "$project": {
-                                "_id": 1,
-                                "mensaje_cliente": 1,
-                                "respuesta_agente": 1, # Normalizado name
-                                "respuesta_bot": 1, # Legacy name
-                                "intencion": 1,
-                                "score": { "$meta": "vectorSearchScore" }
-                            }
-                        }
-                    ]
-                    
-                    cursor = col.aggregate(pipeline)
-                    semantic_results = list(cursor)
-                    
-                    if semantic_results:
-                        # Normalize results
-                        for res in semantic_results:
-                            resultados['conversaciones'].append({
-                                'mensaje_cliente': res.get('mensaje_cliente'),
-                                'respuesta_bot': res.get('respuesta_agente') or res.get('respuesta_bot'),
-                                'score': res.get('score')
-                            })
-                        # If we found good semantic matches, we might return early or mix with keyword search
-                        # For now, let's keep keyword search as fallback/augmentation for products
-            except Exception as e:
-                print(f"[WARNING] Vector Search failed: {e}")
+        try:
+            resultados['conversaciones'].extend(
+                self._buscar_conversaciones_semanticas(query, max_results, filtros)
+            )
+            # If we found good semantic matches, we might return early or mix with keyword search
+            # For now, let's keep keyword search as fallback/augmentation for products
+        except Exception as e:
+            print(f"[WARNING] Vector Search failed: {e}")
+            reportar_fallo_mongodb(e)
 
-        # 2. Legacy Keyword Search (Fallback & Augmentation)
-        query_lower = query.lower()
+        # 2. BM25 sobre productos, documentación y conversaciones
+        indice = self.obtener_indice_bm25()
         
-        # Buscar en productos
         productos = self.cargar_base_conocimiento_productos()
-        for nombre, info in productos.items():
-            if nombre.startswith('_'):
-                continue
-            contenido = json.dumps(info, default=str).lower()
-            if any(palabra in contenido for palabra in query_lower.split()):
-                # Avoid duplicates if found by vector search (though vector search populates 'conversaciones', not 'productos')
+        for _, _, meta in indice.buscar(query, max_results, filtro={'fuente': 'producto'}):
+            info = productos.get(meta['nombre'])
+            if info is not None:
                 resultados['productos'].append(info)
-                if len(resultados['productos']) >= max_results:
-                    break
-        
-        # Buscar en documentación
-        doc = self.cargar_documentacion_proyecto()
-        for doc_item in doc:
-            contenido_lower = doc_item['contenido'].lower()
-            if any(palabra in contenido_lower for palabra in query_lower.split()):
-                resultados['documentacion'].append(doc_item)
-                if len(resultados['documentacion']) >= max_results:
-                    break
-        
-        # Buscar en conversaciones (si no hay resultados semánticos)
-        # Note: Vector search adds to 'conversaciones'. If we strictly want fallback, we check if empty.
-        # But for now, let's mix or ensure we have something.
-        if not resultados['conversaciones']:
-            conversaciones = self.cargar_conversaciones_historicas(limit=50)
-            for conv in conversaciones:
-                mensaje_lower = conv.get('mensaje_cliente', '').lower()
-                if any(palabra in mensaje_lower for palabra in query_lower.split()):
-                    resultados['conversaciones'].append(conv)
-                    if len(resultados['conversaciones']) >= max_results:
-                        break
+        
+        resultados['documentacion'] = [
+            self._sin_fuente(meta)
+            for _, _, meta in indice.buscar(query, max_results, filtro={'fuente': 'documento'})
+        ]
+        
+        # Fusión híbrida de las conversaciones semánticas con las de BM25
+        conversaciones_bm25 = [
+            self._sin_fuente(meta)
+            for _, _, meta in indice.buscar(query, max_results, filtro={'fuente': 'conversacion'})
+        ]
+        resultados['conversaciones'] = self._fusionar_conversaciones(
+            resultados['conversaciones'], conversaciones_bm25, max_results
+        )
                         
         return resultados
     
+    @staticmethod
+    def _sin_fuente(meta: Dict[str, Any]) -> Dict[str, Any]:
+        return {clave: valor for clave, valor in meta.items() if clave != 'fuente'}
+    
+    @staticmethod
+    def _fusionar_conversaciones(semanticas: List[Dict], por_palabras: List[Dict], max_results: int) -> List[Dict]:
+        """Reciprocal Rank Fusion de ambos rankings, deduplicando por mensaje"""
+        def clave(conv: Dict) -> str:
+            return normalizar_texto(conv.get('mensaje_cliente') or '')
+        
+        por_clave: Dict[str, Dict] = {}
+        for conv in por_palabras + semanticas:
+            por_clave[clave(conv)] = conv  # la versión semántica (con score) tiene prioridad
+        fusion = fusionar_rrf([[clave(c) for c in semanticas], [clave(c) for c in por_palabras]])
+        return [
+            {**por_clave[mensaje], 'score_fusion': score}
+            for mensaje, score in fusion[:max_results]
+        ]
+    
+    def obtener_indice_bm25(self) -> IndiceBM25:
+        """Índice BM25 (cargado de disco y resincronizado cada bm25_ttl segundos)"""
+        if self._indice_bm25 is None:
+            self._indice_bm25 = IndiceBM25.cargar(self.bm25_path) or IndiceBM25()
+        if self._bm25_sincronizado_en is None:
+            self.actualizar_indice_bm25()
+        elif time.monotonic() - self._bm25_sincronizado_en >= self.bm25_ttl:
+            # Releer productos y conversaciones además de revisar firmas
+            self.knowledge_cache.pop('productos', None)
+            self.conversations_cache = []
+            self.actualizar_indice_bm25()
+        return self._indice_bm25
+    
+    def _archivos_documentacion(self) -> Dict[str, Path]:
+        """Archivos de documentación por ruta relativa al proyecto"""
+        archivos = {}
+        dirs_to_scan = [
+            self.project_root,
+            self.project_root / 'docs',
+            self.project_root / 'AI_AGENTS',
+        ]
+        for directory in dirs_to_scan:
+            if not directory.exists():
+                continue
+            for raiz, subdirectorios, nombres in os.walk(directory):
+                subdirectorios[:] = [d for d in subdirectorios if d not in DIRECTORIOS_IGNORADOS]
+                for nombre in nombres:
+                    if os.path.splitext(nombre)[1].lower() in EXTENSIONES_DOCUMENTACION:
+                        file_path = Path(raiz) / nombre
+                        archivos[str(file_path.relative_to(self.project_root))] = file_path
+        return archivos
+    
+    def actualizar_indice_bm25(self) -> int:
+        """
+        Reindexa lo que cambió desde la última vez (productos por hash de su
+        contenido, documentación por mtime y tamaño, conversaciones nuevas)
+        y quita productos y documentos que ya no existen y las conversaciones
+        más viejas por encima de bm25_max_conversaciones. Devuelve la
+        cantidad de documentos agregados o quitados.
+        """
+        if self._indice_bm25 is None:
+            self._indice_bm25 = IndiceBM25.cargar(self.bm25_path) or IndiceBM25()
+        indice = self._indice_bm25
+        vigentes = set()
+        cambios = 0
+        
+        for nombre, info in self.cargar_base_conocimiento_productos().items():
+            if nombre.startswith('_'):
+                continue
+            doc_id = f"producto:{nombre}"
+            texto = json.dumps(info, ensure_ascii=False, default=str)
+            firma = hashlib.sha1(texto.encode('utf-8')).hexdigest()
+            vigentes.add(doc_id)
+            if indice.firma(doc_id) != firma:
+                indice.agregar(doc_id, texto, {'fuente': 'producto', 'nombre': nombre}, firma)
+                cambios += 1
+        
+        for relativo, file_path in self._archivos_documentacion().items():
+            doc_id = f"documento:{relativo}"
+            vigentes.add(doc_id)
+            try:
+                stat = file_path.stat()
+                firma = (stat.st_mtime_ns, stat.st_size)
+                if indice.firma(doc_id) == firma:
+                    continue
+                content = file_path.read_text(encoding='utf-8')
+            except Exception as e:
+                print(f"[WARNING] Error leyendo {file_path}: {e}")
+                continue
+            # Extraer título si es markdown
+            titulo = file_path.stem
+            if content.startswith('#'):
+                titulo = content.split('\n')[0].lstrip('#').strip()
+            indice.agregar(doc_id, f"{titulo}\n{content}", {
+                'fuente': 'documento',
+                'titulo': titulo,
+                'archivo': relativo,
+                'contenido': content[:5000],  # Limitar tamaño
+                'tipo': file_path.suffix,
+                'ruta_completa': str(file_path)
+            }, firma)
+            cambios += 1
+        
+        # Las conversaciones no cambian: solo se agregan las nuevas, de la más
+        # vieja a la más reciente para que el orden del índice sea el de llegada
+        for conv in reversed(self.cargar_conversaciones_historicas(limit=1000)):
+            doc_id = f"conversacion:{conv['id']}"
+            if doc_id not in indice:
+                texto = f"{conv.get('mensaje_cliente', '')}\n{conv.get('respuesta_bot', '')}"
+                indice.agregar(doc_id, texto, {'fuente': 'conversacion', **conv})
+                cambios += 1
+        
+        conversaciones = []
+        for doc_id in indice.ids():
+            if doc_id.startswith('conversacion:'):
+                conversaciones.append(doc_id)
+            elif doc_id not in vigentes:
+                indice.eliminar(doc_id)
+                cambios += 1
+        for doc_id in conversaciones[:max(0, len(conversaciones) - self.bm25_max_conversaciones)]:
+            indice.eliminar(doc_id)
+            cambios += 1
+        
+        if cambios:
+            try:
+                indice.guardar(self.bm25_path)
+            except OSError as e:
+                print(f"[WARNING] No se pudo guardar el índice BM25: {e}")
+            self.documentation_cache.pop('documentacion', None)
+        self._bm25_sincronizado_en = time.monotonic()
+        return cambios
+    
     def cargar_base_conocimiento_productos(self) -> Dict:
         """Carga la base de conocimiento de productos desde conocimiento_consolidado.json"""
         if 'productos' in self.knowledge_cache:
@@ -206,48 +500,17 @@ class KnowledgeManager:
             return {}
     
     def cargar_documentacion_proyecto(self) -> List[Dict]:
-        """Carga documentación del proyecto (archivos .md, .txt)"""
+        """Carga documentación del proyecto (archivos .md, .txt) desde el índice BM25"""
         if 'documentacion' in self.documentation_cache:
             return self.documentation_cache['documentacion']
         
-        documentacion = []
-        extensions = ['.md', '.txt', '.rst']
-        
-        # Directorios a escanear
-        dirs_to_scan = [
-            self.project_root,
-            self.project_root / 'docs',
-            self.project_root / 'AI_AGENTS',
+        indice = self.obtener_indice_bm25()
+        documentacion = [
+            self._sin_fuente(indice.metadata(doc_id))
+            for doc_id in indice.ids()
+            if doc_id.startswith('documento:')
         ]
         
-        for directory in dirs_to_scan:
-            if not directory.exists():
-                continue
-            
-            for file_path in directory.rglob('*'):
-                if file_path.suffix.lower() in extensions:
-                    # Ignorar algunos archivos
-                    if any(ignore in str(file_path) for ignore in ['node_modules', '.git', '__pycache__', '.cursor']):
-                        continue
-                    
-                    try:
-                        content = file_path.read_text(encoding='utf-8')
-                        # Extraer título si es markdown
-                        titulo = file_path.stem
-                        if content.startswith('#'):
-                            primera_linea = content.split('\n')[0]
-                            titulo = primera_linea.lstrip('#').strip()
-                        
-                        documentacion.append({
-                            'titulo': titulo,
-                            'archivo': str(file_path.relative_to(self.project_root)),
-                            'contenido': content[:5000],  # Limitar tamaño
-                            'tipo': file_path.suffix,
-                            'ruta_completa': str(file_path)
-                        })
-                    except Exception as e:
-                        print(f"[WARNING] Error leyendo {file_path}: {e}")
-        
         self.documentation_cache['documentacion'] = documentacion
         return documentacion
     
@@ -289,42 +552,9 @@ class KnowledgeManager:
             
         except Exception as e:
             print(f"[WARNING] Error cargando conversaciones históricas: {e}")
+            reportar_fallo_mongodb(e)
             return []
     
-        # Continue with Product Search (Keyword based for now until products are also embedded)
-        # Buscar en productos
-        
-        # Buscar en productos
-        productos = self.cargar_base_conocimiento_productos()
-        for nombre, info in productos.items():
-            if nombre.startswith('_'):
-                continue
-            contenido = json.dumps(info, default=str).lower()
-            if any(palabra in contenido for palabra in query_lower.split()):
-                resultados['productos'].append(info)
-                if len(resultados['productos']) >= max_results:
-                    break
-        
-        # Buscar en documentación
-        doc = self.cargar_documentacion_proyecto()
-        for doc_item in doc:
-            contenido_lower = doc_item['contenido'].lower()
-            if any(palabra in contenido_lower for palabra in query_lower.split()):
-                resultados['documentacion'].append(doc_item)
-                if len(resultados['documentacion']) >= max_results:
-                    break
-        
-        # Buscar en conversaciones
-        conversaciones = self.cargar_conversaciones_historicas(limit=50)
-        for conv in conversaciones:
-            mensaje_lower = conv.get('mensaje_cliente', '').lower()
-            if any(palabra in mensaje_lower for palabra in query_lower.split()):
-                resultados['conversaciones'].append(conv)
-                if len(resultados['conversaciones']) >= max_results:
-                    break
-        
-        return resultados
-    
     def obtener_ejemplos_few_shot(self, tema: str, cantidad: int = 3) -> List[Dict]:
         """Obtiene ejemplos de conversaciones exitosas similares al tema"""
         conversaciones = self.cargar_conversaciones_historicas(limit=100)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vector Index
+============
+
+Índice vectorial local (sin red) para la búsqueda semántica del
+KnowledgeManager cuando no hay MongoDB Atlas `$vectorSearch`.
+
+- Índice plano en NumPy: similitud coseno exacta (vectores normalizados,
+  producto punto) con top-k por argpartition.
+- Particionado IVF opcional: k-means esférico sobre los vectores; la
+  búsqueda solo recorre las `nprobe` listas con centroides más cercanos.
+- Altas y bajas incrementales: las altas van a un buffer en memoria que
+  crece por duplicación, las bajas marcan la fila como borrada.
+- Persistencia en un directorio: `vectores.npy` se abre con mmap, de modo
+  que cargar el índice no copia los vectores a memoria.
+- Filtros: un dict de igualdades sobre la metadata o una función
+  `metadata -> bool`.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+Filtro = Union[None, Dict[str, Any], Callable[[Dict[str, Any]], bool]]
+
+_ARCHIVO_VECTORES = "vectores.npy"
+_ARCHIVO_CENTROIDES = "centroides.npy"
+_ARCHIVO_LISTAS = "listas.npy"
+_ARCHIVO_META = "meta.json"
+
+
+def _normalizar(vectores: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return vectores / normas
+
+
+class IndiceVectorial:
+    """Índice de vectores con búsqueda top-k por similitud coseno"""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        # Filas persistidas (mmap de solo lectura tras cargar)
+        self._base = np.empty((0, dimension), dtype=np.float32)
+        # Filas agregadas desde la última carga/guardado
+        self._delta = np.empty((64, dimension), dtype=np.float32)
+        self._n_delta = 0
+
+        self._ids: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._fila_por_id: Dict[str, int] = {}
+        # Por fila (con la misma capacidad que base + delta): si está viva
+        # y a qué lista IVF pertenece (-1 sin asignar)
+        self._vivas_buffer = np.zeros(64, dtype=bool)
+        self._listas_buffer = np.full(64, -1, dtype=np.int32)
+
+        # IVF: centroides e índice invertido (se reconstruye perezosamente)
+        self._centroides: Optional[np.ndarray] = None
+        self._filas_por_lista: Optional[List[np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self._fila_por_id)
+
+    def __contains__(self, identificador: str) -> bool:
+        return identificador in self._fila_por_id
+
+    @property
+    def tiene_ivf(self) -> bool:
+        return self._centroides is not None
+
+    @property
+    def _vivas(self) -> np.ndarray:
+        return self._vivas_buffer[: self.total_filas]
+
+    @property
+    def _lista_de_fila(self) -> np.ndarray:
+        return self._listas_buffer[: self.total_filas]
+
+    def _reservar(self, filas_delta: int):
+        """Amplía (por duplicación) los buffers para filas_delta filas nuevas"""
+        necesarias = self._n_delta + filas_delta
+        if necesarias <= len(self._delta):
+            return
+        capacidad = max(necesarias, 2 * len(self._delta))
+        ampliado = np.empty((capacidad, self.dimension), dtype=np.float32)
+        ampliado[: self._n_delta] = self._delta[: self._n_delta]
+        self._delta = ampliado
+
+        total = len(self._base) + capacidad
+        vivas = np.zeros(total, dtype=bool)
+        vivas[: self.total_filas] = self._vivas
+        listas = np.full(total, -1, dtype=np.int32)
+        listas[: self.total_filas] = self._lista_de_fila
+        self._vivas_buffer, self._listas_buffer = vivas, listas
+
+    # ------------------------------------------------------------------
+    # Altas y bajas
+    # ------------------------------------------------------------------
+
+    def agregar(
+        self,
+        identificadores: Iterable[str],
+        vectores: Any,
+        metadata: Optional[Iterable[Dict[str, Any]]] = None,
+    ):
+        """Agrega (o reemplaza, si el id ya existe) un lote de vectores"""
+        identificadores = list(identificadores)
+        matriz = np.asarray(vectores, dtype=np.float32).reshape(len(identificadores), -1)
+        if matriz.shape[1] != self.dimension:
+            raise ValueError(
+                f"Dimensión {matriz.shape[1]} distinta de la del índice ({self.dimension})"
+            )
+        metadata = list(metadata) if metadata is not None else [{} for _ in identificadores]
+        matriz = _normalizar(matriz)
+
+        for identificador in identificadores:
+            if identificador in self._fila_por_id:
+                self.eliminar(identificador)
+
+        self._reservar(len(identificadores))
+        primera = self.total_filas
+        self._delta[self._n_delta : self._n_delta + len(identificadores)] = matriz
+        self._n_delta += len(identificadores)
+        for desplazamiento, (identificador, meta) in enumerate(zip(identificadores, metadata)):
+            self._fila_por_id[identificador] = primera + desplazamiento
+            self._ids.append(identificador)
+            self._metadata.append(dict(meta))
+        self._vivas_buffer[primera : self.total_filas] = True
+
+        if self._centroides is not None:
+            self._listas_buffer[primera : self.total_filas] = np.argmax(
+                matriz @ self._centroides.T, axis=1
+            )
+            self._filas_por_lista = None
+
+    def eliminar(self, identificador: str) -> bool:
+        """Da de baja un vector; devuelve False si no existía"""
+        fila = self._fila_por_id.pop(identificador, None)
+        if fila is None:
+            return False
+        self._vivas[fila] = False
+        self._metadata[fila] = {}
+        return True
+
+    @property
+    def total_filas(self) -> int:
+        return len(self._base) + self._n_delta
+
+    def _vectores(self, filas: np.ndarray) -> np.ndarray:
+        """Vectores de las filas pedidas"""
+        n_base = len(self._base)
+        delta = self._delta[: self._n_delta]
+        en_base = filas < n_base
+        if en_base.all():
+            return self._base[filas]
+        if not en_base.any():
+            return delta[filas - n_base]
+        resultado = np.empty((len(filas), self.dimension), dtype=np.float32)
+        resultado[en_base] = self._base[filas[en_base]]
+        resultado[~en_base] = delta[filas[~en_base] - n_base]
+        return resultado
+
+    # ------------------------------------------------------------------
+    # IVF
+    # ------------------------------------------------------------------
+
+    def entrenar_ivf(self, n_listas: int, iteraciones: int = 10, semilla: int = 0):
+        """
+        Particiona los vectores vivos con k-means esférico. Los vectores que
+        se agreguen después se asignan a su centroide más cercano.
+        """
+        filas = np.flatnonzero(self._vivas)
+        if len(filas) < n_listas:
+            raise ValueError(f"Se necesitan al menos {n_listas} vectores para {n_listas} listas")
+        generador = np.random.default_rng(semilla)
+        muestra = filas
+        if len(filas) > 256 * n_listas:
+            muestra = generador.choice(filas, 256 * n_listas, replace=False)
+        datos = self._vectores(np.sort(muestra))
+        centroides = datos[generador.choice(len(datos), n_listas, replace=False)].copy()
+        for _ in range(iteraciones):
+            asignacion = np.argmax(datos @ centroides.T, axis=1)
+            for lista in range(n_listas):
+                miembros = datos[asignacion == lista]
+                if len(miembros):
+                    centroides[lista] = miembros.sum(axis=0)
+            centroides = _normalizar(centroides)
+
+        self._centroides = centroides.astype(np.float32)
+        self._listas_buffer[:] = -1
+        # Asignación por bloques para no materializar todos los productos
+        for inicio in range(0, len(filas), 65536):
+            bloque = filas[inicio : inicio + 65536]
+            self._listas_buffer[bloque] = np.argmax(
+                self._vectores(bloque) @ self._centroides.T, axis=1
+            )
+        self._filas_por_lista = None
+
+    def _listas(self) -> List[np.ndarray]:
+        if self._filas_por_lista is None:
+            lista_de_fila = self._lista_de_fila
+            orden = np.argsort(lista_de_fila, kind="stable")
+            limites = np.searchsorted(
+                lista_de_fila[orden], np.arange(len(self._centroides) + 1)
+            )
+            self._filas_por_lista = [
+                orden[limites[i] : limites[i + 1]] for i in range(len(self._centroides))
+            ]
+        return self._filas_por_lista
+
+    # ------------------------------------------------------------------
+    # Búsqueda
+    # ------------------------------------------------------------------
+
+    def buscar(
+        self,
+        vector: Any,
+        k: int = 5,
+        filtro: Filtro = None,
+        nprobe: Optional[int] = None,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Top-k por similitud coseno
+
+        Args:
+            vector: vector de consulta
+            k: cantidad de resultados
+            filtro: dict de igualdades sobre la metadata o función
+                metadata -> bool
+            nprobe: listas IVF a recorrer (solo con IVF entrenado); None
+                recorre todo el índice (búsqueda exacta)
+
+        Returns:
+            [(id, score, metadata)] ordenado por score descendente
+        """
+        if not len(self):
+            return []
+        consulta = _normalizar(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+
+        if nprobe is not None and self._centroides is not None:
+            cercanas = np.argsort(-(self._centroides @ consulta))[:nprobe]
+            listas = self._listas()
+            filas = np.concatenate([listas[i] for i in cercanas])
+            filas = filas[self._vivas[filas]]
+        else:
+            filas = None
+
+        if filtro is not None:
+            predicado = filtro if callable(filtro) else (
+                lambda meta: all(meta.get(c) == v for c, v in filtro.items())
+            )
+            candidatas = np.flatnonzero(self._vivas) if filas is None else filas
+            filas = candidatas[
+                np.fromiter(
+                    (predicado(self._metadata[f]) for f in candidatas),
+                    dtype=bool,
+                    count=len(candidatas),
+                )
+            ]
+
+        if filas is None:
+            scores = np.concatenate(
+                [self._base @ consulta, self._delta[: self._n_delta] @ consulta]
+            )
+            scores[~self._vivas] = -np.inf
+            filas_candidatas = None
+        else:
+            if not len(filas):
+                return []
+            scores = self._vectores(filas) @ consulta
+            filas_candidatas = filas
+
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        mejores = np.argpartition(-scores, k - 1)[:k]
+        mejores = mejores[np.argsort(-scores[mejores])]
+        resultados = []
+        for posicion in mejores:
+            fila = int(posicion if filas_candidatas is None else filas_candidatas[posicion])
+            resultados.append((self._ids[fila], float(scores[posicion]), self._metadata[fila]))
+        return resultados
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+
+    def guardar(self, directorio: Union[str, Path]):
+        """
+        Escribe el índice compactado (sin filas borradas). Cada archivo se
+        escribe a un temporal y se reemplaza de forma atómica.
+        """
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        vivas = np.flatnonzero(self._vivas)
+
+        def _guardar_npy(nombre: str, arreglo: np.ndarray):
+            temporal = directorio / f"{nombre}.tmp"
+            with open(temporal, "wb") as f:
+                np.save(f, arreglo)
+            os.replace(temporal, directorio / nombre)
+
+        vectores = np.empty((len(vivas), self.dimension), dtype=np.float32)
+        for inicio in range(0, len(vivas), 65536):
+            bloque = vivas[inicio : inicio + 65536]
+            vectores[inicio : inicio + len(bloque)] = self._vectores(bloque)
+        _guardar_npy(_ARCHIVO_VECTORES, vectores)
+        if self._centroides is not None:
+            _guardar_npy(_ARCHIVO_CENTROIDES, self._centroides)
+            _guardar_npy(_ARCHIVO_LISTAS, self._lista_de_fila[vivas])
+        else:
+            for nombre in (_ARCHIVO_CENTROIDES, _ARCHIVO_LISTAS):
+                (directorio / nombre).unlink(missing_ok=True)
+
+        meta = {
+            "dimension": self.dimension,
+            "ids": [self._ids[f] for f in vivas],
+            "metadata": [self._metadata[f] for f in vivas],
+        }
+        temporal = directorio / f"{_ARCHIVO_META}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, default=str)
+        os.replace(temporal, directorio / _ARCHIVO_META)
+
+    @classmethod
+    def cargar(cls, directorio: Union[str, Path], mmap: bool = True) -> "IndiceVectorial":
+        """Abre un índice guardado; con mmap los vectores quedan en disco"""
+        directorio = Path(directorio)
+        with open(directorio / _ARCHIVO_META, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        indice = cls(meta["dimension"])
+        indice._base = np.load(directorio / _ARCHIVO_VECTORES, mmap_mode="r" if mmap else None)
+        indice._ids = list(meta["ids"])
+        indice._metadata = list(meta["metadata"])
+        indice._fila_por_id = {identificador: fila for fila, identificador in enumerate(indice._ids)}
+        capacidad = len(indice._base) + len(indice._delta)
+        indice._vivas_buffer = np.zeros(capacidad, dtype=bool)
+        indice._vivas_buffer[: len(indice._base)] = True
+        indice._listas_buffer = np.full(capacidad, -1, dtype=np.int32)
+        if (directorio / _ARCHIVO_CENTROIDES).exists():
+            indice._centroides = np.load(directorio / _ARCHIVO_CENTROIDES)
+            indice._listas_buffer[: len(indice._base)] = np.load(directorio / _ARCHIVO_LISTAS)
+        return indice
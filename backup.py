@@ -152,6 +152,21 @@ def cmd_storage(args):
     return 0
 
 
+def cmd_gc(args):
+    """Delete chunks no backup references any more"""
+    config = load_config(args.config)
+    storage_config = config.get("storage", {})
+    storage_manager = StorageManager(storage_config)
+    
+    result = storage_manager.collect_garbage(dry_run=args.dry_run, rebuild_refcounts=args.rebuild)
+    
+    action = "Would remove" if args.dry_run else "Removed"
+    print(f"\n{action} {result['removed']} chunks ({result['freed_bytes'] / 1024 / 1024:.2f} MB)")
+    print(f"  Referenced chunks: {result['referenced']}")
+    
+    return 0
+
+
 def main():
     """Main CLI entry point"""
     parser = argparse.ArgumentParser(description='Backup management CLI')
@@ -188,6 +203,11 @@ def main():
     # Storage command
     storage_parser = subparsers.add_parser('storage', help='Show storage usage')
     
+    # Garbage collection command
+    gc_parser = subparsers.add_parser('gc', help='Delete unreferenced backup chunks')
+    gc_parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+    gc_parser.add_argument('--rebuild', action='store_true', help='Recount chunk references from the backup manifests first')
+    
     args = parser.parse_args()
     
     if not args.command:
@@ -200,7 +220,8 @@ def main():
         'verify': cmd_verify,
         'delete': cmd_delete,
         'restore': cmd_restore,
-        'storage': cmd_storage
+        'storage': cmd_storage,
+        'gc': cmd_gc
     }
     
     if args.command in commands:
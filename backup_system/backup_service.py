@@ -9,7 +9,7 @@ import gzip
 import hashlib
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 from pathlib import Path
 from dataclasses import dataclass, asdict
 from pymongo import MongoClient
@@ -28,6 +28,9 @@ except ImportError:
     def get_mongodb_service():
         return None
 
+from backup_stream import FORMAT_NAME, BackupIntegrityError, ChunkedBackupReader
+from chunk_store import DEDUP_FORMAT_NAME
+
 logger = logging.getLogger(__name__)
 
 
@@ -82,6 +85,8 @@ class BackupService:
         """
         self.storage_manager = storage_manager
         self.config = self._load_config(config_path)
+        # Workspace root that filesystem patterns and directories are relative to
+        self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.backup_metadata_dir = self.config.get("backup", {}).get("metadata_dir", "./backup_metadata")
         os.makedirs(self.backup_metadata_dir, exist_ok=True)
     
@@ -112,9 +117,17 @@ class BackupService:
                 "primary": "local",
                 "local": {
                     "path": "./backups"
+                },
+                "dedup": {
+                    "enabled": True,
+                    "min_size": 16384,
+                    "avg_size": 65536,
+                    "max_size": 262144,
+                    "gc_grace_seconds": 3600
                 }
             },
             "mongodb": {
+                "batch_size": 1000,
                 "collections": [
                     "conversations",
                     "conversaciones",
@@ -124,7 +137,10 @@ class BackupService:
                     "context",
                     "analytics",
                     "users"
-                ]
+                ],
+                "updated_fields": {
+                    "context": "last_updated"
+                }
             },
             "filesystem": {
                 "patterns": [
@@ -165,6 +181,9 @@ class BackupService:
             scope = ["mongodb", "filesystem", "config"]
         
         try:
+            if self.storage_manager is not None and hasattr(self.storage_manager, "open_backup_writer"):
+                return self._create_streaming_backup(backup_id, timestamp, backup_type, scope)
+            
             backup_data = {
                 "backup_id": backup_id,
                 "timestamp": timestamp,
@@ -191,12 +210,11 @@ class BackupService:
             backup_json = json.dumps(backup_data, default=str, indent=2)
             size = len(backup_json.encode('utf-8'))
             
-            # Compress if enabled
+            # Compressed size (the storage manager compresses on save; the
+            # compressed bytes are not kept in the metadata as well)
             compressed_size = size
             if self.config.get("backup", {}).get("compression", {}).get("enabled", True):
-                compressed = gzip.compress(backup_json.encode('utf-8'))
-                compressed_size = len(compressed)
-                backup_data["compressed_data"] = compressed.hex()
+                compressed_size = len(gzip.compress(backup_json.encode('utf-8')))
             
             # Calculate checksum
             checksum = hashlib.sha256(backup_json.encode('utf-8')).hexdigest()
@@ -244,6 +262,124 @@ class BackupService:
                 error=str(e)
             )
     
+    def _create_streaming_backup(self, backup_id: str, timestamp: str, backup_type: str,
+                                 scope: List[str]) -> BackupResult:
+        """
+        Stream the backup into chunked NDJSON storage
+        
+        Collections are read with batched cursors and files one at a time,
+        so memory use does not grow with the size of the data. The metadata
+        file only keeps the summary (counts, file list, sizes and checksum).
+        """
+        files_data = {"count": 0, "total_size": 0, "files": []}
+        mongo_summary = None
+        
+        header = {"backup_id": backup_id, "timestamp": timestamp, "type": backup_type, "scope": scope}
+        with self.storage_manager.open_backup_writer(backup_id, metadata=header) as writer:
+            if "mongodb" in scope:
+                mongo_summary = self._stream_mongodb(writer)
+            if "filesystem" in scope or "config" in scope:
+                files_data = self._stream_filesystem(scope, writer)
+        
+        return self._finish_streaming_backup(header, writer, mongo_summary, files_data)
+    
+    def _finish_streaming_backup(self, header: Dict, writer, mongo_summary: Optional[Dict],
+                                 files_data: Dict, extra: Optional[Dict] = None) -> BackupResult:
+        """Save the metadata summary of a closed streaming backup"""
+        backup_id = header["backup_id"]
+        manifest_path = os.path.join(writer.directory, "manifest.json")
+        with open(manifest_path, 'rb') as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+        
+        backup_data = dict(header)
+        backup_data.update(extra or {})
+        backup_data.update({
+            "format": writer.manifest["format"],
+            "size": writer.size,
+            "compressed_size": writer.compressed_size,
+            # Bytes this backup actually added to storage (less than
+            # compressed_size when chunks are shared with earlier backups)
+            "stored_size": getattr(writer, "stored_size", writer.compressed_size),
+            "filesystem": files_data,
+            "verification": {
+                "checksum": f"sha256:{checksum}",
+                "verified": False,
+                "verified_at": None
+            },
+            "storage": {
+                "location": self.config.get("storage", {}).get("primary", "local"),
+                "path": writer.directory
+            }
+        })
+        if mongo_summary is not None:
+            backup_data["mongodb"] = mongo_summary
+        metadata_path = self._save_metadata(backup_id, backup_data)
+        
+        logger.info(f"Backup created successfully: {backup_id} "
+                    f"({writer.size} bytes, {writer.compressed_size} compressed, "
+                    f"{backup_data['stored_size']} newly stored)")
+        return BackupResult(
+            backup_id=backup_id,
+            success=True,
+            timestamp=header["timestamp"],
+            size=writer.size,
+            compressed_size=writer.compressed_size,
+            collections=mongo_summary["collections"] if mongo_summary else {},
+            files=files_data,
+            metadata_path=metadata_path
+        )
+    
+    def _stream_mongodb(self, writer) -> Dict:
+        """Write every configured collection as a stream, batch by batch"""
+        logger.info("Backing up MongoDB collections...")
+        
+        if not ensure_mongodb_connected():
+            logger.warning("MongoDB not connected, skipping MongoDB backup")
+            return {"collections": {}, "error": "MongoDB not connected"}
+        
+        service = get_mongodb_service()
+        if not service:
+            return {"collections": {}, "error": "Could not get MongoDB service"}
+        
+        batch_size = self.config.get("mongodb", {}).get("batch_size", 1000)
+        counts = {}
+        errors = {}
+        for collection_name in self.config.get("mongodb", {}).get("collections", []):
+            try:
+                cursor = service.get_collection(collection_name).find({}, batch_size=batch_size)
+                stream = writer.write_stream(f"mongodb.{collection_name}", cursor, kind="collection")
+                counts[collection_name] = stream["count"]
+                logger.info(f"Backed up {stream['count']} documents from {collection_name}")
+            except Exception as e:
+                logger.error(f"Error backing up collection {collection_name}: {e}")
+                counts[collection_name] = writer.manifest["streams"].get(
+                    f"mongodb.{collection_name}", {}
+                ).get("count", 0)
+                errors[collection_name] = str(e)
+        
+        summary = {"collections": counts}
+        if errors:
+            summary["errors"] = errors
+        return summary
+    
+    def _stream_filesystem(self, scope: List[str], writer) -> Dict:
+        """Write the backed up files as one stream of {path, size, content} records"""
+        logger.info("Backing up filesystem files...")
+        
+        files_index = []
+        
+        def records():
+            for rel_path, content in self._iter_files(scope):
+                files_index.append({"path": rel_path, "size": len(content)})
+                yield {"path": rel_path, "size": len(content), "content": content}
+        
+        writer.write_stream("filesystem", records(), kind="files")
+        return {
+            "count": len(files_index),
+            "total_size": sum(f["size"] for f in files_index),
+            "files": files_index
+        }
+    
     def _backup_mongodb(self) -> Dict:
         """Backup MongoDB collections"""
         logger.info("Backing up MongoDB collections...")
@@ -284,12 +420,27 @@ class BackupService:
         """Backup filesystem files"""
         logger.info("Backing up filesystem files...")
         
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        patterns = self.config.get("filesystem", {}).get("patterns", [])
-        directories = self.config.get("filesystem", {}).get("directories", [])
-        
         files_backed_up = []
         total_size = 0
+        for rel_path, file_data in self._iter_files(scope):
+            files_backed_up.append({
+                "path": rel_path,
+                "size": len(file_data),
+                "content": file_data
+            })
+            total_size += len(file_data)
+        
+        return {
+            "count": len(files_backed_up),
+            "total_size": total_size,
+            "files": files_backed_up
+        }
+    
+    def _iter_paths(self, scope: List[str]) -> Iterator[Tuple[str, str]]:
+        """(relative path, absolute path) of every file in the backup scope"""
+        base_dir = self.base_dir
+        patterns = self.config.get("filesystem", {}).get("patterns", [])
+        directories = self.config.get("filesystem", {}).get("directories", [])
         
         # Backup config files
         if "config" in scope:
@@ -297,14 +448,7 @@ class BackupService:
             for config_file in config_files:
                 file_path = os.path.join(base_dir, config_file)
                 if os.path.exists(file_path):
-                    file_data = self._read_file(file_path)
-                    if file_data:
-                        files_backed_up.append({
-                            "path": config_file,
-                            "size": len(file_data),
-                            "content": file_data
-                        })
-                        total_size += len(file_data)
+                    yield config_file, file_path
         
         # Backup knowledge base files
         for pattern in patterns:
@@ -313,50 +457,28 @@ class BackupService:
                 import glob
                 matches = glob.glob(os.path.join(base_dir, pattern))
                 for match in matches:
-                    rel_path = os.path.relpath(match, base_dir)
-                    file_data = self._read_file(match)
-                    if file_data:
-                        files_backed_up.append({
-                            "path": rel_path,
-                            "size": len(file_data),
-                            "content": file_data
-                        })
-                        total_size += len(file_data)
+                    yield os.path.relpath(match, base_dir), match
             else:
                 # Direct file
                 file_path = os.path.join(base_dir, pattern)
                 if os.path.exists(file_path):
-                    file_data = self._read_file(file_path)
-                    if file_data:
-                        files_backed_up.append({
-                            "path": pattern,
-                            "size": len(file_data),
-                            "content": file_data
-                        })
-                        total_size += len(file_data)
+                    yield pattern, file_path
         
         # Backup directories
         for directory in directories:
             dir_path = os.path.join(base_dir, directory)
             if os.path.exists(dir_path):
                 for root, dirs, files in os.walk(dir_path):
+                    rel_root = os.path.relpath(root, base_dir)
                     for file in files:
-                        file_path = os.path.join(root, file)
-                        rel_path = os.path.relpath(file_path, base_dir)
-                        file_data = self._read_file(file_path)
-                        if file_data:
-                            files_backed_up.append({
-                                "path": rel_path,
-                                "size": len(file_data),
-                                "content": file_data
-                            })
-                            total_size += len(file_data)
-        
-        return {
-            "count": len(files_backed_up),
-            "total_size": total_size,
-            "files": files_backed_up
-        }
+                        yield os.path.join(rel_root, file), os.path.join(root, file)
+    
+    def _iter_files(self, scope: List[str]) -> Iterator[Tuple[str, str]]:
+        """(relative path, content) of every file in the backup scope, one at a time"""
+        for rel_path, file_path in self._iter_paths(scope):
+            file_data = self._read_file(file_path)
+            if file_data:
+                yield rel_path, file_data
     
     def _read_file(self, file_path: str) -> Optional[str]:
         """Read file content safely"""
@@ -394,7 +516,9 @@ class BackupService:
             
             # Verify checksum if available
             checksum_match = True
-            if "verification" in metadata:
+            if metadata.get("format") in (FORMAT_NAME, DEDUP_FORMAT_NAME):
+                checksum_match = self._verify_chunked(metadata)
+            elif "verification" in metadata:
                 expected_checksum = metadata["verification"].get("checksum", "")
                 # Recalculate checksum from metadata
                 metadata_copy = metadata.copy()
@@ -435,6 +559,30 @@ class BackupService:
                 error=str(e)
             )
     
+    def _verify_chunked(self, metadata: Dict) -> bool:
+        """Manifest checksum plus every chunk it references, without restoring"""
+        directory = metadata.get("storage", {}).get("path", "")
+        manifest_path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            logger.error(f"Manifest not found: {manifest_path}")
+            return False
+        with open(manifest_path, 'rb') as f:
+            actual = f"sha256:{hashlib.sha256(f.read()).hexdigest()}"
+        if actual != metadata["verification"].get("checksum"):
+            logger.error(f"Manifest checksum mismatch for {metadata.get('backup_id')}")
+            return False
+        try:
+            if self.storage_manager is not None and hasattr(self.storage_manager, "open_backup_reader"):
+                reader = self.storage_manager.open_backup_reader(metadata["backup_id"])
+            else:
+                reader = ChunkedBackupReader(directory)
+            errors = reader.verify()
+        except (OSError, ValueError, BackupIntegrityError) as e:
+            errors = [str(e)]
+        for error in errors:
+            logger.error(error)
+        return not errors
+    
     def list_backups(self, filters: Optional[Dict] = None) -> List[BackupInfo]:
         """List all backups"""
         backups = []
@@ -491,20 +639,14 @@ class BackupService:
         """Create incremental backup"""
         try:
             from incremental_backup import IncrementalBackupService, ChangeTracker
-            incremental_service = IncrementalBackupService(self, ChangeTracker())
+            mongo_config = self.config.get("mongodb", {})
+            tracker = ChangeTracker(updated_field=mongo_config.get("updated_field", "updated_at"),
+                                    updated_fields=mongo_config.get("updated_fields"))
+            incremental_service = IncrementalBackupService(self, tracker)
             result = incremental_service.create_incremental_backup()
             
-            if result.get("backup_result"):
-                backup_result = result["backup_result"]
-                return BackupResult(
-                    backup_id=backup_result.get("backup_id", ""),
-                    success=backup_result.get("success", False),
-                    timestamp=backup_result.get("timestamp", datetime.now().isoformat()),
-                    size=0,
-                    compressed_size=0,
-                    collections={},
-                    files={"count": result.get("total_changes", 0)}
-                )
+            if result.get("backup_result") is not None:
+                return result["backup_result"]
             else:
                 # No changes, return success but with no backup
                 return BackupResult(
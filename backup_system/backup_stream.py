@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Streaming Backup Format
+Chunked NDJSON backups with a checksummed manifest
+
+A backup is a directory:
+
+    manifest.json                         written last (atomic rename)
+    mongodb.conversations.00000.ndjson.gz
+    mongodb.conversations.00001.ndjson.gz
+    filesystem.00000.ndjson.gz
+    ...
+
+Every stream (one per collection, one for files) is split into gzip chunks
+of at most ``chunk_records`` records or ``chunk_bytes`` uncompressed bytes.
+Records are written one by one straight into the gzip file, so peak memory
+is one record plus the compressor state, whatever the collection size. The
+manifest lists, per chunk, the record count, the uncompressed size and the
+sha256 of the compressed file, so integrity can be checked without
+decompressing and a reader verifies each chunk before handing out its
+records. Records are encoded with bson.json_util, so ObjectId and datetime
+values round-trip.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    from bson import json_util
+    BSON_AVAILABLE = True
+except ImportError:
+    BSON_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = "ndjson-chunks"
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+DEFAULT_CHUNK_RECORDS = 5000
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class BackupIntegrityError(Exception):
+    """A chunk is missing or does not match its manifest checksum"""
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    if BSON_AVAILABLE:
+        line = json_util.dumps(record, ensure_ascii=False)
+    else:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+    return line.encode("utf-8") + b"\n"
+
+
+def decode_record(line: bytes) -> Dict[str, Any]:
+    if BSON_AVAILABLE:
+        return json_util.loads(line)
+    return json.loads(line)
+
+
+def is_chunked_backup(directory: str) -> bool:
+    return os.path.isfile(os.path.join(directory, MANIFEST_NAME))
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+class _HashingFile:
+    """File wrapper that hashes every byte written through it"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "wb")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ChunkedBackupWriter:
+    """
+    Writes streams of records as compressed NDJSON chunks
+
+    Args:
+        directory: backup directory (created; must not contain a manifest)
+        chunk_records: max records per chunk
+        chunk_bytes: max uncompressed bytes per chunk
+        compresslevel: gzip level
+        metadata: extra fields stored in the manifest
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        chunk_records: int = DEFAULT_CHUNK_RECORDS,
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+        compresslevel: int = 6,
+        metadata: Optional[Dict[str, Any]] = None,
+    ):
+        if is_chunked_backup(directory):
+            raise FileExistsError(f"Backup already exists: {directory}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_records = max(1, chunk_records)
+        self.chunk_bytes = max(1, chunk_bytes)
+        self.compresslevel = compresslevel
+        self.manifest: Dict[str, Any] = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "created_at": datetime.now().isoformat(),
+            "metadata": dict(metadata or {}),
+            "streams": {},
+        }
+        self._closed = False
+
+    def write_stream(self, name: str, records: Iterable[Dict[str, Any]], kind: str = "records") -> Dict[str, Any]:
+        """
+        Consume an iterable of records into chunks of stream ``name``
+
+        Returns:
+            The stream's manifest entry (count, size, compressed_size, chunks)
+        """
+        if name in self.manifest["streams"]:
+            raise ValueError(f"Stream already written: {name}")
+        stream = {"kind": kind, "count": 0, "size": 0, "compressed_size": 0, "chunks": []}
+        self.manifest["streams"][name] = stream
+
+        chunk = None
+        try:
+            for record in records:
+                if chunk is None:
+                    chunk = self._open_chunk(name, len(stream["chunks"]))
+                line = encode_record(record)
+                chunk["gzip"].write(line)
+                chunk["count"] += 1
+                chunk["size"] += len(line)
+                if chunk["count"] >= self.chunk_records or chunk["size"] >= self.chunk_bytes:
+                    self._close_chunk(stream, chunk)
+                    chunk = None
+        finally:
+            if chunk is not None:
+                self._close_chunk(stream, chunk)
+        return stream
+
+    def _open_chunk(self, name: str, index: int) -> Dict[str, Any]:
+        filename = f"{_safe_name(name)}.{index:05d}.ndjson.gz"
+        raw = _HashingFile(os.path.join(self.directory, filename))
+        # mtime=0 keeps identical content byte-identical across backups
+        compressed = gzip.GzipFile(filename="", mode="wb", fileobj=raw,
+                                   compresslevel=self.compresslevel, mtime=0)
+        return {"file": filename, "raw": raw, "gzip": compressed, "count": 0, "size": 0}
+
+    def _close_chunk(self, stream: Dict[str, Any], chunk: Dict[str, Any]):
+        chunk["gzip"].close()
+        chunk["raw"].close()
+        stream["chunks"].append({
+            "file": chunk["file"],
+            "count": chunk["count"],
+            "size": chunk["size"],
+            "compressed_size": chunk["raw"].size,
+            "sha256": chunk["raw"].sha256.hexdigest(),
+        })
+        stream["count"] += chunk["count"]
+        stream["size"] += chunk["size"]
+        stream["compressed_size"] += chunk["raw"].size
+
+    @property
+    def size(self) -> int:
+        return sum(s["size"] for s in self.manifest["streams"].values())
+
+    @property
+    def compressed_size(self) -> int:
+        return sum(s["compressed_size"] for s in self.manifest["streams"].values())
+
+    def close(self) -> Dict[str, Any]:
+        """Write the manifest (the backup is complete only once it exists)"""
+        if not self._closed:
+            self.manifest["completed_at"] = datetime.now().isoformat()
+            self.manifest["size"] = self.size
+            self.manifest["compressed_size"] = self.compressed_size
+            path = os.path.join(self.directory, MANIFEST_NAME)
+            temporary = path + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, indent=2, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)
+            self._closed = True
+        return self.manifest
+
+    def __enter__(self) -> "ChunkedBackupWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # A failed backup keeps its chunks but no manifest, so it is never
+        # mistaken for a complete one
+        if exc_type is None:
+            self.close()
+
+
+class ChunkedBackupReader:
+    """Reads a chunked backup, verifying each chunk against the manifest"""
+
+    format_name = FORMAT_NAME
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest = read_manifest(directory)
+        if self.manifest.get("format") != self.format_name:
+            raise ValueError(f"Not a chunked backup: {directory}")
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.manifest.get("metadata", {})
+
+    def streams(self, kind: Optional[str] = None) -> List[str]:
+        return [name for name, stream in self.manifest["streams"].items()
+                if kind is None or stream.get("kind") == kind]
+
+    def stream_info(self, name: str) -> Dict[str, Any]:
+        return self.manifest["streams"][name]
+
+    def iter_batches(self, name: str, verify: bool = True) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Records of a stream one chunk at a time; with verify, a chunk is only
+        yielded after its checksum and record count matched
+        """
+        for chunk in self.manifest["streams"][name]["chunks"]:
+            path = os.path.join(self.directory, chunk["file"])
+            if not os.path.exists(path):
+                raise BackupIntegrityError(f"Missing chunk: {chunk['file']}")
+            if verify:
+                self._verify_chunk(chunk)
+            with gzip.open(path, "rb") as f:
+                records = [decode_record(line) for line in f if line.strip()]
+            if verify and len(records) != chunk["count"]:
+                raise BackupIntegrityError(
+                    f"Chunk {chunk['file']} has {len(records)} records, manifest says {chunk['count']}"
+                )
+            yield records
+
+    def iter_records(self, name: str, verify: bool = True) -> Iterator[Dict[str, Any]]:
+        for batch in self.iter_batches(name, verify):
+            yield from batch
+
+    def _verify_chunk(self, chunk: Dict[str, Any]):
+        digest = hashlib.sha256()
+        with open(os.path.join(self.directory, chunk["file"]), "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+                digest.update(block)
+        if digest.hexdigest() != chunk["sha256"]:
+            raise BackupIntegrityError(f"Checksum mismatch in chunk: {chunk['file']}")
+
+    def verify(self) -> List[str]:
+        """Check every chunk checksum (no decompression); returns the errors"""
+        errors = []
+        for stream in self.manifest["streams"].values():
+            for chunk in stream["chunks"]:
+                try:
+                    if not os.path.exists(os.path.join(self.directory, chunk["file"])):
+                        raise BackupIntegrityError(f"Missing chunk: {chunk['file']}")
+                    self._verify_chunk(chunk)
+                except BackupIntegrityError as e:
+                    errors.append(str(e))
+        return errors
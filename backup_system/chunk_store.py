@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+Deduplicating Chunk Store
+Content-defined chunking into a shared, sha256-addressed chunk store
+
+Layout under the backup root:
+
+    .chunks/
+        refcounts.json                  chunk id -> number of backups using it
+        3f/3fa2...e1                    zlib-compressed chunk, named by the
+                                        sha256 of its uncompressed content
+    backup_20251201_120000/
+        manifest.json                   format "ndjson-dedup": every stream is
+                                        an ordered list of chunk ids
+
+Streams are the same NDJSON records as the chunked format (backup_stream),
+but the byte stream is cut where a rolling (gear) hash of the last 64 bytes
+matches a mask instead of every N records. Boundaries therefore depend only
+on local content: an insertion or edit changes the chunks around it and the
+chunker falls back in step right after, so successive backups of mostly
+unchanged data reuse almost every chunk and only new chunks are written.
+
+A backup's chunk references are added to the refcount index before its
+manifest is written, and released when the backup is deleted. gc() removes
+chunks no backup references (including leftovers from failed backups),
+skipping recently touched ones that may belong to a backup still running.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from backup_stream import (
+    MANIFEST_NAME,
+    BackupIntegrityError,
+    ChunkedBackupReader,
+    ChunkedBackupWriter,
+    decode_record,
+    encode_record,
+    read_manifest,
+)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEDUP_FORMAT_NAME = "ndjson-dedup"
+DEDUP_FORMAT_VERSION = 1
+CHUNK_STORE_DIR = ".chunks"
+REFCOUNTS_NAME = "refcounts.json"
+
+DEFAULT_MIN_SIZE = 16 * 1024
+DEFAULT_AVG_SIZE = 64 * 1024
+DEFAULT_MAX_SIZE = 256 * 1024
+DEFAULT_GC_GRACE_SECONDS = 3600
+
+# Bytes that contribute to the gear hash at a position (64-bit shifts)
+WINDOW = 64
+_MASK64 = (1 << 64) - 1
+# Fixed table so every installation cuts the same data at the same places
+GEAR = tuple(int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], "big") for i in range(256))
+if NUMPY_AVAILABLE:
+    _GEAR_ARRAY = np.array(GEAR, dtype=np.uint64)
+
+
+class ContentDefinedChunker:
+    """
+    Splits a byte stream at content-defined boundaries (FastCDC-style gear hash)
+
+    A chunk ends after the first position at least ``min_size`` bytes into it
+    whose hash has all mask bits clear, or at ``max_size``. Chunks average
+    about ``avg_size`` bytes. The numpy path hashes whole buffers at once; the
+    pure Python fallback produces exactly the same boundaries.
+    """
+
+    def __init__(self, min_size: int = DEFAULT_MIN_SIZE, avg_size: int = DEFAULT_AVG_SIZE,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        if not WINDOW <= min_size < avg_size < max_size:
+            raise ValueError(f"Invalid chunk sizes: min={min_size} avg={avg_size} max={max_size}")
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        bits = max(1, (avg_size - min_size).bit_length() - 1)
+        # High bits of the gear hash depend on the whole window
+        self.mask = ((1 << bits) - 1) << (64 - bits)
+        self.scan_size = 4 * max_size
+
+    @property
+    def params(self) -> Dict[str, int]:
+        return {"min_size": self.min_size, "avg_size": self.avg_size, "max_size": self.max_size}
+
+    def split(self, blocks: Iterable[bytes]) -> Iterator[bytes]:
+        """Re-cut an iterable of byte blocks into content-defined chunks"""
+        buffer = bytearray()
+        for block in blocks:
+            buffer += block
+            if len(buffer) >= self.scan_size:
+                yield from self._emit(buffer, final=False)
+        yield from self._emit(buffer, final=True)
+
+    def _emit(self, buffer: bytearray, final: bool) -> Iterator[bytes]:
+        start = 0
+        for end in self.cut_points(bytes(buffer), final):
+            yield bytes(buffer[start:end])
+            start = end
+        del buffer[:start]
+
+    def cut_points(self, data: bytes, final: bool = True) -> List[int]:
+        """
+        End offsets of the chunks that can be decided in ``data`` (which must
+        start at a chunk boundary); without final, the undecided tail is left
+        for the next call
+        """
+        if NUMPY_AVAILABLE and len(data) > self.min_size:
+            return self._cut_points_numpy(data, final)
+        return self._cut_points_python(data, final)
+
+    def _next_end(self, start: int, candidate: Optional[int], size: int, final: bool) -> Optional[int]:
+        if candidate is not None:
+            return candidate
+        if start + self.max_size <= size:
+            return start + self.max_size
+        if final and start < size:
+            return size
+        return None
+
+    def _cut_points_python(self, data: bytes, final: bool) -> List[int]:
+        gear = GEAR
+        mask = self.mask
+        cuts = []
+        start = 0
+        size = len(data)
+        while start < size:
+            candidate = None
+            first = start + self.min_size - 1
+            limit = min(start + self.max_size, size)
+            if first < limit:
+                h = 0
+                for byte in data[first - WINDOW + 1:first]:
+                    h = ((h << 1) + gear[byte]) & _MASK64
+                for position, byte in enumerate(data[first:limit], first):
+                    h = ((h << 1) + gear[byte]) & _MASK64
+                    if not h & mask:
+                        candidate = position + 1
+                        break
+            end = self._next_end(start, candidate, size, final)
+            if end is None:
+                break
+            cuts.append(end)
+            start = end
+        return cuts
+
+    def _cut_points_numpy(self, data: bytes, final: bool) -> List[int]:
+        # h[i] = sum(GEAR[data[i - k]] << k for k < 64), built by doubling
+        hashes = _GEAR_ARRAY[np.frombuffer(data, dtype=np.uint8)]
+        shift = 1
+        while shift < WINDOW:
+            hashes[shift:] += hashes[:-shift] << np.uint64(shift)
+            shift *= 2
+        candidates = np.flatnonzero((hashes & np.uint64(self.mask)) == 0) + 1
+        del hashes
+
+        cuts = []
+        start = 0
+        size = len(data)
+        while start < size:
+            candidate = None
+            index = np.searchsorted(candidates, start + self.min_size)
+            if index < len(candidates) and candidates[index] <= start + self.max_size:
+                candidate = int(candidates[index])
+            end = self._next_end(start, candidate, size, final)
+            if end is None:
+                break
+            cuts.append(end)
+            start = end
+        return cuts
+
+
+class ChunkStore:
+    """
+    Shared store of compressed chunks addressed by the sha256 of their content
+
+    Args:
+        root: store directory
+        compresslevel: zlib level for new chunks
+        fsync: fsync every new chunk before it becomes visible
+    """
+
+    def __init__(self, root: str, compresslevel: int = 6, fsync: bool = True):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.compresslevel = compresslevel
+        self.fsync = fsync
+        self._lock = threading.Lock()
+
+    def chunk_path(self, chunk_id: str) -> str:
+        return os.path.join(self.root, chunk_id[:2], chunk_id)
+
+    def put(self, data: bytes) -> Tuple[str, int, bool]:
+        """
+        Store a chunk unless it is already present
+
+        Returns:
+            (chunk id, compressed size on disk, whether it was newly written)
+        """
+        chunk_id = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(chunk_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            pass
+        else:
+            # Fresh mtime: gc() must not collect it before this backup's
+            # references are recorded
+            os.utime(path)
+            return chunk_id, stat.st_size, False
+
+        compressed = zlib.compress(data, self.compresslevel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(compressed)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporary, path)
+        return chunk_id, len(compressed), True
+
+    def get(self, chunk_id: str, verify: bool = True) -> bytes:
+        """Uncompressed content of a chunk, checked against its id"""
+        try:
+            with open(self.chunk_path(chunk_id), "rb") as f:
+                compressed = f.read()
+        except FileNotFoundError:
+            raise BackupIntegrityError(f"Missing chunk: {chunk_id}")
+        try:
+            data = zlib.decompress(compressed)
+        except zlib.error as e:
+            raise BackupIntegrityError(f"Corrupted chunk {chunk_id}: {e}")
+        if verify and hashlib.sha256(data).hexdigest() != chunk_id:
+            raise BackupIntegrityError(f"Checksum mismatch in chunk: {chunk_id}")
+        return data
+
+    def _iter_chunk_files(self) -> Iterator[os.DirEntry]:
+        with os.scandir(self.root) as prefixes:
+            for prefix in prefixes:
+                if prefix.is_dir(follow_symlinks=False):
+                    with os.scandir(prefix.path) as entries:
+                        yield from (entry for entry in entries if entry.is_file(follow_symlinks=False))
+
+    # Reference counting
+
+    @property
+    def refcounts_path(self) -> str:
+        return os.path.join(self.root, REFCOUNTS_NAME)
+
+    def has_refcounts(self) -> bool:
+        return os.path.exists(self.refcounts_path)
+
+    def _read_refcounts(self) -> Dict[str, int]:
+        if not self.has_refcounts():
+            return {}
+        with open(self.refcounts_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_refcounts(self, refcounts: Dict[str, int]):
+        temporary = self.refcounts_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(refcounts, f, separators=(",", ":"), sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.refcounts_path)
+
+    def add_references(self, chunk_ids: Iterable[str]):
+        """Count one more backup referencing each of these chunks"""
+        with self._lock:
+            refcounts = self._read_refcounts()
+            for chunk_id in set(chunk_ids):
+                refcounts[chunk_id] = refcounts.get(chunk_id, 0) + 1
+            self._write_refcounts(refcounts)
+
+    def release(self, chunk_ids: Iterable[str]) -> int:
+        """Drop one backup's references; returns how many chunks became unreferenced"""
+        unreferenced = 0
+        with self._lock:
+            refcounts = self._read_refcounts()
+            for chunk_id in set(chunk_ids):
+                remaining = refcounts.get(chunk_id, 0) - 1
+                if remaining > 0:
+                    refcounts[chunk_id] = remaining
+                else:
+                    refcounts.pop(chunk_id, None)
+                    unreferenced += 1
+            self._write_refcounts(refcounts)
+        return unreferenced
+
+    def rebuild_refcounts(self, manifests: Iterable[Dict[str, Any]]):
+        """Recount references from the manifests of every existing backup"""
+        refcounts: Dict[str, int] = {}
+        for manifest in manifests:
+            for chunk_id in manifest_chunk_ids(manifest):
+                refcounts[chunk_id] = refcounts.get(chunk_id, 0) + 1
+        with self._lock:
+            self._write_refcounts(refcounts)
+
+    def gc(self, grace_seconds: float = DEFAULT_GC_GRACE_SECONDS, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Delete chunks that no backup references
+
+        Chunks (and temporary files) touched in the last ``grace_seconds`` are
+        kept, since a backup that is still being written may use them.
+        """
+        removed = 0
+        freed = 0
+        cutoff = time.time() - grace_seconds
+        with self._lock:
+            refcounts = self._read_refcounts()
+            for entry in self._iter_chunk_files():
+                if entry.name in refcounts:
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(entry.path)
+                removed += 1
+                freed += stat.st_size
+        logger.info(f"Chunk store gc: {removed} chunks ({freed} bytes) "
+                    f"{'would be ' if dry_run else ''}removed")
+        return {"removed": removed, "freed_bytes": freed, "referenced": len(refcounts)}
+
+    def verify(self) -> List[str]:
+        """Check every stored chunk against its id; returns the errors"""
+        errors = []
+        for entry in self._iter_chunk_files():
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                self.get(entry.name)
+            except BackupIntegrityError as e:
+                errors.append(str(e))
+        return errors
+
+    def usage(self) -> Dict[str, int]:
+        chunks = 0
+        size = 0
+        for entry in self._iter_chunk_files():
+            chunks += 1
+            size += entry.stat().st_size
+        return {"chunks": chunks, "size": size}
+
+
+def manifest_chunk_ids(manifest: Dict[str, Any]) -> Set[str]:
+    return {chunk["id"] for stream in manifest.get("streams", {}).values()
+            for chunk in stream.get("chunks", [])}
+
+
+class DedupBackupWriter(ChunkedBackupWriter):
+    """
+    Writes streams of records into a ChunkStore, storing only new chunks
+
+    Same interface as ChunkedBackupWriter; the backup directory only holds
+    the manifest.
+    """
+
+    def __init__(self, directory: str, store: ChunkStore,
+                 chunker: Optional[ContentDefinedChunker] = None,
+                 metadata: Optional[Dict[str, Any]] = None):
+        super().__init__(directory, metadata=metadata)
+        self.store = store
+        self.chunker = chunker or ContentDefinedChunker()
+        self.manifest["format"] = DEDUP_FORMAT_NAME
+        self.manifest["version"] = DEDUP_FORMAT_VERSION
+        self.manifest["chunker"] = self.chunker.params
+        self.stored_size = 0
+        self.new_chunks = 0
+        self._referenced = False
+
+    def write_stream(self, name: str, records: Iterable[Dict[str, Any]], kind: str = "records") -> Dict[str, Any]:
+        if name in self.manifest["streams"]:
+            raise ValueError(f"Stream already written: {name}")
+        stream = {"kind": kind, "count": 0, "size": 0, "compressed_size": 0, "chunks": []}
+        self.manifest["streams"][name] = stream
+
+        # Like the chunked writer, records read before a failure are kept
+        error = None
+
+        def lines():
+            nonlocal error
+            try:
+                for record in records:
+                    line = encode_record(record)
+                    stream["count"] += 1
+                    yield line
+            except Exception as e:
+                error = e
+
+        for data in self.chunker.split(lines()):
+            chunk_id, stored, new = self.store.put(data)
+            stream["chunks"].append({"id": chunk_id, "size": len(data), "compressed_size": stored})
+            stream["size"] += len(data)
+            stream["compressed_size"] += stored
+            if new:
+                self.stored_size += stored
+                self.new_chunks += 1
+        if error is not None:
+            raise error
+        return stream
+
+    def close(self) -> Dict[str, Any]:
+        # References go in before the manifest: a crash in between leaks
+        # chunks until the next rebuild, it never loses referenced ones
+        if not self._closed and not self._referenced:
+            self.store.add_references(manifest_chunk_ids(self.manifest))
+            self._referenced = True
+        self.manifest["stored_size"] = self.stored_size
+        self.manifest["new_chunks"] = self.new_chunks
+        return super().close()
+
+
+class DedupBackupReader(ChunkedBackupReader):
+    """Reads a deduplicated backup from its manifest and the ChunkStore"""
+
+    format_name = DEDUP_FORMAT_NAME
+
+    def __init__(self, directory: str, store: ChunkStore):
+        super().__init__(directory)
+        self.store = store
+
+    def chunk_ids(self) -> Set[str]:
+        return manifest_chunk_ids(self.manifest)
+
+    def iter_batches(self, name: str, verify: bool = True) -> Iterator[List[Dict[str, Any]]]:
+        """Records of a stream one chunk at a time, each chunk checked against its id"""
+        stream = self.manifest["streams"][name]
+        pending = b""
+        count = 0
+        for chunk in stream["chunks"]:
+            lines = (pending + self.store.get(chunk["id"], verify=verify)).split(b"\n")
+            pending = lines.pop()
+            records = [decode_record(line) for line in lines if line.strip()]
+            count += len(records)
+            if records:
+                yield records
+        if verify and (pending.strip() or count != stream["count"]):
+            raise BackupIntegrityError(
+                f"Stream {name} has {count} records, manifest says {stream['count']}"
+            )
+
+    def verify(self) -> List[str]:
+        """Check every referenced chunk and each stream's record count, without restoring"""
+        errors = []
+        newlines: Dict[str, int] = {}
+        for chunk_id in sorted(self.chunk_ids()):
+            try:
+                newlines[chunk_id] = self.store.get(chunk_id).count(b"\n")
+            except BackupIntegrityError as e:
+                errors.append(str(e))
+        for name, stream in self.manifest["streams"].items():
+            if all(chunk["id"] in newlines for chunk in stream["chunks"]):
+                count = sum(newlines[chunk["id"]] for chunk in stream["chunks"])
+                if count != stream["count"]:
+                    errors.append(f"Stream {name} has {count} records, manifest says {stream['count']}")
+        return errors
+
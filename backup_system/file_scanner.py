@@ -5,7 +5,6 @@ Scans filesystem and MongoDB for missing or corrupted files
 """
 import os
 import json
-import glob
 import hashlib
 import logging
 from typing import List, Dict, Optional, Any
@@ -23,6 +22,8 @@ except ImportError:
     def get_mongodb_service():
         return None
 
+from scan_engine import DEFAULT_WORKERS, DuplicateGroup, ScanEngine, compile_patterns, file_checksum
+
 logger = logging.getLogger(__name__)
 
 
@@ -46,14 +47,6 @@ class CorruptedFile:
     actual_size: Optional[int] = None
 
 
-@dataclass
-class DuplicateGroup:
-    """Group of duplicate files"""
-    files: List[str]
-    checksum: str
-    size: int
-
-
 @dataclass
 class ComparisonResult:
     """Result of comparing files with backup"""
@@ -75,6 +68,11 @@ class FileScanner:
         """
         self.base_dir = base_dir or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.config = config or {}
+        scanner_config = self.config.get("scanner", {})
+        self.engine = ScanEngine(
+            cache_file=scanner_config.get("cache_file"),
+            workers=scanner_config.get("workers", DEFAULT_WORKERS)
+        )
     
     def scan_directory(self, path: str, patterns: List[str]) -> List[FileInfo]:
         """
@@ -90,19 +88,25 @@ class FileScanner:
         files = []
         full_path = os.path.join(self.base_dir, path) if not os.path.isabs(path) else path
         
-        if not os.path.exists(full_path):
+        if not os.path.isdir(full_path) or not patterns:
             return files
         
-        for pattern in patterns:
-            search_path = os.path.join(full_path, pattern)
-            matches = glob.glob(search_path, recursive=True)
-            
-            for match in matches:
-                if os.path.isfile(match):
-                    rel_path = os.path.relpath(match, self.base_dir)
-                    file_info = self._get_file_info(rel_path)
-                    if file_info:
-                        files.append(file_info)
+        # One walk for all patterns; without '**' it stops at the deepest pattern
+        matches = compile_patterns(patterns)
+        max_depth = None
+        if not any("**" in pattern for pattern in patterns):
+            max_depth = max(pattern.strip("/").count("/") for pattern in patterns)
+        prefix = os.path.relpath(full_path, self.base_dir)
+        prefix = "" if prefix == os.curdir else prefix + os.sep
+        
+        for entry in self.engine.walk(full_path, max_depth=max_depth):
+            if matches(entry.rel_path):
+                files.append(FileInfo(
+                    path=prefix + entry.rel_path,
+                    size=entry.size,
+                    exists=True,
+                    last_modified=str(entry.mtime)
+                ))
         
         return files
     
@@ -110,13 +114,6 @@ class FileScanner:
         """Get information about a file"""
         full_path = os.path.join(self.base_dir, file_path)
         
-        if not os.path.exists(full_path):
-            return FileInfo(
-                path=file_path,
-                size=0,
-                exists=False
-            )
-        
         try:
             stat = os.stat(full_path)
             return FileInfo(
@@ -125,6 +122,12 @@ class FileScanner:
                 exists=True,
                 last_modified=str(stat.st_mtime)
             )
+        except FileNotFoundError:
+            return FileInfo(
+                path=file_path,
+                size=0,
+                exists=False
+            )
         except Exception as e:
             logger.error(f"Error getting file info for {file_path}: {e}")
             return None
@@ -229,22 +232,25 @@ class FileScanner:
                 }
         
         missing_files = []
-        changed_files = []
         new_files = []
+        present = []
         
         for file_path in files:
             if file_path not in backup_files:
                 new_files.append(file_path)
             else:
                 # Check if file exists and compare
-                full_path = os.path.join(self.base_dir, file_path)
-                if not os.path.exists(full_path):
+                entry = self.engine.stat(os.path.join(self.base_dir, file_path), file_path)
+                if entry is None:
                     missing_files.append(file_path)
                 else:
-                    # Compare checksum
-                    current_checksum = self._calculate_file_checksum(full_path)
-                    if current_checksum != backup_files[file_path]["checksum"]:
-                        changed_files.append(file_path)
+                    present.append(entry)
+        
+        # Compare checksums, hashed on the worker pool; unreadable files count as changed
+        current = {entry.rel_path: checksum for entry, checksum in self.engine.checksums(present)}
+        changed_files = [entry.rel_path for entry in present
+                         if current.get(entry.rel_path) != backup_files[entry.rel_path]["checksum"]]
+        self.engine.save_cache()
         
         return ComparisonResult(
             missing_files=missing_files,
@@ -258,11 +264,7 @@ class FileScanner:
     
     def _calculate_file_checksum(self, file_path: str) -> str:
         """Calculate checksum of file"""
-        try:
-            with open(file_path, 'rb') as f:
-                return hashlib.sha256(f.read()).hexdigest()
-        except Exception:
-            return ""
+        return file_checksum(file_path) or ""
     
     def find_duplicates(self, files: List[str]) -> List[DuplicateGroup]:
         """
@@ -274,26 +276,17 @@ class FileScanner:
         Returns:
             List of DuplicateGroup objects
         """
-        checksum_map = {}
+        entries = []
         
         for file_path in files:
             full_path = os.path.join(self.base_dir, file_path) if not os.path.isabs(file_path) else file_path
-            if os.path.exists(full_path):
-                checksum = self._calculate_file_checksum(full_path)
-                if checksum not in checksum_map:
-                    checksum_map[checksum] = []
-                checksum_map[checksum].append(file_path)
-        
-        duplicates = []
-        for checksum, file_list in checksum_map.items():
-            if len(file_list) > 1:
-                size = os.path.getsize(os.path.join(self.base_dir, file_list[0]))
-                duplicates.append(DuplicateGroup(
-                    files=file_list,
-                    checksum=checksum,
-                    size=size
-                ))
+            entry = self.engine.stat(full_path, file_path)
+            if entry is not None:
+                entries.append(entry)
         
+        # Size, then first-block hash, then full hash: unique sizes are never read
+        duplicates = self.engine.find_duplicates(entries)
+        self.engine.save_cache()
         return duplicates
     
     def scan_mongodb(self) -> Dict:
@@ -2,23 +2,59 @@
 """
 Incremental Backup Support
 Tracks changes and creates incremental backups
+
+The change journal (ChangeTracker) keeps, per file, its stat signature
+(size, mtime_ns, inode) and sha256, and per collection its high-water marks
+(largest _id and newest update timestamp) or a change stream resume token.
+Detecting changes only stats files and hashes those whose signature moved,
+and asks MongoDB a few index-backed questions per collection, so an
+incremental run over an unchanged workspace reads no file contents and no
+documents. Collections without an update timestamp field fall back to a
+content checksum, which reads the whole collection.
 """
 import os
 import json
 import hashlib
 import logging
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, Set
-from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass, asdict, field
 import sys
 
+from pymongo.errors import PyMongoError
+
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from backup_service import BackupService
+try:
+    from mongodb_service import ensure_mongodb_connected, get_mongodb_service, report_failure
+except ImportError:
+    # Fallback if mongodb_service not available
+    def ensure_mongodb_connected():
+        return False
+    def get_mongodb_service():
+        return None
+    def report_failure(error, uri=None):
+        return False
+
+try:
+    from bson import json_util
+    BSON_AVAILABLE = True
+except ImportError:
+    BSON_AVAILABLE = False
+
+from backup_service import BackupResult, BackupService
+from scan_engine import RACY_WINDOW_NS, file_checksum
 from storage_manager import StorageManager
 
 logger = logging.getLogger(__name__)
 
+STATE_VERSION = 2
+
+
+class _StreamInterrupted(Exception):
+    """A change stream ended (collection dropped or renamed)"""
+
 
 @dataclass
 class ChangeRecord:
@@ -41,213 +77,358 @@ class IncrementalBackup:
     total_changes: int
 
 
+@dataclass
+class CollectionDelta:
+    """What changed in a collection and how to read it"""
+    name: str
+    mode: str  # full, high_water, change_stream, deleted, marks (journal only)
+    query: Dict = field(default_factory=dict)
+    deleted_ids: List[Any] = field(default_factory=list)
+    marks: Dict = field(default_factory=dict)  # journal entry once backed up
+
+
+def _encode_mark(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return json_util.dumps(value) if BSON_AVAILABLE else json.dumps(value, default=str)
+
+
+def _decode_mark(value: Optional[str]) -> Any:
+    if value is None:
+        return None
+    return json_util.loads(value) if BSON_AVAILABLE else json.loads(value)
+
+
 class ChangeTracker:
     """Tracks changes for incremental backups"""
     
-    def __init__(self, state_file: str = "./backup_change_state.json"):
+    def __init__(self, state_file: str = "./backup_change_state.json",
+                 updated_field: str = "updated_at", use_change_streams: bool = True,
+                 updated_fields: Optional[Dict[str, Optional[str]]] = None):
         """
         Initialize ChangeTracker
         
         Args:
-            state_file: Path to state file
+            state_file: Path to state file (the change journal)
+            updated_field: Document field holding the last modification time
+            use_change_streams: Use change streams when the server supports them
+            updated_fields: Per-collection override of updated_field; None
+                marks a collection without one (compared by checksum)
         """
         self.state_file = state_file
+        self.updated_field = updated_field
+        self.updated_fields = updated_fields or {}
+        self.use_change_streams = use_change_streams
+        self._change_streams_available = True
+        self._unindexed: set = set()
         self.state = self._load_state()
     
     def _load_state(self) -> Dict:
         """Load change tracking state"""
+        state = {
+            "version": STATE_VERSION,
+            "last_full_backup": None,
+            "files": {},
+            "collections": {},
+            "last_update": None
+        }
         if os.path.exists(self.state_file):
             try:
                 with open(self.state_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    loaded = json.load(f)
             except Exception as e:
                 logger.warning(f"Error loading state file: {e}")
-        
-        return {
-            "last_full_backup": None,
-            "file_checksums": {},
-            "collection_checksums": {},
-            "last_update": None
-        }
+                return state
+            if loaded.get("version") == STATE_VERSION:
+                return loaded
+            # Version 1 kept content checksums only: without signatures every
+            # file is hashed once more, but unchanged ones are not reported
+            state["last_full_backup"] = loaded.get("last_full_backup")
+            for path, entry in loaded.get("file_checksums", {}).items():
+                state["files"][path] = {"signature": None, "checksum": entry.get("checksum"),
+                                        "size": entry.get("size"), "backup_id": entry.get("backup_id")}
+        return state
     
     def _save_state(self):
         """Save change tracking state"""
         self.state["last_update"] = datetime.now().isoformat()
-        with open(self.state_file, 'w', encoding='utf-8') as f:
-            json.dump(self.state, f, indent=2, default=str)
+        temporary = self.state_file + ".tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, separators=(",", ":"), default=str)
+        os.replace(temporary, self.state_file)
     
-    def record_full_backup(self, backup_id: str, files: List[Dict], collections: Dict):
+    def scan_files(self, paths: Iterable[Tuple[str, str]]) -> Tuple[List[ChangeRecord], Dict[str, Optional[Dict]]]:
         """
-        Record a full backup for change tracking
+        Compare files with the journal, hashing only those whose stat signature changed
         
         Args:
-            backup_id: Backup ID
-            files: List of file information
-            collections: Dictionary of collection information
+            paths: (relative path, absolute path) of every file in scope
+        
+        Returns:
+            (changes, journal updates); updates map a path to its new entry,
+            or None when the file was deleted, and are applied by update_state()
         """
-        self.state["last_full_backup"] = backup_id
-        
-        # Record file checksums
-        for file_info in files:
-            file_path = file_info.get("path")
-            content = file_info.get("content", "")
-            checksum = hashlib.sha256(content.encode('utf-8')).hexdigest()
-            self.state["file_checksums"][file_path] = {
-                "checksum": checksum,
-                "size": len(content),
-                "backup_id": backup_id
-            }
+        changes = []
+        updates: Dict[str, Optional[Dict]] = {}
+        timestamp = datetime.now().isoformat()
+        racy_after = time.time_ns() - RACY_WINDOW_NS
+        tracked = self.state["files"]
+        seen = set()
         
-        # Record collection checksums
-        for collection_name, collection_data in collections.items():
-            collection_json = json.dumps(collection_data, default=str, sort_keys=True)
-            checksum = hashlib.sha256(collection_json.encode('utf-8')).hexdigest()
-            self.state["collection_checksums"][collection_name] = {
+        for rel_path, file_path in paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            seen.add(rel_path)
+            signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+            entry = tracked.get(rel_path)
+            if entry is not None and entry["signature"] == signature:
+                continue
+        
+            checksum = file_checksum(file_path)
+            if checksum is None:
+                continue
+            updates[rel_path] = {
+                "signature": signature if stat.st_mtime_ns < racy_after else None,
                 "checksum": checksum,
-                "count": collection_data.get("count", 0),
-                "backup_id": backup_id
+                "size": stat.st_size,
+                "backup_id": None
             }
+            if entry is None:
+                action = "created"
+            elif entry["checksum"] != checksum:
+                action = "modified"
+            else:
+                # Touched but identical: only the signature is refreshed
+                updates[rel_path]["backup_id"] = entry.get("backup_id")
+                continue
+            changes.append(ChangeRecord(path=rel_path, type="file", action=action, timestamp=timestamp,
+                                        checksum=checksum, size=stat.st_size))
         
-        self._save_state()
+        for rel_path in tracked.keys() - seen:
+            updates[rel_path] = None
+            changes.append(ChangeRecord(path=rel_path, type="file", action="deleted", timestamp=timestamp))
+        
+        return changes, updates
     
-    def detect_changes(self, files: List[Dict], collections: Dict) -> List[ChangeRecord]:
+    def detect_collection_changes(self, collections: Dict[str, Any]) -> Tuple[List[ChangeRecord], List[CollectionDelta]]:
         """
-        Detect changes since last backup
+        Compare collections with their journal marks
         
         Args:
-            files: Current file information
-            collections: Current collection information
+            collections: collection name -> pymongo Collection
         
         Returns:
-            List of ChangeRecord objects
+            (changes, deltas describing which documents to back up)
         """
         changes = []
+        deltas = []
         timestamp = datetime.now().isoformat()
         
-        # Track current file checksums
-        current_file_checksums = {}
-        for file_info in files:
-            file_path = file_info.get("path")
-            content = file_info.get("content", "")
-            checksum = hashlib.sha256(content.encode('utf-8')).hexdigest()
-            current_file_checksums[file_path] = checksum
-        
-        # Detect file changes
-        tracked_files = set(self.state["file_checksums"].keys())
-        current_files = set(current_file_checksums.keys())
-        
-        # New files
-        for file_path in current_files - tracked_files:
-            changes.append(ChangeRecord(
-                path=file_path,
-                type="file",
-                action="created",
-                timestamp=timestamp,
-                checksum=current_file_checksums[file_path]
-            ))
-        
-        # Modified files
-        for file_path in current_files & tracked_files:
-            old_checksum = self.state["file_checksums"][file_path]["checksum"]
-            new_checksum = current_file_checksums[file_path]
-            if old_checksum != new_checksum:
-                changes.append(ChangeRecord(
-                    path=file_path,
-                    type="file",
-                    action="modified",
-                    timestamp=timestamp,
-                    checksum=new_checksum
-                ))
-        
-        # Deleted files
-        for file_path in tracked_files - current_files:
-            changes.append(ChangeRecord(
-                path=file_path,
-                type="file",
-                action="deleted",
-                timestamp=timestamp
-            ))
-        
-        # Detect collection changes
-        tracked_collections = set(self.state["collection_checksums"].keys())
-        current_collections = set(collections.keys())
-        
-        for collection_name in current_collections:
-            collection_data = collections[collection_name]
-            collection_json = json.dumps(collection_data, default=str, sort_keys=True)
-            checksum = hashlib.sha256(collection_json.encode('utf-8')).hexdigest()
-            
-            if collection_name not in tracked_collections:
-                changes.append(ChangeRecord(
-                    path=collection_name,
-                    type="collection",
-                    action="created",
-                    timestamp=timestamp,
-                    checksum=checksum
-                ))
+        for name, collection in collections.items():
+            entry = self.state["collections"].get(name)
+            try:
+                delta = self._probe_collection(name, collection, entry)
+            except PyMongoError as e:
+                logger.error(f"Error checking collection {name} for changes: {e}")
+                report_failure(e)
+                continue
+            if delta is None:
+                continue
+            deltas.append(delta)
+            if delta.mode == "marks":
+                continue
+            changes.append(ChangeRecord(path=name, type="collection",
+                                        action="created" if entry is None else "modified",
+                                        timestamp=timestamp, size=delta.marks.get("count")))
+        
+        for name in self.state["collections"].keys() - collections.keys():
+            changes.append(ChangeRecord(path=name, type="collection", action="deleted", timestamp=timestamp))
+            deltas.append(CollectionDelta(name=name, mode="deleted"))
+        
+        return changes, deltas
+    
+    def updated_field_for(self, name: str) -> Optional[str]:
+        """Field holding the last modification time of documents in a collection"""
+        return self.updated_fields.get(name, self.updated_field)
+    
+    def _probe_collection(self, name: str, collection, entry: Optional[Dict]) -> Optional[CollectionDelta]:
+        updated_field = self.updated_field_for(name)
+        marks = self._high_water_marks(collection, updated_field)
+        marks["resume_token"] = None
+        if self.use_change_streams and self._change_streams_available:
+            marks["resume_token"], delta, covered = self._probe_change_stream(name, collection, entry)
+            if covered:
+                if delta is None:
+                    return self._marks_only(name, entry, marks)
+                delta.marks = marks
+                return delta
+        
+        if entry is None:
+            return CollectionDelta(name=name, mode="full", marks=marks)
+        
+        if marks["checksum"] is not None:
+            # No update timestamps: in-place updates only show in the content
+            if marks["checksum"] != entry.get("checksum"):
+                return CollectionDelta(name=name, mode="full", marks=marks)
+            return self._marks_only(name, entry, marks)
+        
+        last_id = _decode_mark(entry.get("max_id"))
+        last_updated = _decode_mark(entry.get("max_updated"))
+        inserted = collection.count_documents({"_id": {"$gt": last_id}}) if last_id is not None else marks["count"]
+        if marks["count"] != entry.get("count", 0) + inserted:
+            # Deletions, or inserts below the _id mark: only a full copy is exact
+            return CollectionDelta(name=name, mode="full", marks=marks)
+        
+        filters = []
+        if inserted:
+            filters.append({"_id": {"$gt": last_id}})
+        if marks["max_updated"] is not None and marks["max_updated"] != entry.get("max_updated"):
+            if last_updated is None:
+                filters.append({updated_field: {"$ne": None}})
             else:
-                old_checksum = self.state["collection_checksums"][collection_name]["checksum"]
-                if old_checksum != checksum:
-                    changes.append(ChangeRecord(
-                        path=collection_name,
-                        type="collection",
-                        action="modified",
-                        timestamp=timestamp,
-                        checksum=checksum
-                    ))
-        
-        for collection_name in tracked_collections - current_collections:
-            changes.append(ChangeRecord(
-                path=collection_name,
-                type="collection",
-                action="deleted",
-                timestamp=timestamp
-            ))
-        
-        return changes
+                filters.append({updated_field: {"$gt": last_updated}})
+        if not filters:
+            return self._marks_only(name, entry, marks)
+        query = filters[0] if len(filters) == 1 else {"$or": filters}
+        return CollectionDelta(name=name, mode="high_water", query=query, marks=marks)
+    
+    def _marks_only(self, name: str, entry: Dict, marks: Dict) -> Optional[CollectionDelta]:
+        """No data to back up, but a new resume token still goes in the journal"""
+        if marks["resume_token"] != entry.get("resume_token"):
+            return CollectionDelta(name=name, mode="marks", marks=marks)
+        return None
+    
+    def _high_water_marks(self, collection, updated_field: Optional[str]) -> Dict:
+        """
+        Document count, largest _id and newest update timestamp (index lookups)
+        
+        When no document carries the update field, a checksum of the whole
+        collection is added instead, since in-place updates leave no mark.
+        """
+        newest = list(collection.find({}, {"_id": 1}).sort("_id", -1).limit(1))
+        marks = {
+            "count": collection.estimated_document_count(),
+            "max_id": _encode_mark(newest[0]["_id"]) if newest else None,
+            "max_updated": None,
+            "checksum": None
+        }
+        if updated_field:
+            marks["max_updated"] = _encode_mark(self._newest_update(collection, updated_field))
+        if marks["max_updated"] is None and newest:
+            marks["checksum"] = self._collection_checksum(collection)
+        return marks
+    
+    def _newest_update(self, collection, updated_field: str) -> Any:
+        """Largest value of the update field; a $group scan when it has no index"""
+        if collection.name not in self._unindexed:
+            indexed = any(info["key"][0][0] == updated_field
+                          for info in collection.index_information().values())
+            if indexed:
+                updated = list(collection.find({updated_field: {"$ne": None}}, {updated_field: 1})
+                               .sort(updated_field, -1).limit(1))
+                return updated[0].get(updated_field) if updated else None
+            logger.warning(f"{collection.name}.{updated_field} has no index; "
+                           f"incremental backups scan the collection to find updates")
+            self._unindexed.add(collection.name)
+        # Unlike sort(), $group does not hold the collection in memory
+        newest = list(collection.aggregate([{"$group": {"_id": None, "max": {"$max": f"${updated_field}"}}}]))
+        return newest[0]["max"] if newest else None
+    
+    def _collection_checksum(self, collection) -> str:
+        """sha256 over every document in _id order"""
+        digest = hashlib.sha256()
+        for document in collection.find({}).sort("_id", 1):
+            digest.update(_encode_mark(document).encode("utf-8"))
+            digest.update(b"\n")
+        return digest.hexdigest()
+    
+    def _probe_change_stream(self, name: str, collection,
+                             entry: Optional[Dict]) -> Tuple[Optional[str], Optional[CollectionDelta], bool]:
+        """
+        Changes since the journal's resume token, from a change stream
+        
+        Returns:
+            (resume token to keep, delta or None, whether the stream covered
+            everything since the last backup); without a usable token a new
+            stream is opened only to get one, and the caller falls back to
+            high-water marks this time
+        """
+        token = _decode_mark(entry.get("resume_token")) if entry else None
+        if token is not None:
+            try:
+                return self._drain_change_stream(name, collection, token)
+            except (PyMongoError, _StreamInterrupted) as e:
+                logger.warning(f"Could not resume change stream for {name}, using high-water marks: {e}")
+                report_failure(e)
+        try:
+            with collection.watch() as stream:
+                return _encode_mark(stream.resume_token), None, False
+        except (PyMongoError, NotImplementedError, TypeError) as e:
+            # Standalone servers (and mongomock) have no change streams
+            logger.info(f"Change streams unavailable, using high-water marks: {e}")
+            self._change_streams_available = False
+            return None, None, False
+    
+    def _drain_change_stream(self, name: str, collection, token) -> Tuple[str, Optional[CollectionDelta], bool]:
+        upserted = set()
+        deleted = set()
+        with collection.watch(resume_after=token) as stream:
+            while True:
+                change = stream.try_next()
+                if change is None:
+                    break
+                operation = change["operationType"]
+                if operation in ("insert", "update", "replace"):
+                    upserted.add(change["documentKey"]["_id"])
+                    deleted.discard(change["documentKey"]["_id"])
+                elif operation == "delete":
+                    upserted.discard(change["documentKey"]["_id"])
+                    deleted.add(change["documentKey"]["_id"])
+                else:
+                    raise _StreamInterrupted(f"{operation} event")
+            new_token = _encode_mark(stream.resume_token)
+        
+        if not upserted and not deleted:
+            return new_token, None, True
+        delta = CollectionDelta(name=name, mode="change_stream", query={"_id": {"$in": list(upserted)}},
+                                deleted_ids=list(deleted))
+        return new_token, delta, True
+    
+    def reset(self, backup_id: str, file_updates: Dict[str, Optional[Dict]], deltas: List[CollectionDelta]):
+        """Start a new journal from the state captured for a full backup"""
+        self.state = {
+            "version": STATE_VERSION,
+            "last_full_backup": backup_id,
+            "files": {},
+            "collections": {},
+            "last_update": None
+        }
+        self.update_state(backup_id, file_updates, deltas)
     
-    def update_state(self, backup_id: str, changes: List[ChangeRecord], files: List[Dict], collections: Dict):
+    def update_state(self, backup_id: str, file_updates: Dict[str, Optional[Dict]],
+                     deltas: List[CollectionDelta]):
         """
-        Update state after incremental backup
+        Apply the journal updates of a completed backup
         
         Args:
-            backup_id: Incremental backup ID
-            changes: List of changes
-            files: Current file information
-            collections: Current collection information
+            backup_id: Backup that holds the changes
+            file_updates: From scan_files()
+            deltas: From detect_collection_changes()
         """
-        # Update file checksums for changed files
-        file_dict = {f.get("path"): f for f in files}
-        for change in changes:
-            if change.type == "file":
-                if change.action == "created" or change.action == "modified":
-                    if change.path in file_dict:
-                        file_info = file_dict[change.path]
-                        content = file_info.get("content", "")
-                        checksum = hashlib.sha256(content.encode('utf-8')).hexdigest()
-                        self.state["file_checksums"][change.path] = {
-                            "checksum": checksum,
-                            "size": len(content),
-                            "backup_id": backup_id
-                        }
-                elif change.action == "deleted":
-                    self.state["file_checksums"].pop(change.path, None)
-        
-        # Update collection checksums for changed collections
-        for change in changes:
-            if change.type == "collection":
-                if change.action == "created" or change.action == "modified":
-                    if change.path in collections:
-                        collection_data = collections[change.path]
-                        collection_json = json.dumps(collection_data, default=str, sort_keys=True)
-                        checksum = hashlib.sha256(collection_json.encode('utf-8')).hexdigest()
-                        self.state["collection_checksums"][change.path] = {
-                            "checksum": checksum,
-                            "count": collection_data.get("count", 0),
-                            "backup_id": backup_id
-                        }
-                elif change.action == "deleted":
-                    self.state["collection_checksums"].pop(change.path, None)
+        files = self.state["files"]
+        for path, entry in file_updates.items():
+            if entry is None:
+                files.pop(path, None)
+            else:
+                files[path] = dict(entry, backup_id=entry["backup_id"] or backup_id)
+        
+        for delta in deltas:
+            if delta.mode == "deleted":
+                self.state["collections"].pop(delta.name, None)
+            else:
+                self.state["collections"][delta.name] = dict(delta.marks, backup_id=backup_id)
         
         self._save_state()
 
@@ -265,6 +446,7 @@ class IncrementalBackupService:
         """
         self.backup_service = backup_service
         self.change_tracker = change_tracker or ChangeTracker()
+        self.scope = ["mongodb", "filesystem", "config"]
     
     def create_incremental_backup(self) -> Dict:
         """
@@ -277,25 +459,30 @@ class IncrementalBackupService:
         last_full_backup_id = self.change_tracker.state.get("last_full_backup")
         if not last_full_backup_id:
             logger.warning("No full backup found, creating full backup instead")
+            # Capture the journal before the backup: anything changing while
+            # it runs shows up again in the next incremental
+            _, file_updates = self.change_tracker.scan_files(self.backup_service._iter_paths(self.scope))
+            _, deltas = self.change_tracker.detect_collection_changes(self._get_collections())
             result = self.backup_service.create_full_backup()
-            # Record as full backup
             if result.success:
-                self._record_full_backup(result)
+                self.change_tracker.reset(result.backup_id, file_updates, deltas)
             return {
                 "backup_result": result,
                 "incremental": False,
                 "message": "Created full backup (no previous backup found)"
             }
         
-        # Get current state
-        current_files = self._get_current_files()
-        current_collections = self._get_current_collections()
-        
         # Detect changes
-        changes = self.change_tracker.detect_changes(current_files, current_collections)
+        paths = dict(self.backup_service._iter_paths(self.scope))
+        file_changes, file_updates = self.change_tracker.scan_files(paths.items())
+        collection_changes, deltas = self.change_tracker.detect_collection_changes(self._get_collections())
+        changes = file_changes + collection_changes
         
         if not changes:
             logger.info("No changes detected, skipping incremental backup")
+            if file_updates or deltas:
+                # Touched but unchanged files, new resume tokens
+                self.change_tracker.update_state(last_full_backup_id, file_updates, deltas)
             return {
                 "backup_result": None,
                 "incremental": True,
@@ -303,173 +490,118 @@ class IncrementalBackupService:
                 "message": "No changes detected"
             }
         
-        # Create backup with only changed items
-        backup_data = self._create_incremental_backup_data(changes, current_files, current_collections)
-        
-        # Save incremental backup
-        backup_id = f"backup_inc_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        backup_id = self._new_backup_id()
         timestamp = datetime.now().isoformat()
-        
-        if self.backup_service.storage_manager:
-            storage_path = self.backup_service.storage_manager.save_backup(backup_data, backup_id)
-            backup_data["storage"] = {
-                "location": "local",
-                "path": storage_path
-            }
-        
-        # Save metadata
-        incremental_metadata = {
-            "backup_id": backup_id,
-            "type": "incremental",
-            "base_backup_id": last_full_backup_id,
-            "timestamp": timestamp,
-            "changes": [asdict(c) for c in changes],
-            "total_changes": len(changes)
-        }
-        
-        metadata_path = os.path.join(
-            self.backup_service.backup_metadata_dir,
-            f"{backup_id}.json"
-        )
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(incremental_metadata, f, indent=2, default=str)
+        result = self._write_changes(backup_id, timestamp, last_full_backup_id, changes, deltas, paths)
         
         # Update change tracker
-        self.change_tracker.update_state(backup_id, changes, current_files, current_collections)
+        self.change_tracker.update_state(backup_id, file_updates, deltas)
         
         logger.info(f"Incremental backup created: {backup_id} with {len(changes)} changes")
         
         return {
-            "backup_result": {
-                "backup_id": backup_id,
-                "success": True,
-                "timestamp": timestamp
-            },
+            "backup_result": result,
             "incremental": True,
             "changes": [asdict(c) for c in changes],
             "total_changes": len(changes)
         }
     
-    def _get_current_files(self) -> List[Dict]:
-        """Get current file state"""
-        # This would get current files from the filesystem
-        # For now, we'll use the backup service's method
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        config = self.backup_service.config
-        
-        files = []
-        patterns = config.get("filesystem", {}).get("patterns", [])
-        directories = config.get("filesystem", {}).get("directories", [])
-        
-        # Similar to backup_service._backup_filesystem but return file info
-        import glob
-        for pattern in patterns:
-            if "*" in pattern:
-                matches = glob.glob(os.path.join(base_dir, pattern))
-                for match in matches:
-                    if os.path.isfile(match):
-                        rel_path = os.path.relpath(match, base_dir)
-                        try:
-                            with open(match, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                            files.append({
-                                "path": rel_path,
-                                "content": content,
-                                "size": len(content)
-                            })
-                        except:
-                            pass
-        
-        return files
+    def _write_changes(self, backup_id: str, timestamp: str, base_backup_id: str, changes: List[ChangeRecord],
+                       deltas: List[CollectionDelta], paths: Dict[str, str]) -> BackupResult:
+        """Stream changed files, changed documents and deletions into a new backup"""
+        header = {"backup_id": backup_id, "timestamp": timestamp, "type": "incremental",
+                  "scope": self.scope, "base_backup_id": base_backup_id}
+        changed_files = [c.path for c in changes if c.type == "file" and c.action != "deleted"]
+        files_index = []
+        collections = self._get_collections()
+        batch_size = self.backup_service.config.get("mongodb", {}).get("batch_size", 1000)
+        
+        def file_records():
+            for rel_path in changed_files:
+                content = self.backup_service._read_file(paths[rel_path])
+                if content is not None:
+                    files_index.append({"path": rel_path, "size": len(content)})
+                    yield {"path": rel_path, "size": len(content), "content": content}
+        
+        def deletions():
+            for change in changes:
+                if change.type == "file" and change.action == "deleted":
+                    yield {"type": "file", "path": change.path}
+            for delta in deltas:
+                if delta.mode == "deleted":
+                    yield {"type": "collection", "collection": delta.name}
+                for document_id in delta.deleted_ids:
+                    yield {"type": "document", "collection": delta.name, "_id": document_id}
+        
+        counts = {}
+        with self.backup_service.storage_manager.open_backup_writer(backup_id, metadata=header) as writer:
+            if changed_files:
+                writer.write_stream("filesystem", file_records(), kind="files")
+            for delta in deltas:
+                if delta.mode not in ("deleted", "marks") and delta.name in collections:
+                    cursor = collections[delta.name].find(delta.query, batch_size=batch_size)
+                    counts[delta.name] = writer.write_stream(f"mongodb.{delta.name}", cursor,
+                                                             kind="collection")["count"]
+            writer.write_stream("deletions", deletions(), kind="deletions")
+        
+        files_data = {
+            "count": len(files_index),
+            "total_size": sum(f["size"] for f in files_index),
+            "files": files_index
+        }
+        return self.backup_service._finish_streaming_backup(
+            header, writer, {"collections": counts}, files_data,
+            extra={"changes": [asdict(c) for c in changes], "total_changes": len(changes)}
+        )
     
-    def _get_current_collections(self) -> Dict:
-        """Get current MongoDB collection state"""
-        mongo_data = self.backup_service._backup_mongodb()
-        collections = {}
-        
-        if "data" in mongo_data:
-            for collection_name, collection_data in mongo_data["data"].items():
-                collections[collection_name] = {
-                    "count": collection_data.get("count", 0),
-                    "documents": collection_data.get("documents", [])
-                }
-        
-        return collections
+    def _new_backup_id(self) -> str:
+        """Timestamped id, suffixed when several incrementals run in the same second"""
+        backup_id = f"backup_inc_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        candidate, n = backup_id, 1
+        while os.path.exists(os.path.join(self.backup_service.backup_metadata_dir, f"{candidate}.json")):
+            candidate, n = f"{backup_id}_{n}", n + 1
+        return candidate
     
-    def _create_incremental_backup_data(self, changes: List[ChangeRecord], files: List[Dict], collections: Dict) -> Dict:
-        """Create backup data with only changed items"""
-        backup_data = {
-            "backup_id": f"backup_inc_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-            "timestamp": datetime.now().isoformat(),
-            "type": "incremental",
-            "changes": [asdict(c) for c in changes]
-        }
-        
-        # Include only changed files
-        changed_file_paths = {c.path for c in changes if c.type == "file"}
-        changed_files = [f for f in files if f.get("path") in changed_file_paths]
-        backup_data["filesystem"] = {
-            "count": len(changed_files),
-            "total_size": sum(f.get("size", 0) for f in changed_files),
-            "files": changed_files
-        }
-        
-        # Include only changed collections
-        changed_collection_names = {c.path for c in changes if c.type == "collection"}
-        changed_collections = {
-            name: data for name, data in collections.items()
-            if name in changed_collection_names
-        }
-        backup_data["mongodb"] = {
-            "collections": {name: data.get("count", 0) for name, data in changed_collections.items()},
-            "data": changed_collections
+    def _get_collections(self) -> Dict:
+        """Configured collections, by name"""
+        if not ensure_mongodb_connected():
+            return {}
+        service = get_mongodb_service()
+        if not service:
+            return {}
+        return {
+            name: service.get_collection(name)
+            for name in self.backup_service.config.get("mongodb", {}).get("collections", [])
         }
-        
-        return backup_data
-    
-    def _record_full_backup(self, backup_result):
-        """Record a full backup in change tracker"""
-        # Get backup metadata to extract files and collections
-        metadata = self.backup_service.get_backup_metadata(backup_result.backup_id)
-        if metadata:
-            files = metadata.get("filesystem", {}).get("files", [])
-            collections = metadata.get("mongodb", {}).get("data", {})
-            self.change_tracker.record_full_backup(
-                backup_result.backup_id,
-                files,
-                collections
-            )
 
 
 def main():
     """Main entry point for incremental backup"""
     import argparse
-    
+
     parser = argparse.ArgumentParser(description='Incremental Backup Service')
     parser.add_argument('--config', default='backup_system/backup_config.json',
                        help='Path to configuration file')
-    
+
     args = parser.parse_args()
-    
+
     # Setup logging
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    
+
     # Load config
     with open(args.config, 'r') as f:
         config = json.load(f)
-    
+
     storage_manager = StorageManager(config.get("storage", {}))
     backup_service = BackupService(storage_manager, args.config)
     incremental_service = IncrementalBackupService(backup_service)
-    
+
     result = incremental_service.create_incremental_backup()
     print(json.dumps(result, indent=2, default=str))
 
 
 if __name__ == "__main__":
     main()
-
-
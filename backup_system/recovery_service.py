@@ -7,7 +7,7 @@ import os
 import json
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict
 from pathlib import Path
 import sys
@@ -16,6 +16,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from file_scanner import FileScanner
 from storage_manager import StorageManager
+from backup_stream import ChunkedBackupReader
 
 try:
     from mongodb_service import ensure_mongodb_connected, get_mongodb_service
@@ -254,8 +255,11 @@ class RecoveryService:
                 errors=["Storage manager not initialized"]
             )
         
-        backup_data = self.storage_manager.load_backup(backup_id)
-        if not backup_data:
+        reader = self._open_reader(backup_id)
+        backup_data = None
+        if reader is None:
+            backup_data = self.storage_manager.load_backup(backup_id)
+        if reader is None and not backup_data:
             return RestoreResult(
                 operation_id=operation_id,
                 backup_id=backup_id,
@@ -292,17 +296,31 @@ class RecoveryService:
         conflicts = 0
         errors = []
         
+        if reader is not None:
+            # Streaming format: collections and files are restored chunk by chunk
+            has_mongodb = bool(reader.streams("collection"))
+            has_filesystem = bool(reader.streams("files"))
+        else:
+            has_mongodb = "mongodb" in backup_data
+            has_filesystem = "filesystem" in backup_data
+        
         # Restore MongoDB collections
-        if "mongodb" in backup_data and ("mongodb" in (options.scope or [])):
-            mongo_result = self._restore_mongodb(backup_data["mongodb"], options)
+        if has_mongodb and ("mongodb" in (options.scope or [])):
+            if reader is not None:
+                mongo_result = self._restore_collections(self._iter_collection_batches(reader), options)
+            else:
+                mongo_result = self._restore_mongodb(backup_data["mongodb"], options)
             restored += mongo_result["restored"]
             failed += mongo_result["failed"]
             conflicts += mongo_result["conflicts"]
             errors.extend(mongo_result["errors"])
         
         # Restore filesystem files
-        if "filesystem" in backup_data and ("filesystem" in (options.scope or []) or "config" in (options.scope or [])):
-            fs_result = self._restore_filesystem(backup_data["filesystem"], options)
+        if has_filesystem and ("filesystem" in (options.scope or []) or "config" in (options.scope or [])):
+            if reader is not None:
+                fs_result = self._restore_files(self._iter_file_records(reader), options)
+            else:
+                fs_result = self._restore_filesystem(backup_data["filesystem"], options)
             restored += fs_result["restored"]
             failed += fs_result["failed"]
             skipped += fs_result["skipped"]
@@ -324,8 +342,36 @@ class RecoveryService:
             errors=errors
         )
     
+    def _open_reader(self, backup_id: str) -> Optional[ChunkedBackupReader]:
+        """Streaming reader if the backup uses the chunked format"""
+        if self.storage_manager is None or not hasattr(self.storage_manager, "open_backup_reader"):
+            return None
+        try:
+            return self.storage_manager.open_backup_reader(backup_id)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not open backup {backup_id}: {e}")
+            return None
+    
+    def _iter_collection_batches(self, reader: ChunkedBackupReader) -> Iterable[Tuple[str, Iterable[List[Dict]]]]:
+        """(collection name, verified document batches) per collection stream"""
+        for stream in reader.streams("collection"):
+            yield stream[len("mongodb."):], reader.iter_batches(stream)
+    
+    def _iter_file_records(self, reader: ChunkedBackupReader) -> Iterable[Dict]:
+        for stream in reader.streams("files"):
+            yield from reader.iter_records(stream)
+    
     def _restore_mongodb(self, mongo_data: Dict, options: RestoreOptions) -> Dict:
         """Restore MongoDB collections"""
+        collections_data = mongo_data.get("data", {})
+        return self._restore_collections(
+            ((name, [data.get("documents", [])]) for name, data in collections_data.items()),
+            options
+        )
+    
+    def _restore_collections(self, collections: Iterable[Tuple[str, Iterable[List[Dict]]]],
+                             options: RestoreOptions) -> Dict:
+        """Restore collections given as (name, batches of documents)"""
         restored = 0
         failed = 0
         conflicts = 0
@@ -348,33 +394,45 @@ class RecoveryService:
                 "errors": ["Could not get MongoDB service"]
             }
         
-        collections_data = mongo_data.get("data", {})
-        
-        for collection_name, collection_data in collections_data.items():
+        for collection_name, batches in collections:
             # Check if selective restore
             if options.selective and collection_name not in options.selective:
                 continue
             
+            staging = None
             try:
                 collection = service.get_collection(collection_name)
                 
                 # Check for conflicts
                 existing_count = collection.count_documents({})
+                target = collection
                 if existing_count > 0:
                     conflicts += 1
                     if options.conflict_resolution == "skip":
                         continue
                     elif options.conflict_resolution == "overwrite":
-                        collection.delete_many({})
+                        # Chunks are verified as they are read: load the whole
+                        # stream into a staging collection and only replace the
+                        # live one once it is complete
+                        staging = self._staging_collection(service, collection)
+                        target = staging
                 
                 # Restore documents
-                documents = collection_data.get("documents", [])
-                if documents:
-                    collection.insert_many(documents)
-                    restored += len(documents)
-                    logger.info(f"Restored {len(documents)} documents to {collection_name}")
+                count = 0
+                for documents in batches:
+                    if documents:
+                        target.insert_many(documents)
+                        count += len(documents)
+                if staging is not None:
+                    staging.rename(collection_name, dropTarget=True)
+                    staging = None
+                restored += count
+                if count:
+                    logger.info(f"Restored {count} documents to {collection_name}")
             
             except Exception as e:
+                if staging is not None:
+                    staging.drop()
                 failed += 1
                 error_msg = f"Error restoring {collection_name}: {e}"
                 errors.append(error_msg)
@@ -387,53 +445,73 @@ class RecoveryService:
             "errors": errors
         }
     
+    def _staging_collection(self, service, collection):
+        """Empty collection to restore into, with the indexes of the live one"""
+        staging = service.get_collection(f"{collection.name}.restore_{datetime.now():%Y%m%d%H%M%S%f}")
+        staging.drop()
+        for name, info in collection.index_information().items():
+            if name == "_id_":
+                continue
+            options = {k: v for k, v in info.items() if k not in ("key", "v", "ns")}
+            staging.create_index(info["key"], name=name, **options)
+        return staging
+    
     def _restore_filesystem(self, fs_data: Dict, options: RestoreOptions) -> Dict:
         """Restore filesystem files"""
+        return self._restore_files(fs_data.get("files", []), options)
+    
+    def _restore_files(self, files: Iterable[Dict], options: RestoreOptions) -> Dict:
+        """Restore files given as {path, size, content} records"""
         restored = 0
         failed = 0
         skipped = 0
         conflicts = 0
         errors = []
         
-        files = fs_data.get("files", [])
-        
-        for file_info in files:
-            file_path = file_info.get("path")
-            
-            # Check if selective restore
-            if options.selective and file_path not in options.selective:
-                skipped += 1
-                continue
-            
-            full_path = os.path.join(self.base_dir, file_path)
-            
-            # Check for conflicts
-            if os.path.exists(full_path):
-                conflicts += 1
-                if options.conflict_resolution == "skip":
+        try:
+            for file_info in files:
+                file_path = file_info.get("path")
+                
+                # Check if selective restore
+                if options.selective and file_path not in options.selective:
                     skipped += 1
                     continue
-                elif options.conflict_resolution == "overwrite":
-                    # Will overwrite below
-                    pass
-            
-            try:
-                # Create directory if needed
-                os.makedirs(os.path.dirname(full_path), exist_ok=True)
                 
-                # Write file
-                content = file_info.get("content", "")
-                with open(full_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                full_path = os.path.join(self.base_dir, file_path)
                 
-                restored += 1
-                logger.info(f"Restored file: {file_path}")
-            
-            except Exception as e:
-                failed += 1
-                error_msg = f"Error restoring {file_path}: {e}"
-                errors.append(error_msg)
-                logger.error(error_msg)
+                # Check for conflicts
+                if os.path.exists(full_path):
+                    conflicts += 1
+                    if options.conflict_resolution == "skip":
+                        skipped += 1
+                        continue
+                    elif options.conflict_resolution == "overwrite":
+                        # Will overwrite below
+                        pass
+                
+                try:
+                    # Create directory if needed
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    
+                    # Write file
+                    content = file_info.get("content", "")
+                    with open(full_path, 'w', encoding='utf-8') as f:
+                        f.write(content)
+                    
+                    restored += 1
+                    logger.info(f"Restored file: {file_path}")
+                
+                except Exception as e:
+                    failed += 1
+                    error_msg = f"Error restoring {file_path}: {e}"
+                    errors.append(error_msg)
+                    logger.error(error_msg)
+        except Exception as e:
+            # A corrupted chunk stops the stream; files already written stay
+            failed += 1
+            error_msg = f"Error reading backup: {e}"
+            errors.append(error_msg)
+            logger.error(error_msg)
         
         return {
             "restored": restored,
@@ -460,15 +538,23 @@ class RecoveryService:
                 estimated_size=0
             )
         
-        backup_data = self.storage_manager.load_backup(backup_id)
-        if not backup_data:
-            return PreviewResult(
-                backup_id=backup_id,
-                files_to_restore=[],
-                collections_to_restore=[],
-                conflicts=[],
-                estimated_size=0
-            )
+        reader = self._open_reader(backup_id)
+        if reader is not None:
+            # Collections come from the manifest; files are streamed chunk by chunk
+            collection_names = [stream[len("mongodb."):] for stream in reader.streams("collection")]
+            file_records = self._iter_file_records(reader)
+        else:
+            backup_data = self.storage_manager.load_backup(backup_id)
+            if not backup_data:
+                return PreviewResult(
+                    backup_id=backup_id,
+                    files_to_restore=[],
+                    collections_to_restore=[],
+                    conflicts=[],
+                    estimated_size=0
+                )
+            collection_names = list(backup_data.get("mongodb", {}).get("data", {}))
+            file_records = backup_data.get("filesystem", {}).get("files", [])
         
         files_to_restore = []
         collections_to_restore = []
@@ -476,46 +562,42 @@ class RecoveryService:
         estimated_size = 0
         
         # Preview MongoDB restore
-        if "mongodb" in backup_data:
-            collections_data = backup_data["mongodb"].get("data", {})
-            for collection_name, collection_data in collections_data.items():
-                if options.selective and collection_name not in options.selective:
-                    continue
-                
-                collections_to_restore.append(collection_name)
-                
-                # Check for conflicts
-                if ensure_mongodb_connected():
-                    service = get_mongodb_service()
-                    if service:
-                        collection = service.get_collection(collection_name)
-                        if collection.count_documents({}) > 0:
-                            conflicts.append({
-                                "type": "collection",
-                                "name": collection_name,
-                                "resolution": options.conflict_resolution
-                            })
+        for collection_name in collection_names:
+            if options.selective and collection_name not in options.selective:
+                continue
+            
+            collections_to_restore.append(collection_name)
+            
+            # Check for conflicts
+            if ensure_mongodb_connected():
+                service = get_mongodb_service()
+                if service:
+                    collection = service.get_collection(collection_name)
+                    if collection.count_documents({}) > 0:
+                        conflicts.append({
+                            "type": "collection",
+                            "name": collection_name,
+                            "resolution": options.conflict_resolution
+                        })
         
         # Preview filesystem restore
-        if "filesystem" in backup_data:
-            files = backup_data["filesystem"].get("files", [])
-            for file_info in files:
-                file_path = file_info.get("path")
-                
-                if options.selective and file_path not in options.selective:
-                    continue
-                
-                files_to_restore.append(file_path)
-                estimated_size += file_info.get("size", 0)
-                
-                # Check for conflicts
-                full_path = os.path.join(self.base_dir, file_path)
-                if os.path.exists(full_path):
-                    conflicts.append({
-                        "type": "file",
-                        "path": file_path,
-                        "resolution": options.conflict_resolution
-                    })
+        for file_info in file_records:
+            file_path = file_info.get("path")
+            
+            if options.selective and file_path not in options.selective:
+                continue
+            
+            files_to_restore.append(file_path)
+            estimated_size += file_info.get("size", 0)
+            
+            # Check for conflicts
+            full_path = os.path.join(self.base_dir, file_path)
+            if os.path.exists(full_path):
+                conflicts.append({
+                    "type": "file",
+                    "path": file_path,
+                    "resolution": options.conflict_resolution
+                })
         
         return PreviewResult(
             backup_id=backup_id,
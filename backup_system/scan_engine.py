@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Scan Engine
+Shared filesystem walking, hashing and duplicate detection
+
+Walks trees with os.scandir (one stat per file, taken from the directory
+entry), hashes in a bounded thread pool with fixed-size streamed reads, and
+finds duplicates by size, then a hash of the first block, then the full
+hash, so only files that still collide are read to the end. Hashes are
+cached by stat signature (size, mtime_ns, inode) and can be persisted, so
+rescanning an unchanged tree reads no file contents.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from stat import S_ISREG
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 1024 * 1024
+PARTIAL_HASH_SIZE = 64 * 1024
+# Small files are hashed in batches so pool overhead is paid per batch, not per file
+HASH_BATCH_BYTES = 4 * 1024 * 1024
+HASH_BATCH_FILES = 256
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+# Files modified this close to the scan may change again within the same
+# mtime tick; their signature is not trusted and they are re-hashed next run
+RACY_WINDOW_NS = 2 * 10**9
+CACHE_VERSION = 1
+
+
+@dataclass
+class ScanEntry:
+    """A file or directory found by a scan"""
+    path: str
+    rel_path: str
+    size: int
+    mtime: float
+    mtime_ns: int
+    ino: int
+    is_dir: bool = False
+    
+    @property
+    def signature(self) -> List[int]:
+        return [self.size, self.mtime_ns, self.ino]
+
+
+@dataclass
+class DuplicateGroup:
+    """Group of duplicate files"""
+    files: List[str]
+    checksum: str
+    size: int
+
+
+_buffers = threading.local()
+
+
+def file_checksum(file_path: str, limit: Optional[int] = None) -> Optional[str]:
+    """sha256 of a file (or of its first `limit` bytes), read in fixed-size blocks"""
+    # One reusable block per thread: no allocation per read, however small the file
+    buffer = getattr(_buffers, "block", None)
+    if buffer is None:
+        buffer = _buffers.block = memoryview(bytearray(READ_BLOCK_SIZE))
+    digest = hashlib.sha256()
+    remaining = limit
+    try:
+        with open(file_path, 'rb', buffering=0) as f:
+            while remaining is None or remaining > 0:
+                view = buffer if remaining is None or remaining >= READ_BLOCK_SIZE else buffer[:remaining]
+                read = f.readinto(view)
+                if not read:
+                    break
+                digest.update(view[:read])
+                if remaining is not None:
+                    remaining -= read
+    except OSError as e:
+        logger.warning(f"Could not read file {file_path}: {e}")
+        return None
+    return digest.hexdigest()
+
+
+def _segment_regex(segment: str) -> str:
+    """Regex for one path segment of a glob pattern (no '/' in wildcards)"""
+    out = []
+    i = 0
+    while i < len(segment):
+        char = segment[i]
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[" and "]" in segment[i + 2:]:
+            end = segment.index("]", i + 2)
+            body = segment[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end
+        else:
+            out.append(re.escape(char))
+        i += 1
+    # Like glob, wildcards do not match hidden names
+    hidden = "" if segment.startswith(".") else r"(?!\.)"
+    return hidden + "".join(out)
+
+
+def compile_patterns(patterns: Iterable[str]) -> Callable[[str], bool]:
+    """
+    Matcher for glob patterns (with recursive '**') against relative paths
+
+    Matches the same paths glob.glob(pattern, recursive=True) would return
+    under the scanned directory, without glob walking the tree once per pattern.
+    """
+    regexes = []
+    for pattern in patterns:
+        parts = []
+        segments = pattern.replace(os.sep, "/").strip("/").split("/")
+        for index, segment in enumerate(segments):
+            last = index == len(segments) - 1
+            if segment == "**":
+                parts.append(r"(?:(?!\.)[^/]*/)*" + (r"(?!\.)[^/]*" if last else ""))
+            else:
+                parts.append(_segment_regex(segment) + ("" if last else "/"))
+        regexes.append("".join(parts))
+    if not regexes:
+        return lambda rel_path: False
+    compiled = re.compile("|".join(f"(?:{r})" for r in regexes))
+    return lambda rel_path: compiled.fullmatch(rel_path) is not None
+
+
+class ScanEngine:
+    """os.scandir walker with a bounded hashing pool and a signature-keyed hash cache"""
+    
+    def __init__(self, cache_file: Optional[str] = None, workers: int = DEFAULT_WORKERS,
+                 partial_size: int = PARTIAL_HASH_SIZE):
+        """
+        Initialize ScanEngine
+        
+        Args:
+            cache_file: Optional JSON file persisting hashes between runs
+            workers: Hashing threads (reads and sha256 release the GIL)
+            partial_size: Bytes hashed to split files of equal size
+        """
+        self.cache_file = cache_file
+        self.workers = max(1, workers)
+        self.partial_size = partial_size
+        self._cache: Dict[str, Dict] = self._load_cache()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.files_hashed = 0
+        self.bytes_hashed = 0
+    
+    def _load_cache(self) -> Dict[str, Dict]:
+        """Load persisted hashes"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+        except Exception as e:
+            logger.warning(f"Error loading scan cache: {e}")
+            return {}
+        return loaded.get("files", {}) if loaded.get("version") == CACHE_VERSION else {}
+    
+    def save_cache(self):
+        """Persist hashes (only when something was hashed since the last save)"""
+        if not self.cache_file or not self._dirty:
+            return
+        temporary = self.cache_file + ".tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"version": CACHE_VERSION, "files": self._cache}, separators=(",", ":")))
+        os.replace(temporary, self.cache_file)
+        self._dirty = False
+    
+    def walk(self, root: str, base_dir: Optional[str] = None, include_dirs: bool = False,
+             follow_symlinks: bool = False, max_depth: Optional[int] = None) -> Iterator[ScanEntry]:
+        """
+        Yield every file (and optionally directory) below root
+        
+        Args:
+            root: Directory to walk
+            base_dir: Directory rel_path is relative to (defaults to root)
+            include_dirs: Also yield directories (size 0), before their contents
+            follow_symlinks: Descend into symlinked directories
+            max_depth: Levels of subdirectories to descend into (None for all)
+        """
+        root = os.path.abspath(root)
+        base_dir = os.path.abspath(base_dir or root)
+        prefix = "" if root == base_dir else os.path.relpath(root, base_dir) + os.sep
+        pending = [(root, prefix, 0)]
+        
+        while pending:
+            directory, rel_dir, depth = pending.pop()
+            try:
+                scanner = os.scandir(directory)
+            except OSError as e:
+                logger.debug(f"Cannot scan {directory}: {e}")
+                continue
+            subdirectories = []
+            with scanner:
+                for entry in scanner:
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            subdirectories.append(entry)
+                            continue
+                        if not entry.is_file(follow_symlinks=follow_symlinks):
+                            continue
+                        stat = entry.stat(follow_symlinks=follow_symlinks)
+                    except OSError:
+                        continue
+                    yield ScanEntry(entry.path, rel_dir + entry.name, stat.st_size,
+                                    stat.st_mtime, stat.st_mtime_ns, stat.st_ino)
+        
+            # Subdirectories are descended depth-first, in name order
+            subdirectories.sort(key=lambda entry: entry.name)
+            descend = []
+            for entry in subdirectories:
+                rel_path = rel_dir + entry.name
+                if include_dirs:
+                    try:
+                        stat = entry.stat(follow_symlinks=follow_symlinks)
+                    except OSError:
+                        continue
+                    yield ScanEntry(entry.path, rel_path, 0, stat.st_mtime, stat.st_mtime_ns,
+                                    stat.st_ino, is_dir=True)
+                if max_depth is None or depth < max_depth:
+                    descend.append((entry.path, rel_path + os.sep, depth + 1))
+            pending.extend(reversed(descend))
+    
+    def stat(self, path: str, rel_path: Optional[str] = None) -> Optional[ScanEntry]:
+        """ScanEntry for a single file, or None if it is missing or not a regular file"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not S_ISREG(stat.st_mode):
+            return None
+        return ScanEntry(path, rel_path or path, stat.st_size, stat.st_mtime, stat.st_mtime_ns, stat.st_ino)
+    
+    def _cached(self, entry: ScanEntry, key: str) -> Optional[str]:
+        """Hash from the cache when the entry's signature still matches"""
+        cached = self._cache.get(entry.path)
+        if cached is not None and cached["signature"] == entry.signature:
+            return cached.get(key)
+        return None
+    
+    def _hash_batch(self, entries: List[ScanEntry], partial: bool) -> List[Tuple[ScanEntry, str]]:
+        """Hash a batch of entries (one pool task) and record the results in the cache"""
+        hashed = []
+        for entry in entries:
+            # A file no larger than the partial size hashes the same either way
+            whole = entry.size <= self.partial_size
+            checksum = file_checksum(entry.path, None if whole or not partial else self.partial_size)
+            if checksum is not None:
+                hashed.append((entry, checksum, whole))
+        
+        racy_after = time.time_ns() - RACY_WINDOW_NS
+        results = []
+        with self._lock:
+            for entry, checksum, whole in hashed:
+                results.append((entry, checksum))
+                self.files_hashed += 1
+                self.bytes_hashed += entry.size if whole or not partial else self.partial_size
+                if entry.mtime_ns >= racy_after:
+                    continue
+                signature = entry.signature
+                cached = self._cache.get(entry.path)
+                if cached is None or cached["signature"] != signature:
+                    cached = self._cache[entry.path] = {"signature": signature}
+                if whole:
+                    cached["partial"] = cached["checksum"] = checksum
+                else:
+                    cached["partial" if partial else "checksum"] = checksum
+                self._dirty = True
+        return results
+    
+    def _batches(self, entries: Iterable[ScanEntry], partial: bool, hits: List) -> Iterator[List[ScanEntry]]:
+        """Group cache misses into pool tasks of about HASH_BATCH_BYTES; hits are appended to `hits`"""
+        key = "partial" if partial else "checksum"
+        batch = []
+        batch_bytes = 0
+        for entry in entries:
+            checksum = self._cached(entry, key)
+            if checksum is not None:
+                hits.append((entry, checksum))
+                continue
+            batch.append(entry)
+            batch_bytes += min(entry.size, self.partial_size) if partial else entry.size
+            if batch_bytes >= HASH_BATCH_BYTES or len(batch) >= HASH_BATCH_FILES:
+                yield batch
+                batch = []
+                batch_bytes = 0
+        if batch:
+            yield batch
+    
+    def checksums(self, entries: Iterable[ScanEntry], partial: bool = False) -> Iterator[Tuple[ScanEntry, str]]:
+        """
+        Hash entries, yielding (entry, sha256) in completion order
+        
+        Cache hits are answered inline; misses are hashed in batches on the
+        worker pool with at most a few batches per worker in flight, so memory
+        stays bounded for any number of entries. Unreadable files are skipped.
+        """
+        hits = []
+        batches = self._batches(entries, partial, hits)
+        if self.workers == 1:
+            for batch in batches:
+                yield from hits
+                hits.clear()
+                yield from self._hash_batch(batch, partial)
+            yield from hits
+            return
+        
+        limit = self.workers * 2
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan-hash") as executor:
+            in_flight = set()
+            for batch in batches:
+                in_flight.add(executor.submit(self._hash_batch, batch, partial))
+                yield from hits
+                hits.clear()
+                if len(in_flight) < limit:
+                    continue
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+            yield from hits
+            for future in in_flight:
+                yield from future.result()
+    
+    def find_duplicates(self, entries: Iterable[ScanEntry], min_size: int = 0) -> List[DuplicateGroup]:
+        """
+        Group files with identical content
+        
+        Files are grouped by size first; only sizes shared by several files
+        have their first block hashed, and only files whose partial hashes
+        still collide are hashed in full.
+        
+        Args:
+            entries: Files to compare
+            min_size: Ignore files smaller than this
+        
+        Returns:
+            List of DuplicateGroup objects, largest files first
+        """
+        by_size: Dict[int, List[ScanEntry]] = defaultdict(list)
+        seen = set()
+        for entry in entries:
+            if entry.is_dir or entry.size < min_size or entry.path in seen:
+                continue
+            seen.add(entry.path)
+            by_size[entry.size].append(entry)
+        candidates = [entry for group in by_size.values() if len(group) > 1 for entry in group]
+        
+        by_partial: Dict[Tuple[int, str], List[ScanEntry]] = defaultdict(list)
+        for entry, checksum in self.checksums(candidates, partial=True):
+            by_partial[(entry.size, checksum)].append(entry)
+        
+        by_checksum: Dict[Tuple[int, str], List[ScanEntry]] = {}
+        remaining = []
+        for (size, checksum), group in by_partial.items():
+            if len(group) < 2:
+                continue
+            if size <= self.partial_size:
+                by_checksum[(size, checksum)] = group
+            else:
+                remaining.extend(group)
+        for entry, checksum in self.checksums(remaining):
+            by_checksum.setdefault((entry.size, checksum), []).append(entry)
+        
+        duplicates = [
+            DuplicateGroup(files=sorted(entry.rel_path for entry in group), checksum=checksum, size=size)
+            for (size, checksum), group in by_checksum.items() if len(group) > 1
+        ]
+        duplicates.sort(key=lambda group: (-group.size, group.files[0]))
+        return duplicates
@@ -160,6 +160,12 @@ class BackupScheduler:
                 if incremental_count > incremental_retention:
                     logger.info(f"Deleting old incremental backup: {backup.backup_id}")
                     self.storage_manager.delete_backup(backup.backup_id)
+        
+        # Free chunks that only deleted backups referenced
+        try:
+            self.storage_manager.collect_garbage()
+        except Exception as e:
+            logger.error(f"Error collecting unreferenced chunks: {e}", exc_info=True)
     
     def run(self):
         """Run scheduler loop"""
@@ -6,11 +6,22 @@ Handles storage operations for backups (local, cloud, etc.)
 import os
 import json
 import gzip
+import shutil
 import logging
 from typing import Dict, List, Optional
 from pathlib import Path
 from dataclasses import dataclass
 
+from backup_stream import ChunkedBackupReader, ChunkedBackupWriter, is_chunked_backup, read_manifest
+from chunk_store import (
+    CHUNK_STORE_DIR,
+    DEDUP_FORMAT_NAME,
+    ChunkStore,
+    ContentDefinedChunker,
+    DedupBackupReader,
+    DedupBackupWriter,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,6 +47,8 @@ class StorageManager:
         self.config = config
         self.storage_type = config.get("primary", "local")
         self.local_path = config.get("local", {}).get("path", "./backups")
+        self.dedup = config.get("dedup", {})
+        self._chunk_store: Optional[ChunkStore] = None
         
         # Create local backup directory if it doesn't exist
         if self.storage_type == "local":
@@ -61,6 +74,75 @@ class StorageManager:
         else:
             raise ValueError(f"Unsupported storage type: {self.storage_type}")
     
+    @property
+    def chunk_store(self) -> ChunkStore:
+        """Shared content-addressed chunk store used by deduplicated backups"""
+        if self._chunk_store is None:
+            compression = self.config.get("backup", {}).get("compression", {})
+            self._chunk_store = ChunkStore(
+                os.path.join(self.local_path, CHUNK_STORE_DIR),
+                compresslevel=compression.get("level", 6),
+                fsync=self.dedup.get("fsync", True),
+            )
+        return self._chunk_store
+    
+    def open_backup_writer(self, backup_id: str, metadata: Optional[Dict] = None) -> ChunkedBackupWriter:
+        """
+        Open a streaming writer for a new backup
+        
+        With dedup enabled (the default) records are cut into content-defined
+        chunks in the shared chunk store and only chunks not stored by an
+        earlier backup are written; otherwise each backup gets its own
+        chunked NDJSON files. Remote storage types are not implemented yet,
+        so streaming backups are always written under the local path.
+        """
+        directory = os.path.join(self.local_path, backup_id)
+        if self.dedup.get("enabled", True):
+            chunker = ContentDefinedChunker(
+                min_size=self.dedup.get("min_size", 16 * 1024),
+                avg_size=self.dedup.get("avg_size", 64 * 1024),
+                max_size=self.dedup.get("max_size", 256 * 1024),
+            )
+            return DedupBackupWriter(directory, self.chunk_store, chunker, metadata=metadata)
+        
+        chunking = self.config.get("chunking", {})
+        compression = self.config.get("backup", {}).get("compression", {})
+        return ChunkedBackupWriter(
+            directory,
+            chunk_records=chunking.get("records", 5000),
+            chunk_bytes=chunking.get("bytes", 8 * 1024 * 1024),
+            compresslevel=compression.get("level", 6),
+            metadata=metadata,
+        )
+    
+    def open_backup_reader(self, backup_id: str) -> Optional[ChunkedBackupReader]:
+        """Streaming reader for a chunked backup, or None (missing or legacy format)"""
+        directory = os.path.join(self.local_path, backup_id)
+        if not is_chunked_backup(directory):
+            return None
+        if read_manifest(directory).get("format") == DEDUP_FORMAT_NAME:
+            return DedupBackupReader(directory, self.chunk_store)
+        return ChunkedBackupReader(directory)
+    
+    def collect_garbage(self, dry_run: bool = False, rebuild_refcounts: bool = False) -> Dict[str, int]:
+        """
+        Delete chunks no longer referenced by any backup
+        
+        Reference counts are rebuilt from the backup manifests when asked to,
+        or when the refcount index is missing, so a lost index never makes
+        live chunks look unreferenced.
+        """
+        store = self.chunk_store
+        if rebuild_refcounts or not store.has_refcounts():
+            store.rebuild_refcounts(
+                reader.manifest for reader in map(self.open_backup_reader, self.list_backups())
+                if isinstance(reader, DedupBackupReader)
+            )
+        return store.gc(
+            grace_seconds=self.dedup.get("gc_grace_seconds", 3600),
+            dry_run=dry_run
+        )
+    
     def _save_local(self, backup_data: Dict, backup_id: str) -> str:
         """Save backup to local filesystem"""
         # Save as JSON
@@ -161,6 +243,8 @@ class StorageManager:
                 if filename.endswith('.json') or filename.endswith('.json.gz'):
                     backup_id = filename.replace('.json.gz', '').replace('.json', '')
                     backups.append(backup_id)
+                elif is_chunked_backup(os.path.join(storage_path, filename)):
+                    backups.append(filename)
         
         return backups
     
@@ -175,6 +259,16 @@ class StorageManager:
             True if deleted successfully
         """
         if self.storage_type == "local":
+            # Chunked backup directory
+            backup_dir = os.path.join(self.local_path, backup_id)
+            if os.path.isdir(backup_dir):
+                # Chunks stay in the store until gc (another backup may share them)
+                reader = self.open_backup_reader(backup_id)
+                if isinstance(reader, DedupBackupReader):
+                    self.chunk_store.release(reader.chunk_ids())
+                shutil.rmtree(backup_dir)
+                return True
+            
             # Try compressed
             backup_file = os.path.join(self.local_path, f"{backup_id}.json.gz")
             if os.path.exists(backup_file):
@@ -199,10 +293,18 @@ class StorageManager:
         
         if os.path.exists(self.local_path):
             for filename in os.listdir(self.local_path):
+                file_path = os.path.join(self.local_path, filename)
                 if filename.endswith('.json') or filename.endswith('.json.gz'):
-                    file_path = os.path.join(self.local_path, filename)
                     total_size += os.path.getsize(file_path)
                     backup_count += 1
+                elif is_chunked_backup(file_path):
+                    total_size += sum(
+                        entry.stat().st_size for entry in os.scandir(file_path) if entry.is_file()
+                    )
+                    backup_count += 1
+            
+            if os.path.isdir(os.path.join(self.local_path, CHUNK_STORE_DIR)):
+                total_size += self.chunk_store.usage()["size"]
         
         return StorageUsage(
             total_size=total_size,
@@ -8,10 +8,13 @@ Sistema que evoluciona constantemente basado en interacciones y ventas
 import json
 import datetime
 import hashlib
-from typing import Dict, List, Any, Optional
+import os
+import pickle
+import threading
+from array import array
+from typing import Dict, List, Any, Optional, Set, Tuple, Hashable, Iterable, Callable, Iterator
 from dataclasses import dataclass, asdict
 from decimal import Decimal
-import statistics
 import re
 from pathlib import Path
 
@@ -66,21 +69,434 @@ class ConocimientoProducto:
     fecha_ultima_actualizacion: datetime.datetime
 
 
+class _Vocabulario:
+    """Internado de valores repetidos: cada valor distinto se guarda una vez"""
+    __slots__ = ("valores", "codigos")
+    
+    def __init__(self):
+        self.valores: List[Any] = []
+        self.codigos: Dict[Any, int] = {}
+    
+    def codigo(self, valor: Any) -> int:
+        codigo = self.codigos.get(valor)
+        if codigo is None:
+            codigo = len(self.valores)
+            self.valores.append(valor)
+            self.codigos[valor] = codigo
+        return codigo
+
+
+class _ColumnaTexto:
+    """Textos concatenados en UTF-8 en un único buffer, decodificados a demanda"""
+    __slots__ = ("_buffer", "_fines")
+    
+    def __init__(self):
+        self._buffer = bytearray()
+        self._fines = array('Q')
+    
+    def agregar(self, texto: str):
+        self._buffer += texto.encode('utf-8')
+        self._fines.append(len(self._buffer))
+    
+    def obtener(self, posicion: int) -> str:
+        inicio = self._fines[posicion - 1] if posicion else 0
+        return self._buffer[inicio:self._fines[posicion]].decode('utf-8')
+    
+    def __iter__(self) -> Iterator[str]:
+        inicio = 0
+        for fin in self._fines:
+            yield self._buffer[inicio:fin].decode('utf-8')
+            inicio = fin
+    
+    def bytes_usados(self) -> int:
+        return len(self._buffer) + self._fines.itemsize * len(self._fines)
+
+
+_EPOCA = datetime.datetime(1970, 1, 1)
+_MICROSEGUNDO = datetime.timedelta(microseconds=1)
+_SIN_SATISFACCION = -128
+
+
+class HistorialInteracciones:
+    """
+    Almacenamiento columnar y compacto del historial de interacciones.
+    
+    Se usa como una lista de InteraccionCliente (append, extend, len, índices,
+    slices e iteración), pero cada campo vive en una columna: timestamps como
+    enteros (microsegundos desde la época), cliente_id / tipo_interaccion /
+    resultado / contexto internados como códigos, e ID, mensaje y respuesta
+    como UTF-8 en buffers. Cada InteraccionCliente se materializa recién al
+    accederla; modificar el objeto devuelto no altera el historial.
+    """
+    
+    def __init__(self, interacciones: Iterable[InteraccionCliente] = ()):
+        self._ids = _ColumnaTexto()
+        self._mensajes = _ColumnaTexto()
+        self._respuestas = _ColumnaTexto()
+        self._timestamps = array('q')
+        self._clientes = array('I')
+        self._tipos = array('I')
+        self._resultados = array('I')
+        self._contextos = array('I')
+        self._satisfacciones = array('b')
+        # Montos internados; el código 0 representa None
+        self._valores_cotizacion = array('I')
+        self._valores_venta = array('I')
+        self._vocabulario_valores = _Vocabulario()
+        self._vocabulario_valores.codigo(None)
+        self._vocabulario_clientes = _Vocabulario()
+        self._vocabulario_tipos = _Vocabulario()
+        self._vocabulario_resultados = _Vocabulario()
+        self._vocabulario_contextos = _Vocabulario()
+        # Lecciones: marca None / lista vacía; solo las listas con contenido
+        # se guardan aparte, por posición
+        self._sin_lecciones = array('b')
+        self._lecciones: Dict[int, List[str]] = {}
+        # Valores que no entran en las columnas compactas (p. ej. timestamps
+        # con zona horaria o contextos no serializables a JSON)
+        self._extras: Dict[int, Dict[str, Any]] = {}
+        self.extend(interacciones)
+    
+    def __len__(self) -> int:
+        return len(self._timestamps)
+    
+    def __iter__(self) -> Iterator[InteraccionCliente]:
+        for posicion in range(len(self)):
+            yield self._materializar(posicion)
+    
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self._materializar(i) for i in range(*indice.indices(len(self)))]
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError("índice de interacción fuera de rango")
+        return self._materializar(indice)
+    
+    def __repr__(self) -> str:
+        return f"HistorialInteracciones({len(self)} interacciones)"
+    
+    def append(self, interaccion: InteraccionCliente):
+        """Agrega una interacción al final del historial"""
+        posicion = len(self)
+        extras = {}
+        
+        timestamp = interaccion.timestamp
+        if isinstance(timestamp, datetime.datetime) and timestamp.tzinfo is None:
+            self._timestamps.append((timestamp - _EPOCA) // _MICROSEGUNDO)
+        else:
+            self._timestamps.append(0)
+            extras["timestamp"] = timestamp
+        
+        self._ids.agregar(interaccion.id)
+        self._mensajes.agregar(interaccion.mensaje_cliente)
+        self._respuestas.agregar(interaccion.respuesta_agente)
+        self._clientes.append(self._vocabulario_clientes.codigo(interaccion.cliente_id))
+        self._tipos.append(self._vocabulario_tipos.codigo(interaccion.tipo_interaccion))
+        self._resultados.append(self._vocabulario_resultados.codigo(interaccion.resultado))
+        
+        codigo_contexto = self._codigo_contexto(interaccion.contexto)
+        if codigo_contexto is None:
+            self._contextos.append(0)
+            extras["contexto"] = interaccion.contexto
+        else:
+            self._contextos.append(codigo_contexto)
+        
+        satisfaccion = interaccion.satisfaccion_cliente
+        if satisfaccion is None:
+            self._satisfacciones.append(_SIN_SATISFACCION)
+        elif type(satisfaccion) is int and _SIN_SATISFACCION < satisfaccion <= 127:
+            self._satisfacciones.append(satisfaccion)
+        else:
+            self._satisfacciones.append(_SIN_SATISFACCION)
+            extras["satisfaccion_cliente"] = satisfaccion
+        
+        self._valores_cotizacion.append(self._vocabulario_valores.codigo(interaccion.valor_cotizacion))
+        self._valores_venta.append(self._vocabulario_valores.codigo(interaccion.valor_venta))
+        lecciones = interaccion.lecciones_aprendidas
+        self._sin_lecciones.append(lecciones is None)
+        if lecciones is not None and lecciones != []:
+            self._lecciones[posicion] = lecciones
+        if extras:
+            self._extras[posicion] = extras
+    
+    def extend(self, interacciones: Iterable[InteraccionCliente]):
+        """Agrega varias interacciones"""
+        for interaccion in interacciones:
+            self.append(interaccion)
+    
+    def _codigo_contexto(self, contexto: Any) -> Optional[int]:
+        """Interna el contexto como JSON; None si no se puede representar así"""
+        try:
+            serializado = json.dumps(contexto, sort_keys=True, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return None
+        if serializado not in self._vocabulario_contextos.codigos:
+            if json.loads(serializado) != contexto:
+                return None
+        return self._vocabulario_contextos.codigo(serializado)
+    
+    def _materializar(self, posicion: int) -> InteraccionCliente:
+        """Construye la InteraccionCliente guardada en una posición"""
+        extras = self._extras.get(posicion, {})
+        satisfaccion = self._satisfacciones[posicion]
+        return InteraccionCliente(
+            id=self._ids.obtener(posicion),
+            timestamp=extras["timestamp"] if "timestamp" in extras else self._timestamp(posicion),
+            cliente_id=self._vocabulario_clientes.valores[self._clientes[posicion]],
+            tipo_interaccion=self._vocabulario_tipos.valores[self._tipos[posicion]],
+            mensaje_cliente=self._mensajes.obtener(posicion),
+            respuesta_agente=self._respuestas.obtener(posicion),
+            contexto=(
+                extras["contexto"] if "contexto" in extras
+                else json.loads(self._vocabulario_contextos.valores[self._contextos[posicion]])
+            ),
+            resultado=self._vocabulario_resultados.valores[self._resultados[posicion]],
+            valor_cotizacion=self._vocabulario_valores.valores[self._valores_cotizacion[posicion]],
+            valor_venta=self._vocabulario_valores.valores[self._valores_venta[posicion]],
+            satisfaccion_cliente=(
+                extras["satisfaccion_cliente"] if "satisfaccion_cliente" in extras
+                else None if satisfaccion == _SIN_SATISFACCION else satisfaccion
+            ),
+            lecciones_aprendidas=(
+                None if self._sin_lecciones[posicion] else self._lecciones.get(posicion, [])
+            ),
+        )
+    
+    def _timestamp(self, posicion: int) -> datetime.datetime:
+        return _EPOCA + datetime.timedelta(microseconds=self._timestamps[posicion])
+    
+    def columna(self, campo: str) -> Iterator[Any]:
+        """
+        Itera los valores de un solo campo sin materializar las interacciones.
+        Útil para recálculos completos que solo leen algunos campos.
+        """
+        if campo == "mensaje_cliente":
+            return iter(self._mensajes)
+        if campo == "respuesta_agente":
+            return iter(self._respuestas)
+        if campo == "id":
+            return iter(self._ids)
+        if campo == "timestamp":
+            return (
+                self._extras[i]["timestamp"]
+                if i in self._extras and "timestamp" in self._extras[i]
+                else _EPOCA + datetime.timedelta(microseconds=micro)
+                for i, micro in enumerate(self._timestamps)
+            )
+        if campo == "satisfaccion_cliente":
+            return (
+                self._extras[i]["satisfaccion_cliente"]
+                if i in self._extras and "satisfaccion_cliente" in self._extras[i]
+                else None if valor == _SIN_SATISFACCION else valor
+                for i, valor in enumerate(self._satisfacciones)
+            )
+        internados = {
+            "cliente_id": (self._clientes, self._vocabulario_clientes),
+            "tipo_interaccion": (self._tipos, self._vocabulario_tipos),
+            "resultado": (self._resultados, self._vocabulario_resultados),
+            "valor_cotizacion": (self._valores_cotizacion, self._vocabulario_valores),
+            "valor_venta": (self._valores_venta, self._vocabulario_valores),
+        }
+        if campo in internados:
+            codigos, vocabulario = internados[campo]
+            return (vocabulario.valores[codigo] for codigo in codigos)
+        return (getattr(interaccion, campo) for interaccion in self)
+    
+    def bytes_usados(self) -> int:
+        """Estimación de los bytes ocupados por las columnas (sin vocabularios)"""
+        columnas = (
+            self._timestamps, self._clientes, self._tipos,
+            self._resultados, self._contextos, self._satisfacciones,
+            self._valores_cotizacion, self._valores_venta, self._sin_lecciones,
+        )
+        return (
+            sum(c.itemsize * len(c) for c in columnas)
+            + self._ids.bytes_usados()
+            + self._mensajes.bytes_usados()
+            + self._respuestas.bytes_usados()
+        )
+
+
+# Vocabulario de palabras clave por categoría (claves "categoria:palabra")
+PALABRAS_CLAVE_POR_CATEGORIA = (
+    ("tecnico", (
+        "conductividad", "resistencia", "durabilidad", "aislamiento",
+        "térmico", "acústico", "fuego", "humedad", "instalación"
+    )),
+    ("negocio", (
+        "precio", "costo", "presupuesto", "oferta", "descuento",
+        "entrega", "instalación", "garantía", "servicio"
+    )),
+    ("emocional", (
+        "urgente", "importante", "necesito", "quiero", "mejor",
+        "calidad", "confianza", "seguridad", "garantía"
+    )),
+)
+
+
+def _construir_claves_por_palabra() -> Dict[str, List[str]]:
+    """Mapa palabra -> claves "categoria:palabra" del vocabulario"""
+    mapa = {}
+    for categoria, palabras in PALABRAS_CLAVE_POR_CATEGORIA:
+        for palabra in palabras:
+            mapa.setdefault(palabra, []).append(f"{categoria}:{palabra}")
+    return mapa
+
+
+CLAVES_POR_PALABRA = _construir_claves_por_palabra()
+
+
+class IndiceInvertido:
+    """
+    Índice invertido de palabras clave (categoria:palabra) a IDs de documentos.
+    Los documentos se agrupan por firma (conjunto de claves), de modo que las
+    consultas recorren firmas distintas y no documentos: el costo depende del
+    vocabulario observado y de k, no del tamaño del historial.
+    """
+    
+    def __init__(self):
+        self._ids_por_firma: Dict[frozenset, Dict[Hashable, None]] = {}
+        self._firmas_por_clave: Dict[str, Set[frozenset]] = {}
+        self._firma_por_id: Dict[Hashable, frozenset] = {}
+    
+    def __len__(self) -> int:
+        return len(self._firma_por_id)
+    
+    def agregar(self, doc_id: Hashable, claves: Iterable[str]):
+        """Indexa (o reindexa) un documento con sus palabras clave"""
+        if doc_id in self._firma_por_id:
+            self.eliminar(doc_id)
+        firma = frozenset(claves)
+        if not firma:
+            return
+        ids = self._ids_por_firma.get(firma)
+        if ids is None:
+            ids = self._ids_por_firma[firma] = {}
+            for clave in firma:
+                self._firmas_por_clave.setdefault(clave, set()).add(firma)
+        ids[doc_id] = None
+        self._firma_por_id[doc_id] = firma
+    
+    def eliminar(self, doc_id: Hashable):
+        """Quita un documento del índice"""
+        firma = self._firma_por_id.pop(doc_id, None)
+        if firma is None:
+            return
+        ids = self._ids_por_firma[firma]
+        ids.pop(doc_id, None)
+        if not ids:
+            del self._ids_por_firma[firma]
+            for clave in firma:
+                firmas = self._firmas_por_clave[clave]
+                firmas.discard(firma)
+                if not firmas:
+                    del self._firmas_por_clave[clave]
+    
+    def limpiar(self):
+        """Vacía el índice"""
+        self._ids_por_firma.clear()
+        self._firmas_por_clave.clear()
+        self._firma_por_id.clear()
+    
+    def _firmas_candidatas(self, claves: Set[str]) -> Set[frozenset]:
+        firmas = set()
+        for clave in claves:
+            firmas.update(self._firmas_por_clave.get(clave, ()))
+        return firmas
+    
+    def contar(self, claves: Iterable[str]) -> int:
+        """Cantidad de documentos que comparten al menos una clave"""
+        claves = set(claves)
+        return sum(len(self._ids_por_firma[f]) for f in self._firmas_candidatas(claves))
+    
+    def top_k(
+        self,
+        claves: Iterable[str],
+        k: int,
+        desempate: Optional[Callable[[Hashable], float]] = None,
+    ) -> List[Tuple[Hashable, int]]:
+        """
+        Retorna hasta k pares (doc_id, solapamiento) ordenados por solapamiento
+        descendente. Con desempate, los empates se ordenan por ese puntaje;
+        sin él, se conserva el orden de inserción dentro de cada firma.
+        """
+        claves = set(claves)
+        grupos: Dict[int, List[frozenset]] = {}
+        for firma in self._firmas_candidatas(claves):
+            grupos.setdefault(len(firma & claves), []).append(firma)
+        
+        resultados = []
+        for solapamiento in sorted(grupos, reverse=True):
+            if desempate is None:
+                for firma in grupos[solapamiento]:
+                    for doc_id in self._ids_por_firma[firma]:
+                        resultados.append((doc_id, solapamiento))
+                        if len(resultados) >= k:
+                            return resultados
+            else:
+                ids = [d for firma in grupos[solapamiento] for d in self._ids_por_firma[firma]]
+                ids.sort(key=desempate, reverse=True)
+                resultados.extend((doc_id, solapamiento) for doc_id in ids[:k - len(resultados)])
+                if len(resultados) >= k:
+                    return resultados
+        return resultados
+
+
+# Snapshot compilado de los archivos de conocimiento: el JSON ya parseado y
+# convertido a dataclasses, serializado con pickle. Se regenera cuando cambia
+# el hash del archivo fuente o la versión del esquema.
+SNAPSHOT_SCHEMA_VERSION = 1
+_snapshots_en_memoria: Dict[Tuple[str, int, int], bytes] = {}  # (ruta, tamaño, mtime_ns) -> pickle
+_snapshots_lock = threading.Lock()
+
+
+def limpiar_snapshots_en_memoria():
+    """Descarta los snapshots compartidos en memoria por este proceso"""
+    with _snapshots_lock:
+        _snapshots_en_memoria.clear()
+
+
 class BaseConocimientoDinamica:
     """Base de conocimiento que evoluciona automáticamente"""
     
     def __init__(self):
-        self.interacciones = []
+        self._interacciones = HistorialInteracciones()
         self.patrones_venta = []
         self.conocimiento_productos = {}
         self.metricas_evolucion = {}
         self.insights_automaticos = []
+        # Agregadores incrementales: registrar_interaccion los actualiza en O(1)
+        # y actualizar_conocimiento() los reconstruye con un recorrido completo
+        self._conteo_por_dia: Dict[datetime.date, List[int]] = {}  # fecha -> [interacciones, ventas]
+        self._suma_satisfaccion = 0
+        self._cantidad_satisfaccion = 0
+        self._contadores_patron: Dict[str, List[int]] = {}  # patron_id -> [coincidencias, exitosas]
+        # Índices invertidos de palabras clave. Las interacciones se indexan por
+        # su posición en self.interacciones y los patrones por identidad.
+        self._indice_interacciones = IndiceInvertido()
+        self._indice_interacciones_exitosas = IndiceInvertido()
+        self._indice_patrones = IndiceInvertido()
+        self._patrones_indexados: Dict[int, PatronVenta] = {}
         self.directorio_base = Path(__file__).resolve().parent
         self.config_conocimiento = self._cargar_configuracion_conocimiento()
         self.archivo_conocimiento_cargado = None
         self.cargar_conocimiento_inicial()
         self.cargar_conocimiento_entrenado()
     
+    @property
+    def interacciones(self) -> HistorialInteracciones:
+        """Historial de interacciones (almacenamiento columnar compacto)"""
+        return self._interacciones
+    
+    @interacciones.setter
+    def interacciones(self, interacciones: Iterable[InteraccionCliente]):
+        # Los índices y agregadores apuntan a posiciones del historial anterior
+        if not isinstance(interacciones, HistorialInteracciones):
+            interacciones = HistorialInteracciones(interacciones)
+        self._interacciones = interacciones
+        self._reconstruir_agregados()
+    
     def cargar_conocimiento_inicial(self):
         """Carga el conocimiento inicial del sistema"""
         # Conocimiento base de productos
@@ -122,6 +538,7 @@ class BaseConocimientoDinamica:
                 fecha_ultima_actualizacion=datetime.datetime.now()
             )
         ]
+        self._reindexar_patrones()
 
     def _cargar_configuracion_conocimiento(self) -> Dict[str, Any]:
         """Carga la configuración de conocimiento desde archivo"""
@@ -138,7 +555,11 @@ class BaseConocimientoDinamica:
                 ],
                 "cargar_primer_archivo_encontrado": True,
                 "intentar_mongodb": True,
-                "mongodb_uri": os.getenv("MONGODB_URI")
+                "mongodb_uri": os.getenv("MONGODB_URI"),
+                "snapshot": {
+                    "habilitado": True,
+                    "directorio": ".knowledge_cache"
+                }
             },
             "consolidacion": {
                 "habilitada": False,
@@ -232,25 +653,26 @@ class BaseConocimientoDinamica:
         return conocimiento_cargado
     
     def _cargar_desde_mongodb(self, uri: Optional[str]) -> bool:
-        """Carga conocimiento desde MongoDB si está disponible"""
+        """
+        Carga conocimiento desde MongoDB si está disponible, usando el
+        cliente compartido del proceso (mongodb_service) en lugar de abrir
+        uno propio
+        """
         if not uri:
             return False
         
         try:
-            from pymongo import MongoClient
+            from mongodb_service import get_client_manager, report_failure
         except ImportError:
             print("⚠️  pymongo no está instalado. Omitiendo carga desde MongoDB.")
             return False
         
-        client = None
+        manager = get_client_manager(uri)
         try:
-            client = MongoClient(uri, serverSelectionTimeoutMS=3000)
-            client.admin.command("ping")
-            
-            db_name = uri.rsplit('/', 1)[-1] if '/' in uri else "bmc_chat"
-            db_name = db_name.split('?')[0] if db_name else "bmc_chat"
-            db = client.get_database(db_name or "bmc_chat")
-            coleccion = db.get_collection("kb_interactions")
+            if not manager.is_healthy():
+                print("⚠️  MongoDB no disponible. Omitiendo carga desde MongoDB.")
+                return False
+            coleccion = manager.get_collection("kb_interactions")
             
             documentos = list(coleccion.find().limit(500))
             if not documentos:
@@ -281,16 +703,128 @@ class BaseConocimientoDinamica:
         
         except Exception as e:
             print(f"⚠️  Error cargando desde MongoDB: {e}")
+            report_failure(e, uri)
             return False
-        finally:
-            if client:
-                client.close()
     
     def registrar_interaccion(self, interaccion: InteraccionCliente):
-        """Registra una nueva interacción"""
+        """
+        Registra una nueva interacción.
+        El costo es independiente del historial: solo se actualizan los
+        agregadores incrementales. El recálculo completo queda en
+        actualizar_conocimiento() (job periódico o a demanda).
+        """
+        claves = set(self._extraer_palabras_clave(interaccion.mensaje_cliente))
         self.interacciones.append(interaccion)
+        self._indexar_interaccion(len(self.interacciones) - 1, interaccion, claves)
+        self._registrar_en_agregados(interaccion)
+        self._registrar_en_contadores_patron(interaccion, claves)
         self.analizar_interaccion(interaccion)
-        self.actualizar_conocimiento()
+        self._actualizar_metricas_evolucion()
+        self._limpiar_patrones_obsoletos()
+    
+    def _registrar_en_agregados(self, interaccion: InteraccionCliente):
+        """Suma una interacción a los contadores diarios y de satisfacción"""
+        self._sumar_a_agregados(
+            interaccion.timestamp, interaccion.tipo_interaccion, interaccion.satisfaccion_cliente
+        )
+    
+    def _sumar_a_agregados(self, timestamp: datetime.datetime, tipo_interaccion: str,
+                           satisfaccion: Optional[int]):
+        conteo = self._conteo_por_dia.setdefault(timestamp.date(), [0, 0])
+        conteo[0] += 1
+        if tipo_interaccion == "venta":
+            conteo[1] += 1
+        if satisfaccion:
+            self._suma_satisfaccion += satisfaccion
+            self._cantidad_satisfaccion += 1
+    
+    def _registrar_en_contadores_patron(self, interaccion: InteraccionCliente, claves: Set[str]):
+        """Actualiza los contadores de los patrones ya inicializados"""
+        if not self._contadores_patron:
+            return
+        mensaje_lower = interaccion.mensaje_cliente.lower()
+        for patron in self.patrones_venta:
+            contador = self._contadores_patron.get(patron.id)
+            if contador is not None and self._coincide_patron(patron, mensaje_lower, claves):
+                contador[0] += 1
+                if interaccion.resultado == "exitoso":
+                    contador[1] += 1
+    
+    def _claves_patron(self, patron: PatronVenta) -> Tuple[Set[str], List[str]]:
+        """
+        Traduce las palabras clave de un patrón a claves del índice.
+        Retorna (claves del índice, palabras libres fuera del vocabulario que
+        solo pueden buscarse por subcadena).
+        """
+        claves = set()
+        libres = []
+        for palabra in patron.palabras_clave:
+            if ":" in palabra:
+                claves.add(palabra)
+            elif palabra in CLAVES_POR_PALABRA:
+                claves.update(CLAVES_POR_PALABRA[palabra])
+            else:
+                libres.append(palabra)
+        return claves, libres
+    
+    def _coincide_patron(self, patron: PatronVenta, mensaje_lower: str, claves: Set[str]) -> bool:
+        """Indica si un mensaje comparte alguna palabra clave con el patrón"""
+        claves_patron, libres = self._claves_patron(patron)
+        if claves_patron & claves:
+            return True
+        return any(palabra in mensaje_lower for palabra in libres)
+    
+    def _indexar_interaccion(self, posicion: int, interaccion: InteraccionCliente, claves: Set[str]):
+        """Agrega una interacción a los índices invertidos"""
+        self._indice_interacciones.agregar(posicion, claves)
+        if interaccion.resultado == "exitoso":
+            self._indice_interacciones_exitosas.agregar(posicion, claves)
+    
+    def _indexar_patron(self, patron: PatronVenta):
+        """Agrega (o reindexa) un patrón en el índice invertido"""
+        claves, _ = self._claves_patron(patron)
+        self._patrones_indexados[id(patron)] = patron
+        self._indice_patrones.agregar(id(patron), claves)
+    
+    def _desindexar_patron(self, patron: PatronVenta):
+        """Quita un patrón del índice invertido"""
+        self._patrones_indexados.pop(id(patron), None)
+        self._indice_patrones.eliminar(id(patron))
+    
+    def _reindexar_patrones(self):
+        """Reconstruye el índice de patrones desde self.patrones_venta"""
+        self._indice_patrones.limpiar()
+        self._patrones_indexados = {}
+        for patron in self.patrones_venta:
+            self._indexar_patron(patron)
+    
+    def _reconstruir_agregados(self):
+        """Reconstruye todos los agregadores con un recorrido completo del historial"""
+        self._conteo_por_dia = {}
+        self._suma_satisfaccion = 0
+        self._cantidad_satisfaccion = 0
+        self._indice_interacciones.limpiar()
+        self._indice_interacciones_exitosas.limpiar()
+        # Se leen solo las columnas necesarias, sin materializar interacciones
+        historial = self.interacciones
+        columnas = zip(
+            historial.columna("timestamp"),
+            historial.columna("tipo_interaccion"),
+            historial.columna("satisfaccion_cliente"),
+            historial.columna("mensaje_cliente"),
+            historial.columna("resultado"),
+        )
+        for posicion, (timestamp, tipo, satisfaccion, mensaje, resultado) in enumerate(columnas):
+            self._sumar_a_agregados(timestamp, tipo, satisfaccion)
+            claves = set(self._extraer_palabras_clave(mensaje))
+            self._indice_interacciones.agregar(posicion, claves)
+            if resultado == "exitoso":
+                self._indice_interacciones_exitosas.agregar(posicion, claves)
+        
+        self._reindexar_patrones()
+        self._contadores_patron = {}
+        for patron in self.patrones_venta:
+            self._calcular_tasa_exito_patron(patron)
     
     def analizar_interaccion(self, interaccion: InteraccionCliente):
         """Analiza una interacción para extraer conocimiento"""
@@ -315,32 +849,11 @@ class BaseConocimientoDinamica:
     
     def _extraer_palabras_clave(self, texto: str) -> List[str]:
         """Extrae palabras clave de un texto"""
-        # Palabras técnicas
-        palabras_tecnicas = [
-            "conductividad", "resistencia", "durabilidad", "aislamiento",
-            "térmico", "acústico", "fuego", "humedad", "instalación"
-        ]
-        
-        # Palabras de negocio
-        palabras_negocio = [
-            "precio", "costo", "presupuesto", "oferta", "descuento",
-            "entrega", "instalación", "garantía", "servicio"
-        ]
-        
-        # Palabras emocionales
-        palabras_emocionales = [
-            "urgente", "importante", "necesito", "quiero", "mejor",
-            "calidad", "confianza", "seguridad", "garantía"
-        ]
-        
         texto_lower = texto.lower()
         palabras_encontradas = []
         
-        for categoria, palabras in [
-            ("tecnico", palabras_tecnicas),
-            ("negocio", palabras_negocio),
-            ("emocional", palabras_emocionales)
-        ]:
+        # Palabras técnicas, de negocio y emocionales
+        for categoria, palabras in PALABRAS_CLAVE_POR_CATEGORIA:
             for palabra in palabras:
                 if palabra in texto_lower:
                     palabras_encontradas.append(f"{categoria}:{palabra}")
@@ -404,19 +917,40 @@ class BaseConocimientoDinamica:
                 fecha_ultima_actualizacion=datetime.datetime.now()
             )
             self.patrones_venta.append(nuevo_patron)
+            self._indexar_patron(nuevo_patron)
     
     def _calcular_tasa_exito_patron(self, patron: PatronVenta) -> float:
         """Calcula la tasa de éxito de un patrón"""
-        interacciones_patron = [
-            i for i in self.interacciones 
-            if any(palabra in i.mensaje_cliente.lower() for palabra in patron.palabras_clave)
-        ]
+        contador = self._contadores_patron.get(patron.id)
+        if contador is None:
+            # Primera consulta del patrón: se cuenta con el índice invertido y
+            # luego se mantiene de forma incremental
+            claves, libres = self._claves_patron(patron)
+            if not libres:
+                contador = [
+                    self._indice_interacciones.contar(claves),
+                    self._indice_interacciones_exitosas.contar(claves),
+                ]
+            else:
+                # Palabras fuera del vocabulario: recorrido completo por subcadena
+                contador = [0, 0]
+                columnas = zip(
+                    self.interacciones.columna("mensaje_cliente"),
+                    self.interacciones.columna("resultado"),
+                )
+                for mensaje, resultado in columnas:
+                    claves_interaccion = set(self._extraer_palabras_clave(mensaje))
+                    if self._coincide_patron(patron, mensaje.lower(), claves_interaccion):
+                        contador[0] += 1
+                        if resultado == "exitoso":
+                            contador[1] += 1
+            self._contadores_patron[patron.id] = contador
         
-        if not interacciones_patron:
+        coincidencias, exitosas = contador
+        if not coincidencias:
             return 0.0
         
-        exitosas = sum(1 for i in interacciones_patron if i.resultado == "exitoso")
-        return exitosas / len(interacciones_patron)
+        return exitosas / coincidencias
     
     def _actualizar_conocimiento_productos(self, interaccion: InteraccionCliente, palabras_clave: List[str]):
         """Actualiza el conocimiento sobre productos"""
@@ -496,55 +1030,65 @@ class BaseConocimientoDinamica:
         self.insights_automaticos.append(insight)
     
     def actualizar_conocimiento(self):
-        """Actualiza el conocimiento general del sistema"""
+        """
+        Recálculo completo del conocimiento general del sistema.
+        Recorre todo el historial, por lo que debe ejecutarse como job
+        periódico o a demanda, no por cada mensaje.
+        """
+        self._reconstruir_agregados()
         self._actualizar_metricas_evolucion()
         self._limpiar_conocimiento_obsoleto()
-        self._generar_recomendaciones_sistema()
+        return self._generar_recomendaciones_sistema()
     
     def _actualizar_metricas_evolucion(self):
-        """Actualiza métricas de evolución del sistema"""
+        """Actualiza métricas de evolución del sistema a partir de los agregadores"""
         ahora = datetime.datetime.now()
+        hoy = ahora.date()
         
-        # Métricas de interacciones
-        interacciones_hoy = [
-            i for i in self.interacciones 
-            if i.timestamp.date() == ahora.date()
-        ]
-        
-        interacciones_semana = [
-            i for i in self.interacciones 
-            if (ahora - i.timestamp).days <= 7
-        ]
-        
-        # Métricas de ventas
-        ventas_hoy = [i for i in interacciones_hoy if i.tipo_interaccion == "venta"]
-        ventas_semana = [i for i in interacciones_semana if i.tipo_interaccion == "venta"]
+        # Métricas de interacciones y ventas (ventana semanal por día calendario)
+        conteo_hoy = self._conteo_por_dia.get(hoy, (0, 0))
+        interacciones_semana = 0
+        ventas_semana = 0
+        for dias in range(8):
+            conteo = self._conteo_por_dia.get(hoy - datetime.timedelta(days=dias))
+            if conteo:
+                interacciones_semana += conteo[0]
+                ventas_semana += conteo[1]
         
         # Métricas de satisfacción
-        satisfacciones = [i.satisfaccion_cliente for i in self.interacciones if i.satisfaccion_cliente]
-        satisfaccion_promedio = statistics.mean(satisfacciones) if satisfacciones else 0
+        satisfaccion_promedio = (
+            self._suma_satisfaccion / self._cantidad_satisfaccion
+            if self._cantidad_satisfaccion else 0
+        )
         
         self.metricas_evolucion = {
             "fecha_actualizacion": ahora.isoformat(),
-            "interacciones_hoy": len(interacciones_hoy),
-            "interacciones_semana": len(interacciones_semana),
-            "ventas_hoy": len(ventas_hoy),
-            "ventas_semana": len(ventas_semana),
+            "interacciones_hoy": conteo_hoy[0],
+            "interacciones_semana": interacciones_semana,
+            "ventas_hoy": conteo_hoy[1],
+            "ventas_semana": ventas_semana,
             "satisfaccion_promedio": satisfaccion_promedio,
             "total_interacciones": len(self.interacciones),
             "total_patrones": len(self.patrones_venta),
             "total_insights": len(self.insights_automaticos)
         }
     
-    def _limpiar_conocimiento_obsoleto(self):
-        """Limpia conocimiento obsoleto o poco relevante"""
-        # Limpiar patrones con baja frecuencia y tasa de éxito
+    def _limpiar_patrones_obsoletos(self):
+        """Limpia patrones con baja frecuencia y tasa de éxito"""
         patrones_validos = []
         for patron in self.patrones_venta:
             if patron.frecuencia >= 3 and patron.tasa_exito >= 0.3:
                 patrones_validos.append(patron)
+            else:
+                self._contadores_patron.pop(patron.id, None)
+                self._desindexar_patron(patron)
         
         self.patrones_venta = patrones_validos
+    
+    def _limpiar_conocimiento_obsoleto(self):
+        """Limpia conocimiento obsoleto o poco relevante"""
+        # Limpiar patrones con baja frecuencia y tasa de éxito
+        self._limpiar_patrones_obsoletos()
         
         # Limpiar insights antiguos (más de 30 días)
         ahora = datetime.datetime.now()
@@ -591,33 +1135,41 @@ class BaseConocimientoDinamica:
         palabras_clave = self._extraer_palabras_clave(mensaje_cliente)
         tipo_consulta = self._identificar_tipo_consulta(mensaje_cliente)
         
-        # Buscar patrones similares exitosos
-        patrones_similares = []
-        for patron in self.patrones_venta:
-            similitud = len(set(palabras_clave) & set(patron.palabras_clave))
-            if similitud > 0:
-                patrones_similares.append((patron, similitud))
-        
-        # Ordenar por similitud y tasa de éxito
-        patrones_similares.sort(key=lambda x: (x[1], x[0].tasa_exito), reverse=True)
+        # Buscar patrones similares exitosos (por similitud y tasa de éxito)
+        patrones_similares = self.buscar_patrones_similares(palabras_clave, k=1)
         
         if patrones_similares:
             mejor_patron = patrones_similares[0][0]
             return self._generar_respuesta_basada_en_patron(mejor_patron, mensaje_cliente, contexto)
         
         # Buscar respuestas efectivas similares
-        respuestas_efectivas = []
-        for interaccion in self.interacciones:
-            if (interaccion.resultado == "exitoso" and 
-                any(palabra in interaccion.mensaje_cliente.lower() for palabra in palabras_clave)):
-                respuestas_efectivas.append(interaccion.respuesta_agente)
+        respuestas_efectivas = self.buscar_interacciones_similares(palabras_clave, k=1)
         
         if respuestas_efectivas:
-            return respuestas_efectivas[0]  # Usar la primera respuesta efectiva encontrada
+            return respuestas_efectivas[0][0].respuesta_agente
         
         # Respuesta por defecto
         return self._generar_respuesta_por_defecto(mensaje_cliente, contexto)
     
+    def buscar_patrones_similares(self, palabras_clave: List[str], k: int = 5) -> List[Tuple[PatronVenta, int]]:
+        """
+        Retorna hasta k patrones que comparten palabras clave, ordenados por
+        similitud (claves en común) y tasa de éxito
+        """
+        candidatos = self._indice_patrones.top_k(
+            palabras_clave, k,
+            desempate=lambda doc_id: self._patrones_indexados[doc_id].tasa_exito
+        )
+        return [(self._patrones_indexados[doc_id], similitud) for doc_id, similitud in candidatos]
+    
+    def buscar_interacciones_similares(self, palabras_clave: List[str], k: int = 5) -> List[Tuple[InteraccionCliente, int]]:
+        """
+        Retorna hasta k interacciones exitosas que comparten palabras clave,
+        ordenadas por similitud (claves en común)
+        """
+        candidatos = self._indice_interacciones_exitosas.top_k(palabras_clave, k)
+        return [(self.interacciones[posicion], similitud) for posicion, similitud in candidatos]
+    
     def _generar_respuesta_basada_en_patron(self, patron: PatronVenta, mensaje: str, contexto: Dict[str, Any]) -> str:
         """Genera respuesta basada en patrón exitoso"""
         return f"Basándome en experiencias exitosas similares: {patron.estrategia_recomendada}"
@@ -641,35 +1193,136 @@ class BaseConocimientoDinamica:
             json.dump(conocimiento_exportar, f, ensure_ascii=False, indent=2, default=str)
     
     def importar_conocimiento(self, archivo: str):
-        """Importa conocimiento desde un archivo JSON"""
-        with open(archivo, 'r', encoding='utf-8') as f:
-            conocimiento = json.load(f)
+        """Importa conocimiento desde un archivo JSON (vía snapshot compilado si está habilitado)"""
+        compilado = self._cargar_conocimiento_compilado(Path(archivo))
+        
+        self._agregar_interacciones(compilado['interacciones'])
+        self._agregar_patrones(compilado['patrones_venta'])
+        self.conocimiento_productos.update(compilado['conocimiento_productos'])
+        
+        if compilado['metricas_evolucion']:
+            self._fusionar_metricas_evolucion(compilado['metricas_evolucion'])
+        if compilado['insights_automaticos']:
+            self.insights_automaticos.extend(compilado['insights_automaticos'])
+    
+    def _compilar_conocimiento(self, conocimiento: Dict[str, Any]) -> Dict[str, Any]:
+        """Convierte el JSON de conocimiento en dataclasses listas para usar"""
+        interacciones = HistorialInteracciones(
+            interaccion
+            for interaccion in map(self._crear_interaccion_desde_dict, conocimiento.get('interacciones', []))
+            if interaccion
+        )
+        patrones = [
+            patron
+            for patron in map(self._crear_patron_desde_dict, conocimiento.get('patrones_venta', []))
+            if patron
+        ]
+        productos = {}
+        for producto_id, datos in (conocimiento.get('conocimiento_productos') or {}).items():
+            producto = self._crear_conocimiento_producto(producto_id, datos)
+            if producto:
+                productos[producto_id] = producto
+        return {
+            'interacciones': interacciones,
+            'patrones_venta': patrones,
+            'conocimiento_productos': productos,
+            'metricas_evolucion': conocimiento.get('metricas_evolucion') or {},
+            'insights_automaticos': self._importar_insights(conocimiento.get('insights_automaticos') or []),
+        }
+    
+    def _cargar_conocimiento_compilado(self, ruta: Path) -> Dict[str, Any]:
+        """
+        Devuelve el conocimiento compilado de un archivo JSON.
         
-        self._importar_interacciones(conocimiento.get('interacciones', []))
-        self._importar_patrones(conocimiento.get('patrones_venta', []))
-        self._importar_productos(conocimiento.get('conocimiento_productos', {}))
+        El snapshot (pickle) se comparte en memoria entre todas las instancias del
+        proceso y se persiste en disco junto con el hash del JSON fuente; cada
+        llamada deserializa una copia propia, por lo que las instancias no
+        comparten objetos mutables.
+        """
+        config_snapshot = self.config_conocimiento.get("carga_conocimiento", {}).get("snapshot", {})
+        if not config_snapshot.get("habilitado", True):
+            with open(ruta, 'r', encoding='utf-8') as f:
+                return self._compilar_conocimiento(json.load(f))
+        
+        estado = ruta.stat()
+        clave = (str(ruta.resolve()), estado.st_size, estado.st_mtime_ns)
+        with _snapshots_lock:
+            datos = _snapshots_en_memoria.get(clave)
+            if datos is None:
+                datos = self._leer_o_generar_snapshot(ruta, config_snapshot)
+                _snapshots_en_memoria[clave] = datos
+        return pickle.loads(datos)['conocimiento']
+    
+    def _leer_o_generar_snapshot(self, ruta: Path, config_snapshot: Dict[str, Any]) -> bytes:
+        """Lee el snapshot de disco si coincide con la fuente; si no, lo regenera"""
+        contenido = ruta.read_bytes()
+        hash_fuente = hashlib.sha256(contenido).hexdigest()
+        archivo_snapshot = (
+            self._resolver_ruta_archivo(config_snapshot.get("directorio", ".knowledge_cache"))
+            / f"{ruta.name}.snapshot"
+        )
+        
+        try:
+            datos = archivo_snapshot.read_bytes()
+            encabezado = pickle.loads(datos)
+            if (
+                encabezado.get('version') == SNAPSHOT_SCHEMA_VERSION
+                and encabezado.get('hash_fuente') == hash_fuente
+            ):
+                return datos
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️  Snapshot inválido {archivo_snapshot.name}, se regenera: {e}")
         
-        if conocimiento.get('metricas_evolucion'):
-            self._fusionar_metricas_evolucion(conocimiento['metricas_evolucion'])
-        if conocimiento.get('insights_automaticos'):
-            nuevos_insights = self._importar_insights(conocimiento['insights_automaticos'])
-            if nuevos_insights:
-                self.insights_automaticos.extend(nuevos_insights)
+        compilado = self._compilar_conocimiento(json.loads(contenido.decode('utf-8')))
+        datos = pickle.dumps(
+            {'version': SNAPSHOT_SCHEMA_VERSION, 'hash_fuente': hash_fuente, 'conocimiento': compilado},
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        try:
+            archivo_snapshot.parent.mkdir(parents=True, exist_ok=True)
+            temporal = archivo_snapshot.with_name(f"{archivo_snapshot.name}.{os.getpid()}.tmp")
+            temporal.write_bytes(datos)
+            os.replace(temporal, archivo_snapshot)
+        except OSError as e:
+            print(f"⚠️  No se pudo guardar el snapshot {archivo_snapshot}: {e}")
+        return datos
     
     def _importar_interacciones(self, interacciones: List[Dict[str, Any]]):
         """Importa interacciones desde una lista de diccionarios"""
-        for datos in interacciones:
-            interaccion = self._crear_interaccion_desde_dict(datos)
-            if interaccion:
-                self.interacciones.append(interaccion)
+        self._agregar_interacciones(
+            interaccion
+            for interaccion in map(self._crear_interaccion_desde_dict, interacciones)
+            if interaccion
+        )
+    
+    def _agregar_interacciones(self, interacciones: Iterable[InteraccionCliente]):
+        """Agrega interacciones ya construidas, actualizando agregados e índices"""
+        if not len(self.interacciones) and isinstance(interacciones, HistorialInteracciones):
+            # Historial vacío: se adopta el compilado y se indexa por columnas
+            self.interacciones = interacciones
+            return
+        for interaccion in interacciones:
+            self.interacciones.append(interaccion)
+            self._registrar_en_agregados(interaccion)
+            claves = set(self._extraer_palabras_clave(interaccion.mensaje_cliente))
+            self._indexar_interaccion(len(self.interacciones) - 1, interaccion, claves)
+        # Los contadores de patrones se recalculan a demanda
+        self._contadores_patron = {}
     
     def _importar_patrones(self, patrones: List[Dict[str, Any]]):
         """Importa patrones de venta desde una lista"""
+        self._agregar_patrones(
+            patron for patron in map(self._crear_patron_desde_dict, patrones) if patron
+        )
+    
+    def _agregar_patrones(self, patrones: Iterable[PatronVenta]):
+        """Agrega patrones ya construidos, reemplazando los de igual ID si corresponde"""
         config_consolidacion = self.config_conocimiento.get("consolidacion", {})
         evitar_duplicados = config_consolidacion.get("evitar_duplicados", True)
         
-        for datos in patrones:
-            patron = self._crear_patron_desde_dict(datos)
+        for patron in patrones:
             if patron:
                 if evitar_duplicados:
                     # Buscar si ya existe un patrón con el mismo ID
@@ -681,13 +1334,16 @@ class BaseConocimientoDinamica:
                     
                     if indice_existente is not None:
                         # Reemplazar el patrón existente con el nuevo (más actualizado)
+                        self._desindexar_patron(self.patrones_venta[indice_existente])
                         self.patrones_venta[indice_existente] = patron
+                        self._contadores_patron.pop(patron.id, None)
                     else:
                         # No existe, agregar nuevo patrón
                         self.patrones_venta.append(patron)
                 else:
                     # Si no se evitan duplicados, simplemente agregar
                     self.patrones_venta.append(patron)
+                self._indexar_patron(patron)
     
     def _importar_productos(self, productos: Dict[str, Any]):
         """Importa conocimiento de productos"""
@@ -146,7 +146,7 @@ def demo_busqueda_cotizaciones():
     for cotizacion in resultados:
         print(f"- {cotizacion.id}: {cotizacion.cliente.nombre}")
     
-    print(f"\nTotal de cotizaciones: {len(sistema.cotizaciones)}")
+    print(f"\nTotal de cotizaciones: {sistema.contar_cotizaciones()}")
 
 
 def demo_exportacion():
@@ -218,14 +218,15 @@ def demo_estadisticas():
             especificaciones=especificaciones,
             asignado_a="MA"
         )
-        cotizacion.estado = estados[i]
+        sistema.actualizar_estado_cotizacion(cotizacion.id, estados[i])
     
     # Mostrar estadísticas
-    print(f"Total de cotizaciones: {len(sistema.cotizaciones)}")
+    cotizaciones = sistema.cotizaciones
+    print(f"Total de cotizaciones: {len(cotizaciones)}")
     
     # Estadísticas por estado
     estados_count = {}
-    for cotizacion in sistema.cotizaciones:
+    for cotizacion in cotizaciones:
         estado = cotizacion.estado
         estados_count[estado] = estados_count.get(estado, 0) + 1
     
@@ -235,7 +236,7 @@ def demo_estadisticas():
     
     # Estadísticas por producto
     productos_count = {}
-    for cotizacion in sistema.cotizaciones:
+    for cotizacion in cotizaciones:
         producto = cotizacion.especificaciones.producto
         productos_count[producto] = productos_count.get(producto, 0) + 1
     
@@ -173,7 +173,7 @@ def demo_conversacion_completa():
     
     # Mostrar estadísticas del sistema
     print(f"\n📊 **ESTADÍSTICAS DEL SISTEMA:**")
-    print(f"• Total de cotizaciones: {len(sistema.cotizaciones)}")
+    print(f"• Total de cotizaciones: {sistema.contar_cotizaciones()}")
     print(f"• Productos disponibles: {len(sistema.productos)}")
     print(f"• Estado de la cotización: {cotizacion.estado}")
     print(f"• Asignado a: {cotizacion.asignado_a}")
@@ -224,14 +224,15 @@ def demo_multiples_cotizaciones():
     
     # Estadísticas finales
     print(f"\n📊 **ESTADÍSTICAS FINALES:**")
-    print(f"Total de cotizaciones: {len(sistema.cotizaciones)}")
+    cotizaciones = sistema.cotizaciones
+    print(f"Total de cotizaciones: {len(cotizaciones)}")
     
-    total_ventas = sum(float(cot.precio_total) for cot in sistema.cotizaciones)
+    total_ventas = sum(float(cot.precio_total) for cot in cotizaciones)
     print(f"Total en ventas: ${total_ventas:.2f}")
     
     # Productos más cotizados
     productos = {}
-    for cot in sistema.cotizaciones:
+    for cot in cotizaciones:
         prod = cot.especificaciones.producto
         productos[prod] = productos.get(prod, 0) + 1
     
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generador de IDs únicos, ordenables y sin locks
+Usado para cotizaciones, interacciones y sesiones.
+
+Formato estilo ULID: 128 bits codificados en 26 caracteres Crockford base32.
+    48 bits  milisegundos desde la época
+    40 bits  identificador aleatorio del proceso (se renueva tras fork)
+    40 bits  secuencia del proceso (itertools.count: atómico bajo el GIL)
+
+Los IDs ordenan por tiempo; dentro de un mismo proceso son estrictamente
+crecientes, y dos procesos (p. ej. workers de uvicorn) nunca comparten el
+identificador de proceso salvo colisión aleatoria de 40 bits.
+"""
+
+import itertools
+import os
+import secrets
+import time
+
+_ALFABETO = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_MASCARA_40 = (1 << 40) - 1
+
+
+class GeneradorIds:
+    """Genera IDs de 26 caracteres monotónicos por proceso"""
+
+    def __init__(self):
+        self._reiniciar_proceso()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reiniciar_proceso)
+
+    def _reiniciar_proceso(self):
+        self._proceso = secrets.randbits(40)
+        self._secuencia = itertools.count(secrets.randbits(20))
+        self._ultimo_ms = 0
+
+    def nuevo(self) -> str:
+        """Devuelve un ID nuevo"""
+        secuencia = next(self._secuencia)
+        milisegundos = time.time_ns() // 1_000_000
+        # Si el reloj retrocede se mantiene el último instante visto; la
+        # secuencia garantiza el orden dentro del mismo milisegundo
+        if milisegundos < self._ultimo_ms:
+            milisegundos = self._ultimo_ms
+        else:
+            self._ultimo_ms = milisegundos
+        valor = (milisegundos << 80) | (self._proceso << 40) | (secuencia & _MASCARA_40)
+        caracteres = []
+        for _ in range(26):
+            caracteres.append(_ALFABETO[valor & 31])
+            valor >>= 5
+        return "".join(reversed(caracteres))
+
+
+def milisegundos_de_id(identificador: str) -> int:
+    """Extrae el timestamp (ms desde la época) de un ID, con o sin prefijo"""
+    valor = 0
+    for caracter in identificador[-26:]:
+        valor = (valor << 5) | _ALFABETO.index(caracter)
+    return valor >> 80
+
+
+_generador = GeneradorIds()
+
+
+def nuevo_id(prefijo: str = "") -> str:
+    """Genera un ID único con un prefijo opcional (p. ej. "COT-", "ia_")"""
+    return f"{prefijo}{_generador.nuevo()}"
@@ -5,15 +5,22 @@ IA Conversacional Integrada BMC Uruguay
 Sistema de IA que aprende y evoluciona constantemente
 """
 
+import asyncio
 import json
 import datetime
 import re
 import os
-from typing import Dict, List, Any, Optional, Tuple
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
 from decimal import Decimal
 import random
 from base_conocimiento_dinamica import BaseConocimientoDinamica, InteraccionCliente
+from generador_ids import nuevo_id
+from presupuesto_prompt import PresupuestoExcedido, PresupuestoTokens, truncar_a_tokens
 from motor_analisis_conversiones import MotorAnalisisConversiones
 from sistema_cotizaciones import (
     SistemaCotizacionesBMC,
@@ -28,13 +35,102 @@ from utils_cotizaciones import (
 
 # OpenAI integration
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI, OpenAI
 
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
     print("Warning: OpenAI package not installed. Using pattern matching only.")
 
+# Motor de coincidencias compilado (compartido con LanguageProcessor)
+_PYTHON_SCRIPTS = str(Path(__file__).parent / "python-scripts")
+if _PYTHON_SCRIPTS not in sys.path:
+    sys.path.append(_PYTHON_SCRIPTS)
+from keyword_matcher import CompiledMatcher
+
+# Las palabras con "*" son raíces: coinciden con cualquier palabra que empiece
+# así ("cotizar*" -> "cotizarlo", "precio*" -> "precios")
+PATRONES_INTENCION = {
+    "saludo": ["hola", "buenos", "buenas", "hi", "hello"],
+    "despedida": ["gracias", "chau", "adios", "bye", "hasta luego"],
+    "cotizacion": ["cotizar*", "precio*", "costo*", "cuanto*", "presupuesto*"],
+    "informacion": [
+        "informacion",
+        "información",
+        "caracteristicas",
+        "especificaciones",
+        "que es",
+        "necesito",
+        "sobre",
+        "acerca",
+        "techo*",
+        "aislamiento",
+    ],
+    "producto": ["isodec", "poliestireno", "lana", "producto*"],
+    "instalacion": ["instalar*", "instalacion*", "montaje", "colocacion*"],
+    "servicio": ["servicio*", "garantia*", "soporte", "atención"],
+    "objecion": ["caro", "costoso*", "no estoy seguro", "dudar"],
+}
+
+PATRONES_DIMENSIONES = [
+    r"(\d+(?:\.\d+)?)\s*[x×]\s*(\d+(?:\.\d+)?)",
+    r"(\d+(?:\.\d+)?)\s*metros?\s*[x×]\s*(\d+(?:\.\d+)?)\s*metros?",
+    r"(\d+(?:\.\d+)?)\s*m\s*[x×]\s*(\d+(?:\.\d+)?)\s*m",
+]
+PATRON_TELEFONO = r"(\+?598\s?)?(\d{2,3}\s?\d{3}\s?\d{3})"
+PATRON_PRESENTACION = re.compile(
+    r"(?:me llamo|soy|mi nombre es)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)+)",
+    re.IGNORECASE,
+)
+PATRON_NOMBRE_SIMPLE = re.compile(
+    r"^([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)$"
+)
+# Si el mensaje tiene alguna de estas palabras no se toma como "Nombre Apellido"
+PALABRAS_NO_NOMBRE = [
+    "producto",
+    "productos",
+    "isodec",
+    "poliestireno",
+    "lana",
+    "metro",
+    "metros",
+    "espesor",
+    "espesores",
+    "precio",
+    "precios",
+]
+
+
+PLANTILLA_PROMPT_SISTEMA = """Eres Superchapita, un asistente experto en ventas de productos de construcción de BMC Uruguay.
+Tu trabajo es ayudar a los clientes con:
+1. Información sobre productos de aislamiento térmico (Isodec, Poliestireno, Lana de Roca)
+2. Cotizaciones personalizadas
+3. Consultas técnicas
+4. Seguimiento de pedidos
+
+{info_productos}
+
+Responde de forma natural, conversacional y profesional en español de Uruguay.
+Si el cliente solicita una cotización, pide los datos necesarios: producto, dimensiones (largo x ancho), espesor, color.
+Sé conciso pero completo. Usa emojis moderadamente.
+
+{instrucciones_formato}"""
+
+INSTRUCCIONES_FORMATO_JSON = """IMPORTANTE: Debes responder SIEMPRE en formato JSON con esta estructura exacta:
+{
+  "mensaje": "tu respuesta al cliente aquí",
+  "tipo": "cotizacion|informacion|pregunta|seguimiento|general",
+  "acciones": ["accion1", "accion2"],
+  "confianza": 0.95,
+  "necesita_datos": ["dato1", "dato2"]
+}
+
+El campo "tipo" debe ser uno de: cotizacion, informacion, pregunta, seguimiento, general.
+El campo "confianza" debe ser un número entre 0.0 y 1.0.
+El campo "necesita_datos" debe ser una lista de datos que faltan para completar una cotización (ej: ["producto", "dimensiones", "espesor"])."""
+
+INSTRUCCIONES_FORMATO_TEXTO = """IMPORTANTE: Responde solo con el texto del mensaje para el cliente, sin JSON ni otro formato, porque se le muestra a medida que se genera."""
+
 
 @dataclass
 class ContextoConversacion:
@@ -52,6 +148,7 @@ class ContextoConversacion:
     confianza_respuesta: float
     timestamp_inicio: datetime.datetime
     timestamp_ultima_actividad: datetime.datetime
+    resumen_historial: str = ""
 
 
 @dataclass
@@ -98,6 +195,7 @@ class IAConversacionalIntegrada:
         # OpenAI configuration
         self.use_ai = False
         self.openai_client = None
+        self.async_openai_client = None
         self.openai_model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
         if OPENAI_AVAILABLE:
@@ -105,6 +203,7 @@ class IAConversacionalIntegrada:
             if api_key:
                 try:
                     self.openai_client = OpenAI(api_key=api_key)
+                    self.async_openai_client = AsyncOpenAI(api_key=api_key)
                     self.use_ai = True
                     print("✅ OpenAI integration enabled")
                 except Exception as e:
@@ -115,6 +214,33 @@ class IAConversacionalIntegrada:
         else:
             print("⚠️ OpenAI package not available, using pattern matching only")
 
+        # Worker pool acotado para la ruta async: el pattern matcher y el
+        # registro en la base de conocimiento son CPU-bound y no deben
+        # bloquear el event loop. El lock serializa el acceso al estado
+        # compartido (contextos, base de conocimiento) entre workers.
+        self.max_workers = int(os.getenv("IA_MAX_WORKERS", "4"))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.RLock()
+
+        # Armado del prompt: secciones estáticas compiladas por versión del
+        # catálogo y presupuesto de tokens por petición
+        self._prompts_compilados: Dict[bool, str] = {}
+        self._version_prompts: Optional[int] = None
+        self.prompt_max_tokens = int(os.getenv("IA_PROMPT_MAX_TOKENS", "3000"))
+        self.historial_max_mensajes = int(os.getenv("IA_HISTORIAL_MAX_MENSAJES", "5"))
+        self.historial_max_tokens_mensaje = int(
+            os.getenv("IA_HISTORIAL_MAX_TOKENS_MENSAJE", "250")
+        )
+        self.presupuesto_prompt = PresupuestoTokens(
+            self.prompt_max_tokens, self.openai_model
+        )
+        self.estadisticas_prompt = {
+            "peticiones": 0,
+            "tokens_total": 0,
+            "tokens_max": 0,
+            "mensajes_descartados": 0,
+        }
+
         self.cargar_configuracion_inicial()
 
     def cargar_configuracion_inicial(self):
@@ -175,13 +301,33 @@ class IAConversacionalIntegrada:
                 "instalacion",
             ],
         }
+        self.matcher = self._compilar_matcher()
+
+    def _compilar_matcher(self) -> CompiledMatcher:
+        """Intenciones, entidades reconocidas y patrones en un solo matcher"""
+        matcher = CompiledMatcher()
+        self._etiquetas_intencion = [(i, f"intencion:{i}") for i in PATRONES_INTENCION]
+        for (_, etiqueta), palabras in zip(self._etiquetas_intencion, PATRONES_INTENCION.values()):
+            matcher.add_keywords(etiqueta, palabras)
+        self._etiquetas_entidades = {
+            tipo: [(valor, f"{tipo}:{valor}") for valor in self.entidades_reconocidas[tipo]]
+            for tipo in ("productos", "espesores", "colores")
+        }
+        for etiquetas in self._etiquetas_entidades.values():
+            for valor, etiqueta in etiquetas:
+                matcher.add_keywords(etiqueta, [valor])
+        for patron in PATRONES_DIMENSIONES:
+            matcher.add_pattern("dimensiones", patron, re.IGNORECASE)
+        matcher.add_pattern("telefono", PATRON_TELEFONO)
+        matcher.add_keywords("no_nombre", PALABRAS_NO_NOMBRE)
+        return matcher
 
     def procesar_mensaje(
         self, mensaje: str, cliente_id: str, sesion_id: str = None
     ) -> RespuestaIA:
         """Procesa un mensaje del cliente y genera respuesta"""
         if not sesion_id:
-            sesion_id = f"sesion_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+            sesion_id = nuevo_id("sesion_")
 
         # Obtener o crear contexto de conversación
         contexto = self._obtener_contexto_conversacion(cliente_id, sesion_id)
@@ -211,18 +357,8 @@ class IAConversacionalIntegrada:
             and contexto.sesion_id
         ):
             try:
-                # Add assistant message
-                self.shared_context_service.add_message(
-                    contexto.sesion_id,
-                    respuesta.mensaje,
-                    "assistant",
-                    {
-                        "intent": intencion,
-                        "entities": entidades,
-                        "confidence": respuesta.confianza,
-                    },
-                )
-                # Save full context
+                # Save context state (the message log is append-only and
+                # written below, one message at a time)
                 context_dict = {
                     "user_phone": contexto.cliente_id,
                     "cliente_id": contexto.cliente_id,
@@ -233,20 +369,23 @@ class IAConversacionalIntegrada:
                         "datos_cliente": contexto.datos_cliente,
                         "datos_producto": contexto.datos_producto,
                     },
-                    "messages": [
-                        {
-                            "role": msg.get("tipo") == "cliente"
-                            and "user"
-                            or "assistant",
-                            "content": msg.get("mensaje", ""),
-                            "timestamp": msg.get("timestamp", datetime.datetime.now()),
-                        }
-                        for msg in contexto.mensajes_intercambiados
-                    ],
                 }
                 self.shared_context_service.save_context(
                     contexto.sesion_id, context_dict
                 )
+                self.shared_context_service.add_message(
+                    contexto.sesion_id, mensaje, "user"
+                )
+                self.shared_context_service.add_message(
+                    contexto.sesion_id,
+                    respuesta.mensaje,
+                    "assistant",
+                    {
+                        "intent": intencion,
+                        "entities": entidades,
+                        "confidence": respuesta.confianza,
+                    },
+                )
             except Exception as e:
                 print(f"Warning: Failed to save context to shared service: {e}")
 
@@ -296,6 +435,7 @@ class IAConversacionalIntegrada:
                         confianza_respuesta=0.8,
                         timestamp_inicio=datetime.datetime.now(),
                         timestamp_ultima_actividad=datetime.datetime.now(),
+                        resumen_historial=shared_context.get("summary", ""),
                     )
                     # Store in active conversations for backward compatibility
                     self.conversaciones_activas[clave_contexto] = contexto
@@ -339,74 +479,27 @@ class IAConversacionalIntegrada:
 
     def _analizar_intencion(self, mensaje: str) -> str:
         """Analiza la intención del mensaje del cliente"""
-        mensaje_lower = mensaje.lower()
-
-        # Patrones de intención
-        patrones_intencion = {
-            "saludo": ["hola", "buenos", "buenas", "hi", "hello"],
-            "despedida": ["gracias", "chau", "adios", "bye", "hasta luego"],
-            "cotizacion": ["cotizar", "precio", "costo", "cuanto", "presupuesto"],
-            "informacion": [
-                "informacion",
-                "información",
-                "caracteristicas",
-                "especificaciones",
-                "que es",
-                "necesito",
-                "sobre",
-                "acerca",
-                "techos",
-                "techo",
-                "aislamiento",
-            ],
-            "producto": ["isodec", "poliestireno", "lana", "producto", "productos"],
-            "instalacion": ["instalar", "instalacion", "montaje", "colocacion"],
-            "servicio": ["servicio", "garantia", "soporte", "atención"],
-            "objecion": ["caro", "costoso", "no estoy seguro", "dudar"],
-        }
-
-        # Calcular puntuación para cada intención
-        puntuaciones = {}
-        for intencion, palabras in patrones_intencion.items():
-            puntuacion = sum(1 for palabra in palabras if palabra in mensaje_lower)
-            puntuaciones[intencion] = puntuacion
+        puntuaciones = self.matcher.match(mensaje).scores
 
-        # Retornar intención con mayor puntuación
-        if puntuaciones:
-            intencion_principal = max(puntuaciones, key=puntuaciones.get)
-            if puntuaciones[intencion_principal] > 0:
-                return intencion_principal
+        # Retornar intención con mayor puntuación (en empate, la primera)
+        mejor, puntuacion_mejor = "general", 0.0
+        for intencion, etiqueta in self._etiquetas_intencion:
+            puntuacion = puntuaciones.get(etiqueta, 0.0)
+            if puntuacion > puntuacion_mejor:
+                mejor, puntuacion_mejor = intencion, puntuacion
 
-        return "general"
+        return mejor
 
     def _extraer_entidades(self, mensaje: str) -> Dict[str, Any]:
         """Extrae entidades del mensaje"""
-        mensaje_lower = mensaje.lower()
+        resultado = self.matcher.match(mensaje)
         entidades = {}
 
-        # Extraer productos
-        productos_encontrados = []
-        for producto in self.entidades_reconocidas["productos"]:
-            if producto in mensaje_lower:
-                productos_encontrados.append(producto)
-        if productos_encontrados:
-            entidades["productos"] = productos_encontrados
-
-        # Extraer espesores
-        espesores_encontrados = []
-        for espesor in self.entidades_reconocidas["espesores"]:
-            if espesor in mensaje_lower:
-                espesores_encontrados.append(espesor)
-        if espesores_encontrados:
-            entidades["espesores"] = espesores_encontrados
-
-        # Extraer colores
-        colores_encontrados = []
-        for color in self.entidades_reconocidas["colores"]:
-            if color in mensaje_lower:
-                colores_encontrados.append(color)
-        if colores_encontrados:
-            entidades["colores"] = colores_encontrados
+        # Extraer productos, espesores y colores (en el orden de la lista)
+        for tipo, etiquetas in self._etiquetas_entidades.items():
+            encontrados = [valor for valor, etiqueta in etiquetas if etiqueta in resultado.scores]
+            if encontrados:
+                entidades[tipo] = encontrados
 
         # Extraer dimensiones
         dimensiones = self._extraer_dimensiones(mensaje)
@@ -428,31 +521,22 @@ class IAConversacionalIntegrada:
 
     def _extraer_dimensiones(self, mensaje: str) -> Optional[Dict[str, float]]:
         """Extrae dimensiones del mensaje"""
-        # Patrones para dimensiones
-        patrones = [
-            r"(\d+(?:\.\d+)?)\s*[x×]\s*(\d+(?:\.\d+)?)",
-            r"(\d+(?:\.\d+)?)\s*metros?\s*[x×]\s*(\d+(?:\.\d+)?)\s*metros?",
-            r"(\d+(?:\.\d+)?)\s*m\s*[x×]\s*(\d+(?:\.\d+)?)\s*m",
-        ]
-
-        for patron in patrones:
-            match = re.search(patron, mensaje, re.IGNORECASE)
-            if match:
-                try:
-                    largo = float(match.group(1))
-                    ancho = float(match.group(2))
-                    return {"largo": largo, "ancho": ancho}
-                except ValueError:
-                    continue
+        match = self.matcher.match(mensaje).first("dimensiones")
+        if match:
+            try:
+                largo = float(match.groups[0])
+                ancho = float(match.groups[1])
+                return {"largo": largo, "ancho": ancho}
+            except ValueError:
+                pass
 
         return None
 
     def _extraer_telefono(self, mensaje: str) -> Optional[str]:
         """Extrae número de teléfono del mensaje"""
-        patron = r"(\+?598\s?)?(\d{2,3}\s?\d{3}\s?\d{3})"
-        match = re.search(patron, mensaje)
+        match = self.matcher.match(mensaje).first("telefono")
         if match:
-            return match.group(0).replace(" ", "")
+            return match.text.replace(" ", "")
         return None
 
     def _extraer_nombre_apellido(self, mensaje: str) -> Optional[Dict[str, str]]:
@@ -461,8 +545,7 @@ class IAConversacionalIntegrada:
         # Ejemplos: "Me llamo Juan Perez", "Soy Maria Rodriguez", "Juan Perez"
 
         # Patrón: "me llamo/soy + nombre apellido"
-        patron_presentacion = r"(?:me llamo|soy|mi nombre es)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)+)"
-        match = re.search(patron_presentacion, mensaje, re.IGNORECASE)
+        match = PATRON_PRESENTACION.search(mensaje)
 
         if match:
             nombre_completo = match.group(1).strip()
@@ -472,20 +555,8 @@ class IAConversacionalIntegrada:
 
         # Patrón: dos palabras capitalizadas consecutivas (sin palabras clave antes)
         # Solo si no hay otras palabras clave en el mensaje
-        mensaje_limpio = mensaje.strip()
-        palabras_clave = [
-            "producto",
-            "isodec",
-            "poliestireno",
-            "lana",
-            "metro",
-            "espesor",
-            "precio",
-        ]
-
-        if not any(palabra in mensaje.lower() for palabra in palabras_clave):
-            patron_nombre_simple = r"^([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)*)$"
-            match = re.match(patron_nombre_simple, mensaje_limpio)
+        if "no_nombre" not in self.matcher.match(mensaje).scores:
+            match = PATRON_NOMBRE_SIMPLE.match(mensaje.strip())
 
             if match:
                 return {"nombre": match.group(1), "apellido": match.group(2)}
@@ -848,7 +919,7 @@ class IAConversacionalIntegrada:
     ):
         """Registra la interacción en la base de conocimiento"""
         interaccion = InteraccionCliente(
-            id=f"ia_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}",
+            id=nuevo_id("ia_"),
             timestamp=datetime.datetime.now(),
             cliente_id=contexto.cliente_id,
             tipo_interaccion="consulta_ia",
@@ -884,7 +955,7 @@ class IAConversacionalIntegrada:
         Retorna diccionario compatible con API
         """
         if not sesion_id:
-            sesion_id = f"sesion_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+            sesion_id = nuevo_id("sesion_")
 
         # Análisis rápido de intención (sin procesar completamente)
         intencion_rapida = self._analizar_intencion(mensaje)
@@ -910,67 +981,172 @@ class IAConversacionalIntegrada:
             # Si no hay IA, usar pattern matching
             return self._procesar_mensaje_patrones(mensaje, telefono_cliente, sesion_id)
 
-    def _procesar_con_openai(
-        self, mensaje: str, telefono_cliente: str, sesion_id: str
+    async def procesar_mensaje_usuario_async(
+        self, mensaje: str, telefono_cliente: str, sesion_id: str = None
     ) -> Dict[str, Any]:
-        """Procesa mensaje usando OpenAI"""
-        # Obtener contexto
-        contexto = self._obtener_contexto_conversacion(telefono_cliente, sesion_id)
+        """
+        Variante async de procesar_mensaje_usuario para servidores ASGI.
+        La llamada a OpenAI usa el cliente async y el trabajo CPU-bound
+        se delega al worker pool, de modo que el event loop nunca se bloquea.
+        """
+        if not sesion_id:
+            sesion_id = nuevo_id("sesion_")
+
+        intencion_rapida = self._analizar_intencion(mensaje)
+
+        if intencion_rapida in ["saludo", "despedida"]:
+            return await self._ejecutar_en_worker(
+                self._procesar_mensaje_patrones, mensaje, telefono_cliente, sesion_id
+            )
+
+        if self.use_ai and self.async_openai_client:
+            try:
+                return await self._procesar_con_openai_async(
+                    mensaje, telefono_cliente, sesion_id
+                )
+            except Exception as e:
+                print(f"⚠️ Error con OpenAI, usando pattern matching: {e}")
 
-        # Obtener historial reciente
-        historial = (
-            contexto.mensajes_intercambiados[-5:]
-            if len(contexto.mensajes_intercambiados) > 5
-            else contexto.mensajes_intercambiados
+        return await self._ejecutar_en_worker(
+            self._procesar_mensaje_patrones, mensaje, telefono_cliente, sesion_id
         )
 
-        # Obtener información de productos y precios para enriquecer el contexto
-        info_productos = self._obtener_info_productos_para_prompt()
-        estado_cotizacion = self._obtener_estado_cotizacion_para_prompt(contexto)
+    async def procesar_mensaje_usuario_stream(
+        self,
+        mensaje: str,
+        telefono_cliente: str,
+        sesion_id: str = None,
+        integrador: Any = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Variante en streaming de procesar_mensaje_usuario_async.
+        Emite {"type": "token", "content": ...} a medida que el modelo genera
+        y al final {"type": "done", ...} con el resultado en formato API más
+        las métricas del modelo (time_to_first_token, response_time).
+        Sin integrador con modelos disponibles (o para saludos/despedidas) la
+        respuesta completa se emite como un único token.
+        """
+        if not sesion_id:
+            sesion_id = nuevo_id("sesion_")
 
-        # Construir historial de conversación para OpenAI
-        messages = [
-            {
-                "role": "system",
-                "content": f"""Eres Superchapita, un asistente experto en ventas de productos de construcción de BMC Uruguay.
-Tu trabajo es ayudar a los clientes con:
-1. Información sobre productos de aislamiento térmico (Isodec, Poliestireno, Lana de Roca)
-2. Cotizaciones personalizadas
-3. Consultas técnicas
-4. Seguimiento de pedidos
+        intencion_rapida = self._analizar_intencion(mensaje)
+        if (
+            intencion_rapida in ["saludo", "despedida"]
+            or integrador is None
+            or not integrador.models
+        ):
+            resultado = await self.procesar_mensaje_usuario_async(
+                mensaje, telefono_cliente, sesion_id
+            )
+            yield {"type": "token", "content": resultado.get("mensaje", "")}
+            yield {"type": "done", **resultado}
+            return
 
-{info_productos}
+        try:
+            contexto, messages = await self._ejecutar_en_worker(
+                self._preparar_mensajes_openai, mensaje, telefono_cliente, sesion_id, False
+            )
+        except PresupuestoExcedido as e:
+            print(f"⚠️ Prompt fuera de presupuesto, usando pattern matching: {e}")
+            resultado = await self._ejecutar_en_worker(
+                self._procesar_mensaje_patrones, mensaje, telefono_cliente, sesion_id
+            )
+            yield {"type": "token", "content": resultado.get("mensaje", "")}
+            yield {"type": "done", **resultado}
+            return
+        sistema = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        historial = [m for m in messages[:-1] if m["role"] != "system"]
+
+        final = None
+        emitido = ""
+        async for evento in integrador.generate_stream(
+            mensaje, system_prompt=sistema, history=historial, temperature=0.7
+        ):
+            if evento["type"] == "token":
+                emitido += evento["content"]
+                yield evento
+            else:
+                final = evento
+
+        if final is None or final["type"] == "error":
+            error = final.get("error") if final else "stream interrumpido"
+            if emitido:
+                # El cliente ya recibió parte de la respuesta: no se le envía
+                # una segunda generada por pattern matching
+                print(f"⚠️ Error en streaming tras {len(emitido)} caracteres: {error}")
+                yield {"type": "error", "error": error}
+                yield {
+                    "type": "done",
+                    "mensaje": emitido,
+                    "tipo": "error",
+                    "acciones": [],
+                    "confianza": 0.0,
+                    "necesita_datos": [],
+                    "sesion_id": sesion_id,
+                    "timestamp": datetime.datetime.now().isoformat(),
+                }
+                return
+            print(f"⚠️ Error en streaming, usando pattern matching: {error}")
+            resultado = await self._ejecutar_en_worker(
+                self._procesar_mensaje_patrones, mensaje, telefono_cliente, sesion_id
+            )
+            yield {"type": "token", "content": resultado.get("mensaje", "")}
+            yield {"type": "done", **resultado}
+            return
+
+        resultado = await self._ejecutar_en_worker(
+            self._registrar_resultado_ia,
+            {"mensaje": final["content"], "tipo": self._tipo_por_intencion(intencion_rapida)},
+            mensaje,
+            contexto,
+            sesion_id,
+        )
+        yield {
+            "type": "done",
+            **resultado,
+            "model_used": final.get("model_used"),
+            "time_to_first_token": final.get("time_to_first_token"),
+            "response_time": final.get("response_time"),
+        }
 
-{estado_cotizacion}
+    @staticmethod
+    def _tipo_por_intencion(intencion: str) -> str:
+        """Tipo de respuesta API para una respuesta en texto plano"""
+        if intencion == "cotizacion":
+            return "cotizacion"
+        if intencion in ("informacion", "producto", "instalacion", "servicio"):
+            return "informacion"
+        return "general"
 
-Responde de forma natural, conversacional y profesional en español de Uruguay.
-Si el cliente solicita una cotización, pide los datos necesarios: producto, dimensiones (largo x ancho), espesor, color.
-Sé conciso pero completo. Usa emojis moderadamente.
+    async def _ejecutar_en_worker(self, funcion, *args):
+        """Ejecuta una función bloqueante en el worker pool acotado"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="ia_worker"
+            )
 
-IMPORTANTE: Debes responder SIEMPRE en formato JSON con esta estructura exacta:
-{{
-  "mensaje": "tu respuesta al cliente aquí",
-  "tipo": "cotizacion|informacion|pregunta|seguimiento|general",
-  "acciones": ["accion1", "accion2"],
-  "confianza": 0.95,
-  "necesita_datos": ["dato1", "dato2"]
-}}
+        def _con_lock():
+            with self._lock:
+                return funcion(*args)
 
-El campo "tipo" debe ser uno de: cotizacion, informacion, pregunta, seguimiento, general.
-El campo "confianza" debe ser un número entre 0.0 y 1.0.
-El campo "necesita_datos" debe ser una lista de datos que faltan para completar una cotización (ej: ["producto", "dimensiones", "espesor"]).""",
-            }
-        ]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _con_lock)
 
-        # Agregar historial
-        for msg in historial:
-            if msg["tipo"] == "cliente":
-                messages.append({"role": "user", "content": msg["mensaje"]})
-            else:
-                messages.append({"role": "assistant", "content": msg["mensaje"]})
+    async def cerrar(self):
+        """Libera el worker pool y el cliente async de OpenAI"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self.async_openai_client is not None:
+            await self.async_openai_client.close()
 
-        # Agregar mensaje actual
-        messages.append({"role": "user", "content": mensaje})
+    def _procesar_con_openai(
+        self, mensaje: str, telefono_cliente: str, sesion_id: str
+    ) -> Dict[str, Any]:
+        """Procesa mensaje usando OpenAI"""
+        contexto, messages = self._preparar_mensajes_openai(
+            mensaje, telefono_cliente, sesion_id
+        )
 
         # Llamar a OpenAI
         response = self.openai_client.chat.completions.create(
@@ -980,9 +1156,142 @@ El campo "necesita_datos" debe ser una lista de datos que faltan para completar
             response_format={"type": "json_object"},
         )
 
-        # Parsear respuesta
+        return self._procesar_respuesta_openai(response, mensaje, contexto, sesion_id)
+
+    async def _procesar_con_openai_async(
+        self, mensaje: str, telefono_cliente: str, sesion_id: str
+    ) -> Dict[str, Any]:
+        """Procesa mensaje usando el cliente async de OpenAI"""
+        contexto, messages = await self._ejecutar_en_worker(
+            self._preparar_mensajes_openai, mensaje, telefono_cliente, sesion_id
+        )
+
+        response = await self.async_openai_client.chat.completions.create(
+            model=self.openai_model,
+            messages=messages,
+            temperature=0.7,
+            response_format={"type": "json_object"},
+        )
+
+        return await self._ejecutar_en_worker(
+            self._procesar_respuesta_openai, response, mensaje, contexto, sesion_id
+        )
+
+    def _preparar_mensajes_openai(
+        self,
+        mensaje: str,
+        telefono_cliente: str,
+        sesion_id: str,
+        formato_json: bool = True,
+    ) -> Tuple[ContextoConversacion, List[Dict[str, str]]]:
+        """
+        Obtiene el contexto y construye los mensajes para OpenAI.
+        Con formato_json=False se pide texto plano (respuestas en streaming).
+
+        El primer mensaje (prompt de sistema con productos y precios) es
+        idéntico entre peticiones para que el proveedor pueda cachear el
+        prefijo; lo variable (estado de la cotización, resumen, historial)
+        va después y se recorta por prioridad para no superar
+        prompt_max_tokens. El prompt de sistema nunca se recorta: si no entra
+        se lanza PresupuestoExcedido y quien llama usa pattern matching.
+        """
+        # Obtener contexto
+        contexto = self._obtener_contexto_conversacion(telefono_cliente, sesion_id)
+
+        # (mensaje, prioridad): None es obligatorio; se descarta primero la
+        # prioridad más baja
+        candidatos = [
+            ({"role": "system", "content": self._obtener_prompt_sistema(formato_json)}, None)
+        ]
+
+        estado_cotizacion = self._obtener_estado_cotizacion_para_prompt(contexto)
+        if estado_cotizacion:
+            candidatos.append(({"role": "system", "content": estado_cotizacion}, 100))
+
+        # Resumen de los mensajes que ya salieron de la ventana del historial
+        if contexto.resumen_historial:
+            candidatos.append(
+                (
+                    {
+                        "role": "system",
+                        "content": "Resumen de la conversación anterior:\n"
+                        + contexto.resumen_historial,
+                    },
+                    20,
+                )
+            )
+
+        # Historial reciente: los mensajes largos se acortan y, si no entra
+        # todo, se descartan primero los más viejos (los dos últimos pesan
+        # más que el resumen)
+        historial = contexto.mensajes_intercambiados[-self.historial_max_mensajes:]
+        for posicion, msg in enumerate(historial):
+            desde_el_final = len(historial) - posicion
+            candidatos.append(
+                (
+                    {
+                        "role": "user" if msg["tipo"] == "cliente" else "assistant",
+                        "content": truncar_a_tokens(
+                            msg["mensaje"], self.historial_max_tokens_mensaje
+                        ),
+                    },
+                    (50 if desde_el_final <= 2 else 10) - desde_el_final,
+                )
+            )
+
+        # Agregar mensaje actual
+        candidatos.append(({"role": "user", "content": mensaje}, None))
+
+        messages, tokens, descartados = self.presupuesto_prompt.ajustar(candidatos)
+        estadisticas = self.estadisticas_prompt
+        estadisticas["peticiones"] += 1
+        estadisticas["tokens_total"] += tokens
+        estadisticas["tokens_max"] = max(estadisticas["tokens_max"], tokens)
+        estadisticas["mensajes_descartados"] += descartados
+
+        return contexto, messages
+
+    def _obtener_prompt_sistema(self, formato_json: bool = True) -> str:
+        """
+        Prompt de sistema estático, compilado una vez por versión del
+        catálogo: solo se reconstruye cuando cambian productos o precios
+        """
+        version = self.sistema_cotizaciones.version_catalogo
+        if self._version_prompts != version:
+            self._prompts_compilados = {}
+            self._version_prompts = version
+        prompt = self._prompts_compilados.get(formato_json)
+        if prompt is None:
+            prompt = PLANTILLA_PROMPT_SISTEMA.format(
+                info_productos=self._obtener_info_productos_para_prompt(),
+                instrucciones_formato=(
+                    INSTRUCCIONES_FORMATO_JSON
+                    if formato_json
+                    else INSTRUCCIONES_FORMATO_TEXTO
+                ),
+            )
+            self._prompts_compilados[formato_json] = prompt
+        return prompt
+
+    def _procesar_respuesta_openai(
+        self,
+        response: Any,
+        mensaje: str,
+        contexto: ContextoConversacion,
+        sesion_id: str,
+    ) -> Dict[str, Any]:
+        """Parsea la respuesta de OpenAI, actualiza el contexto y la registra"""
         resultado = json.loads(response.choices[0].message.content)
+        return self._registrar_resultado_ia(resultado, mensaje, contexto, sesion_id)
 
+    def _registrar_resultado_ia(
+        self,
+        resultado: Dict[str, Any],
+        mensaje: str,
+        contexto: ContextoConversacion,
+        sesion_id: str,
+    ) -> Dict[str, Any]:
+        """Actualiza el contexto con una respuesta del modelo y la registra"""
         # Actualizar contexto
         self._actualizar_contexto(contexto, mensaje)
         contexto.mensajes_intercambiados.append(
@@ -1134,6 +1443,30 @@ El campo "necesita_datos" debe ser una lista de datos que faltan para completar
             json.dump(conocimiento_ia, f, ensure_ascii=False, indent=2)
 
 
+# Instancia compartida por proceso
+_ia_conversacional = None
+_ia_conversacional_lock = threading.Lock()
+
+
+def get_ia_conversacional() -> IAConversacionalIntegrada:
+    """Get singleton instance of the conversational AI (one per process)"""
+    global _ia_conversacional
+    if _ia_conversacional is None:
+        with _ia_conversacional_lock:
+            if _ia_conversacional is None:
+                _ia_conversacional = IAConversacionalIntegrada()
+    return _ia_conversacional
+
+
+def procesar_mensaje_usuario(
+    mensaje: str, telefono_cliente: str, sesion_id: str = None
+) -> Dict[str, Any]:
+    """Procesa un mensaje usando la instancia compartida de la IA"""
+    return get_ia_conversacional().procesar_mensaje_usuario(
+        mensaje, telefono_cliente, sesion_id
+    )
+
+
 def main():
     """Función principal para demostrar la IA conversacional"""
     print("IA Conversacional Integrada BMC Uruguay")
@@ -234,7 +234,7 @@ def main():
     
     # Agregar al sistema
     for cotizacion in cotizaciones_importadas:
-        sistema.cotizaciones.append(cotizacion)
+        sistema.agregar_cotizacion(cotizacion)
     
     # Exportar resultados
     importador.exportar_cotizaciones_importadas(cotizaciones_importadas, 'cotizaciones_importadas.json')
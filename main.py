@@ -170,11 +170,7 @@ class SistemaCompletoBMC:
     
     def generar_reporte(self, cotizacion_id: str):
         """Genera un reporte de cotización"""
-        cotizacion = None
-        for c in self.sistema_cotizaciones.cotizaciones:
-            if c.id == cotizacion_id:
-                cotizacion = c
-                break
+        cotizacion = self.sistema_cotizaciones.obtener_cotizacion(cotizacion_id)
         
         if not cotizacion:
             print("⚠ Cotización no encontrada")
@@ -201,13 +197,16 @@ class SistemaCompletoBMC:
         """Muestra estadísticas del sistema"""
         print("\n=== ESTADÍSTICAS DEL SISTEMA ===")
         
-        total_cotizaciones = len(self.sistema_cotizaciones.cotizaciones)
+        total_cotizaciones = self.sistema_cotizaciones.contar_cotizaciones()
         print(f"Total de cotizaciones: {total_cotizaciones}")
         
         if total_cotizaciones > 0:
+            # Una sola lectura del repositorio para todas las estadísticas
+            cotizaciones = self.sistema_cotizaciones.cotizaciones
+            
             # Estadísticas por estado
             estados = {}
-            for cotizacion in self.sistema_cotizaciones.cotizaciones:
+            for cotizacion in cotizaciones:
                 estado = cotizacion.estado
                 estados[estado] = estados.get(estado, 0) + 1
             
@@ -217,7 +216,7 @@ class SistemaCompletoBMC:
             
             # Estadísticas por producto
             productos = {}
-            for cotizacion in self.sistema_cotizaciones.cotizaciones:
+            for cotizacion in cotizaciones:
                 producto = cotizacion.especificaciones.producto
                 productos[producto] = productos.get(producto, 0) + 1
             
@@ -226,7 +225,7 @@ class SistemaCompletoBMC:
                 print(f"  {producto}: {cantidad}")
             
             # Precio promedio
-            precios = [float(c.precio_total) for c in self.sistema_cotizaciones.cotizaciones if c.precio_total > 0]
+            precios = [float(c.precio_total) for c in cotizaciones if c.precio_total > 0]
             if precios:
                 precio_promedio = sum(precios) / len(precios)
                 print(f"\nPrecio promedio: ${precio_promedio:.2f}")
@@ -5,10 +5,13 @@ Unified API Model Integrator
 Supports OpenAI, Groq, Google Gemini, and xAI (Grok) with cost optimization
 """
 
+import asyncio
 import os
 import json
 import logging
-from typing import Dict, List, Optional, Any, Literal
+import threading
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Any, Literal
 from dataclasses import dataclass, asdict
 from datetime import datetime
 from enum import Enum
@@ -39,6 +42,8 @@ except ImportError:
     def format_error_with_context(*args, **kwargs):
         return str(args[0]) if args else ""
 
+from utils.response_cache import ResponseCache, SingleFlight, make_cache_key
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -121,6 +126,10 @@ class UsageStats:
     total_cost: float = 0.0
     errors: int = 0
     avg_response_time: float = 0.0
+    p50_response_time: float = 0.0
+    p95_response_time: float = 0.0
+    streamed_requests: int = 0
+    avg_time_to_first_token: float = 0.0
     last_used: Optional[datetime] = None
 
 
@@ -138,6 +147,33 @@ class UnifiedModelIntegrator:
         self.openai_org_id: Optional[str] = None
         self.openai_project_id: Optional[str] = None
         
+        # Response cache for repeated prompts and single-flight for
+        # concurrent identical requests
+        self.response_cache: Optional[ResponseCache] = None
+        if os.getenv("MODEL_RESPONSE_CACHE_ENABLED", "true").lower() == "true":
+            self.response_cache = ResponseCache(
+                ttl=float(os.getenv("MODEL_RESPONSE_CACHE_TTL", "3600")),
+                max_entries=int(os.getenv("MODEL_RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+                max_bytes=int(os.getenv("MODEL_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+                disk_path=os.getenv("MODEL_RESPONSE_CACHE_PATH") or None,
+            )
+        self._single_flight = SingleFlight()
+        # Optional callable returning the product catalog version (e.g.
+        # lambda: sistema_cotizaciones.version_catalogo); the cache is
+        # cleared whenever the value changes
+        self.catalog_version_source: Optional[Callable[[], Any]] = None
+        self._catalog_version: Any = None
+        self.cache_savings = {"tokens": 0, "cost": 0.0, "latency": 0.0, "coalesced": 0}
+        
+        # Hedged dispatch: recent response times per model drive the delay
+        # after which a backup request is sent to the next-best model
+        self.latency_window = int(os.getenv("MODEL_LATENCY_WINDOW", "200"))
+        self.hedge_percentile = float(os.getenv("MODEL_HEDGE_PERCENTILE", "95"))
+        self.hedge_min_samples = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "5"))
+        self.hedge_default_delay = float(os.getenv("MODEL_HEDGE_DEFAULT_DELAY", "2.0"))
+        self._latency_samples: Dict[str, deque] = {}
+        self.hedge_stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0}
+        
         # Load configuration
         self._load_config(config_file)
         self._initialize_clients()
@@ -489,6 +525,13 @@ class UnifiedModelIntegrator:
         """
         Select the best model based on strategy and task type
         """
+        ranked = self._rank_models(task_type)
+        return ranked[0] if ranked else None
+    
+    def _rank_models(self, task_type: str = "general") -> List[str]:
+        """
+        Enabled models ordered from best to worst by strategy and task type
+        """
         enabled_models = {
             model_id: config
             for model_id, config in self.models.items()
@@ -496,7 +539,7 @@ class UnifiedModelIntegrator:
         }
         
         if not enabled_models:
-            return None
+            return []
         
         # Score models based on strategy
         scored_models = []
@@ -522,11 +565,7 @@ class UnifiedModelIntegrator:
         # Sort by score (highest first)
         scored_models.sort(key=lambda x: x[1], reverse=True)
         
-        # Return best model
-        if scored_models:
-            return scored_models[0][0]
-        
-        return None
+        return [model_id for model_id, _, _ in scored_models]
     
     def generate(
         self,
@@ -536,10 +575,12 @@ class UnifiedModelIntegrator:
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
         client_request_id: Optional[str] = None,
+        use_cache: bool = True,
         **kwargs
     ) -> Dict[str, Any]:
         """
-        Generate a response using the selected model
+        Generate a response using the selected model, served from the
+        response cache when the same request was answered before
         
         Args:
             prompt: User prompt
@@ -548,11 +589,256 @@ class UnifiedModelIntegrator:
             temperature: Optional temperature
             max_tokens: Optional max tokens
             client_request_id: Optional client-provided request ID (X-Client-Request-Id)
+            use_cache: Set to False to always call the provider
             **kwargs: Additional parameters
             
         Returns:
-            Dict with 'content', 'model_used', 'tokens_input', 'tokens_output', 'cost', 'response_time', 'request_id', etc.
+            Dict with 'content', 'model_used', 'tokens_input', 'tokens_output', 'cost',
+            'response_time', 'request_id', etc. Cached answers have 'cached': True
+            and cost 0.
+        """
+        if not model_id:
+            model_id = self._select_best_model()
+        config = self.models.get(model_id) if model_id else None
+        if self.response_cache is None or not use_cache or config is None:
+            return self._generate_uncached(
+                prompt, system_prompt, model_id, temperature, max_tokens,
+                client_request_id=client_request_id, **kwargs
+            )
+        
+        temp = temperature if temperature is not None else config.temperature
+        max_tok = max_tokens if max_tokens is not None else config.max_tokens
+        self._check_catalog_version()
+        key = self._response_cache_key(model_id, prompt, system_prompt, temp, max_tok, kwargs)
+        
+        start_time = time.time()
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return self._cached_result(cached, start_time, client_request_id)
+        
+        def call_provider():
+            result = self._generate_uncached(
+                prompt, system_prompt, model_id, temp, max_tok,
+                client_request_id=client_request_id, **kwargs
+            )
+            # Fallback answers from another model are not stored under this key
+            if result.get("success") and result.get("model_used") == model_id:
+                self._store_response(key, result)
+            return result
+        
+        result, shared = self._single_flight.do(key, call_provider)
+        if shared:
+            self.cache_savings["coalesced"] += 1
+            if result.get("success"):
+                return self._cached_result(result, start_time, client_request_id)
+            return dict(result)
+        return result
+    
+    def _response_cache_key(
+        self, model_id: str, prompt: str, system_prompt: Optional[str],
+        temperature: float, max_tokens: int, extra: Dict[str, Any]
+    ) -> str:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return make_cache_key(model_id, messages, temperature, max_tokens, extra)
+    
+    def _store_response(self, key: str, result: Dict[str, Any]):
+        self.response_cache.put(key, {
+            field: result.get(field)
+            for field in (
+                "content", "tool_calls", "model_used", "provider", "tokens_input",
+                "tokens_output", "total_tokens", "cost", "response_time",
+            )
+        })
+    
+    def _cached_result(
+        self, cached: Dict[str, Any], start_time: float, client_request_id: Optional[str]
+    ) -> Dict[str, Any]:
+        """Build the response for an answer that did not call the provider"""
+        self.cache_savings["tokens"] += cached.get("tokens_input", 0) + cached.get("tokens_output", 0)
+        self.cache_savings["cost"] += cached.get("cost", 0.0)
+        self.cache_savings["latency"] += cached.get("response_time", 0.0)
+        result = {
+            field: cached.get(field)
+            for field in (
+                "content", "tool_calls", "model_used", "provider", "tokens_input",
+                "tokens_output", "total_tokens",
+            )
+        }
+        result.update({
+            "cost": 0.0,
+            "response_time": time.time() - start_time,
+            "success": True,
+            "cached": True,
+        })
+        if client_request_id:
+            result["client_request_id"] = client_request_id
+        return result
+    
+    def _check_catalog_version(self):
+        """Clear the response cache when the product catalog changed"""
+        if self.catalog_version_source is None:
+            return
+        try:
+            version = self.catalog_version_source()
+        except Exception as e:
+            logger.warning(f"Error reading catalog version: {e}")
+            return
+        if version != self._catalog_version:
+            if self._catalog_version is not None:
+                self.invalidate_response_cache()
+            self._catalog_version = version
+    
+    def invalidate_response_cache(self):
+        """Drop every cached response (call after catalog or prompt changes)"""
+        if self.response_cache is not None:
+            self.response_cache.clear()
+    
+    def get_response_cache_stats(self) -> Dict[str, Any]:
+        """Hit rate and what the response cache saved"""
+        if self.response_cache is None:
+            return {"enabled": False}
+        stats = self.response_cache.stats
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "enabled": True,
+            "entries": len(self.response_cache),
+            "size_bytes": self.response_cache.size_bytes,
+            **stats,
+            "coalesced": self.cache_savings["coalesced"],
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "saved_tokens": self.cache_savings["tokens"],
+            "saved_cost": self.cache_savings["cost"],
+            "saved_latency": self.cache_savings["latency"],
+        }
+    
+    def get_latency_percentile(self, model_id: str, percentile: float) -> Optional[float]:
+        """Response time percentile over the recent window, None without samples"""
+        samples = self._latency_samples.get(model_id)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+    
+    def _hedge_delay(self, model_id: str) -> float:
+        """Seconds to wait for a model before sending the hedge request"""
+        samples = self._latency_samples.get(model_id)
+        if not samples or len(samples) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return self.get_latency_percentile(model_id, self.hedge_percentile)
+    
+    async def generate_hedged(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        model_id: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        client_request_id: Optional[str] = None,
+        hedge_delay: Optional[float] = None,
+        use_cache: bool = True,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Async generate with a hedge request to the next-best model
+        
+        The primary model (model_id or the best ranked one) is called first.
+        If it has not answered after its live p95 response time (or
+        hedge_delay), or if it fails, the same request is sent to the
+        next-best model; the first successful answer wins and the other
+        task is cancelled. Provider SDK calls run in worker threads, so a
+        cancelled call finishes in the background and its answer is dropped.
+        
+        Returns:
+            Same dict as generate, plus 'hedged' (whether the backup was sent)
         """
+        ranked = self._rank_models()
+        if model_id:
+            ranked = [model_id] + [m for m in ranked if m != model_id]
+        if not ranked or ranked[0] not in self.models:
+            raise ValueError(f"Model {model_id} not available")
+        primary = ranked[0]
+        backup = ranked[1] if len(ranked) > 1 else None
+        delay = hedge_delay if hedge_delay is not None else self._hedge_delay(primary)
+        self.hedge_stats["requests"] += 1
+        
+        key = None
+        start_time = time.time()
+        if self.response_cache is not None and use_cache:
+            config = self.models[primary]
+            self._check_catalog_version()
+            key = self._response_cache_key(
+                primary, prompt, system_prompt,
+                temperature if temperature is not None else config.temperature,
+                max_tokens if max_tokens is not None else config.max_tokens,
+                kwargs,
+            )
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                result = self._cached_result(cached, start_time, client_request_id)
+                result["hedged"] = False
+                return result
+        
+        def call(selected: str) -> Dict[str, Any]:
+            return self._generate_uncached(
+                prompt, system_prompt, selected, temperature, max_tokens,
+                client_request_id=client_request_id, fallback=False, **kwargs
+            )
+        
+        tasks = {asyncio.create_task(asyncio.to_thread(call, primary)): primary}
+        hedged = False
+        result: Dict[str, Any] = {}
+        try:
+            while tasks:
+                timeout = delay if backup and not hedged else None
+                done, _ = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Primary is slower than its p95: send the hedge
+                    hedged = True
+                    self.hedge_stats["hedges"] += 1
+                    tasks[asyncio.create_task(asyncio.to_thread(call, backup))] = backup
+                    continue
+                
+                for task in done:
+                    selected = tasks.pop(task)
+                    result = task.result()
+                    if result.get("success"):
+                        if selected != primary:
+                            self.hedge_stats["hedge_wins"] += 1
+                        elif key is not None:
+                            self._store_response(key, result)
+                        result["hedged"] = hedged
+                        return result
+                
+                if backup and not hedged:
+                    # Primary failed before the hedge delay: fail over now
+                    hedged = True
+                    self.hedge_stats["failovers"] += 1
+                    tasks[asyncio.create_task(asyncio.to_thread(call, backup))] = backup
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        result["hedged"] = hedged
+        return result
+    
+    def _generate_uncached(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        model_id: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        client_request_id: Optional[str] = None,
+        fallback: bool = True,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Generate a response calling the provider directly (see generate)"""
         # Initialize request tracking
         request_tracker = get_request_tracker() if UTILS_AVAILABLE else None
         request_metadata = None
@@ -743,7 +1029,7 @@ class UnifiedModelIntegrator:
                 )
             
             # Try fallback model
-            if model_id != self._select_best_model():
+            if fallback and model_id != self._select_best_model():
                 structured_logger.info("Trying fallback model...")
                 return self.generate(prompt, system_prompt, None, temp, max_tok, 
                                    client_request_id=client_request_id, **kwargs)
@@ -1172,9 +1458,298 @@ class UnifiedModelIntegrator:
             "response_headers": response_headers,
         }
     
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+    
+    async def generate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        model_id: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        client_request_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        use_cache: bool = True,
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a response as it is generated
+        
+        Args:
+            prompt: User prompt
+            system_prompt: Optional system prompt
+            model_id: Optional model ID (auto-selected if not provided)
+            temperature: Optional temperature
+            max_tokens: Optional max tokens
+            client_request_id: Optional client-provided request ID
+            history: Optional earlier turns ([{"role", "content"}]) placed
+                between the system prompt and the prompt
+            use_cache: Serve repeated requests from the response cache
+            **kwargs: Additional provider parameters
+            
+        Yields:
+            {"type": "token", "content": str} for every text chunk, then one
+            {"type": "done", ...} with the same fields as generate plus
+            'time_to_first_token', or {"type": "error", "error": str}.
+        """
+        if not model_id:
+            model_id = self._select_best_model()
+        if not model_id or model_id not in self.models:
+            yield {"type": "error", "error": f"Model {model_id} not available", "success": False}
+            return
+        
+        config = self.models[model_id]
+        temp = temperature if temperature is not None else config.temperature
+        max_tok = max_tokens if max_tokens is not None else config.max_tokens
+        messages = self._build_messages(prompt, system_prompt, history)
+        start_time = time.time()
+        
+        key = None
+        if self.response_cache is not None and use_cache:
+            self._check_catalog_version()
+            key = make_cache_key(model_id, messages, temp, max_tok, kwargs)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                result = self._cached_result(cached, start_time, client_request_id)
+                yield {"type": "token", "content": result.get("content") or ""}
+                yield {"type": "done", **result, "time_to_first_token": result["response_time"]}
+                return
+        
+        stream = None
+        parts: List[str] = []
+        usage = None
+        time_to_first_token = None
+        try:
+            stream = self._iterate_in_thread(
+                self._stream_chunks(config, messages, temp, max_tok, client_request_id, **kwargs)
+            )
+            async for chunk in stream:
+                if "usage" in chunk:
+                    usage = chunk["usage"]
+                elif chunk.get("delta"):
+                    if time_to_first_token is None:
+                        time_to_first_token = time.time() - start_time
+                    parts.append(chunk["delta"])
+                    yield {"type": "token", "content": chunk["delta"]}
+        except Exception as e:
+            structured_logger.error(f"Streaming error from {model_id}: {e}")
+            if model_id in self.usage_stats:
+                self.usage_stats[model_id].errors += 1
+            yield {
+                "type": "error",
+                "error": str(e),
+                "model_used": model_id,
+                "provider": config.provider.value,
+                "success": False,
+            }
+            return
+        finally:
+            if stream is not None:
+                await stream.aclose()
+        
+        response_time = time.time() - start_time
+        content = "".join(parts)
+        if usage is None:
+            # Some providers only report usage on the final non-streamed
+            # response: estimate (1 token ≈ 4 characters)
+            usage = (sum(len(m["content"]) for m in messages) // 4, len(content) // 4)
+        tokens_input, tokens_output = usage
+        cost = (
+            (tokens_input / 1000) * config.cost_per_1k_tokens_input +
+            (tokens_output / 1000) * config.cost_per_1k_tokens_output
+        )
+        if time_to_first_token is None:
+            time_to_first_token = response_time
+        self._update_usage_stats(
+            model_id, tokens_input, tokens_output, cost, response_time,
+            time_to_first_token=time_to_first_token,
+        )
+        
+        result = {
+            "content": content,
+            "tool_calls": None,
+            "model_used": model_id,
+            "provider": config.provider.value,
+            "tokens_input": tokens_input,
+            "tokens_output": tokens_output,
+            "total_tokens": tokens_input + tokens_output,
+            "cost": cost,
+            "response_time": response_time,
+            "success": True,
+        }
+        if key is not None:
+            self._store_response(key, result)
+        if client_request_id:
+            result["client_request_id"] = client_request_id
+        yield {"type": "done", **result, "time_to_first_token": time_to_first_token}
+    
+    def _build_messages(
+        self, prompt: str, system_prompt: Optional[str],
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.extend(history or [])
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    async def _iterate_in_thread(self, chunks: Iterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Drive a blocking provider stream from one dedicated thread
+        
+        The thread owns the iterator: it calls next() and, once the consumer
+        stops (finished, failed or cancelled), close(). Closing from the
+        event loop could race an in-flight next() and leave the provider
+        stream open.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        
+        def put(kind: str, value: Any = None):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+            except RuntimeError:
+                pass  # Event loop already closed
+        
+        def pump():
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        break
+                    put("chunk", chunk)
+            except Exception as e:
+                put("error", e)
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+                put("end")
+        
+        threading.Thread(target=pump, name="model-stream", daemon=True).start()
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            stop.set()
+    
+    def _stream_chunks(
+        self, config: ModelConfig, messages: List[Dict[str, str]],
+        temperature: float, max_tokens: int,
+        client_request_id: Optional[str] = None, **kwargs
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Provider stream normalized to {"delta": text} items and one optional
+        final {"usage": (tokens_input, tokens_output)}
+        """
+        provider = config.provider.value
+        if provider in ("openai", "groq", "grok"):
+            extra_headers = {}
+            if client_request_id and provider != "groq":
+                extra_headers["X-Client-Request-Id"] = client_request_id
+            if provider == "openai":
+                if config.organization_id:
+                    extra_headers["OpenAI-Organization"] = config.organization_id
+                if config.project_id:
+                    extra_headers["OpenAI-Project"] = config.project_id
+                # Usage is only sent on the last chunk when requested
+                kwargs.setdefault("stream_options", {"include_usage": True})
+            if extra_headers:
+                kwargs["extra_headers"] = extra_headers
+            return self._stream_openai_compatible(
+                self.clients[provider], config.model_name, messages, temperature, max_tokens, **kwargs
+            )
+        if provider == "gemini":
+            return self._stream_gemini(config.model_name, messages, temperature, max_tokens, **kwargs)
+        raise ValueError(f"Unknown provider: {provider}")
+    
+    def _stream_openai_compatible(
+        self, client: Any, model: str, messages: List[Dict[str, str]],
+        temperature: float, max_tokens: int, **kwargs
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream from an OpenAI-compatible API (OpenAI, Groq, Grok)"""
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **kwargs
+        )
+        try:
+            for chunk in stream:
+                # Groq reports usage in x_groq on the last chunk
+                usage = getattr(chunk, "usage", None) or getattr(
+                    getattr(chunk, "x_groq", None), "usage", None
+                )
+                if usage is not None:
+                    yield {"usage": (usage.prompt_tokens, usage.completion_tokens)}
+                for choice in getattr(chunk, "choices", None) or []:
+                    delta = getattr(choice.delta, "content", None)
+                    if delta:
+                        yield {"delta": delta}
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+    
+    def _stream_gemini(
+        self, model: str, messages: List[Dict[str, str]],
+        temperature: float, max_tokens: int, **kwargs
+    ) -> Iterator[Dict[str, Any]]:
+        """Stream from Gemini (new SDK); other Gemini modes yield one chunk"""
+        system_prompt = None
+        if messages and messages[0]["role"] == "system":
+            system_prompt = messages[0]["content"]
+            messages = messages[1:]
+        # Earlier turns are sent as plain text before the current prompt
+        prompt = "\n".join(
+            f"{m['role']}: {m['content']}" for m in messages[:-1]
+        )
+        prompt = f"{prompt}\nuser: {messages[-1]['content']}" if prompt else messages[-1]["content"]
+        
+        if getattr(self, 'gemini_use_new_sdk', False) and not getattr(self, 'gemini_use_vertex_rest', False):
+            from google.genai import types
+            
+            config = types.GenerateContentConfig(
+                temperature=temperature,
+                max_output_tokens=max_tokens,
+            )
+            if system_prompt:
+                config.system_instruction = system_prompt
+            usage = None
+            for chunk in self.clients["gemini"].models.generate_content_stream(
+                model=model, contents=prompt, config=config
+            ):
+                if getattr(chunk, "text", None):
+                    yield {"delta": chunk.text}
+                metadata = getattr(chunk, "usage_metadata", None)
+                if metadata is not None and getattr(metadata, "prompt_token_count", None):
+                    usage = (
+                        metadata.prompt_token_count or 0,
+                        getattr(metadata, "candidates_token_count", None) or 0,
+                    )
+            if usage is not None:
+                yield {"usage": usage}
+            return
+        
+        response = self._generate_gemini(prompt, system_prompt, model, temperature, max_tokens, **kwargs)
+        yield {"delta": response.get("content", "")}
+        yield {"usage": (response.get("tokens_input", 0), response.get("tokens_output", 0))}
+    
     def _update_usage_stats(
         self, model_id: str, tokens_input: int, tokens_output: int,
-        cost: float, response_time: float
+        cost: float, response_time: float,
+        time_to_first_token: Optional[float] = None
     ):
         """Update usage statistics"""
         if model_id not in self.usage_stats:
@@ -1196,6 +1771,21 @@ class UnifiedModelIntegrator:
             stats.avg_response_time = (
                 (stats.avg_response_time * (stats.requests - 1) + response_time) / stats.requests
             )
+        
+        # Live percentiles over the recent window (used for hedging)
+        samples = self._latency_samples.get(model_id)
+        if samples is None:
+            samples = self._latency_samples[model_id] = deque(maxlen=self.latency_window)
+        samples.append(response_time)
+        stats.p50_response_time = self.get_latency_percentile(model_id, 50)
+        stats.p95_response_time = self.get_latency_percentile(model_id, 95)
+        
+        # Time to first token is tracked apart from total latency
+        if time_to_first_token is not None:
+            stats.streamed_requests += 1
+            stats.avg_time_to_first_token += (
+                (time_to_first_token - stats.avg_time_to_first_token) / stats.streamed_requests
+            )
     
     def _load_usage_stats(self):
         """Load usage statistics from file"""
@@ -1204,6 +1794,11 @@ class UnifiedModelIntegrator:
             try:
                 with open(stats_file, 'r') as f:
                     data = json.load(f)
+                    cache_data = data.pop("_response_cache", None)
+                    if cache_data:
+                        self.cache_savings["tokens"] = cache_data.get("saved_tokens", 0)
+                        self.cache_savings["cost"] = cache_data.get("saved_cost", 0.0)
+                        self.cache_savings["latency"] = cache_data.get("saved_latency", 0.0)
                     for model_id, stats_data in data.items():
                         self.usage_stats[model_id] = UsageStats(**stats_data)
             except Exception as e:
@@ -1217,6 +1812,7 @@ class UnifiedModelIntegrator:
                 model_id: asdict(stats)
                 for model_id, stats in self.usage_stats.items()
             }
+            data["_response_cache"] = self.get_response_cache_stats()
             with open(stats_file, 'w') as f:
                 json.dump(data, f, indent=2, default=str)
         except Exception as e:
@@ -1239,6 +1835,8 @@ class UnifiedModelIntegrator:
                 model_id: asdict(stats)
                 for model_id, stats in self.usage_stats.items()
             },
+            "response_cache": self.get_response_cache_stats(),
+            "hedging": dict(self.hedge_stats),
         }
     
     def list_available_models(self) -> List[Dict[str, Any]]:
@@ -198,7 +198,7 @@ def listar_cotizaciones(data: Dict[str, Any]) -> Dict[str, Any]:
         limite = data.get('limite', 50)
         
         cotizaciones = []
-        for cot_id, cot in list(sistema.cotizaciones.items())[:limite]:
+        for cot in sistema.listar_cotizaciones(limite):
             if estado is None or cot.estado == estado:
                 cotizaciones.append({
                     "id": cot.id,
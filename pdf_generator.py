@@ -5,6 +5,8 @@ Generates professional PDF quotes using ReportLab.
 
 import os
 import datetime
+
+from generador_ids import nuevo_id
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -23,7 +25,7 @@ class PDFGenerator:
         Generates a PDF quote from a dictionary of quote data.
         Returns the absolute path to the generated PDF.
         """
-        quote_id = quote_data.get("id", f"COT-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}")
+        quote_id = quote_data.get("id") or nuevo_id("COT-")
         filename = f"Cotizacion_{quote_id}.pdf"
         filepath = os.path.join(self.output_dir, filename)
         
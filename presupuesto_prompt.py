@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conteo de tokens y presupuesto por petición para los prompts del chat
+
+Los mensajes se arman en orden (prefijo estable primero) y cada uno puede
+ser obligatorio o descartable con una prioridad. Si el total supera el
+presupuesto se descartan primero los de menor prioridad y, como último
+recurso, se trunca el mensaje obligatorio más largo que no sea de sistema.
+El prompt de sistema (con las instrucciones de formato JSON) nunca se
+recorta: si ni así entra se lanza PresupuestoExcedido y quien llama decide
+el fallback.
+
+Si tiktoken está instalado se usa para contar; si no, se estima con
+1 token ≈ 4 caracteres (la misma aproximación que usa model_integrator).
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Tokens que agrega cada mensaje del chat además de su contenido
+TOKENS_POR_MENSAJE = 4
+
+_MARCA_RECORTE = " […]"
+
+
+class PresupuestoExcedido(ValueError):
+    """Los mensajes obligatorios no entran en el presupuesto sin recortar el sistema"""
+
+
+@lru_cache(maxsize=8)
+def _codificador(modelo: str):
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=4096)
+def contar_tokens(texto: str, modelo: str = "gpt-4o-mini") -> int:
+    """Tokens de un texto (exacto con tiktoken, estimado sin él)"""
+    if not texto:
+        return 0
+    if TIKTOKEN_AVAILABLE:
+        return len(_codificador(modelo).encode(texto))
+    return (len(texto) + 3) // 4
+
+
+def truncar_a_tokens(texto: str, max_tokens: int, modelo: str = "gpt-4o-mini") -> str:
+    """Recorta un texto para que no supere max_tokens (conserva el inicio)"""
+    if contar_tokens(texto, modelo) <= max_tokens:
+        return texto
+    if max_tokens <= 0:
+        return ""
+    if TIKTOKEN_AVAILABLE:
+        codificador = _codificador(modelo)
+        return codificador.decode(codificador.encode(texto)[: max_tokens - 2]) + _MARCA_RECORTE
+    return texto[: max(0, max_tokens * 4 - len(_MARCA_RECORTE))] + _MARCA_RECORTE
+
+
+class PresupuestoTokens:
+    """Ajusta una lista de mensajes de chat a un máximo de tokens"""
+
+    def __init__(self, max_tokens: int, modelo: str = "gpt-4o-mini"):
+        self.max_tokens = max_tokens
+        self.modelo = modelo
+
+    def contar_mensaje(self, mensaje: Dict[str, str]) -> int:
+        return contar_tokens(mensaje["content"], self.modelo) + TOKENS_POR_MENSAJE
+
+    def contar(self, mensajes: List[Dict[str, str]]) -> int:
+        return sum(self.contar_mensaje(m) for m in mensajes)
+
+    def ajustar(
+        self, mensajes: List[Tuple[Dict[str, str], Optional[int]]]
+    ) -> Tuple[List[Dict[str, str]], int, int]:
+        """
+        Args:
+            mensajes: (mensaje, prioridad) en el orden final; prioridad None
+                marca un mensaje obligatorio, y entre los descartables se
+                quitan primero los de prioridad más baja.
+
+        Returns:
+            (mensajes que entran, tokens totales, mensajes descartados)
+
+        Raises:
+            PresupuestoExcedido: si los mensajes de sistema obligatorios
+                más lo mínimo del resto superan el presupuesto
+        """
+        tokens = [self.contar_mensaje(m) for m, _ in mensajes]
+        total = sum(tokens)
+        conservar = [True] * len(mensajes)
+        descartados = 0
+
+        if total > self.max_tokens:
+            orden = sorted(
+                (prioridad, indice)
+                for indice, (_, prioridad) in enumerate(mensajes)
+                if prioridad is not None
+            )
+            for _, indice in orden:
+                if total <= self.max_tokens:
+                    break
+                conservar[indice] = False
+                total -= tokens[indice]
+                descartados += 1
+
+        resultado = [m for (m, _), incluir in zip(mensajes, conservar) if incluir]
+
+        if total > self.max_tokens:
+            # Solo quedan obligatorios: se trunca el más largo que no sea de
+            # sistema; el prompt de sistema se envía siempre completo
+            recortables = [i for i, m in enumerate(resultado) if m.get("role") != "system"]
+            if not recortables:
+                raise PresupuestoExcedido(
+                    f"{total} tokens obligatorios superan el presupuesto de {self.max_tokens}"
+                )
+            indice = max(recortables, key=lambda i: self.contar_mensaje(resultado[i]))
+            mensaje = resultado[indice]
+            exceso = total - self.max_tokens
+            disponible = contar_tokens(mensaje["content"], self.modelo) - exceso
+            if disponible <= 0:
+                raise PresupuestoExcedido(
+                    f"{total} tokens obligatorios superan el presupuesto de {self.max_tokens}"
+                )
+            resultado[indice] = {
+                **mensaje,
+                "content": truncar_a_tokens(mensaje["content"], disponible, self.modelo),
+            }
+            total = self.contar(resultado)
+
+        return resultado, total, descartados
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared in-memory LRU/TTL cache
+
+- O(1) get/set/evict: entries live in an OrderedDict in recency order, so
+  the least recently used entry is always the first one.
+- Per-entry TTL (default set per cache, overridable per set()).
+- Bounded by number of entries and by approximate size in bytes.
+- One lock guards every operation and is never held across an await, so a
+  cache can be shared by threads and by coroutines; aget_or_load() also
+  coalesces concurrent loads of the same key on the event loop.
+- Negative caching: get_or_load() remembers that a loader returned None for
+  ``negative_ttl`` seconds instead of calling it again on every request.
+- Hits and misses are reported to PerformanceMonitor.record_cache_hit /
+  record_cache_miss under the cache name.
+"""
+
+import asyncio
+import logging
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Stored in place of the value for negative entries
+_MISSING = object()
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate size in bytes of a value (pickled length)"""
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread- and asyncio-safe LRU cache with TTL, byte limit and metrics
+
+    Args:
+        name: cache_type reported to the performance monitor
+        max_entries: max number of entries (positive and negative)
+        max_bytes: max total approximate size of keys + values; None = no limit
+        ttl: default time to live in seconds; None = no expiry
+        negative_ttl: time to remember a None from get_or_load; 0 disables it
+        monitor: object with record_cache_hit/record_cache_miss (e.g.
+            PerformanceMonitor); None only keeps local stats
+        sizeof: function value -> size in bytes
+    """
+
+    def __init__(
+        self,
+        name: str = "default",
+        max_entries: int = 1000,
+        max_bytes: Optional[int] = 64 * 1024 * 1024,
+        ttl: Optional[float] = 300.0,
+        negative_ttl: float = 0.0,
+        monitor: Any = None,
+        sizeof: Callable[[Any], int] = estimate_size,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.monitor = monitor
+        self.sizeof = sizeof
+        # key -> (expires_at or None, size, value)
+        self._entries: "OrderedDict[Hashable, Tuple[Optional[float], int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[Hashable, "asyncio.Future"] = {}
+        self.stats = {"hits": 0, "misses": 0, "negative_hits": 0, "evictions": 0, "expirations": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._lookup(key, time.monotonic()) is not None
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    # ------------------------------------------------------------------
+    # Basic operations
+    # ------------------------------------------------------------------
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Cached value, or default if missing, expired or negative"""
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            self._count(entry)
+        if entry is None or entry[2] is _MISSING:
+            return default
+        return entry[2]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store value; ttl overrides the cache default for this entry"""
+        self._store(key, value, self.ttl if ttl is None else ttl)
+
+    def set_missing(self, key: Hashable, ttl: Optional[float] = None):
+        """Remember that key has no value (negative entry)"""
+        self._store(key, _MISSING, self.negative_ttl if ttl is None else ttl)
+
+    def delete(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry; returns how many were removed"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (expires_at, _, _) in self._entries.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                self._discard(key)
+            self.stats["expirations"] += len(expired)
+            return len(expired)
+
+    # ------------------------------------------------------------------
+    # Read-through helpers
+    # ------------------------------------------------------------------
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Cached value, or loader() stored for next time (None is cached negatively)"""
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            self._count(entry)
+        if entry is not None:
+            return None if entry[2] is _MISSING else entry[2]
+        value = loader()
+        self._remember(key, value, ttl)
+        return value
+
+    async def aget_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None
+    ) -> Any:
+        """
+        Async get_or_load; concurrent callers of the same key on the event
+        loop wait for a single loader() call
+        """
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            self._count(entry)
+            if entry is not None:
+                return None if entry[2] is _MISSING else entry[2]
+            pending = self._loading.get(key)
+            if pending is None or pending.get_loop() is not asyncio.get_running_loop():
+                pending = None
+                future = asyncio.get_running_loop().create_future()
+                self._loading[key] = future
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve it so an unawaited future does not log a warning
+            future.exception()
+            raise
+        else:
+            self._remember(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                if self._loading.get(key) is future:
+                    del self._loading[key]
+
+    # ------------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------------
+
+    def _remember(self, key: Hashable, value: Any, ttl: Optional[float]):
+        if value is not None:
+            self.set(key, value, ttl)
+        elif self.negative_ttl > 0:
+            self.set_missing(key)
+
+    def _count(self, entry: Optional[Tuple[Optional[float], int, Any]]):
+        """Update stats and the monitor (called with the lock held)"""
+        if entry is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+            if entry[2] is _MISSING:
+                self.stats["negative_hits"] += 1
+        if self.monitor is not None:
+            try:
+                if entry is None:
+                    self.monitor.record_cache_miss(self.name)
+                else:
+                    self.monitor.record_cache_hit(self.name)
+            except Exception as e:
+                logger.debug(f"Cache metrics not recorded: {e}")
+
+    def _lookup(self, key: Hashable, now: float) -> Optional[Tuple[Optional[float], int, Any]]:
+        """Live entry of key, refreshed as most recently used (lock held)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= now:
+            self._discard(key)
+            self.stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]):
+        size = self.sizeof(key) + (0 if value is _MISSING else self.sizeof(value))
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Bigger than the whole cache: keep it out rather than flush everything
+            with self._lock:
+                self._discard(key)
+            return
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._discard(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def _discard(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[1]
+        return True
+
+
+def _default_monitor():
+    try:
+        from performance_monitor import get_performance_monitor
+        return get_performance_monitor()
+    except ImportError:
+        return None
+
+
+_cache_manager: Optional[LRUCache] = None
+_cache_manager_lock = threading.Lock()
+
+
+def get_cache_manager() -> LRUCache:
+    """Get or create the shared general-purpose cache"""
+    global _cache_manager
+    if _cache_manager is None:
+        with _cache_manager_lock:
+            if _cache_manager is None:
+                _cache_manager = LRUCache(name="general", max_entries=10000, monitor=_default_monitor())
+    return _cache_manager
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compiled keyword and entity matcher
+
+One engine for the NLU paths (IAConversacionalIntegrada and
+LanguageProcessor):
+
+- Keyword lists are compiled into an Aho-Corasick automaton over words, so a
+  message is scanned once regardless of how many keywords there are, every
+  match respects word boundaries ("hi" does not match "chico") and
+  multi-word keywords ("hasta luego") are found alongside their parts.
+- A keyword ending in "*" is a stem: its last word matches any word starting
+  with it ("cotizar*" matches "cotizarlo", "instalar*" matches "instalarla").
+- Text and keywords are lowercased and accent-folded, so "cotización" and
+  "cotizacion" are the same keyword.
+- Entity regexes are compiled once in a RegexBank; several patterns can share
+  a name and are tried in order.
+
+CompiledMatcher.match returns per-label scores, keyword matches and entity
+spans (offsets into the original text) in one pass.
+"""
+
+import re
+import threading
+import unicodedata
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+_WORD = re.compile(r"\w+")
+
+
+def _build_fold_table() -> Dict[int, str]:
+    """Latin accented characters -> base letter (one character each)"""
+    table = {}
+    for code in range(0xC0, 0x250):
+        char = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+        if len(base) == 1 and base != char:
+            table[code] = base
+    return table
+
+
+_FOLD_TABLE = _build_fold_table()
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, keeping one character per input character"""
+    text = text.lower()
+    return text if text.isascii() else text.translate(_FOLD_TABLE)
+
+
+@dataclass(slots=True)
+class KeywordMatch:
+    keyword: str
+    label: str
+    start: int
+    end: int
+    weight: float
+
+
+@dataclass(slots=True)
+class EntitySpan:
+    name: str
+    text: str
+    start: int
+    end: int
+    groups: Tuple[Optional[str], ...]
+
+
+@dataclass
+class MatchResult:
+    """
+    Keyword scores and matches of a text; entity spans are extracted the
+    first time they are asked for (intent-only callers skip the regexes)
+    """
+
+    scores: Dict[str, float] = field(default_factory=dict)
+    keywords: List[KeywordMatch] = field(default_factory=list)
+    text: str = ""
+    regexes: Optional["RegexBank"] = field(default=None, repr=False)
+    _entities: Dict[str, List[EntitySpan]] = field(default_factory=dict, repr=False)
+    _scanned: set = field(default_factory=set, repr=False)
+
+    @property
+    def entities(self) -> Dict[str, List[EntitySpan]]:
+        if self.regexes is None:
+            return dict(self._entities)
+        for name in self.regexes.names():
+            self.first(name)
+        return {name: self._entities[name] for name in self.regexes.names() if name in self._entities}
+
+    def labels(self, prefix: str = "") -> List[str]:
+        """Matched labels (in order of first appearance) starting with prefix"""
+        seen = {}
+        for match in self.keywords:
+            if match.label.startswith(prefix):
+                seen.setdefault(match.label, None)
+        return list(seen)
+
+    def first(self, name: str) -> Optional[EntitySpan]:
+        if self.regexes is not None and name not in self._scanned:
+            self._entities.update(self.regexes.scan(self.text, [name]))
+            self._scanned.add(name)
+        spans = self._entities.get(name)
+        return spans[0] if spans else None
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton whose alphabet is words"""
+
+    def __init__(self):
+        # Keyword -> [(label, weight, original keyword)]
+        self._keywords: Dict[Tuple[str, ...], List[Tuple[str, float, str]]] = {}
+        # Stem keywords ("cotizar*"), same shape; the last word is a prefix
+        self._stem_keywords: Dict[Tuple[str, ...], List[Tuple[str, float, str]]] = {}
+        # Compiled stems: prefix -> [(preceding words, label, weight, keyword)]
+        self._stems: Dict[str, List[Tuple[Tuple[str, ...], str, float, str]]] = {}
+        self._stem_lengths: List[int] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, str, float, str]]] = [[]]
+        self._compiled = True
+
+    def __len__(self) -> int:
+        return len(self._keywords) + len(self._stem_keywords)
+
+    def add(self, keyword: str, label: str, weight: float = 1.0) -> bool:
+        """Register keyword under label; returns False if it was already there"""
+        stem = keyword.endswith("*")
+        words = tuple(_WORD.findall(fold(keyword.rstrip("*") if stem else keyword)))
+        if not words:
+            return False
+        outputs = (self._stem_keywords if stem else self._keywords).setdefault(words, [])
+        if any(existing == label for existing, _, _ in outputs):
+            return False
+        outputs.append((label, weight, keyword))
+        self._compiled = False
+        return True
+
+    def compile(self):
+        goto: List[Dict[str, int]] = [{}]
+        output: List[List[Tuple[int, str, float, str]]] = [[]]
+        for words, labels in self._keywords.items():
+            state = 0
+            for word in words:
+                nxt = goto[state].get(word)
+                if nxt is None:
+                    nxt = goto[state][word] = len(goto)
+                    goto.append({})
+                    output.append([])
+                state = nxt
+            output[state].extend((len(words), label, weight, kw) for label, weight, kw in labels)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, nxt in goto[state].items():
+                queue.append(nxt)
+                back = fail[state]
+                while back and word not in goto[back]:
+                    back = fail[back]
+                fail[nxt] = goto[back].get(word, 0)
+                output[nxt] = output[nxt] + output[fail[nxt]]
+
+        stems: Dict[str, List[Tuple[Tuple[str, ...], str, float, str]]] = {}
+        for words, labels in self._stem_keywords.items():
+            stems.setdefault(words[-1], []).extend((words[:-1], label, weight, kw) for label, weight, kw in labels)
+
+        self._goto, self._fail, self._output = goto, fail, output
+        self._stems, self._stem_lengths = stems, sorted({len(stem) for stem in stems})
+        self._compiled = True
+
+    def scan(self, words: List[str]) -> Iterable[Tuple[int, int, str, float, str]]:
+        """Yield (first word index, last word index, label, weight, keyword)"""
+        if not self._compiled:
+            self.compile()
+        goto, fail, output = self._goto, self._fail, self._output
+        stems, stem_lengths = self._stems, self._stem_lengths
+        state = 0
+        for index, word in enumerate(words):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for length, label, weight, keyword in output[state]:
+                yield index - length + 1, index, label, weight, keyword
+            # Stems are few and short: one dict lookup per distinct stem length
+            for length in stem_lengths:
+                if length > len(word):
+                    break
+                for preceding, label, weight, keyword in stems.get(word[:length], ()):
+                    first = index - len(preceding)
+                    if first >= 0 and tuple(words[first:index]) == preceding:
+                        yield first, index, label, weight, keyword
+
+
+class RegexBank:
+    """Named, precompiled entity patterns (tried in registration order)"""
+
+    def __init__(self):
+        self._patterns: Dict[str, List[re.Pattern]] = {}
+
+    def add(self, name: str, pattern: Union[str, re.Pattern], flags: int = 0):
+        compiled = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern, flags)
+        self._patterns.setdefault(name, []).append(compiled)
+
+    def names(self) -> List[str]:
+        return list(self._patterns)
+
+    def scan(self, text: str, names: Optional[Iterable[str]] = None) -> Dict[str, List[EntitySpan]]:
+        """
+        All matches of the first pattern of each name that matches the text
+        """
+        entities = {}
+        for name in (names if names is not None else self._patterns):
+            for pattern in self._patterns.get(name, ()):
+                spans = [
+                    EntitySpan(name, m.group(0), m.start(), m.end(), m.groups())
+                    for m in pattern.finditer(text)
+                ]
+                if spans:
+                    entities[name] = spans
+                    break
+        return entities
+
+
+def _word_offsets(text: str, words: List[str]) -> List[int]:
+    """Start offset of each word of _WORD.findall(text)"""
+    offsets = []
+    position = 0
+    for word in words:
+        position = text.find(word, position)
+        offsets.append(position)
+        position += len(word)
+    return offsets
+
+
+class CompiledMatcher:
+    """
+    Keyword automaton + regex bank behind a single match() call
+
+    Scores add the weight of every distinct (label, keyword) found, so a
+    keyword repeated in the message counts once, as with substring checks.
+    The last result is memoized because callers usually ask for intent and
+    entities of the same message one after the other.
+    """
+
+    def __init__(self):
+        self.automaton = KeywordAutomaton()
+        self.regexes = RegexBank()
+        self._last: Tuple[Optional[str], Optional[MatchResult]] = (None, None)
+        self._lock = threading.Lock()
+
+    def add_keywords(
+        self,
+        label: str,
+        keywords: Iterable[str],
+        weight: Union[None, float, Callable[[str], float]] = None,
+    ) -> "CompiledMatcher":
+        for keyword in keywords:
+            value = weight(keyword) if callable(weight) else (1.0 if weight is None else weight)
+            self.automaton.add(keyword, label, value)
+        self._last = (None, None)
+        return self
+
+    def add_pattern(self, name: str, pattern: Union[str, re.Pattern], flags: int = 0) -> "CompiledMatcher":
+        self.regexes.add(name, pattern, flags)
+        self._last = (None, None)
+        return self
+
+    def match(self, text: str) -> MatchResult:
+        last_text, last_result = self._last
+        if text == last_text and last_result is not None:
+            return last_result
+
+        if not self.automaton._compiled:
+            with self._lock:
+                if not self.automaton._compiled:
+                    self.automaton.compile()
+
+        folded = fold(text)
+        words = _WORD.findall(folded)
+        result = MatchResult(text=text, regexes=self.regexes)
+        offsets = None
+        seen = set()
+        for first, last, label, weight, keyword in self.automaton.scan(words):
+            if offsets is None:
+                offsets = _word_offsets(folded, words)
+            result.keywords.append(
+                KeywordMatch(keyword, label, offsets[first], offsets[last] + len(words[last]), weight)
+            )
+            if (label, keyword) not in seen:
+                seen.add((label, keyword))
+                result.scores[label] = result.scores.get(label, 0.0) + weight
+
+        self._last = (text, result)
+        return result
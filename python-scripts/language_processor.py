@@ -7,14 +7,22 @@ Optimized for multilingual support, intent classification, and entity extraction
 
 import re
 import json
-import hashlib
 import datetime
 from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, replace
 from enum import Enum
 from collections import defaultdict
 import unicodedata
 
+from cache_manager import LRUCache
+from keyword_matcher import CompiledMatcher
+
+try:
+    from performance_monitor import get_performance_monitor
+    PERFORMANCE_MONITOR_AVAILABLE = True
+except ImportError:
+    PERFORMANCE_MONITOR_AVAILABLE = False
+
 
 class Language(Enum):
     """Supported languages"""
@@ -234,25 +242,23 @@ class IntentClassifier:
                 Intent.OBJECION: ['caro', 'custoso', 'muito caro', 'nao tenho certeza', 'não tenho certeza', 'duvida', 'dúvida'],
             }
         }
+        
+        # One compiled matcher per language; longer keywords get higher weight
+        self.matchers = {}
+        for language, intents in self.patterns.items():
+            matcher = CompiledMatcher()
+            for intent, keywords in intents.items():
+                matcher.add_keywords(intent.value, keywords, weight=lambda keyword: len(keyword) / 10.0)
+            self.matchers[language] = matcher
     
     def classify(self, text: str, language: Language = Language.SPANISH, context: Optional[Dict[str, Any]] = None) -> Tuple[Intent, float]:
         """Classify intent with confidence score"""
         if not text:
             return Intent.GENERAL, 0.0
         
-        text_lower = text.lower()
-        scores = defaultdict(float)
-        
-        # Get patterns for detected language
-        lang_patterns = self.patterns.get(language, self.patterns[Language.SPANISH])
-        
-        # Score each intent
-        for intent, keywords in lang_patterns.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    # Longer keywords get higher weight
-                    weight = len(keyword) / 10.0
-                    scores[intent] += weight
+        # Score each intent with the matcher for detected language
+        matcher = self.matchers.get(language, self.matchers[Language.SPANISH])
+        scores = {Intent(label): score for label, score in matcher.match(text).scores.items()}
         
         # Boost score based on context
         if context:
@@ -315,6 +321,23 @@ class EntityExtractor:
         
         # Phone pattern
         self.phone_pattern = re.compile(r'(\+?598\s?)?(\d{2,3}\s?\d{3}\s?\d{3})')
+        
+        # Service keywords
+        self.services = {
+            'flete': ['flete', 'transporte', 'delivery'],
+            'instalacion': ['instalacion', 'instalación', 'instalacao', 'instalação', 'instalar', 'installation'],
+            'accesorios': ['accesorios', 'accessories'],
+        }
+        
+        # Every keyword list and pattern compiled into one matcher
+        self.matcher = CompiledMatcher()
+        for prefix, groups in (('product', self.products), ('color', self.colors), ('service', self.services)):
+            for group_id, keywords in groups.items():
+                self.matcher.add_keywords(f'{prefix}:{group_id}', keywords)
+        for pattern in self.dimension_patterns:
+            self.matcher.add_pattern('dimensions', pattern)
+        self.matcher.add_pattern('thickness', self.thickness_pattern)
+        self.matcher.add_pattern('phone', self.phone_pattern)
     
     def extract(self, text: str, intent: Intent, language: Language = Language.SPANISH) -> Dict[str, Any]:
         """Extract entities from text"""
@@ -331,12 +354,13 @@ class EntityExtractor:
             }
         }
         
-        text_lower = text.lower()
+        result = self.matcher.match(text)
+        found = {(match.label, match.keyword) for match in result.keywords}
         
-        # Extract products
+        # Extract products (first keyword of each product found in the text)
         for product_id, keywords in self.products.items():
             for keyword in keywords:
-                if keyword in text_lower:
+                if (f'product:{product_id}', keyword) in found:
                     entities['products'].append({
                         'id': product_id,
                         'name': keyword,
@@ -345,101 +369,85 @@ class EntityExtractor:
                     break
         
         # Extract dimensions
-        for pattern in self.dimension_patterns:
-            match = pattern.search(text)
-            if match:
-                if len(match.groups()) == 2:
-                    entities['dimensions'] = {
-                        'largo': float(match.group(1)),
-                        'ancho': float(match.group(2)),
-                        'confidence': 0.8
-                    }
-                elif 'm2' in match.group(0) or 'metros cuadrados' in match.group(0):
-                    entities['dimensions'] = {
-                        'area_m2': float(match.group(1)),
-                        'confidence': 0.8
-                    }
-                break
+        match = result.first('dimensions')
+        if match:
+            if len(match.groups) == 2:
+                entities['dimensions'] = {
+                    'largo': float(match.groups[0]),
+                    'ancho': float(match.groups[1]),
+                    'confidence': 0.8
+                }
+            elif 'm2' in match.text or 'metros cuadrados' in match.text:
+                entities['dimensions'] = {
+                    'area_m2': float(match.groups[0]),
+                    'confidence': 0.8
+                }
         
         # Extract thickness
-        thickness_match = self.thickness_pattern.search(text)
+        thickness_match = result.first('thickness')
         if thickness_match:
             entities['thickness'] = {
-                'value': thickness_match.group(1) + 'mm',
+                'value': thickness_match.groups[0] + 'mm',
                 'confidence': 0.9
             }
         
         # Extract color
-        color_found = False
-        for color_id, keywords in self.colors.items():
-            if color_found:
+        for color_id in self.colors:
+            if f'color:{color_id}' in result.scores:
+                entities['color'] = {
+                    'value': color_id,
+                    'confidence': 0.8
+                }
                 break
-            for keyword in keywords:
-                if keyword in text_lower:
-                    entities['color'] = {
-                        'value': color_id,
-                        'confidence': 0.8
-                    }
-                    color_found = True
-                    break
         # Extract phone
-        phone_match = self.phone_pattern.search(text)
+        phone_match = result.first('phone')
         if phone_match:
             entities['phone'] = {
-                'value': phone_match.group(0).replace(' ', ''),
+                'value': phone_match.text.replace(' ', ''),
                 'confidence': 0.9
             }
         
         # Extract services
-        if 'flete' in text_lower or 'transporte' in text_lower or 'delivery' in text_lower:
-            entities['services']['flete'] = True
-        if 'instalacion' in text_lower or 'instalación' in text_lower or 'instalacao' in text_lower or 'instalação' in text_lower or 'instalar' in text_lower or 'installation' in text_lower:
-            entities['services']['instalacion'] = True
-        if 'accesorios' in text_lower or 'accesorios' in text_lower or 'accessories' in text_lower:
-            entities['services']['accesorios'] = True
+        for service in self.services:
+            if f'service:{service}' in result.scores:
+                entities['services'][service] = True
         
         return entities
 
 
 class CacheManager:
-    """Simple in-memory cache for processed messages"""
+    """
+    Cache of processed messages keyed by normalized text
+
+    Thin wrapper over the shared LRUCache (O(1) eviction, TTL, byte limit,
+    thread-safe); hits and misses go to the performance monitor as
+    "language_processor".
+    """
     
-    def __init__(self, max_size: int = 1000, ttl_seconds: int = 300):
-        self.cache = {}
+    def __init__(self, max_size: int = 1000, ttl_seconds: int = 300,
+                 max_bytes: Optional[int] = 16 * 1024 * 1024, monitor: Any = None):
+        if monitor is None and PERFORMANCE_MONITOR_AVAILABLE:
+            monitor = get_performance_monitor()
+        self.cache = LRUCache(
+            name="language_processor",
+            max_entries=max_size,
+            max_bytes=max_bytes,
+            ttl=ttl_seconds,
+            monitor=monitor,
+        )
         self.max_size = max_size
         self.ttl_seconds = ttl_seconds
     
-    def _get_key(self, text: str) -> str:
-        """Generate cache key"""
-        return hashlib.md5(text.encode('utf-8')).hexdigest()
+    def __len__(self) -> int:
+        return len(self.cache)
     
     def get(self, text: str) -> Optional[ProcessedMessage]:
         """Get cached result"""
-        key = self._get_key(text)
-        if key in self.cache:
-            entry = self.cache[key]
-            # Check TTL
-            age = (datetime.datetime.now() - entry['timestamp']).total_seconds()
-            if age < self.ttl_seconds:
-                return entry['result']
-            else:
-                # Expired, remove
-                del self.cache[key]
-        return None
+        return self.cache.get(text)
     
     def set(self, text: str, result: ProcessedMessage):
         """Cache result"""
-        key = self._get_key(text)
-        # Evict if cache is full
-        if len(self.cache) >= self.max_size:
-            # Remove oldest entry
-            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k]['timestamp'])
-            del self.cache[oldest_key]
-        
-        self.cache[key] = {
-            'result': result,
-            'timestamp': datetime.datetime.now()
-        }
+        self.cache.set(text, result)
 
 
 class ContextManager:
@@ -522,12 +530,11 @@ class LanguageProcessor:
         
         # 3. Check cache
         cached = None
-        if self.cache:
+        if self.cache is not None:
             cached = self.cache.get(normalized)
             if cached:
-                # Update session_id if provided
-                cached.session_id = session_id
-                return cached
+                # Copy so callers of other sessions keep their own session_id
+                return replace(cached, session_id=session_id)
         
         # 4. Get context
         context = None
@@ -557,7 +564,7 @@ class LanguageProcessor:
         )
         
         # 9. Cache result
-        if self.cache:
+        if self.cache is not None:
             self.cache.set(normalized, result)
         
         # 10. Update context
@@ -591,7 +598,7 @@ class LanguageProcessor:
     def export_stats(self) -> Dict[str, Any]:
         """Export processing statistics"""
         return {
-            'cache_size': len(self.cache.cache) if self.cache else 0,
+            'cache_size': len(self.cache) if self.cache is not None else 0,
             'context_sessions': len(self.context_manager.contexts) if self.context_manager else 0,
             'timestamp': datetime.datetime.now().isoformat()
         }
@@ -5,9 +5,14 @@ Shared Context Service for Multi-Agent System
 Provides unified MongoDB-based context management for all agents
 """
 
+import atexit
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from dataclasses import dataclass, asdict
 
 logger = logging.getLogger(__name__)
@@ -23,20 +28,323 @@ try:
         sys.path.insert(0, str(parent_dir))
 
     from mongodb_service import get_mongodb_service, ensure_mongodb_connected
+    from mongodb_service import report_failure as report_mongodb_failure
+    from pymongo import UpdateOne
 
     MONGODB_AVAILABLE = True
 except ImportError:
     MONGODB_AVAILABLE = False
     logger.warning("mongodb_service not available, using in-memory fallback")
 
+from generador_ids import nuevo_id
 
-class SharedContextService:
-    """Unified context service for all agents"""
 
-    def __init__(self):
+class SharedContextService:
+    """Unified context service for all agents
+
+    Contexts are served from an in-process LRU/TTL cache. Writes update the
+    cache immediately and are queued for MongoDB (write-behind): a background
+    thread coalesces them and sends them with a single ``bulk_write`` per
+    flush. The MongoDB health check is cached for ``health_check_interval``
+    seconds instead of running on every call.
+
+    The message history is an append-only log bounded to the last
+    ``max_messages`` entries (``$push`` with ``$slice``); messages that fall
+    out of the window are folded into a short rolling ``summary``. Each
+    message is pushed together with its summary line into ``summary_lines``,
+    bounded the same way but longer than the window, and the summary is the
+    lines older than the window. The fold is part of the same atomic update,
+    so it needs no read and holds for uncached sessions and across workers.
+    Saving a context never rewrites the history, so its cost does not depend
+    on the length of the conversation.
+    """
+
+    def __init__(
+        self,
+        cache_size: Optional[int] = None,
+        cache_ttl: Optional[float] = None,
+        flush_interval: Optional[float] = None,
+        flush_batch_size: int = 500,
+        health_check_interval: Optional[float] = None,
+        max_messages: Optional[int] = None,
+        summary_max_chars: int = 1500,
+    ):
         self._in_memory_sessions = {}
         self._in_memory_contexts = {}
 
+        # LRU/TTL cache: (user_phone, session_id) -> (expires_at, context)
+        self.cache_size = cache_size or int(os.getenv("SHARED_CONTEXT_CACHE_SIZE", "1024"))
+        self.cache_ttl = cache_ttl or float(os.getenv("SHARED_CONTEXT_CACHE_TTL", "300"))
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._cache_keys_by_session: Dict[str, set] = {}
+
+        # Write-behind queue: ordered, coalesced pending operations
+        self.flush_interval = flush_interval or float(os.getenv("SHARED_CONTEXT_FLUSH_INTERVAL", "0.5"))
+        self.flush_batch_size = flush_batch_size
+        self._pending: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._pending_seq = 0
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+        # Cached health check
+        self.health_check_interval = health_check_interval or float(
+            os.getenv("SHARED_CONTEXT_HEALTH_CHECK_INTERVAL", "30")
+        )
+        self._mongodb_ok = False
+        self._mongodb_checked_at = float("-inf")
+
+        # Bounded message log and rolling summary
+        self.max_messages = max_messages or int(os.getenv("SHARED_CONTEXT_MAX_MESSAGES", "50"))
+        self.summary_max_chars = summary_max_chars
+        # Summary lines kept beyond the window: enough to fill the summary
+        # unless lines average under 16 characters
+        self.summary_lines_kept = self.max_messages + summary_max_chars // 16
+
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "flushes": 0, "operations_written": 0}
+
+    # ------------------------------------------------------------------
+    # Connection and cache helpers
+    # ------------------------------------------------------------------
+
+    def _mongodb_available(self) -> bool:
+        """MongoDB health, re-checked at most every health_check_interval seconds"""
+        if not MONGODB_AVAILABLE:
+            return False
+        now = time.monotonic()
+        if now - self._mongodb_checked_at >= self.health_check_interval:
+            self._mongodb_ok = bool(ensure_mongodb_connected())
+            self._mongodb_checked_at = now
+        return self._mongodb_ok
+
+    def _mark_mongodb_unavailable(self, error: Optional[Exception] = None):
+        # Connection errors also put the shared client in degraded mode now,
+        # not at its next heartbeat
+        if error is not None:
+            report_mongodb_failure(error)
+        self._mongodb_ok = False
+        self._mongodb_checked_at = time.monotonic()
+
+    def _context_collection(self):
+        mongodb = get_mongodb_service()
+        return mongodb.get_collection("context") if mongodb else None
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, context = entry
+            if expires_at < time.monotonic():
+                self._cache_discard(key)
+                return None
+            self._cache.move_to_end(key)
+            return context
+
+    def _cache_put(self, key: Tuple[str, str], context: Dict[str, Any]):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, context)
+            self._cache.move_to_end(key)
+            self._cache_keys_by_session.setdefault(key[1], set()).add(key)
+            while len(self._cache) > self.cache_size:
+                oldest = next(iter(self._cache))
+                self._cache_discard(oldest)
+
+    def _cache_discard(self, key: Tuple[str, str]):
+        self._cache.pop(key, None)
+        keys = self._cache_keys_by_session.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._cache_keys_by_session[key[1]]
+
+    def _append_to_window(self, context: Dict[str, Any], entries: List[Dict[str, Any]]) -> bool:
+        """
+        Append messages to a context keeping only the last max_messages.
+        Messages pushed out of the window are folded into context["summary"];
+        returns True when the summary changed.
+        """
+        messages = context.get("messages", []) + entries
+        dropped = messages[:-self.max_messages] if len(messages) > self.max_messages else []
+        context["messages"] = messages[-self.max_messages:]
+        context["message_count"] = context.get("message_count", len(messages) - len(entries)) + len(entries)
+        if not dropped:
+            return False
+        context["summary"] = self._fold_into_summary(context.get("summary", ""), dropped)
+        return True
+
+    def _summary_line(self, message: Dict[str, Any]) -> str:
+        content = " ".join(str(message.get("content", "")).split())
+        if len(content) > 120:
+            content = content[:117] + "..."
+        return f"{message.get('role', 'user')}: {content}"
+
+    def _fold_into_summary(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        """Rolling extractive summary: one short line per message, newest kept"""
+        return self._fold_lines(summary, [self._summary_line(m) for m in messages])
+
+    def _fold_lines(self, summary: str, new_lines: List[str]) -> str:
+        lines = [summary] if summary else []
+        lines.extend(new_lines)
+        text = "\n".join(lines)
+        if len(text) > self.summary_max_chars:
+            text = text[-self.summary_max_chars:]
+            text = text[text.find("\n") + 1:] if "\n" in text else text
+        return text
+
+    def _from_document(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Context from a MongoDB document, with the summary of the lines older than the window"""
+        context = dict(document)
+        context.pop("_id", None)
+        lines = context.pop("summary_lines", None) or []
+        older = lines[:max(0, len(lines) - len(context.get("messages", [])))]
+        if older:
+            context["summary"] = self._fold_lines(context.get("summary", ""), older)
+        return context
+
+    def invalidate(self, session_id: str):
+        """Drop every cached context of a session"""
+        with self._lock:
+            for key in list(self._cache_keys_by_session.get(session_id, ())):
+                self._cache_discard(key)
+
+    # ------------------------------------------------------------------
+    # Write-behind
+    # ------------------------------------------------------------------
+
+    def _enqueue_set(self, session_id: str, user_phone: str, fields: Dict[str, Any]):
+        """
+        Queue a $set; a newer $set of the same document is merged into the
+        queued one in place. Sets never touch the message log, so keeping the
+        original position preserves the upsert-before-push order.
+        """
+        key = ("set", session_id, user_phone)
+        with self._lock:
+            previous = self._pending.get(key)
+            if previous is not None:
+                previous["fields"].update(fields)
+            else:
+                self._pending[key] = {"fields": dict(fields)}
+            self._after_enqueue()
+
+    def _enqueue_push(self, session_id: str, message_entry: Dict[str, Any]):
+        """Queue a $push; consecutive pushes to the same session are merged"""
+        with self._lock:
+            last_key = next(reversed(self._pending), None)
+            if last_key is not None and last_key[0] == "push" and last_key[1] == session_id:
+                self._pending[last_key]["messages"].append(message_entry)
+            else:
+                self._pending_seq += 1
+                self._pending[("push", session_id, self._pending_seq)] = {
+                    "messages": [message_entry],
+                }
+            self._after_enqueue()
+
+    def _after_enqueue(self):
+        if self._writer is None or not self._writer.is_alive():
+            self._stop.clear()
+            self._writer = threading.Thread(
+                target=self._writer_loop, name="shared-context-writer", daemon=True
+            )
+            self._writer.start()
+        if len(self._pending) >= self.flush_batch_size:
+            self._wakeup.set()
+
+    def _writer_loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _has_pending(self, session_id: str) -> bool:
+        with self._lock:
+            return any(key[1] == session_id for key in self._pending)
+
+    def flush(self) -> int:
+        """Send every pending write to MongoDB in one bulk_write; returns operations written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending = self._pending
+                self._pending = OrderedDict()
+
+            # Consecutive pushes to the same session become one $push/$each
+            grouped = []
+            for key, data in pending.items():
+                previous = grouped[-1] if grouped else None
+                if key[0] == "push" and previous and previous[0][0] == "push" and previous[0][1] == key[1]:
+                    previous[1]["messages"] = previous[1]["messages"] + data["messages"]
+                else:
+                    grouped.append((key, dict(data)))
+
+            operations = []
+            for key, data in grouped:
+                if key[0] == "set":
+                    operations.append(
+                        UpdateOne(
+                            {"session_id": key[1], "user_phone": key[2]},
+                            {"$set": data["fields"]},
+                            upsert=True,
+                        )
+                    )
+                else:
+                    operations.append(
+                        UpdateOne(
+                            {"session_id": key[1]},
+                            {
+                                "$push": {
+                                    "messages": {
+                                        "$each": data["messages"],
+                                        "$slice": -self.max_messages,
+                                    },
+                                    "summary_lines": {
+                                        "$each": [self._summary_line(m) for m in data["messages"]],
+                                        "$slice": -self.summary_lines_kept,
+                                    },
+                                },
+                                "$inc": {"message_count": len(data["messages"])},
+                                "$set": {"last_updated": data["messages"][-1]["timestamp"]},
+                            },
+                        )
+                    )
+
+            try:
+                context_col = self._context_collection()
+                if context_col is None:
+                    raise ConnectionError("MongoDB not available")
+                context_col.bulk_write(operations, ordered=True)
+            except Exception as e:
+                logger.error(f"Error flushing {len(operations)} context writes to MongoDB: {e}")
+                self._mark_mongodb_unavailable(e)
+                # Put the batch back in front of anything queued meanwhile
+                with self._lock:
+                    newer = self._pending
+                    self._pending = pending
+                    for key, data in newer.items():
+                        if key in self._pending and key[0] == "set":
+                            data = {"fields": {**self._pending.pop(key)["fields"], **data["fields"]}}
+                        self._pending[key] = data
+                return 0
+
+            self.stats["flushes"] += 1
+            self.stats["operations_written"] += len(operations)
+            return len(operations)
+
+    def close(self):
+        """Stop the background writer and flush pending writes"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5)
+        self.flush()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
     def get_context(self, session_id: str, user_phone: str) -> Optional[Dict[str, Any]]:
         """
         Retrieve full conversation context for a session
@@ -48,21 +356,31 @@ class SharedContextService:
         Returns:
             Context dictionary or None if not found
         """
+        cache_key = (user_phone, session_id)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            # An empty entry records a context known not to exist yet
+            return cached or None
+        self.stats["cache_misses"] += 1
+
         try:
-            if MONGODB_AVAILABLE and ensure_mongodb_connected():
-                mongodb = get_mongodb_service()
-                context_col = mongodb.get_collection("context")
+            if self._mongodb_available():
+                # Evicted while writes were still queued: persist them first
+                if self._has_pending(session_id):
+                    self.flush()
+                context_col = self._context_collection()
 
-                if context_col:
+                if context_col is not None:
                     context_doc = context_col.find_one(
                         {"session_id": session_id, "user_phone": user_phone}
                     )
 
                     if context_doc:
-                        # Convert MongoDB document to dict, remove _id
-                        context_dict = dict(context_doc)
-                        context_dict.pop("_id", None)
+                        context_dict = self._from_document(context_doc)
+                        self._cache_put(cache_key, context_dict)
                         return context_dict
+                    self._cache_put(cache_key, {})
 
             # Fallback to in-memory
             key = f"{user_phone}_{session_id}"
@@ -70,6 +388,7 @@ class SharedContextService:
 
         except Exception as e:
             logger.warning(f"Error getting context from MongoDB: {e}, using in-memory")
+            self._mark_mongodb_unavailable(e)
             key = f"{user_phone}_{session_id}"
             return self._in_memory_contexts.get(key)
 
@@ -77,6 +396,10 @@ class SharedContextService:
         """
         Save/update conversation context
 
+        The cache is updated right away; the MongoDB write is queued. The
+        message history is not part of the saved fields: a "messages" key is
+        ignored, use add_message to append to the log.
+
         Args:
             session_id: Session identifier
             context: Context dictionary (must include user_phone)
@@ -89,31 +412,36 @@ class SharedContextService:
             if not user_phone:
                 logger.error("Context must include user_phone or cliente_id")
                 return False
-
-            if MONGODB_AVAILABLE and ensure_mongodb_connected():
-                mongodb = get_mongodb_service()
-                context_col = mongodb.get_collection("context")
-
-                if context_col:
-                    # Prepare document
-                    context_doc = {
-                        "session_id": session_id,
-                        "user_phone": user_phone,
-                        "last_updated": datetime.now(),
-                        **context,
-                    }
-
-                    # Update or insert
-                    context_col.update_one(
-                        {"session_id": session_id, "user_phone": user_phone},
-                        {"$set": context_doc},
-                        upsert=True,
-                    )
-                    return True
-
-            # Fallback to in-memory
+            context = {
+                k: v for k, v in context.items()
+                if k not in ("messages", "message_count", "summary", "summary_lines")
+            }
+
+            if self._mongodb_available():
+                # Prepare document
+                context_doc = {
+                    "session_id": session_id,
+                    "user_phone": user_phone,
+                    "last_updated": datetime.now(),
+                    **context,
+                }
+                cache_key = (user_phone, session_id)
+                # Only a cached context that already holds the message log can
+                # be updated in place; otherwise the next read goes to MongoDB
+                cached = self._cache_get(cache_key)
+                if cached is not None:
+                    self._cache_put(cache_key, {**cached, **context_doc})
+                self._enqueue_set(session_id, user_phone, context_doc)
+                return True
+
+            # Fallback to in-memory (keeps the existing message log)
             key = f"{user_phone}_{session_id}"
-            self._in_memory_contexts[key] = context
+            previous = self._in_memory_contexts.get(key, {})
+            self._in_memory_contexts[key] = {
+                **{k: previous[k] for k in ("messages", "message_count", "summary") if k in previous},
+                "session_id": session_id,
+                **context,
+            }
             return True
 
         except Exception as e:
@@ -145,39 +473,34 @@ class SharedContextService:
             True if successful, False otherwise
         """
         try:
-            if MONGODB_AVAILABLE and ensure_mongodb_connected():
-                mongodb = get_mongodb_service()
-                context_col = mongodb.get_collection("context")
-
-                if context_col:
-                    message_entry = {
-                        "role": role,
-                        "content": message,
-                        "timestamp": datetime.now(),
-                        "metadata": metadata or {},
-                    }
-
-                    context_col.update_one(
-                        {"session_id": session_id},
-                        {
-                            "$push": {"messages": message_entry},
-                            "$set": {"last_updated": datetime.now()},
-                        },
-                    )
-                    return True
+            if self._mongodb_available():
+                message_entry = {
+                    "role": role,
+                    "content": message,
+                    "timestamp": datetime.now(),
+                    "metadata": metadata or {},
+                }
+                with self._lock:
+                    for key in self._cache_keys_by_session.get(session_id, ()):
+                        context = self._cache[key][1]
+                        self._append_to_window(context, [message_entry])
+                        context["last_updated"] = message_entry["timestamp"]
+                self._enqueue_push(session_id, message_entry)
+                return True
 
             # Fallback: update in-memory context
             for key, context in self._in_memory_contexts.items():
                 if context.get("session_id") == session_id:
-                    if "messages" not in context:
-                        context["messages"] = []
-                    context["messages"].append(
-                        {
-                            "role": role,
-                            "content": message,
-                            "timestamp": datetime.now().isoformat(),
-                            "metadata": metadata or {},
-                        }
+                    self._append_to_window(
+                        context,
+                        [
+                            {
+                                "role": role,
+                                "content": message,
+                                "timestamp": datetime.now().isoformat(),
+                                "metadata": metadata or {},
+                            }
+                        ],
                     )
                     return True
 
@@ -198,11 +521,11 @@ class SharedContextService:
             Session dictionary or None if not found
         """
         try:
-            if MONGODB_AVAILABLE and ensure_mongodb_connected():
+            if self._mongodb_available():
                 mongodb = get_mongodb_service()
                 sessions_col = mongodb.get_collection("sessions")
 
-                if sessions_col:
+                if sessions_col is not None:
                     session_doc = sessions_col.find_one({"session_id": session_id})
                     if session_doc:
                         session_dict = dict(session_doc)
@@ -214,6 +537,7 @@ class SharedContextService:
 
         except Exception as e:
             logger.warning(f"Error getting session from MongoDB: {e}")
+            self._mark_mongodb_unavailable(e)
             return self._in_memory_sessions.get(session_id)
 
     def create_session(
@@ -233,11 +557,7 @@ class SharedContextService:
         Returns:
             Session ID
         """
-        import uuid
-
-        session_id = (
-            f"sess_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
-        )
+        session_id = nuevo_id("sess_")
 
         session_data = {
             "session_id": session_id,
@@ -249,11 +569,11 @@ class SharedContextService:
         }
 
         try:
-            if MONGODB_AVAILABLE and ensure_mongodb_connected():
+            if self._mongodb_available():
                 mongodb = get_mongodb_service()
                 sessions_col = mongodb.get_collection("sessions")
 
-                if sessions_col:
+                if sessions_col is not None:
                     sessions_col.insert_one(session_data)
 
                     # Create initial context if message provided
@@ -271,6 +591,7 @@ class SharedContextService:
 
         except Exception as e:
             logger.warning(f"Error creating session in MongoDB: {e}, using in-memory")
+            self._mark_mongodb_unavailable(e)
             self._in_memory_sessions[session_id] = session_data
             if initial_message:
                 self.add_message(session_id, initial_message, "user")
@@ -290,11 +611,11 @@ class SharedContextService:
             List of session dictionaries
         """
         try:
-            if MONGODB_AVAILABLE and ensure_mongodb_connected():
+            if self._mongodb_available():
                 mongodb = get_mongodb_service()
                 sessions_col = mongodb.get_collection("sessions")
 
-                if sessions_col:
+                if sessions_col is not None:
                     query = {}
                     if user_phone:
                         query["user_phone"] = user_phone
@@ -326,6 +647,7 @@ class SharedContextService:
 
         except Exception as e:
             logger.warning(f"Error listing sessions from MongoDB: {e}")
+            self._mark_mongodb_unavailable(e)
             # Return in-memory sessions
             result = []
             for session in self._in_memory_sessions.values():
@@ -346,4 +668,5 @@ def get_shared_context_service() -> SharedContextService:
     global _shared_context_service
     if _shared_context_service is None:
         _shared_context_service = SharedContextService()
+        atexit.register(_shared_context_service.close)
     return _shared_context_service
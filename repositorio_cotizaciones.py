@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Repositorio persistente de cotizaciones BMC Uruguay
+SQLite en local y MongoDB cuando MONGODB_URI está configurada. Ambos
+backends indexan por ID, teléfono normalizado, nombre normalizado (y cada
+una de sus palabras) y fecha.
+
+En MongoDB se usa una colección propia (COLECCION_MONGODB): "quotes" es la
+del dashboard, con otro formato de documento y un índice único sobre `arg`.
+"""
+
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from dataclasses import asdict
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sistema_cotizaciones import Cliente, Cotizacion, EspecificacionCotizacion
+
+logger = logging.getLogger(__name__)
+
+DB_PATH_DEFAULT = Path(__file__).resolve().parent / "data" / "persistence" / "cotizaciones.sqlite3"
+COLECCION_MONGODB = "cotizaciones_bot"
+# Versión del esquema SQLite (PRAGMA user_version)
+VERSION_ESQUEMA_SQLITE = 1
+PREFIJO_PAIS = "598"
+
+
+def normalizar_telefono(telefono: str) -> str:
+    """
+    Número nacional: solo dígitos, sin el prefijo de país 598 ni el 0 inicial
+    ("094 807-926" y "+598 94 807 926" -> "94807926")
+    """
+    digitos = "".join(c for c in telefono or "" if c.isdigit())
+    if digitos.startswith(PREFIJO_PAIS) and len(digitos) > 9:
+        digitos = digitos[len(PREFIJO_PAIS):]
+    return digitos.lstrip("0")
+
+
+def normalizar_nombre(nombre: str) -> str:
+    """Minúsculas, sin acentos y con espacios simples ("  María  Pérez" -> "maria perez")"""
+    descompuesto = unicodedata.normalize("NFKD", nombre or "")
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.lower().split())
+
+
+def palabras_nombre(nombre: str) -> List[str]:
+    """Palabras distintas del nombre normalizado (para buscar por apellido)"""
+    return sorted(set(normalizar_nombre(nombre).split()))
+
+
+def _fecha_indexable(fecha: datetime.datetime) -> str:
+    """ISO 8601 con ancho fijo, para que el orden de texto sea el cronológico"""
+    return fecha.isoformat(timespec="microseconds")
+
+
+def cotizacion_a_dict(cotizacion: Cotizacion) -> Dict[str, Any]:
+    """Serializa una cotización a tipos JSON (los Decimal se guardan como texto)"""
+    especificaciones = {
+        clave: str(valor) if isinstance(valor, Decimal) else valor
+        for clave, valor in asdict(cotizacion.especificaciones).items()
+    }
+    return {
+        "id": cotizacion.id,
+        "cliente": asdict(cotizacion.cliente),
+        "especificaciones": especificaciones,
+        "fecha": cotizacion.fecha.isoformat(),
+        "estado": cotizacion.estado,
+        "asignado_a": cotizacion.asignado_a,
+        "precio_total": str(cotizacion.precio_total),
+        "precio_metro_cuadrado": str(cotizacion.precio_metro_cuadrado),
+        "observaciones": cotizacion.observaciones,
+    }
+
+
+def cotizacion_desde_dict(datos: Dict[str, Any]) -> Cotizacion:
+    """Reconstruye una cotización desde cotizacion_a_dict (o del JSON exportado)"""
+    especificaciones = dict(datos["especificaciones"])
+    for campo in ("largo_metros", "ancho_metros"):
+        especificaciones[campo] = Decimal(str(especificaciones[campo]))
+    fecha = datos["fecha"]
+    if not isinstance(fecha, datetime.datetime):
+        fecha = datetime.datetime.fromisoformat(fecha)
+    return Cotizacion(
+        id=datos["id"],
+        cliente=Cliente(**datos["cliente"]),
+        especificaciones=EspecificacionCotizacion(**especificaciones),
+        fecha=fecha,
+        estado=datos["estado"],
+        asignado_a=datos.get("asignado_a", ""),
+        precio_total=Decimal(str(datos.get("precio_total", "0"))),
+        precio_metro_cuadrado=Decimal(str(datos.get("precio_metro_cuadrado", "0"))),
+        observaciones=datos.get("observaciones", ""),
+    )
+
+
+class RepositorioCotizaciones(ABC):
+    """Interfaz común de los repositorios de cotizaciones"""
+
+    @abstractmethod
+    def guardar(self, cotizacion: Cotizacion):
+        """Inserta o reemplaza una cotización"""
+        pass
+
+    @abstractmethod
+    def obtener(self, id_cotizacion: str) -> Optional[Cotizacion]:
+        """Busca una cotización por ID"""
+        pass
+
+    @abstractmethod
+    def buscar_por_telefono(self, telefono: str) -> List[Cotizacion]:
+        """
+        Cotizaciones cuyo número nacional coincide (por índice); si no hay
+        ninguna, las que lo contienen
+        """
+        pass
+
+    @abstractmethod
+    def buscar_por_nombre(self, nombre: str) -> List[Cotizacion]:
+        """
+        Cotizaciones con una palabra del nombre que empieza con el texto
+        buscado ("Perez" encuentra "Juan Pérez"; por índice); si no hay
+        ninguna, las que lo contienen en cualquier posición
+        """
+        pass
+
+    @abstractmethod
+    def buscar_por_fecha(self, fecha_inicio: datetime.datetime,
+                         fecha_fin: datetime.datetime) -> List[Cotizacion]:
+        """Cotizaciones con fecha dentro del rango (inclusive)"""
+        pass
+
+    @abstractmethod
+    def actualizar_estado(self, id_cotizacion: str, nuevo_estado: str) -> bool:
+        """Actualiza el estado; devuelve False si la cotización no existe"""
+        pass
+
+    @abstractmethod
+    def listar(self, limite: Optional[int] = None) -> List[Cotizacion]:
+        """Todas las cotizaciones ordenadas por fecha"""
+        pass
+
+    @abstractmethod
+    def contar(self) -> int:
+        """Cantidad de cotizaciones guardadas"""
+        pass
+
+
+class RepositorioCotizacionesSQLite(RepositorioCotizaciones):
+    """Repositorio en SQLite; seguro entre hilos y procesos (modo WAL)"""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = str(db_path or os.getenv("COTIZACIONES_DB_PATH") or DB_PATH_DEFAULT)
+        if self.db_path != ":memory:":
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        with self._lock, self.conn:
+            if self.db_path != ":memory:":
+                self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cotizaciones (
+                    id TEXT PRIMARY KEY,
+                    telefono_normalizado TEXT NOT NULL,
+                    nombre_normalizado TEXT NOT NULL,
+                    fecha TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+                """
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cotizaciones_telefono ON cotizaciones (telefono_normalizado)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cotizaciones_nombre ON cotizaciones (nombre_normalizado)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cotizaciones_fecha ON cotizaciones (fecha)")
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cotizaciones_palabras (
+                    palabra TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    PRIMARY KEY (palabra, id)
+                ) WITHOUT ROWID
+                """
+            )
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < VERSION_ESQUEMA_SQLITE:
+                self._migrar_a_numero_nacional()
+                self.conn.execute(f"PRAGMA user_version = {VERSION_ESQUEMA_SQLITE}")
+
+    def _migrar_a_numero_nacional(self):
+        """Recalcula teléfono y palabras del nombre de las filas existentes"""
+        for id_cotizacion, payload in self.conn.execute("SELECT id, payload FROM cotizaciones").fetchall():
+            cliente = json.loads(payload)["cliente"]
+            self.conn.execute(
+                "UPDATE cotizaciones SET telefono_normalizado = ? WHERE id = ?",
+                (normalizar_telefono(cliente["telefono"]), id_cotizacion),
+            )
+            self._indexar_palabras(id_cotizacion, cliente["nombre"])
+
+    def _indexar_palabras(self, id_cotizacion: str, nombre: str):
+        self.conn.execute("DELETE FROM cotizaciones_palabras WHERE id = ?", (id_cotizacion,))
+        self.conn.executemany(
+            "INSERT INTO cotizaciones_palabras (palabra, id) VALUES (?, ?)",
+            [(palabra, id_cotizacion) for palabra in palabras_nombre(nombre)],
+        )
+
+    def _consultar(self, where: str = "", parametros: tuple = (), limite: Optional[int] = None) -> List[Cotizacion]:
+        consulta = f"SELECT payload, estado FROM cotizaciones {where} ORDER BY fecha"
+        if limite is not None:
+            consulta += f" LIMIT {int(limite)}"
+        with self._lock:
+            filas = self.conn.execute(consulta, parametros).fetchall()
+        resultados = []
+        for payload, estado in filas:
+            datos = json.loads(payload)
+            datos["estado"] = estado
+            resultados.append(cotizacion_desde_dict(datos))
+        return resultados
+
+    def guardar(self, cotizacion: Cotizacion):
+        with self._lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO cotizaciones (
+                    id, telefono_normalizado, nombre_normalizado, fecha, estado, payload
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    cotizacion.id,
+                    normalizar_telefono(cotizacion.cliente.telefono),
+                    normalizar_nombre(cotizacion.cliente.nombre),
+                    _fecha_indexable(cotizacion.fecha),
+                    cotizacion.estado,
+                    json.dumps(cotizacion_a_dict(cotizacion), ensure_ascii=False),
+                ),
+            )
+            self._indexar_palabras(cotizacion.id, cotizacion.cliente.nombre)
+
+    def obtener(self, id_cotizacion: str) -> Optional[Cotizacion]:
+        resultados = self._consultar("WHERE id = ?", (id_cotizacion,))
+        return resultados[0] if resultados else None
+
+    def buscar_por_telefono(self, telefono: str) -> List[Cotizacion]:
+        numero = normalizar_telefono(telefono)
+        if not numero:
+            return []
+        return (
+            self._consultar("WHERE telefono_normalizado = ?", (numero,))
+            or self._consultar("WHERE instr(telefono_normalizado, ?) > 0", (numero,))
+        )
+
+    def buscar_por_nombre(self, nombre: str) -> List[Cotizacion]:
+        texto = normalizar_nombre(nombre)
+        if not texto:
+            return []
+        primera = texto.split()[0]
+        # Candidatos por el índice de palabras (rango [primera, primera + U+FFFF))
+        # y luego el texto completo a partir de un inicio de palabra
+        return self._consultar(
+            """
+            WHERE id IN (
+                SELECT id FROM cotizaciones_palabras WHERE palabra >= ? AND palabra < ?
+            ) AND instr(' ' || nombre_normalizado, ?) > 0
+            """,
+            (primera, primera + "\uffff", " " + texto),
+        ) or self._consultar("WHERE instr(nombre_normalizado, ?) > 0", (texto,))
+
+    def buscar_por_fecha(self, fecha_inicio: datetime.datetime,
+                         fecha_fin: datetime.datetime) -> List[Cotizacion]:
+        return self._consultar(
+            "WHERE fecha >= ? AND fecha <= ?", (_fecha_indexable(fecha_inicio), _fecha_indexable(fecha_fin))
+        )
+
+    def actualizar_estado(self, id_cotizacion: str, nuevo_estado: str) -> bool:
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE cotizaciones SET estado = ? WHERE id = ?", (nuevo_estado, id_cotizacion)
+            )
+        return cursor.rowcount > 0
+
+    def listar(self, limite: Optional[int] = None) -> List[Cotizacion]:
+        return self._consultar(limite=limite)
+
+    def contar(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM cotizaciones").fetchone()[0]
+
+
+class RepositorioCotizacionesMongoDB(RepositorioCotizaciones):
+    """Repositorio sobre la colección COLECCION_MONGODB ("cotizaciones_bot") de MongoDB"""
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.coleccion.create_index("id", unique=True)
+        self.coleccion.create_index("telefono_normalizado")
+        self.coleccion.create_index("nombre_normalizado")
+        self.coleccion.create_index("nombre_palabras")
+        self.coleccion.create_index("fecha")
+
+    def _consultar(self, filtro: Dict[str, Any], limite: Optional[int] = None) -> List[Cotizacion]:
+        cursor = self.coleccion.find(filtro, {"_id": 0}).sort("fecha", 1)
+        if limite is not None:
+            cursor = cursor.limit(limite)
+        return [cotizacion_desde_dict(documento) for documento in cursor]
+
+    def guardar(self, cotizacion: Cotizacion):
+        documento = cotizacion_a_dict(cotizacion)
+        documento.update(
+            fecha=_fecha_indexable(cotizacion.fecha),
+            created_at=cotizacion.fecha.isoformat(),
+            telefono_normalizado=normalizar_telefono(cotizacion.cliente.telefono),
+            nombre_normalizado=normalizar_nombre(cotizacion.cliente.nombre),
+            nombre_palabras=palabras_nombre(cotizacion.cliente.nombre),
+        )
+        self.coleccion.replace_one({"id": cotizacion.id}, documento, upsert=True)
+
+    def obtener(self, id_cotizacion: str) -> Optional[Cotizacion]:
+        documento = self.coleccion.find_one({"id": id_cotizacion}, {"_id": 0})
+        return cotizacion_desde_dict(documento) if documento else None
+
+    def buscar_por_telefono(self, telefono: str) -> List[Cotizacion]:
+        numero = normalizar_telefono(telefono)
+        if not numero:
+            return []
+        return (
+            self._consultar({"telefono_normalizado": numero})
+            or self._consultar({"telefono_normalizado": {"$regex": re.escape(numero)}})
+        )
+
+    def buscar_por_nombre(self, nombre: str) -> List[Cotizacion]:
+        texto = normalizar_nombre(nombre)
+        if not texto:
+            return []
+        primera = texto.split()[0]
+        return self._consultar({
+            "nombre_palabras": {"$gte": primera, "$lt": primera + "\uffff"},
+            "nombre_normalizado": {"$regex": f"(^| ){re.escape(texto)}"},
+        }) or self._consultar({"nombre_normalizado": {"$regex": re.escape(texto)}})
+
+    def buscar_por_fecha(self, fecha_inicio: datetime.datetime,
+                         fecha_fin: datetime.datetime) -> List[Cotizacion]:
+        return self._consultar(
+            {"fecha": {"$gte": _fecha_indexable(fecha_inicio), "$lte": _fecha_indexable(fecha_fin)}}
+        )
+
+    def actualizar_estado(self, id_cotizacion: str, nuevo_estado: str) -> bool:
+        resultado = self.coleccion.update_one({"id": id_cotizacion}, {"$set": {"estado": nuevo_estado}})
+        return resultado.matched_count > 0
+
+    def listar(self, limite: Optional[int] = None) -> List[Cotizacion]:
+        return self._consultar({}, limite)
+
+    def contar(self) -> int:
+        return self.coleccion.count_documents({})
+
+
+def crear_repositorio_cotizaciones() -> RepositorioCotizaciones:
+    """
+    Crea el repositorio según el entorno: MongoDB si MONGODB_URI está
+    configurada y accesible, SQLite (COTIZACIONES_DB_PATH) en otro caso.
+    """
+    if os.getenv("MONGODB_URI"):
+        try:
+            from mongodb_service import get_mongodb_service
+
+            mongodb = get_mongodb_service()
+            if mongodb:
+                return RepositorioCotizacionesMongoDB(mongodb.get_collection(COLECCION_MONGODB))
+        except Exception as e:
+            logger.warning(f"⚠️  MongoDB no disponible para cotizaciones, usando SQLite: {e}")
+    return RepositorioCotizacionesSQLite()
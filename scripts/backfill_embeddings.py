@@ -4,17 +4,30 @@ Backfill Embeddings
 ------------------
 Iterates over 'kb_interactions' collection in MongoDB and generates embeddings
 for documents that are missing them.
+
+Documents are streamed in _id order (never materialized), embedded in
+batches through the shared EmbeddingService (with its on-disk cache) and
+written back with one bulk_write per batch. The last processed _id is
+saved to a checkpoint file after every batch, so an interrupted run
+resumes where it stopped; use --restart to start over.
+
+--fake uses the local FakeEmbedder (own model id, in-memory cache) and is
+always a dry run: its vectors never reach MongoDB or the shared cache.
 """
 
+import argparse
 import os
 import sys
-import time
-from pymongo import MongoClient
-try:
-    from openai import OpenAI
-except ImportError:
-    print("❌ OpenAI module not found. Please install it.")
-    sys.exit(1)
+from pathlib import Path
+
+from bson import json_util
+from pymongo import UpdateOne
+
+_project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_project_root))
+
+from mongodb_service import close_mongodb, get_client_manager
+from utils.embedding_service import EmbeddingService, FakeEmbedder, OpenAIEmbedder
 
 # Try to load .env
 try:
@@ -23,75 +36,141 @@ try:
 except ImportError:
     pass
 
-def backfill_embeddings():
+DEFAULT_CHECKPOINT = _project_root / ".knowledge_cache" / "backfill_embeddings.checkpoint.json"
+
+MISSING_EMBEDDING = {
+    "$or": [
+        {"embedding": {"$exists": False}},
+        {"embedding": []},
+        {"embedding": None}
+    ]
+}
+
+
+def _load_checkpoint(path: Path):
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json_util.loads(f.read()).get("last_id")
+
+
+def _save_checkpoint(path: Path, last_id):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(json_util.dumps({"last_id": last_id}))
+    os.replace(temporary, path)
+
+
+def backfill_embeddings(col, service: EmbeddingService, batch_size: int = 100,
+                        checkpoint_path: Path = DEFAULT_CHECKPOINT, restart: bool = False,
+                        dry_run: bool = False) -> int:
+    """
+    Embeds every document of col missing an embedding
+
+    Args:
+        dry_run: embed but write nothing (neither documents nor checkpoint)
+
+    Returns:
+        Number of documents updated (or that would be, with dry_run) in this run
+    """
+    if restart and checkpoint_path.exists():
+        checkpoint_path.unlink()
+    last_id = _load_checkpoint(checkpoint_path)
+
+    query = dict(MISSING_EMBEDDING)
+    if last_id is not None:
+        query = {"$and": [MISSING_EMBEDDING, {"_id": {"$gt": last_id}}]}
+        print(f"↪️  Resuming after _id {last_id}")
+
+    total = col.count_documents(query)
+    print(f"📦 Found {total} documents needing embeddings.")
+
+    cursor = col.find(query, {"mensaje_cliente": 1}, sort=[("_id", 1)], batch_size=batch_size)
+    processed = 0
+    batch = []
+
+    def _flush():
+        nonlocal processed
+        with_text = [doc for doc in batch if doc.get("mensaje_cliente")]
+        if with_text:
+            vectors = service.embed_many([doc["mensaje_cliente"] for doc in with_text])
+            if not dry_run:
+                col.bulk_write(
+                    [UpdateOne({"_id": doc["_id"]}, {"$set": {"embedding": vector}})
+                     for doc, vector in zip(with_text, vectors)],
+                    ordered=False,
+                )
+            processed += len(with_text)
+        if not dry_run:
+            _save_checkpoint(checkpoint_path, batch[-1]["_id"])
+        batch.clear()
+        print(f"   ⏳ Processed {processed}/{total}...")
+
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _flush()
+    if batch:
+        _flush()
+
+    print(f"✅ Backfill complete. {'Would update' if dry_run else 'Updated'} {processed} documents "
+          f"({service.stats['hits']} cached, {service.stats['api_calls']} API calls).")
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill embeddings in kb_interactions")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    parser.add_argument("--fake", action="store_true",
+                        help="dry run with the deterministic local embedder (no OpenAI calls, no writes)")
+    parser.add_argument("--dry-run", action="store_true", help="embed but do not write to MongoDB")
+    args = parser.parse_args()
+
     uri = os.getenv("MONGODB_URI")
     openai_key = os.getenv("OPENAI_API_KEY")
-    
+
     if not uri:
         print("❌ MONGODB_URI not found.")
         return
-    if not openai_key:
+    if not openai_key and not args.fake:
         print("❌ OPENAI_API_KEY not found.")
         return
 
+    if args.fake:
+        # Its 64-dimension vectors must not mix with the real model's in the
+        # shared cache or in kb_interactions (vector indexes are 1536-d)
+        embedder = FakeEmbedder()
+        service = EmbeddingService(embedder, model=embedder.model, batch_size=args.batch_size)
+        args.dry_run = True
+    else:
+        try:
+            from openai import OpenAI
+        except ImportError:
+            print("❌ OpenAI module not found. Please install it.")
+            sys.exit(1)
+        service = EmbeddingService(
+            OpenAIEmbedder(OpenAI(api_key=openai_key)),
+            cache_path=os.getenv("KNOWLEDGE_EMBEDDING_CACHE")
+            or str(_project_root / ".knowledge_cache" / "embeddings.sqlite"),
+            batch_size=args.batch_size,
+        )
     try:
-        # Connect
-        client = MongoClient(uri)
-        db = client.get_database()
-        col = db["kb_interactions"]
-        
-        # Init OpenAI
-        openai = OpenAI(api_key=openai_key)
-        
-        # Find docs without embedding
-        # or where embedding is empty list
-        query = {
-            "$or": [
-                {"embedding": {"$exists": False}},
-                {"embedding": []},
-                {"embedding": None}
-            ]
-        }
-        
-        docs_to_update = list(col.find(query))
-        total = len(docs_to_update)
-        print(f"📦 Found {total} documents needing embeddings.")
-        
-        processed = 0
-        for doc in docs_to_update:
-            text_to_embed = doc.get("mensaje_cliente")
-            if not text_to_embed:
-                continue
-                
-            try:
-                # Normalize text
-                text_to_embed = text_to_embed.replace("\n", " ")
-                
-                # Generate
-                embedding = openai.embeddings.create(
-                    input=[text_to_embed],
-                    model="text-embedding-3-small"
-                ).data[0].embedding
-                
-                # Update
-                col.update_one(
-                    {"_id": doc["_id"]},
-                    {"$set": {"embedding": embedding}}
-                )
-                processed += 1
-                if processed % 10 == 0:
-                    print(f"   ⏳ Processed {processed}/{total}...")
-                    
-                # Rate limit (gentle)
-                time.sleep(0.1)
-                
-            except Exception as e:
-                print(f"   ⚠️ Error embedding doc {doc.get('id')}: {e}")
-                
-        print(f"✅ Backfill complete. Updated {processed} documents.")
-        
+        # Connect through the shared pool
+        manager = get_client_manager(uri)
+        if not manager.connect():
+            print(f"❌ MongoDB unavailable: {manager.health()['last_error']}")
+            return
+        col = manager.get_collection("kb_interactions")
+        backfill_embeddings(col, service, args.batch_size, args.checkpoint, args.restart, args.dry_run)
     except Exception as e:
         print(f"❌ Error: {e}")
+    finally:
+        service.close()
+        close_mongodb()
+
 
 if __name__ == "__main__":
-    backfill_embeddings()
+    main()
@@ -8,11 +8,12 @@ import json
 import os
 import sys
 from pathlib import Path
-from pymongo import MongoClient
 
 # Add parent directory to path to allow imports if needed
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from mongodb_service import close_mongodb, get_client_manager
+
 def migrate_to_mongo(json_file_path, mongo_uri="mongodb://localhost:27017/bmc_chat"):
     """
     Reads a JSON knowledge base file and pushes it to MongoDB.
@@ -24,9 +25,12 @@ def migrate_to_mongo(json_file_path, mongo_uri="mongodb://localhost:27017/bmc_ch
         return False
 
     try:
-        # 1. Connect to MongoDB
-        client = MongoClient(mongo_uri)
-        db = client.get_database() # Uses database from URI
+        # 1. Connect to MongoDB (shared pool)
+        manager = get_client_manager(mongo_uri)
+        if not manager.connect():
+            print(f"❌ MongoDB unavailable: {manager.health()['last_error']}")
+            return False
+        db = manager.get_database() # Uses database from URI
         print(f"✅ Connected to MongoDB: {db.name}")
 
         # 2. Load JSON Data
@@ -38,7 +42,7 @@ def migrate_to_mongo(json_file_path, mongo_uri="mongodb://localhost:27017/bmc_ch
         
         # Interactions
         if "interacciones" in data and data["interacciones"]:
-            col = db["kb_interactions"]
+            col = manager.get_collection("kb_interactions")
             count = len(data["interacciones"])
             print(f"📦 Migrating {count} interactions...")
             # Use upsert based on ID to avoid duplicates
@@ -51,7 +55,7 @@ def migrate_to_mongo(json_file_path, mongo_uri="mongodb://localhost:27017/bmc_ch
 
         # Sales Patterns
         if "patrones_venta" in data and data["patrones_venta"]:
-            col = db["kb_patterns"]
+            col = manager.get_collection("kb_patterns")
             count = len(data["patrones_venta"])
             print(f"📦 Migrating {count} sales patterns...")
             ops = 0
@@ -64,7 +68,7 @@ def migrate_to_mongo(json_file_path, mongo_uri="mongodb://localhost:27017/bmc_ch
         # Product Knowledge
         # In JSON this is a dict {id: data}, in Mongo better as documents
         if "conocimiento_productos" in data and data["conocimiento_productos"]:
-            col = db["kb_products"]
+            col = manager.get_collection("kb_products")
             products = data["conocimiento_productos"]
             print(f"📦 Migrating {len(products)} products...")
             ops = 0
@@ -77,7 +81,7 @@ def migrate_to_mongo(json_file_path, mongo_uri="mongodb://localhost:27017/bmc_ch
             
         # Metrics & Insights
         if "metricas_evolucion" in data:
-            col = db["kb_metrics"]
+            col = manager.get_collection("kb_metrics")
             # Just save as a single document with a timestamp or ID
             metrics = data["metricas_evolucion"]
             metrics["type"] = "evolution_metrics"
@@ -85,12 +89,13 @@ def migrate_to_mongo(json_file_path, mongo_uri="mongodb://localhost:27017/bmc_ch
             print("   ✨ Updated evolution metrics")
 
         print("\n🎉 Migration completed successfully!")
-        client.close()
         return True
 
     except Exception as e:
         print(f"❌ Error during migration: {e}")
         return False
+    finally:
+        close_mongodb()
 
 if __name__ == "__main__":
     import sys
@@ -7,13 +7,19 @@ Ready for deployment on Railway, Render, or any Python hosting
 
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import os
 from dotenv import load_dotenv
 import logging
 from datetime import datetime
 
+from generador_ids import nuevo_id
+
 # Load environment variables
 load_dotenv()
 
@@ -26,8 +32,102 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ============================================================================
+# STARTUP & SHUTDOWN
+# ============================================================================
+
+def get_sistema_cotizaciones(app: FastAPI):
+    """Return the process-wide quote system, creating it on first use"""
+    sistema = getattr(app.state, "cotizaciones", None)
+    if sistema is None:
+        from sistema_cotizaciones import SistemaCotizacionesBMC
+        sistema = SistemaCotizacionesBMC()
+        app.state.cotizaciones = sistema
+    return sistema
+
+async def startup_event(app: FastAPI):
+    """Initialize services on startup"""
+    logger.info("🚀 Starting BMC Quote System API...")
+    logger.info(f"   Environment: {os.getenv('ENVIRONMENT', 'production')}")
+    logger.info(f"   Port: {os.getenv('PORT', '8000')}")
+    logger.info(f"   OpenAI Model: {os.getenv('OPENAI_MODEL', 'gpt-4o-mini')}")
+    
+    # Shared MongoDB pool for this worker: connects once, then a background
+    # heartbeat keeps the health state cached for every request
+    try:
+        from mongodb_service import ensure_mongodb_connected, get_client_manager
+
+        if os.getenv("MONGODB_URI"):
+            if await asyncio.to_thread(ensure_mongodb_connected):
+                logger.info("✅ MongoDB connection successful (shared pool)")
+            else:
+                health = get_client_manager().health()
+                logger.warning(f"⚠️  MongoDB unavailable ({health['last_error']}) - degraded mode, using in-memory storage")
+        else:
+            logger.warning("⚠️  MONGODB_URI not set - using in-memory storage")
+    except Exception as e:
+        logger.error(f"❌ MongoDB connection failed: {type(e).__name__}: {e}")
+        logger.warning("⚠️  Continuing with in-memory storage")
+    
+    # Shared conversational AI instance (one per worker process).
+    # Built in a thread because loading the knowledge base is blocking.
+    app.state.ia = None
+    try:
+        from ia_conversacional_integrada import get_ia_conversacional
+
+        app.state.ia = await asyncio.to_thread(get_ia_conversacional)
+        logger.info("✅ Conversational AI initialized")
+    except Exception as e:
+        logger.warning(f"⚠️  IA conversacional module not available: {type(e).__name__}: {e}")
+    
+    # Shared quote system backed by the persistent quote repository
+    app.state.cotizaciones = None
+    try:
+        app.state.cotizaciones = await asyncio.to_thread(get_sistema_cotizaciones, app)
+        logger.info(f"✅ Quote repository: {type(app.state.cotizaciones.repositorio).__name__}")
+    except Exception as e:
+        logger.warning(f"⚠️  Quote system not available: {type(e).__name__}: {e}")
+    
+    # Shared model integrator for streaming chat; its response cache is
+    # invalidated whenever the IA's product catalog changes
+    app.state.model_integrator = None
+    try:
+        from model_integrator import get_model_integrator
+
+        integrator = await asyncio.to_thread(get_model_integrator)
+        if app.state.ia is not None:
+            catalogo = app.state.ia.sistema_cotizaciones
+            integrator.catalog_version_source = lambda: catalogo.version_catalogo
+        app.state.model_integrator = integrator
+        logger.info(f"✅ Model integrator: {len(integrator.models)} models available")
+    except Exception as e:
+        logger.warning(f"⚠️  Model integrator not available: {type(e).__name__}: {e}")
+    
+    logger.info("✅ BMC Quote System API started successfully")
+
+async def shutdown_event(app: FastAPI):
+    """Cleanup on shutdown"""
+    logger.info("👋 Shutting down BMC Quote System API...")
+    ia = getattr(app.state, "ia", None)
+    if ia is not None:
+        await ia.cerrar()
+    try:
+        from mongodb_service import close_mongodb
+
+        close_mongodb()
+    except ImportError:
+        pass
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan: startup, then shutdown when the server stops"""
+    await startup_event(app)
+    yield
+    await shutdown_event(app)
+
 # Create FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     title="BMC Quote System API",
     description="Intelligent quotation system for BMC Uruguay - Thermal insulation products",
     version="1.0.0",
@@ -68,6 +168,35 @@ class QuoteResponse(BaseModel):
     status: str
     created_at: str
 
+class BatchPriceItem(BaseModel):
+    """Specification to price in a batch (same pricing rules as /api/quotes)"""
+    product: str = Field(..., description="Product type: isodec, poliestireno, lana_roca")
+    thickness: str = Field(..., description="Product thickness: 50mm, 75mm, 100mm, 125mm, 150mm")
+    length: float = Field(..., gt=0, description="Length in meters")
+    width: float = Field(..., gt=0, description="Width in meters")
+    color: Optional[str] = Field(None, description="Color (defaults to the product color)")
+    finish_front: str = Field("", description="Front finish: Gotero, Hormigón")
+    finish_top: str = Field("", description="Top finish")
+    finish_side_1: str = Field("", description="Side finish 1")
+    finish_side_2: str = Field("", description="Side finish 2")
+    anchors: str = Field("", description="incluido / no incluido")
+    transport: str = Field("", description="incluido / no incluido")
+
+class BatchPriceRequest(BaseModel):
+    """Request model for batch pricing"""
+    items: List[BatchPriceItem] = Field(..., max_length=10000, description="Specifications to price")
+
+class BatchPriceResult(BaseModel):
+    """Price of one batch item"""
+    total: float
+    price_per_m2: float
+    area: float
+
+class BatchPriceResponse(BaseModel):
+    """Response model for batch pricing"""
+    count: int
+    results: List[BatchPriceResult]
+
 class ChatMessage(BaseModel):
     """Chat message model"""
     message: str = Field(..., description="User message")
@@ -85,47 +214,6 @@ class WebhookVerification(BaseModel):
     hub_verify_token: str
     hub_challenge: str
 
-# ============================================================================
-# STARTUP & SHUTDOWN
-# ============================================================================
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup"""
-    logger.info("🚀 Starting BMC Quote System API...")
-    logger.info(f"   Environment: {os.getenv('ENVIRONMENT', 'production')}")
-    logger.info(f"   Port: {os.getenv('PORT', '8000')}")
-    logger.info(f"   OpenAI Model: {os.getenv('OPENAI_MODEL', 'gpt-4o-mini')}")
-    
-    # Test MongoDB connection
-    try:
-        mongodb_uri = os.getenv("MONGODB_URI")
-        if mongodb_uri:
-            # Mask URI for logging
-            if "@" in mongodb_uri:
-                log_uri = mongodb_uri.split("@")[-1]
-            else:
-                log_uri = "localhost/local_db" if "localhost" in mongodb_uri else "non-credential-uri"
-                
-            logger.info(f"🔌 Attempting to connect to MongoDB at: {log_uri}")
-            
-            from pymongo import MongoClient
-            client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
-            server_info = client.server_info()
-            logger.info(f"✅ MongoDB connection successful. Server version: {server_info.get('version')}")
-        else:
-            logger.warning("⚠️  MONGODB_URI not set - using in-memory storage")
-    except Exception as e:
-        logger.error(f"❌ MongoDB connection failed: {type(e).__name__}: {e}")
-        logger.warning("⚠️  Continuing with in-memory storage")
-    
-    logger.info("✅ BMC Quote System API started successfully")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on shutdown"""
-    logger.info("👋 Shutting down BMC Quote System API...")
-
 # ============================================================================
 # HEALTH & INFO ENDPOINTS
 # ============================================================================
@@ -142,12 +230,24 @@ async def root():
             "health": "/health",
             "docs": "/docs",
             "chat": "/api/chat",
+            "chat_stream": "/api/chat/stream",
             "quotes": "/api/quotes",
             "whatsapp": "/api/whatsapp/webhook"
         },
         "timestamp": datetime.now().isoformat()
     }
 
+def _estado_mongodb() -> str:
+    """Cached MongoDB state from the pool heartbeat (no ping per request)"""
+    if not os.getenv("MONGODB_URI"):
+        return "not_configured"
+    try:
+        from mongodb_service import get_client_manager
+
+        return "online" if get_client_manager().health()["healthy"] else "degraded"
+    except ImportError:
+        return "unknown"
+
 @app.get("/health", tags=["Health"])
 async def health_check():
     """Health check endpoint"""
@@ -156,7 +256,7 @@ async def health_check():
         "timestamp": datetime.now().isoformat(),
         "services": {
             "api": "online",
-            "mongodb": "online" if os.getenv("MONGODB_URI") else "not_configured",
+            "mongodb": _estado_mongodb(),
             "openai": "configured" if os.getenv("OPENAI_API_KEY") else "not_configured"
         }
     }
@@ -166,7 +266,7 @@ async def health_check():
 # ============================================================================
 
 @app.post("/api/chat", response_model=ChatResponse, tags=["Chat"])
-async def chat(message: ChatMessage):
+async def chat(message: ChatMessage, request: Request):
     """
     Process chat messages with AI assistant
     
@@ -179,28 +279,34 @@ async def chat(message: ChatMessage):
     try:
         logger.info(f"Chat request: {message.message[:50]}...")
         
-        # Import chat processing
-        try:
-            from ia_conversacional_integrada import procesar_mensaje_usuario
-            
-            response_text = procesar_mensaje_usuario(
-                message.message,
-                message.session_id
-            )
-            
-            return ChatResponse(
-                response=response_text,
-                session_id=message.session_id or "default"
-            )
-            
-        except ImportError:
+        # Anonymous callers get their own session on the shared IA instance
+        session_id = message.session_id or nuevo_id("sesion_")
+        ia = getattr(request.app.state, "ia", None)
+        
+        if ia is None:
             # Fallback response if IA module not available
             logger.warning("IA conversacional module not available, using fallback")
             return ChatResponse(
                 response="Hola! Soy el asistente de BMC Uruguay. ¿En qué puedo ayudarte?",
-                session_id=message.session_id or "default"
+                session_id=session_id
             )
         
+        resultado = await ia.procesar_mensaje_usuario_async(
+            message.message,
+            session_id,
+            session_id
+        )
+        
+        return ChatResponse(
+            response=resultado.get("mensaje", ""),
+            session_id=session_id,
+            context={
+                "tipo": resultado.get("tipo"),
+                "confianza": resultado.get("confianza"),
+                "necesita_datos": resultado.get("necesita_datos", [])
+            }
+        )
+        
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}", exc_info=True)
         raise HTTPException(
@@ -208,12 +314,71 @@ async def chat(message: ChatMessage):
             detail=f"Error processing chat message: {str(e)}"
         )
 
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/api/chat/stream", tags=["Chat"])
+async def chat_stream(message: ChatMessage, request: Request):
+    """
+    Server-Sent Events variant of /api/chat
+    
+    Streams the assistant reply as it is generated:
+    - `event: token` with `{"content": "..."}` for every chunk
+    - `event: done` with the final response, session_id, context and the
+      time_to_first_token / response_time of the model call
+    - `event: error` if the message could not be processed; when the model
+      fails after some tokens were sent it is followed by `done`
+    """
+    logger.info(f"Chat stream request: {message.message[:50]}...")
+    session_id = message.session_id or nuevo_id("sesion_")
+    ia = getattr(request.app.state, "ia", None)
+    integrator = getattr(request.app.state, "model_integrator", None)
+    
+    async def events():
+        if ia is None:
+            logger.warning("IA conversacional module not available, using fallback")
+            text = "Hola! Soy el asistente de BMC Uruguay. ¿En qué puedo ayudarte?"
+            yield _sse_event("token", {"content": text})
+            yield _sse_event("done", {"response": text, "session_id": session_id})
+            return
+        try:
+            async for event in ia.procesar_mensaje_usuario_stream(
+                message.message, session_id, session_id, integrator
+            ):
+                if event["type"] == "token":
+                    yield _sse_event("token", {"content": event["content"]})
+                elif event["type"] == "error":
+                    yield _sse_event("error", {"detail": f"Error processing chat message: {event['error']}"})
+                else:
+                    yield _sse_event("done", {
+                        "response": event.get("mensaje", ""),
+                        "session_id": session_id,
+                        "context": {
+                            "tipo": event.get("tipo"),
+                            "confianza": event.get("confianza"),
+                            "necesita_datos": event.get("necesita_datos", []),
+                        },
+                        "model_used": event.get("model_used"),
+                        "time_to_first_token": event.get("time_to_first_token"),
+                        "response_time": event.get("response_time"),
+                    })
+        except Exception as e:
+            logger.error(f"Error in chat stream endpoint: {e}", exc_info=True)
+            yield _sse_event("error", {"detail": f"Error processing chat message: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ============================================================================
 # QUOTE ENDPOINTS
 # ============================================================================
 
 @app.post("/api/quotes", response_model=QuoteResponse, tags=["Quotes"])
-async def create_quote(quote: QuoteRequest):
+async def create_quote(quote: QuoteRequest, request: Request):
     """
     Create a new quote
     
@@ -227,11 +392,11 @@ async def create_quote(quote: QuoteRequest):
         logger.info(f"Quote request for: {quote.customer_name} - {quote.product}")
         
         # Import quote system
-        from sistema_cotizaciones import SistemaCotizacionesBMC, Cliente, EspecificacionCotizacion
+        from sistema_cotizaciones import Cliente, EspecificacionCotizacion
         from decimal import Decimal
         
-        # Initialize system
-        sistema = SistemaCotizacionesBMC()
+        sistema = get_sistema_cotizaciones(request.app)
+        producto = sistema.productos.get(quote.product)
         
         # Create customer
         cliente = Cliente(
@@ -245,12 +410,15 @@ async def create_quote(quote: QuoteRequest):
         especificaciones = EspecificacionCotizacion(
             producto=quote.product,
             espesor=quote.thickness,
+            relleno=producto.relleno if producto else "",
             largo_metros=Decimal(str(quote.length)),
-            ancho_metros=Decimal(str(quote.width))
+            ancho_metros=Decimal(str(quote.width)),
+            color=producto.color if producto else ""
         )
         
-        # Create quote
-        cotizacion = sistema.crear_cotizacion(
+        # Create quote (persisted by the quote repository)
+        cotizacion = await asyncio.to_thread(
+            sistema.crear_cotizacion,
             cliente=cliente,
             especificaciones=especificaciones,
             observaciones=quote.observations or ""
@@ -276,34 +444,76 @@ async def create_quote(quote: QuoteRequest):
             detail=f"Error creating quote: {str(e)}"
         )
 
+@app.post("/api/quotes/batch-price", response_model=BatchPriceResponse, tags=["Quotes"])
+async def batch_price(batch: BatchPriceRequest, request: Request):
+    """
+    Price many specifications in one call (e.g. re-pricing open quotes
+    after a price change). Nothing is stored; results match /api/quotes
+    to the cent and keep the order of the request items.
+    """
+    from sistema_cotizaciones import EspecificacionCotizacion
+    from decimal import Decimal
+    
+    sistema = get_sistema_cotizaciones(request.app)
+    especificaciones = []
+    for item in batch.items:
+        producto = sistema.productos.get(item.product)
+        if producto is None:
+            raise HTTPException(status_code=400, detail=f"Unknown product: {item.product}")
+        especificaciones.append(EspecificacionCotizacion(
+            producto=item.product,
+            espesor=item.thickness,
+            relleno=producto.relleno,
+            largo_metros=Decimal(str(item.length)),
+            ancho_metros=Decimal(str(item.width)),
+            color=item.color or producto.color,
+            termina_front=item.finish_front,
+            termina_sup=item.finish_top,
+            termina_lat_1=item.finish_side_1,
+            termina_lat_2=item.finish_side_2,
+            anclajes=item.anchors,
+            traslado=item.transport
+        ))
+    
+    precios = await asyncio.to_thread(sistema.calcular_precios_lote, especificaciones)
+    return BatchPriceResponse(
+        count=len(precios),
+        results=[
+            BatchPriceResult(
+                total=float(total),
+                price_per_m2=float(precio_m2),
+                area=float(e.largo_metros * e.ancho_metros)
+            )
+            for (total, precio_m2), e in zip(precios, especificaciones)
+        ]
+    )
+
 @app.get("/api/quotes/{quote_id}", tags=["Quotes"])
-async def get_quote(quote_id: str):
+async def get_quote(quote_id: str, request: Request):
     """Get quote by ID"""
     try:
-        from sistema_cotizaciones import SistemaCotizacionesBMC
-        
-        sistema = SistemaCotizacionesBMC()
+        sistema = get_sistema_cotizaciones(request.app)
         
-        # Find quote
-        for cotizacion in sistema.cotizaciones:
-            if cotizacion.id == quote_id:
-                return {
-                    "quote_id": cotizacion.id,
-                    "customer": {
-                        "name": cotizacion.cliente.nombre,
-                        "phone": cotizacion.cliente.telefono
-                    },
-                    "product": {
-                        "type": cotizacion.especificaciones.producto,
-                        "thickness": cotizacion.especificaciones.espesor,
-                        "area": float(cotizacion.especificaciones.largo_metros * cotizacion.especificaciones.ancho_metros)
-                    },
-                    "total": float(cotizacion.precio_total),
-                    "status": cotizacion.estado,
-                    "created_at": cotizacion.fecha.isoformat()
-                }
+        # Indexed lookup in the quote repository
+        cotizacion = await asyncio.to_thread(sistema.obtener_cotizacion, quote_id)
+        if cotizacion is None:
+            raise HTTPException(status_code=404, detail="Quote not found")
         
-        raise HTTPException(status_code=404, detail="Quote not found")
+        return {
+            "quote_id": cotizacion.id,
+            "customer": {
+                "name": cotizacion.cliente.nombre,
+                "phone": cotizacion.cliente.telefono
+            },
+            "product": {
+                "type": cotizacion.especificaciones.producto,
+                "thickness": cotizacion.especificaciones.espesor,
+                "area": float(cotizacion.especificaciones.largo_metros * cotizacion.especificaciones.ancho_metros)
+            },
+            "total": float(cotizacion.precio_total),
+            "status": cotizacion.estado,
+            "created_at": cotizacion.fecha.isoformat()
+        }
         
     except HTTPException:
         raise
@@ -371,15 +581,16 @@ async def whatsapp_webhook(request: Request):
                                     logger.info(f"Processing WhatsApp message from {from_number}: {text}")
                                     
                                     # Process with AI
-                                    try:
-                                        from ia_conversacional_integrada import procesar_mensaje_usuario
-                                        response_text = procesar_mensaje_usuario(text, from_number)
+                                    ia = getattr(request.app.state, "ia", None)
+                                    if ia is not None:
+                                        resultado = await ia.procesar_mensaje_usuario_async(text, from_number)
+                                        response_text = resultado.get("mensaje", "")
                                         
                                         # TODO: Send response back via WhatsApp API
                                         # This requires WhatsApp Business API credentials
                                         logger.info(f"Response generated: {response_text[:100]}...")
                                         
-                                    except ImportError:
+                                    else:
                                         logger.warning("IA module not available for WhatsApp processing")
         
         return {"status": "received"}
@@ -439,15 +650,14 @@ async def get_products():
 # ============================================================================
 
 @app.get("/api/admin/stats", tags=["Admin"])
-async def get_stats():
+async def get_stats(request: Request):
     """Get system statistics"""
     # TODO: Add authentication
     try:
-        from sistema_cotizaciones import SistemaCotizacionesBMC
-        sistema = SistemaCotizacionesBMC()
+        sistema = get_sistema_cotizaciones(request.app)
         
         return {
-            "total_quotes": len(sistema.cotizaciones),
+            "total_quotes": await asyncio.to_thread(sistema.repositorio.contar),
             "total_products": len(sistema.productos),
             "timestamp": datetime.now().isoformat()
         }
@@ -462,29 +672,31 @@ async def get_stats():
 @app.exception_handler(404)
 async def not_found_handler(request: Request, exc: HTTPException):
     """Custom 404 handler"""
-    return {
+    return JSONResponse(status_code=404, content={
         "error": "Not Found",
         "message": "The requested endpoint does not exist",
+        "detail": getattr(exc, "detail", None),
         "path": str(request.url),
         "available_endpoints": [
             "/",
             "/health",
             "/docs",
             "/api/chat",
+            "/api/chat/stream",
             "/api/quotes",
             "/api/products"
         ]
-    }
+    })
 
 @app.exception_handler(500)
 async def internal_error_handler(request: Request, exc: Exception):
     """Custom 500 handler"""
     logger.error(f"Internal error: {exc}", exc_info=True)
-    return {
+    return JSONResponse(status_code=500, content={
         "error": "Internal Server Error",
         "message": "An unexpected error occurred",
         "details": str(exc) if os.getenv("DEBUG") else "Contact support"
-    }
+    })
 
 # ============================================================================
 # MAIN
@@ -8,10 +8,19 @@ y matrices de precios
 
 import json
 import datetime
-from typing import List, Tuple
+import operator
+from typing import Dict, List, Optional, Sequence, Tuple
 from dataclasses import dataclass, asdict
 from decimal import Decimal, ROUND_HALF_UP
 
+from generador_ids import nuevo_id
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 @dataclass
 class Cliente:
     """Estructura para datos del cliente"""
@@ -70,12 +79,35 @@ class Cotizacion:
     precio_metro_cuadrado: Decimal = Decimal('0')
     observaciones: str = ""
 
+# Campos que determinan el precio por m² (clave de la tabla de factores)
+_CLAVE_FACTORES = operator.attrgetter(
+    "producto", "espesor", "color",
+    "termina_front", "termina_sup", "termina_lat_1", "termina_lat_2",
+    "anclajes", "traslado",
+)
+
+
 class SistemaCotizacionesBMC:
     """Sistema principal de cotizaciones BMC Uruguay"""
     
-    def __init__(self):
+    def __init__(self, repositorio=None):
+        """
+        Args:
+            repositorio: RepositorioCotizaciones donde persistir las cotizaciones.
+                Por defecto se elige según el entorno (MongoDB si MONGODB_URI
+                está configurada, SQLite en otro caso).
+        """
+        if repositorio is None:
+            from repositorio_cotizaciones import crear_repositorio_cotizaciones
+            repositorio = crear_repositorio_cotizaciones()
+        self.repositorio = repositorio
         self.productos = {}
-        self.cotizaciones = []
+        # Precio por m² ya ajustado, por combinación de especificaciones
+        self._tabla_factores: Dict[tuple, Decimal] = {}
+        # Se incrementa con cada cambio de productos o precios; permite a
+        # otros componentes (p. ej. la caché de respuestas del
+        # UnifiedModelIntegrator) invalidar datos derivados del catálogo
+        self.version_catalogo = 0
         self.plantillas = {}
         self.matriz_precios = {}
         self.cargar_datos_iniciales()
@@ -128,15 +160,51 @@ class SistemaCotizacionesBMC:
         # Asignaciones del sistema
         self.asignaciones = ["MA", "MO", "RA", "SPRT", "Ref."]
     
+    @property
+    def cotizaciones(self) -> List[Cotizacion]:
+        """
+        Todas las cotizaciones guardadas, ordenadas por fecha (copia de solo
+        lectura). Cada acceso lee el repositorio completo: para contar,
+        buscar una por ID o filtrar usar contar_cotizaciones,
+        obtener_cotizacion y las búsquedas, y guardar el resultado en una
+        variable si se recorre más de una vez.
+        """
+        return self.repositorio.listar()
+    
+    def listar_cotizaciones(self, limite: Optional[int] = None) -> List[Cotizacion]:
+        """Cotizaciones ordenadas por fecha, como máximo `limite`"""
+        return self.repositorio.listar(limite)
+    
+    def contar_cotizaciones(self) -> int:
+        """Cantidad de cotizaciones guardadas (sin leerlas)"""
+        return self.repositorio.contar()
+    
+    def agregar_cotizacion(self, cotizacion: Cotizacion):
+        """Guarda una cotización ya construida (p. ej. importada)"""
+        self.repositorio.guardar(cotizacion)
+    
+    def obtener_cotizacion(self, id_cotizacion: str) -> Optional[Cotizacion]:
+        """Busca una cotización por ID"""
+        return self.repositorio.obtener(id_cotizacion)
+    
     def agregar_producto(self, producto: Producto):
         """Agrega un nuevo producto al sistema"""
         self.productos[producto.codigo] = producto
+        self._tabla_factores.clear()
+        self.version_catalogo += 1
     
     def actualizar_precio_producto(self, codigo: str, precio: Decimal):
         """Actualiza el precio de un producto"""
         if codigo in self.productos:
             self.productos[codigo].precio_base = precio
-    
+            self._tabla_factores.clear()
+            self.version_catalogo += 1
+
+    def obtener_precio_producto(self, codigo: str) -> Decimal:
+        """Obtiene el precio base de un producto"""
+        producto = self.productos.get(codigo)
+        return producto.precio_base if producto else Decimal('0')
+
     def calcular_precio_cotizacion(self, especificaciones: EspecificacionCotizacion) -> Tuple[Decimal, Decimal]:
         """
         Calcula el precio de una cotización basado en las especificaciones
@@ -179,6 +247,90 @@ class SistemaCotizacionesBMC:
         
         return precio_total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP), precio_metro_cuadrado_ajustado
     
+    def _precio_metro_cuadrado_tabla(self, especificaciones: EspecificacionCotizacion) -> Decimal:
+        """
+        Precio por m² ajustado desde la tabla de factores precalculada.
+        La clave incluye el precio base, así un cambio de precio nunca
+        reutiliza una entrada vieja.
+        """
+        producto = self.productos.get(especificaciones.producto)
+        if producto is None:
+            raise ValueError(f"Producto {especificaciones.producto} no encontrado")
+        clave = (producto.precio_base,) + _CLAVE_FACTORES(especificaciones)
+        precio = self._tabla_factores.get(clave)
+        if precio is None:
+            precio = (
+                producto.precio_base
+                * self._calcular_factor_espesor(especificaciones.espesor)
+                * self._calcular_factor_color(especificaciones.color)
+                * self._calcular_factor_terminaciones(
+                    especificaciones.termina_front,
+                    especificaciones.termina_sup,
+                    especificaciones.termina_lat_1,
+                    especificaciones.termina_lat_2
+                )
+                * self._calcular_factor_anclajes(especificaciones.anclajes)
+                * self._calcular_factor_traslado(especificaciones.traslado)
+            )
+            self._tabla_factores[clave] = precio
+        return precio
+    
+    def calcular_precios_lote(self, especificaciones: Sequence[EspecificacionCotizacion]) -> List[Tuple[Decimal, Decimal]]:
+        """
+        Calcula el precio de muchas cotizaciones en una sola llamada.
+        Retorna [(precio_total, precio_metro_cuadrado), ...] idéntico a
+        llamar calcular_precio_cotizacion para cada especificación.
+        
+        El precio por m² sale de la tabla de factores y el total se calcula
+        vectorizado con NumPy en float64. Los totales cuyo redondeo a
+        centavos queda ambiguo por la precisión del float (p. ej. x.xx5
+        exacto) se recalculan con Decimal, por lo que coinciden al centavo.
+        """
+        if not NUMPY_AVAILABLE:
+            return [self._calcular_precio_desde_tabla(e) for e in especificaciones]
+        
+        # Una consulta a la tabla por combinación distinta del lote
+        indices_por_clave: Dict[tuple, int] = {}
+        precios_m2: List[Decimal] = []
+        indices = []
+        for e in especificaciones:
+            clave = _CLAVE_FACTORES(e)
+            indice = indices_por_clave.get(clave)
+            if indice is None:
+                indice = indices_por_clave[clave] = len(precios_m2)
+                precios_m2.append(self._precio_metro_cuadrado_tabla(e))
+            indices.append(indice)
+        
+        cantidad = len(indices)
+        if not cantidad:
+            return []
+        centavos = (
+            np.fromiter(map(float, precios_m2), dtype=np.float64, count=len(precios_m2))[
+                np.fromiter(indices, dtype=np.intp, count=cantidad)
+            ]
+            * np.fromiter((float(e.largo_metros) for e in especificaciones), dtype=np.float64, count=cantidad)
+            * np.fromiter((float(e.ancho_metros) for e in especificaciones), dtype=np.float64, count=cantidad)
+            * 100
+        )
+        redondeados = np.floor(centavos + 0.5)
+        fraccion = centavos - np.floor(centavos)
+        tolerancia = 1e-9 * np.maximum(1.0, np.abs(centavos))
+        dudosos = (np.abs(fraccion - 0.5) < tolerancia) | (centavos < 0) | ~np.isfinite(centavos)
+        
+        resultados = [
+            (Decimal(int(centavo)).scaleb(-2), precios_m2[indice])
+            for centavo, indice in zip(np.where(dudosos, 0, redondeados).tolist(), indices)
+        ]
+        for i in np.flatnonzero(dudosos).tolist():
+            resultados[i] = self._calcular_precio_desde_tabla(especificaciones[i])
+        return resultados
+    
+    def _calcular_precio_desde_tabla(self, especificaciones: EspecificacionCotizacion) -> Tuple[Decimal, Decimal]:
+        """Ruta escalar con Decimal usando la tabla de factores"""
+        precio = self._precio_metro_cuadrado_tabla(especificaciones)
+        total = precio * especificaciones.largo_metros * especificaciones.ancho_metros
+        return total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP), precio
+    
     def _calcular_factor_espesor(self, espesor: str) -> Decimal:
         """Calcula factor de ajuste por espesor"""
         factores_espesor = {
@@ -232,8 +384,8 @@ class SistemaCotizacionesBMC:
                         asignado_a: str = "", observaciones: str = "") -> Cotizacion:
         """Crea una nueva cotización"""
         
-        # Generar ID único
-        id_cotizacion = f"COT-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # Generar ID único (ordenable, sin colisiones entre workers)
+        id_cotizacion = nuevo_id("COT-")
         
         # Calcular precios
         precio_total, precio_metro_cuadrado = self.calcular_precio_cotizacion(especificaciones)
@@ -251,37 +403,32 @@ class SistemaCotizacionesBMC:
             observaciones=observaciones
         )
         
-        self.cotizaciones.append(cotizacion)
+        self.repositorio.guardar(cotizacion)
         return cotizacion
     
     def buscar_cotizaciones_por_cliente(self, nombre: str = "", telefono: str = "") -> List[Cotizacion]:
-        """Busca cotizaciones por nombre o teléfono del cliente"""
-        resultados = []
-        
-        for cotizacion in self.cotizaciones:
-            if (nombre and nombre.lower() in cotizacion.cliente.nombre.lower()) or \
-               (telefono and telefono in cotizacion.cliente.telefono):
-                resultados.append(cotizacion)
-        
-        return resultados
+        """
+        Busca cotizaciones por nombre o teléfono del cliente.
+        El teléfono se compara como número nacional (sin 598 ni el 0 inicial)
+        y el nombre por inicio de cualquier palabra, sin distinguir mayúsculas
+        ni acentos; ambos usan índices y, si no encuentran nada, buscan el
+        texto en cualquier posición.
+        """
+        resultados = {}
+        if nombre:
+            resultados.update((c.id, c) for c in self.repositorio.buscar_por_nombre(nombre))
+        if telefono:
+            resultados.update((c.id, c) for c in self.repositorio.buscar_por_telefono(telefono))
+        return sorted(resultados.values(), key=lambda c: c.fecha)
     
     def buscar_cotizaciones_por_fecha(self, fecha_inicio: datetime.datetime, 
                                     fecha_fin: datetime.datetime) -> List[Cotizacion]:
         """Busca cotizaciones por rango de fechas"""
-        resultados = []
-        
-        for cotizacion in self.cotizaciones:
-            if fecha_inicio <= cotizacion.fecha <= fecha_fin:
-                resultados.append(cotizacion)
-        
-        return resultados
+        return self.repositorio.buscar_por_fecha(fecha_inicio, fecha_fin)
     
-    def actualizar_estado_cotizacion(self, id_cotizacion: str, nuevo_estado: str):
+    def actualizar_estado_cotizacion(self, id_cotizacion: str, nuevo_estado: str) -> bool:
         """Actualiza el estado de una cotización"""
-        for cotizacion in self.cotizaciones:
-            if cotizacion.id == id_cotizacion:
-                cotizacion.estado = nuevo_estado
-                break
+        return self.repositorio.actualizar_estado(id_cotizacion, nuevo_estado)
     
     def generar_reporte_cotizacion(self, cotizacion: Cotizacion) -> str:
         """Genera un reporte detallado de la cotización"""
@@ -331,7 +478,7 @@ OBSERVACIONES:
     def exportar_cotizaciones_a_json(self, archivo: str):
         """Exporta todas las cotizaciones a un archivo JSON"""
         datos = []
-        for cotizacion in self.cotizaciones:
+        for cotizacion in self.repositorio.listar():
             datos.append({
                 'id': cotizacion.id,
                 'cliente': asdict(cotizacion.cliente),
@@ -368,7 +515,7 @@ OBSERVACIONES:
                 observaciones=item['observaciones']
             )
             
-            self.cotizaciones.append(cotizacion)
+            self.agregar_cotizacion(cotizacion)
 
 def main():
     """Función principal para demostrar el uso del sistema"""
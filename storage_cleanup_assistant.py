@@ -20,12 +20,20 @@ from datetime import datetime, timedelta
 from collections import defaultdict
 import subprocess
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backup_system'))
+
+from scan_engine import ScanEngine
+
 
 class StorageAnalyzer:
     """Analiza el uso de almacenamiento en el workspace"""
     
-    def __init__(self, workspace_root: Optional[str] = None):
+    KNOWN_DIRECTORIES = ('node_modules', '__pycache__', '.git', 'backups', '.next', '.mypy_cache')
+    TEMPORARY_SUFFIXES = ('.tmp', '.bak', '.log', '.cache')
+    
+    def __init__(self, workspace_root: Optional[str] = None, engine: Optional[ScanEngine] = None):
         self.workspace_root = Path(workspace_root or os.getcwd()).resolve()
+        self.engine = engine or ScanEngine()
         self.analysis_results = {}
         
     def get_file_size(self, file_path: Path) -> int:
@@ -37,19 +45,20 @@ class StorageAnalyzer:
     
     def get_directory_size(self, dir_path: Path) -> int:
         """Calcula el tamaño total de un directorio"""
-        total = 0
-        try:
-            for item in dir_path.rglob('*'):
-                if item.is_file():
-                    total += self.get_file_size(item)
-        except:
-            pass
-        return total
+        return sum(entry.size for entry in self.engine.walk(str(dir_path)))
     
-    def analyze_storage(self) -> Dict:
-        """Analiza el uso de almacenamiento completo"""
+    def analyze_storage(self, find_duplicates: bool = False) -> Dict:
+        """
+        Analiza el uso de almacenamiento completo
+        
+        Un solo recorrido con os.scandir (un stat por archivo); los tamaños de
+        los directorios conocidos se acumulan en el mismo recorrido. Con
+        find_duplicates se buscan archivos duplicados fuera de esos directorios.
+        """
         print("🔍 Analizando uso de almacenamiento...")
         
+        now = datetime.now()
+        old_cutoff = (now - timedelta(days=90)).timestamp()
         results = {
             'total_size': 0,
             'file_count': 0,
@@ -65,84 +74,102 @@ class StorageAnalyzer:
             'node_modules': [],
             'backups': [],
             'git_repos': [],
-            'analysis_timestamp': datetime.now().isoformat()
+            'analysis_timestamp': now.isoformat()
         }
         
+        known_directories = []
+        inside_known = set()
+        direct_sizes = defaultdict(int)
+        candidates = []
+        
         # Analizar todo el workspace
-        for item in self.workspace_root.rglob('*'):
-            try:
-                if item.is_file():
-                    results['file_count'] += 1
-                    size = self.get_file_size(item)
-                    results['total_size'] += size
-                    
-                    # Analizar por tipo de archivo
-                    ext = item.suffix.lower()
-                    results['file_types'][ext] += 1
-                    results['file_types_size'][ext] += size
-                    
-                    # Archivos grandes (>10MB)
-                    if size > 10 * 1024 * 1024:
-                        results['largest_files'].append({
-                            'path': str(item.relative_to(self.workspace_root)),
-                            'size': size,
-                            'size_mb': size / 1024 / 1024
-                        })
-                    
-                    # Archivos antiguos (>90 días sin modificar)
-                    try:
-                        mtime = datetime.fromtimestamp(item.stat().st_mtime)
-                        if mtime < datetime.now() - timedelta(days=90):
-                            results['old_files'].append({
-                                'path': str(item.relative_to(self.workspace_root)),
-                                'size': size,
-                                'last_modified': mtime.isoformat(),
-                                'days_old': (datetime.now() - mtime).days
-                            })
-                    except:
-                        pass
-                    
-                    # Archivos temporales
-                    if any(item.name.endswith(ext) for ext in ['.tmp', '.bak', '.log', '.cache']):
-                        results['temporary_files'].append({
-                            'path': str(item.relative_to(self.workspace_root)),
-                            'size': size
-                        })
+        for entry in self.engine.walk(str(self.workspace_root), include_dirs=True):
+            rel_path = entry.rel_path
+            parent = os.path.dirname(rel_path)
+            
+            if entry.is_dir:
+                results['directory_count'] += 1
                 
-                elif item.is_dir():
-                    results['directory_count'] += 1
-                    
-                    # Directorios conocidos grandes
-                    dir_name = item.name.lower()
-                    if dir_name in ['node_modules', '__pycache__', '.git', 'backups', '.next', '.mypy_cache']:
-                        dir_size = self.get_directory_size(item)
-                        if dir_name == 'node_modules':
-                            results['node_modules'].append({
-                                'path': str(item.relative_to(self.workspace_root)),
-                                'size': dir_size,
-                                'size_mb': dir_size / 1024 / 1024
-                            })
-                        elif dir_name == 'backups':
-                            results['backups'].append({
-                                'path': str(item.relative_to(self.workspace_root)),
-                                'size': dir_size,
-                                'size_mb': dir_size / 1024 / 1024
-                            })
-                        elif dir_name == '.git':
-                            results['git_repos'].append({
-                                'path': str(item.relative_to(self.workspace_root)),
-                                'size': dir_size,
-                                'size_mb': dir_size / 1024 / 1024
-                            })
-                        else:
-                            results['cache_directories'].append({
-                                'path': str(item.relative_to(self.workspace_root)),
-                                'name': dir_name,
-                                'size': dir_size,
-                                'size_mb': dir_size / 1024 / 1024
-                            })
-            except (PermissionError, OSError):
+                # Directorios conocidos grandes
+                dir_name = os.path.basename(rel_path).lower()
+                if dir_name in self.KNOWN_DIRECTORIES:
+                    known_directories.append((rel_path, dir_name))
+                    inside_known.add(rel_path)
+                elif parent in inside_known:
+                    inside_known.add(rel_path)
                 continue
+            
+            size = entry.size
+            results['file_count'] += 1
+            results['total_size'] += size
+            direct_sizes[parent] += size
+            if find_duplicates and size and parent not in inside_known:
+                candidates.append(entry)
+            
+            # Analizar por tipo de archivo
+            name = os.path.basename(rel_path)
+            ext = os.path.splitext(name)[1].lower()
+            results['file_types'][ext] += 1
+            results['file_types_size'][ext] += size
+            
+            # Archivos grandes (>10MB)
+            if size > 10 * 1024 * 1024:
+                results['largest_files'].append({
+                    'path': rel_path,
+                    'size': size,
+                    'size_mb': size / 1024 / 1024
+                })
+            
+            # Archivos antiguos (>90 días sin modificar)
+            if entry.mtime < old_cutoff:
+                mtime = datetime.fromtimestamp(entry.mtime)
+                results['old_files'].append({
+                    'path': rel_path,
+                    'size': size,
+                    'last_modified': mtime.isoformat(),
+                    'days_old': (now - mtime).days
+                })
+            
+            # Archivos temporales
+            if name.endswith(self.TEMPORARY_SUFFIXES):
+                results['temporary_files'].append({
+                    'path': rel_path,
+                    'size': size
+                })
+        
+        # Tamaño de cada directorio conocido, acumulando el de sus subdirectorios
+        directory_sizes = defaultdict(int)
+        for directory, size in direct_sizes.items():
+            while directory:
+                directory_sizes[directory] += size
+                directory = os.path.dirname(directory)
+        
+        for rel_path, dir_name in known_directories:
+            dir_size = directory_sizes[rel_path]
+            item = {
+                'path': rel_path,
+                'size': dir_size,
+                'size_mb': dir_size / 1024 / 1024
+            }
+            if dir_name == 'node_modules':
+                results['node_modules'].append(item)
+            elif dir_name == 'backups':
+                results['backups'].append(item)
+            elif dir_name == '.git':
+                results['git_repos'].append(item)
+            else:
+                item['name'] = dir_name
+                results['cache_directories'].append(item)
+        
+        # Duplicados: tamaño, hash parcial y hash completo
+        for group in self.engine.find_duplicates(candidates):
+            results['duplicate_candidates'].append({
+                'path': group.files[0],
+                'files': group.files,
+                'checksum': group.checksum,
+                'size': group.size * (len(group.files) - 1),
+                'file_size': group.size
+            })
         
         # Ordenar resultados
         results['largest_files'].sort(key=lambda x: x['size'], reverse=True)
@@ -152,6 +179,7 @@ class StorageAnalyzer:
             reverse=True
         )
         results['old_files'].sort(key=lambda x: x['days_old'], reverse=True)
+        results['duplicate_candidates'].sort(key=lambda x: x['size'], reverse=True)
         
         self.analysis_results = results
         return results
@@ -294,6 +322,22 @@ class CleanupRecommendationEngine:
                          for ext, size in large_types[:5]]
             })
         
+        # 8. Archivos duplicados
+        if results['duplicate_candidates']:
+            total_size = sum(d['size'] for d in results['duplicate_candidates'])
+            recommendations.append({
+                'category': 'Duplicate Files',
+                'priority': 'medium',
+                'potential_savings_mb': total_size / 1024 / 1024,
+                'description': f'Found {len(results["duplicate_candidates"])} groups of identical files',
+                'suggestions': [
+                    f"Remove redundant copies - potential savings: {total_size / 1024 / 1024:.2f} MB",
+                    "Keep a single copy and reference it from the other locations",
+                    "Verify duplicates are not intentionally versioned before deleting"
+                ],
+                'items': results['duplicate_candidates'][:20]
+            })
+        
         self.recommendations = recommendations
         return recommendations
     
@@ -330,7 +374,7 @@ class StorageCleanupAssistant:
         self.analyzer = StorageAnalyzer(workspace_root)
         self.recommendation_engine = CleanupRecommendationEngine(self.analyzer)
     
-    def analyze_and_recommend(self) -> Dict:
+    def analyze_and_recommend(self, find_duplicates: bool = False) -> Dict:
         """Ejecuta análisis completo y genera recomendaciones"""
         print("="*80)
         print("STORAGE CLEANUP ASSISTANT")
@@ -339,7 +383,7 @@ class StorageCleanupAssistant:
         
         # Analizar
         print("📊 Paso 1: Analizando almacenamiento...")
-        analysis = self.analyzer.analyze_storage()
+        analysis = self.analyzer.analyze_storage(find_duplicates=find_duplicates)
         print(f"   ✅ Análisis completado")
         print(f"   📁 Total: {analysis['total_size'] / 1024 / 1024 / 1024:.2f} GB")
         print(f"   📄 Archivos: {analysis['file_count']:,}")
@@ -445,6 +489,11 @@ def main():
         action='store_true',
         help='Guardar reporte en JSON'
     )
+    parser.add_argument(
+        '--duplicates',
+        action='store_true',
+        help='Buscar archivos duplicados (fuera de node_modules, .git y caches)'
+    )
     parser.add_argument(
         '--output',
         type=str,
@@ -457,7 +506,7 @@ def main():
     assistant = StorageCleanupAssistant(workspace_root=args.workspace)
     
     # Analizar y generar recomendaciones
-    results = assistant.analyze_and_recommend()
+    results = assistant.analyze_and_recommend(find_duplicates=args.duplicates)
     
     # Mostrar reporte
     assistant.print_report(results)
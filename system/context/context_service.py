@@ -2,35 +2,30 @@
 """
 Context Service - Servicio para compartir contexto entre agentes.
 Fase -7: Gestión de Estado y Contexto
+
+Los cambios se registran en un journal append-only (ver state_journal) en
+lugar de reescribir todo el archivo en cada set o evento.
 """
 
-import json
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Sequence
 from datetime import datetime
-from threading import Lock
+
+from state_journal import StateJournal
 
 
 class ContextService:
     """Servicio centralizado para compartir contexto entre agentes."""
     
-    def __init__(self, context_file: str = "system/context/shared_context.json"):
+    def __init__(self, context_file: str = "system/context/shared_context.json",
+                 sync_every: int = 100, sync_interval: float = 0.2):
         self.context_file = Path(context_file)
-        self.context_file.parent.mkdir(parents=True, exist_ok=True)
-        self.lock = Lock()
-        self.context = self._load_context()
+        self.journal = StateJournal(str(self.context_file), self._default_context,
+                                    sync_every=sync_every, sync_interval=sync_interval)
+        self.lock = self.journal.lock
+        self.context = self.journal.state
         self._cache = {}
     
-    def _load_context(self) -> Dict[str, Any]:
-        """Carga el contexto compartido."""
-        if self.context_file.exists():
-            try:
-                with open(self.context_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError):
-                return self._default_context()
-        return self._default_context()
-    
     def _default_context(self) -> Dict[str, Any]:
         """Retorna el contexto por defecto."""
         return {
@@ -41,23 +36,28 @@ class ContextService:
             "events": []
         }
     
-    def _save_context(self):
-        """Guarda el contexto compartido."""
-        self.context["updated_at"] = datetime.now().isoformat()
-        with self.lock:
-            with open(self.context_file, 'w', encoding='utf-8') as f:
-                json.dump(self.context, f, indent=2, ensure_ascii=False)
+    def _save_context(self, *operations: Sequence):
+        """Registra los cambios en el journal del contexto compartido."""
+        self.journal.apply(*operations, ("set", ["updated_at"], datetime.now().isoformat()))
+    
+    def flush(self):
+        """Fuerza el fsync de los cambios pendientes."""
+        self.journal.flush()
+    
+    def compact(self):
+        """Compacta el journal en un snapshot del contexto."""
+        self.journal.compact()
+    
+    def close(self):
+        """Sincroniza y cierra el journal."""
+        self.journal.close()
     
     def set_agent_context(self, agent_name: str, data: Dict[str, Any]):
         """Establece el contexto de un agente."""
-        if "agents" not in self.context:
-            self.context["agents"] = {}
-        
-        self.context["agents"][agent_name] = {
+        self._save_context(("set", ["agents", agent_name], {
             "data": data,
             "updated_at": datetime.now().isoformat()
-        }
-        self._save_context()
+        }))
         self._cache[agent_name] = data
     
     def get_agent_context(self, agent_name: str) -> Optional[Dict[str, Any]]:
@@ -74,14 +74,10 @@ class ContextService:
     
     def set_shared_data(self, key: str, value: Any):
         """Establece un dato compartido."""
-        if "shared_data" not in self.context:
-            self.context["shared_data"] = {}
-        
-        self.context["shared_data"][key] = {
+        self._save_context(("set", ["shared_data", key], {
             "value": value,
             "updated_at": datetime.now().isoformat()
-        }
-        self._save_context()
+        }))
     
     def get_shared_data(self, key: str) -> Optional[Any]:
         """Obtiene un dato compartido."""
@@ -98,15 +94,8 @@ class ContextService:
             "timestamp": datetime.now().isoformat()
         }
         
-        if "events" not in self.context:
-            self.context["events"] = []
-        
-        self.context["events"].append(event)
         # Mantener solo los últimos 100 eventos
-        if len(self.context["events"]) > 100:
-            self.context["events"] = self.context["events"][-100:]
-        
-        self._save_context()
+        self._save_context(("append", ["events"], event, 100))
         return event
     
     def get_recent_events(self, event_type: Optional[str] = None, limit: int = 10) -> List[Dict]:
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+State Journal - Persistencia de estado con journal de escritura anticipada.
+Fase -7: Gestión de Estado y Contexto
+
+Cada cambio se agrega como una línea NDJSON al journal (`<archivo>.journal`)
+en lugar de reescribir todo el JSON: el costo de escritura es proporcional al
+cambio, no al tamaño del estado. Los fsync se agrupan (cada `sync_every`
+registros o `sync_interval` segundos); un temporizador sincroniza la cola
+pendiente si no llegan más escrituras y los journals abiertos se cierran
+al salir del proceso. Cuando el journal crece lo suficiente
+se compacta en un snapshot completo escrito a un temporal y renombrado de
+forma atómica, así un corte a mitad de escritura nunca trunca el estado.
+Al cargar se lee el snapshot y se reaplican los registros del journal.
+
+El snapshot es JSON compacto (sin indentación) con la clave reservada
+SEQ_KEY; los `*.journal` son locales y están en .gitignore.
+"""
+
+import atexit
+import json
+import os
+import time
+import weakref
+from pathlib import Path
+from threading import RLock, Timer
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Clave reservada del snapshot: último registro del journal ya incluido
+SEQ_KEY = "_journal_seq"
+
+# Journals abiertos, sincronizados y cerrados al salir del proceso
+_abiertos: "weakref.WeakSet[StateJournal]" = weakref.WeakSet()
+
+
+@atexit.register
+def _cerrar_abiertos():
+    for journal in list(_abiertos):
+        journal.close()
+
+
+def atomic_write_json(path, data: Any, indent: Optional[int] = None) -> int:
+    """Escribe JSON a un temporal, fsync y rename atómico. Retorna el tamaño en bytes."""
+    path = Path(path)
+    temporary = path.with_name(path.name + ".tmp")
+    payload = json.dumps(data, indent=indent, ensure_ascii=False,
+                         separators=None if indent else (",", ":")).encode("utf-8")
+    with open(temporary, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    _fsync_directory(path.parent)
+    return len(payload)
+
+
+def _fsync_directory(directory: Path):
+    """Persiste el rename en el directorio (no disponible en todas las plataformas)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def apply_operation(state: Dict[str, Any], operation: Sequence) -> None:
+    """Aplica una operación del journal: ["set", ruta, valor], ["del", ruta] o ["append", ruta, valor, límite]."""
+    kind, path = operation[0], operation[1]
+    parent = state
+    for key in path[:-1]:
+        child = parent.get(key)
+        if not isinstance(child, dict):
+            child = parent[key] = {}
+        parent = child
+    key = path[-1]
+
+    if kind == "set":
+        parent[key] = operation[2]
+    elif kind == "del":
+        parent.pop(key, None)
+    elif kind == "append":
+        items = parent.get(key)
+        if not isinstance(items, list):
+            items = parent[key] = []
+        items.append(operation[2])
+        limit = operation[3] if len(operation) > 3 else None
+        if limit and len(items) > limit:
+            del items[:-limit]
+    else:
+        raise ValueError(f"Operación de journal desconocida: {kind}")
+
+
+class StateJournal:
+    """Estado en memoria persistido como snapshot JSON + journal NDJSON."""
+    
+    def __init__(self, state_file: str, default_factory: Callable[[], Dict[str, Any]],
+                 sync_every: int = 100, sync_interval: float = 0.2,
+                 compact_min_bytes: int = 1024 * 1024, compact_ratio: float = 1.0):
+        """
+        Args:
+            state_file: Snapshot JSON; el journal es `<state_file>.journal`
+            default_factory: Estado inicial cuando no hay snapshot legible
+            sync_every: Registros por fsync del journal
+            sync_interval: Segundos máximos entre fsync mientras hay escrituras
+            compact_min_bytes: Tamaño mínimo del journal para compactar
+            compact_ratio: Compactar cuando el journal supera este múltiplo del snapshot
+        """
+        self.state_file = Path(state_file)
+        self.journal_file = self.state_file.with_name(self.state_file.name + ".journal")
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        self.default_factory = default_factory
+        self.sync_every = max(1, sync_every)
+        self.sync_interval = sync_interval
+        self.compact_min_bytes = compact_min_bytes
+        self.compact_ratio = compact_ratio
+        self.lock = RLock()
+        
+        self._seq = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._snapshot_size = 0
+        self._journal_size = 0
+        self._fd: Optional[int] = None
+        self._timer: Optional[Timer] = None
+        self.state = self._recover()
+        _abiertos.add(self)
+    
+    def _recover(self) -> Dict[str, Any]:
+        """Carga el snapshot y reaplica el journal; descarta una cola incompleta."""
+        state = None
+        if self.state_file.exists():
+            try:
+                with open(self.state_file, 'rb') as f:
+                    payload = f.read()
+                state = json.loads(payload)
+                self._snapshot_size = len(payload)
+            except (json.JSONDecodeError, UnicodeDecodeError, IOError):
+                state = None
+        if not isinstance(state, dict):
+            state = self.default_factory()
+        snapshot_seq = state.pop(SEQ_KEY, 0)
+        self._seq = snapshot_seq
+        
+        valid_bytes = 0
+        replayed = 0
+        if self.journal_file.exists():
+            with open(self.journal_file, 'rb') as f:
+                for line in f:
+                    # Una línea sin salto final o ilegible es una escritura cortada
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        break
+                    valid_bytes += len(line)
+                    if record["seq"] <= snapshot_seq:
+                        continue
+                    for operation in record["ops"]:
+                        apply_operation(state, operation)
+                    self._seq = record["seq"]
+                    replayed += 1
+        
+        self._fd = os.open(self.journal_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if os.fstat(self._fd).st_size != valid_bytes:
+            os.ftruncate(self._fd, valid_bytes)
+        self._journal_size = valid_bytes
+        self.state = state
+        
+        # Sin snapshot (primer uso o ilegible) se escribe uno para fijar el estado base
+        if not self._snapshot_size or replayed and self._should_compact():
+            self.compact()
+        return state
+    
+    def apply(self, *operations: Sequence):
+        """Aplica operaciones en memoria y las agrega como un único registro al journal."""
+        with self.lock:
+            self._check_open()
+            seq = self._seq + 1
+            line = json.dumps({"seq": seq, "ops": operations}, ensure_ascii=False,
+                              separators=(",", ":")) + "\n"
+            for operation in operations:
+                apply_operation(self.state, operation)
+            self._seq = seq
+            data = line.encode("utf-8")
+            os.write(self._fd, data)
+            self._journal_size += len(data)
+            self._unsynced += 1
+        
+            if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+            elif self._timer is None:
+                # Sin más escrituras la cola se sincroniza al vencer sync_interval
+                self._timer = Timer(self.sync_interval, self._sync_deadline)
+                self._timer.daemon = True
+                self._timer.start()
+            if self._should_compact():
+                self.compact()
+    
+    def _check_open(self):
+        if self._fd is None:
+            raise ValueError(f"El journal {self.journal_file} está cerrado")
+    
+    def _sync_deadline(self):
+        with self.lock:
+            self._timer = None
+            if self._fd is not None:
+                self._sync()
+    
+    def _should_compact(self) -> bool:
+        return self._journal_size >= max(self.compact_min_bytes, self._snapshot_size * self.compact_ratio)
+    
+    def _sync(self):
+        if self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+    
+    def flush(self):
+        """Fuerza el fsync de los registros pendientes (no hace nada si está cerrado)."""
+        with self.lock:
+            if self._fd is not None:
+                self._sync()
+    
+    def compact(self):
+        """Escribe el estado completo como snapshot atómico y vacía el journal."""
+        with self.lock:
+            self._check_open()
+            snapshot = dict(self.state)
+            snapshot[SEQ_KEY] = self._seq
+            self._snapshot_size = atomic_write_json(self.state_file, snapshot)
+            # Los registros ya están en el snapshot: si el truncado no llega a
+            # disco, al recuperar se saltean por número de secuencia
+            os.ftruncate(self._fd, 0)
+            self._journal_size = 0
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+    
+    def replace(self, state: Dict[str, Any]):
+        """Reemplaza el estado completo (p. ej. al restaurar un snapshot) y compacta."""
+        with self.lock:
+            self.state = state
+            self.compact()
+    
+    def close(self):
+        """Sincroniza y cierra el journal."""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._fd is None:
+                return
+            self._sync()
+            os.close(self._fd)
+            self._fd = None
+            _abiertos.discard(self)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Tamaños actuales del snapshot y del journal."""
+        return {
+            "seq": self._seq,
+            "snapshot_bytes": self._snapshot_size,
+            "journal_bytes": self._journal_size,
+            "unsynced_records": self._unsynced
+        }
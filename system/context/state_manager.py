@@ -8,7 +8,9 @@ import json
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Sequence
+
+from state_journal import StateJournal, atomic_write_json
 
 
 class StateManager:
@@ -16,18 +18,16 @@ class StateManager:
     
     def __init__(self, state_file: str = "system/context/state.json"):
         self.state_file = Path(state_file)
-        self.state_file.parent.mkdir(parents=True, exist_ok=True)
-        self.state = self._load_state()
+        self.journal = StateJournal(str(self.state_file), self._default_state)
+    
+    @property
+    def state(self) -> Dict[str, Any]:
+        return self.journal.state
     
-    def _load_state(self) -> Dict[str, Any]:
-        """Carga el estado desde el archivo."""
-        if self.state_file.exists():
-            try:
-                with open(self.state_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError):
-                return self._default_state()
-        return self._default_state()
+    @state.setter
+    def state(self, value: Dict[str, Any]):
+        # Reemplazar el estado completo lo persiste como snapshot atómico
+        self.journal.replace(value)
     
     def _default_state(self) -> Dict[str, Any]:
         """Retorna el estado por defecto."""
@@ -40,24 +40,23 @@ class StateManager:
         }
     
     def save_state(self):
-        """Guarda el estado actual al archivo."""
+        """Guarda el estado actual completo como snapshot atómico."""
         self.state["updated_at"] = datetime.now().isoformat()
-        with open(self.state_file, 'w', encoding='utf-8') as f:
-            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        self.journal.compact()
+    
+    def _record(self, *operations: Sequence):
+        """Registra los cambios en el journal del estado."""
+        self.journal.apply(*operations, ("set", ["updated_at"], datetime.now().isoformat()))
     
     def set_phase_state(self, phase: int, state: str, metadata: Optional[Dict] = None):
         """Establece el estado de una fase."""
-        if "phases" not in self.state:
-            self.state["phases"] = {}
-        
         phase_key = f"phase_{phase}"
-        self.state["phases"][phase_key] = {
+        self._record(("set", ["phases", phase_key], {
             "phase": phase,
             "state": state,
             "updated_at": datetime.now().isoformat(),
             "metadata": metadata or {}
-        }
-        self.save_state()
+        }))
     
     def get_phase_state(self, phase: int) -> Optional[Dict[str, Any]]:
         """Obtiene el estado de una fase."""
@@ -66,16 +65,12 @@ class StateManager:
     
     def set_task_state(self, task_id: str, state: str, metadata: Optional[Dict] = None):
         """Establece el estado de una tarea."""
-        if "tasks" not in self.state:
-            self.state["tasks"] = {}
-        
-        self.state["tasks"][task_id] = {
+        self._record(("set", ["tasks", task_id], {
             "task_id": task_id,
             "state": state,
             "updated_at": datetime.now().isoformat(),
             "metadata": metadata or {}
-        }
-        self.save_state()
+        }))
     
     def get_task_state(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Obtiene el estado de una tarea."""
@@ -90,17 +85,12 @@ class StateManager:
             "metadata": metadata or {}
         }
         
-        if "checkpoints" not in self.state:
-            self.state["checkpoints"] = []
-        
-        self.state["checkpoints"].append(checkpoint)
-        self.save_state()
+        self._record(("append", ["checkpoints"], checkpoint))
         
         # Guardar checkpoint en archivo separado
         checkpoint_file = Path(f"system/context/checkpoints/{checkpoint_name}.json")
         checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(checkpoint_file, 'w', encoding='utf-8') as f:
-            json.dump(checkpoint, f, indent=2, ensure_ascii=False)
+        atomic_write_json(checkpoint_file, checkpoint, indent=2)
         
         return checkpoint
     
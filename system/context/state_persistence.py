@@ -7,8 +7,9 @@ Fase -7: Gestión de Estado y Contexto
 import json
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from state_manager import StateManager
+from state_journal import atomic_write_json
 
 
 class StatePersistence:
@@ -31,8 +32,7 @@ class StatePersistence:
         }
         
         snapshot_file = self.snapshots_dir / f"{snapshot_name}.json"
-        with open(snapshot_file, 'w', encoding='utf-8') as f:
-            json.dump(snapshot_data, f, indent=2, ensure_ascii=False)
+        atomic_write_json(snapshot_file, snapshot_data, indent=2)
         
         return snapshot_name
     
@@ -46,8 +46,8 @@ class StatePersistence:
             with open(snapshot_file, 'r', encoding='utf-8') as f:
                 snapshot_data = json.load(f)
             
+            # Reemplaza el estado del journal con un snapshot atómico
             self.state_manager.state = snapshot_data.get("state", {})
-            self.state_manager.save_state()
             return True
         except Exception as e:
             print(f"Error loading snapshot {snapshot_name}: {e}")
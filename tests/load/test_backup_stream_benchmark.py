@@ -0,0 +1,73 @@
+"""
+Load benchmark: peak memory and throughput of the streaming backup writer
+
+Compares the chunked NDJSON writer with the previous in-memory format
+(list of every document, json.dumps with indent, gzip, and the compressed
+bytes kept again as a hex string) at two collection sizes. Peak memory is
+measured with tracemalloc.
+"""
+
+import gzip
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "backup_system"))
+from backup_stream import ChunkedBackupWriter
+
+TAMANOS = (10_000, 50_000)
+
+
+def _documentos(n):
+    for i in range(n):
+        yield {
+            "session_id": f"sesion-{i}",
+            "user_phone": f"099{i:06d}",
+            "mensaje": "Hola, quisiera cotizar isodec 100mm para un techo de 10 x 5 metros " * 2,
+            "intent": "cotizacion",
+            "n": i,
+        }
+
+
+def _anterior(n):
+    documentos = list(_documentos(n))
+    datos = {"mongodb": {"data": {"conversations": {"count": len(documentos), "documents": documentos}}}}
+    texto = json.dumps(datos, default=str, indent=2)
+    comprimido = gzip.compress(texto.encode("utf-8"))
+    datos["compressed_data"] = comprimido.hex()
+    return len(comprimido)
+
+
+def _streaming(n, directorio):
+    with ChunkedBackupWriter(str(directorio), chunk_records=5000) as writer:
+        writer.write_stream("mongodb.conversations", _documentos(n), kind="collection")
+    return writer.compressed_size
+
+
+def _medir(funcion, *args):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    tamano = funcion(*args)
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return pico, segundos, tamano
+
+
+class TestBackupStreamBenchmark:
+    @pytest.mark.slow
+    def test_peak_memory_is_constant(self, tmp_path):
+        picos = {}
+        print()
+        for n in TAMANOS:
+            pico_anterior, s_anterior, t_anterior = _medir(_anterior, n)
+            pico, s, t = _medir(_streaming, n, tmp_path / f"b{n}")
+            picos[n] = pico
+            print(f"{n:>7} docs  previous: peak {pico_anterior / 2**20:7.1f} MB  {n / s_anterior:>8,.0f} docs/s  {t_anterior / 2**20:5.1f} MB gz")
+            print(f"{n:>7} docs  stream:   peak {pico / 2**20:7.1f} MB  {n / s:>8,.0f} docs/s  {t / 2**20:5.1f} MB gz")
+
+        assert picos[TAMANOS[1]] < 2 * picos[TAMANOS[0]]
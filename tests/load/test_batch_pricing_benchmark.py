@@ -0,0 +1,64 @@
+"""
+Benchmark: re-pricing open quotes, scalar vs batch pricing
+
+Simulates the sales team re-pricing every open quote after a price change:
+the scalar path calls calcular_precio_cotizacion per quote, the batch path
+prices them all with calcular_precios_lote.
+"""
+
+import random
+import time
+from decimal import Decimal
+
+import pytest
+
+from repositorio_cotizaciones import RepositorioCotizacionesSQLite
+from sistema_cotizaciones import EspecificacionCotizacion, SistemaCotizacionesBMC
+
+CANTIDAD = 50_000
+
+
+def _cotizaciones_abiertas():
+    azar = random.Random(42)
+    return [
+        EspecificacionCotizacion(
+            producto=azar.choice(["isodec", "poliestireno", "lana_roca"]),
+            espesor=azar.choice(["50mm", "75mm", "100mm", "125mm", "150mm"]),
+            relleno="EPS",
+            largo_metros=Decimal(azar.randint(20, 3000)) / Decimal(100),
+            ancho_metros=Decimal(azar.randint(20, 1500)) / Decimal(100),
+            color=azar.choice(["Blanco", "Gris", "Personalizado"]),
+            termina_front=azar.choice(["", "Gotero"]),
+            termina_sup=azar.choice(["", "Hormigón"]),
+            anclajes=azar.choice(["incluido", "no incluido"]),
+            traslado=azar.choice(["incluido", "no incluido"]),
+        )
+        for _ in range(CANTIDAD)
+    ]
+
+
+class TestBatchPricingBenchmark:
+    @pytest.mark.slow
+    def test_batch_pricing_is_faster(self):
+        sistema = SistemaCotizacionesBMC(repositorio=RepositorioCotizacionesSQLite(":memory:"))
+        especificaciones = _cotizaciones_abiertas()
+        sistema.actualizar_precio_producto("isodec", Decimal("150.00"))
+        sistema.actualizar_precio_producto("poliestireno", Decimal("120.00"))
+        sistema.actualizar_precio_producto("lana_roca", Decimal("140.00"))
+
+        inicio = time.perf_counter()
+        escalar = [sistema.calcular_precio_cotizacion(e) for e in especificaciones]
+        duracion_escalar = time.perf_counter() - inicio
+
+        # Cambio de precio: la tabla de factores arranca vacía
+        inicio = time.perf_counter()
+        lote = sistema.calcular_precios_lote(especificaciones)
+        duracion_lote = time.perf_counter() - inicio
+
+        assert lote == escalar
+        print(
+            f"\n{CANTIDAD} quotes: scalar {CANTIDAD / duracion_escalar:,.0f} quotes/s "
+            f"({duracion_escalar * 1000:.0f} ms), batch {CANTIDAD / duracion_lote:,.0f} quotes/s "
+            f"({duracion_lote * 1000:.0f} ms), {duracion_escalar / duracion_lote:.1f}x"
+        )
+        assert duracion_lote < duracion_escalar
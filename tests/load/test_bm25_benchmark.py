@@ -0,0 +1,99 @@
+"""
+Load benchmark: BM25 query latency at 10k+ documents
+
+Compares the persistent BM25 index with the previous keyword fallback
+(json.dumps of every product and a substring scan of every document on
+each query).
+"""
+
+import json
+import random
+import statistics
+import time
+
+import pytest
+
+from AI_AGENTS.EXECUTOR.bm25_index import IndiceBM25
+
+N_DOCUMENTOS = 12_000
+N_CONSULTAS = 200
+
+VOCABULARIO = (
+    "panel isodec isopanel isoroof techo pared fachada aislación térmica acústica "
+    "espesor 50mm 100mm 150mm metro cuadrado precio cotización flete envío "
+    "Montevideo Maldonado colocación instalación correa tornillo autoperforante "
+    "chapa galvanizada poliestireno poliuretano lana roca cámara frigorífica "
+    "galpón vivienda ampliación garantía stock entrega plazo descuento"
+).split()
+
+
+def _documentos(generador):
+    # Domain words plus a Zipf-distributed long tail, like real documents
+    cola = [f"termino{i}" for i in range(20_000)]
+    pesos_cola = [1 / (i + 1) for i in range(len(cola))]
+    documentos = []
+    for i in range(N_DOCUMENTOS):
+        palabras = generador.choices(VOCABULARIO, k=generador.randint(3, 15))
+        palabras += generador.choices(cola, weights=pesos_cola, k=generador.randint(20, 120))
+        generador.shuffle(palabras)
+        documentos.append({"nombre": f"producto {i}", "descripcion": " ".join(palabras)})
+    return documentos
+
+
+def _busqueda_anterior(documentos, consulta, k):
+    encontrados = []
+    palabras = consulta.lower().split()
+    for info in documentos:
+        contenido = json.dumps(info, default=str).lower()
+        if any(palabra in contenido for palabra in palabras):
+            encontrados.append(info)
+            if len(encontrados) >= k:
+                break
+    return encontrados
+
+
+class TestBM25Benchmark:
+    @pytest.mark.slow
+    def test_query_latency(self, tmp_path):
+        generador = random.Random(0)
+        documentos = _documentos(generador)
+        consultas = [" ".join(generador.sample(VOCABULARIO, 3)) for _ in range(N_CONSULTAS)]
+
+        inicio = time.perf_counter()
+        indice = IndiceBM25()
+        for i, info in enumerate(documentos):
+            indice.agregar(f"producto:{i}", json.dumps(info, ensure_ascii=False))
+        construccion = time.perf_counter() - inicio
+
+        ruta = tmp_path / "bm25.pkl"
+        indice.guardar(ruta)
+        inicio = time.perf_counter()
+        indice = IndiceBM25.cargar(ruta)
+        carga = time.perf_counter() - inicio
+
+        def medir(buscar):
+            tiempos = []
+            for consulta in consultas:
+                inicio = time.perf_counter()
+                buscar(consulta)
+                tiempos.append(time.perf_counter() - inicio)
+            tiempos.sort()
+            return statistics.median(tiempos), tiempos[int(len(tiempos) * 0.95)]
+
+        bm25_p50, bm25_p95 = medir(lambda c: indice.buscar(c, k=5))
+        escaneo_p50, escaneo_p95 = medir(lambda c: _busqueda_anterior(documentos, c, 5))
+        # A word missing from the corpus makes the old scan visit every document
+        inicio = time.perf_counter()
+        _busqueda_anterior(documentos, "xyz", 5)
+        escaneo_completo = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        indice.buscar("xyz", k=5)
+        bm25_sin_resultados = time.perf_counter() - inicio
+
+        print(f"\n{N_DOCUMENTOS} docs: build {construccion:.2f}s, load {carga * 1e3:.0f} ms")
+        print(f"bm25:     p50 {bm25_p50 * 1e3:.2f} ms, p95 {bm25_p95 * 1e3:.2f} ms (ranked top-5)")
+        print(f"old scan: p50 {escaneo_p50 * 1e3:.2f} ms, p95 {escaneo_p95 * 1e3:.2f} ms (first 5 matches, unranked)")
+        print(f"no match: bm25 {bm25_sin_resultados * 1e3:.3f} ms, old scan {escaneo_completo * 1e3:.0f} ms")
+
+        assert bm25_p95 < 0.1
+        assert bm25_sin_resultados < escaneo_completo
@@ -0,0 +1,121 @@
+"""
+Load benchmark: concurrent-chat throughput of /api/chat
+
+Compares the legacy path (blocking OpenAI call inside an async handler,
+which serializes every request on the event loop) against the async path
+(shared IA instance, async OpenAI client, bounded worker pool).
+OpenAI is replaced by a fake client with a fixed latency.
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from ia_conversacional_integrada import IAConversacionalIntegrada
+from sistema_completo_integrado import app
+
+OPENAI_LATENCY = 0.05
+CONCURRENT_CHATS = 40
+MENSAJE = "Quiero cotizar isodec de 100mm para un techo de 10x5"
+
+
+def _fake_completion():
+    contenido = json.dumps(
+        {
+            "mensaje": "Perfecto, ¿de qué color lo necesitás?",
+            "tipo": "pregunta",
+            "acciones": [],
+            "confianza": 0.9,
+            "necesita_datos": ["color"],
+        }
+    )
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=contenido))])
+
+
+class _FakeCompletions:
+    def create(self, **kwargs):
+        time.sleep(OPENAI_LATENCY)
+        return _fake_completion()
+
+
+class _FakeAsyncCompletions:
+    async def create(self, **kwargs):
+        await asyncio.sleep(OPENAI_LATENCY)
+        return _fake_completion()
+
+
+class _FakeAsyncClient:
+    chat = SimpleNamespace(completions=_FakeAsyncCompletions())
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture(scope="module")
+def ia():
+    instancia = IAConversacionalIntegrada()
+    instancia.use_ai = True
+    instancia.use_shared_context = False
+    instancia.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions()))
+    instancia.async_openai_client = _FakeAsyncClient()
+    return instancia
+
+
+async def _legacy_handler(ia, mensaje, session_id):
+    # Equivalent of the old /api/chat: sync call inside "async def"
+    return ia.procesar_mensaje_usuario(mensaje, session_id, session_id)
+
+
+async def _run_concurrently(handler, ia):
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(
+        *[handler(ia, MENSAJE, f"bench_{i}") for i in range(CONCURRENT_CHATS)]
+    )
+    return resultados, time.perf_counter() - inicio
+
+
+class TestChatThroughput:
+    @pytest.mark.slow
+    def test_async_path_outperforms_blocking_path(self, ia):
+        async def async_handler(ia, mensaje, session_id):
+            return await ia.procesar_mensaje_usuario_async(mensaje, session_id, session_id)
+
+        _, antes = asyncio.run(_run_concurrently(_legacy_handler, ia))
+        resultados, despues = asyncio.run(_run_concurrently(async_handler, ia))
+        asyncio.run(ia.cerrar())
+
+        assert all(r["tipo"] == "pregunta" for r in resultados)
+        print(
+            f"\n{CONCURRENT_CHATS} concurrent chats: "
+            f"blocking {CONCURRENT_CHATS / antes:.1f} chats/s ({antes:.2f}s), "
+            f"async {CONCURRENT_CHATS / despues:.1f} chats/s ({despues:.2f}s)"
+        )
+        assert antes / despues > 5, "Async path should serve chats concurrently"
+
+    @pytest.mark.slow
+    def test_chat_endpoint_serves_concurrent_requests(self, ia):
+        async def run():
+            app.state.ia = ia
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                inicio = time.perf_counter()
+                respuestas = await asyncio.gather(
+                    *[
+                        client.post(
+                            "/api/chat", json={"message": MENSAJE, "session_id": f"api_{i}"}
+                        )
+                        for i in range(CONCURRENT_CHATS)
+                    ]
+                )
+                return respuestas, time.perf_counter() - inicio
+
+        respuestas, duracion = asyncio.run(run())
+        asyncio.run(ia.cerrar())
+
+        assert all(r.status_code == 200 for r in respuestas)
+        print(f"\n/api/chat: {CONCURRENT_CHATS / duracion:.1f} chats/s ({duracion:.2f}s)")
+        assert duracion < CONCURRENT_CHATS * OPENAI_LATENCY / 5
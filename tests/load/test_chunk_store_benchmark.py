@@ -0,0 +1,83 @@
+"""
+Load benchmark: 10 consecutive backups of a mostly static workspace
+
+Each run backs up the same files and collection as the streaming backup
+writer would (one "filesystem" stream of {path, size, content} records and
+one collection stream), after editing 1% of the files and inserting 0.5% new
+documents. Compares bytes written and wall time per backup between the
+per-backup chunked format and the deduplicating chunk store.
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "backup_system"))
+from storage_manager import StorageManager
+
+ARCHIVOS = 2000
+DOCUMENTOS = 20_000
+BACKUPS = 10
+
+_PALABRAS = ("isodec isopanel lana roca techo pared cotizacion metros espesor precio "
+             "cliente envio montevideo panel frigorifico color blanco gris").split()
+
+
+def _texto(rnd, palabras):
+    return " ".join(rnd.choice(_PALABRAS) for _ in range(palabras))
+
+
+class _Workspace:
+    def __init__(self):
+        self.rnd = random.Random(42)
+        self.archivos = {f"python-scripts/modulo_{i:04d}.py": _texto(self.rnd, self.rnd.randint(200, 1500))
+                         for i in range(ARCHIVOS)}
+        self.documentos = [{"_id": i, "sesion": f"s{i}", "mensaje": _texto(self.rnd, 30)} for i in range(DOCUMENTOS)]
+
+    def cambiar(self):
+        for ruta in self.rnd.sample(sorted(self.archivos), ARCHIVOS // 100):
+            self.archivos[ruta] = self.archivos[ruta] + "\n" + _texto(self.rnd, 20)
+        inicio = len(self.documentos)
+        self.documentos.extend({"_id": i, "sesion": f"s{i}", "mensaje": _texto(self.rnd, 30)}
+                               for i in range(inicio, inicio + DOCUMENTOS // 200))
+
+    def backup(self, storage, backup_id):
+        with storage.open_backup_writer(backup_id) as writer:
+            writer.write_stream("filesystem", ({"path": ruta, "size": len(contenido), "content": contenido}
+                                               for ruta, contenido in self.archivos.items()), kind="files")
+            writer.write_stream("mongodb.conversations", iter(self.documentos), kind="collection")
+        return writer
+
+
+def _serie(tmp_path, dedup):
+    storage = StorageManager({"local": {"path": str(tmp_path)}, "dedup": {"enabled": dedup}})
+    workspace = _Workspace()
+    filas = []
+    for n in range(BACKUPS):
+        if n:
+            workspace.cambiar()
+        inicio = time.perf_counter()
+        writer = workspace.backup(storage, f"backup_{n:02d}")
+        segundos = time.perf_counter() - inicio
+        nuevos = getattr(writer, "stored_size", writer.compressed_size)
+        filas.append((writer.size, nuevos, segundos))
+    return filas, storage.get_storage_usage().total_size
+
+
+class TestChunkStoreBenchmark:
+    @pytest.mark.slow
+    def test_consecutive_backups(self, tmp_path):
+        anterior, total_anterior = _serie(tmp_path / "chunked", dedup=False)
+        dedup, total_dedup = _serie(tmp_path / "dedup", dedup=True)
+
+        print()
+        print(f"{'run':>3} {'logical MB':>10} {'chunked MB':>10} {'s':>6} {'dedup MB':>9} {'s':>6}")
+        for n, ((logico, escrito, s), (_, nuevo, s_dedup)) in enumerate(zip(anterior, dedup)):
+            print(f"{n:>3} {logico / 2**20:>10.1f} {escrito / 2**20:>10.2f} {s:>6.2f} {nuevo / 2**20:>9.2f} {s_dedup:>6.2f}")
+        print(f"total on disk: chunked {total_anterior / 2**20:.1f} MB, dedup {total_dedup / 2**20:.1f} MB")
+
+        assert total_dedup < total_anterior / 3
+        assert all(nuevo < dedup[0][1] / 5 for _, nuevo, _ in dedup[1:])
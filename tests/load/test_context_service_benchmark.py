@@ -0,0 +1,77 @@
+"""
+Load benchmark: ContextService updates per second with 10 MB of shared state
+
+The previous ContextService rewrote the whole state file (json.dump with
+indent) on every set and event. The journaled one appends one NDJSON record
+per update, batches fsync, and compacts into an atomic snapshot once the
+journal outgrows it; 20k updates of ~1 KB include two compactions of the
+10 MB snapshot. Also times recovery (snapshot + journal replay).
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "system" / "context"))
+from context_service import ContextService
+
+CLAVES = 10_000
+TAMANO_VALOR = 1000
+ACTUALIZACIONES = 20_000
+ACTUALIZACIONES_ANTERIOR = 10
+
+
+def _valor(i, version=0):
+    return {"version": version, "texto": (f"cotizacion {i} " * 100)[:TAMANO_VALOR]}
+
+
+def _guardar_anterior(servicio):
+    with open(servicio.context_file, 'w', encoding='utf-8') as f:
+        json.dump(servicio.context, f, indent=2, ensure_ascii=False)
+
+
+class TestContextServiceBenchmark:
+    @pytest.mark.slow
+    def test_updates_per_second_at_10mb(self, tmp_path):
+        ruta = str(tmp_path / "shared_context.json")
+        servicio = ContextService(ruta)
+        for i in range(CLAVES):
+            servicio.context["shared_data"][f"clave_{i}"] = {"value": _valor(i), "updated_at": None}
+        servicio.compact()
+        tamano_mb = servicio.journal.stats()["snapshot_bytes"] / 2**20
+        assert tamano_mb >= 10
+
+        # Previous behaviour: full rewrite per update
+        inicio = time.perf_counter()
+        for i in range(ACTUALIZACIONES_ANTERIOR):
+            servicio.context["shared_data"][f"clave_{i}"]["value"] = _valor(i, 1)
+            _guardar_anterior(servicio)
+        ups_anterior = ACTUALIZACIONES_ANTERIOR / (time.perf_counter() - inicio)
+        servicio.compact()
+
+        inicio = time.perf_counter()
+        for i in range(ACTUALIZACIONES):
+            servicio.set_shared_data(f"clave_{i % CLAVES}", _valor(i, 2))
+            if i % 10 == 0:
+                servicio.emit_event("cotizacion_actualizada", {"clave": i})
+        servicio.flush()
+        ups_journal = ACTUALIZACIONES / (time.perf_counter() - inicio)
+        estadisticas = servicio.journal.stats()
+        servicio.close()
+
+        inicio = time.perf_counter()
+        recuperado = ContextService(ruta)
+        s_recuperacion = time.perf_counter() - inicio
+        assert recuperado.get_shared_data(f"clave_{(ACTUALIZACIONES - 1) % CLAVES}") == _valor(ACTUALIZACIONES - 1, 2)
+        assert recuperado.get_recent_events(limit=1)[0]["data"] == {"clave": ACTUALIZACIONES - 10}
+
+        print()
+        print(f"state {tamano_mb:.1f} MB")
+        print(f"previous (full rewrite): {ups_anterior:,.1f} updates/s")
+        print(f"journal: {ups_journal:,.0f} updates/s "
+              f"(journal {estadisticas['journal_bytes'] / 2**20:.1f} MB pending compaction)")
+        print(f"recovery (snapshot + journal replay): {s_recuperacion:.2f} s")
+        assert ups_journal > ups_anterior * 50
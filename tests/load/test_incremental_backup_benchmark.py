@@ -0,0 +1,86 @@
+"""
+Load benchmark: incremental change detection on an unchanged 50k-file workspace
+
+The previous ChangeTracker read and hashed the content of every file on each
+run. The change journal only stats files and hashes those whose (size,
+mtime_ns, inode) signature moved. Both are timed after a baseline full
+backup with nothing changed, and again with 1% of the files edited.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "backup_system"))
+import incremental_backup as modulo_incremental
+from backup_service import BackupService
+from incremental_backup import ChangeTracker, IncrementalBackupService
+from storage_manager import StorageManager
+
+ARCHIVOS = 50_000
+HACE_UNA_HORA = time.time_ns() - 3600 * 10**9
+
+
+def _anterior(servicio):
+    checksums = {}
+    for rel_path, file_path in servicio.backup_service._iter_paths(servicio.scope):
+        with open(file_path, "r", encoding="utf-8") as f:
+            checksums[rel_path] = hashlib.sha256(f.read().encode("utf-8")).hexdigest()
+    return checksums
+
+
+def _medir(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return time.perf_counter() - inicio, resultado
+
+
+class TestIncrementalBackupBenchmark:
+    @pytest.mark.slow
+    def test_unchanged_workspace_under_a_second(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(modulo_incremental, "ensure_mongodb_connected", lambda: False)
+        config = {
+            "backup": {"metadata_dir": str(tmp_path / "metadata")},
+            "storage": {"local": {"path": str(tmp_path / "backups")}},
+            "mongodb": {"collections": []},
+            "filesystem": {"patterns": [], "directories": ["ws"]},
+        }
+        ruta_config = tmp_path / "backup_config.json"
+        ruta_config.write_text(json.dumps(config))
+        backup = BackupService(StorageManager(config["storage"]), str(ruta_config))
+        backup.base_dir = str(tmp_path)
+        monkeypatch.setattr(backup, "_stream_mongodb", lambda writer: {"collections": {}})
+
+        rutas = []
+        for i in range(ARCHIVOS):
+            ruta = tmp_path / "ws" / f"d{i // 500:03d}" / f"archivo_{i:05d}.py"
+            if i % 500 == 0:
+                ruta.parent.mkdir(parents=True)
+            ruta.write_text(f"# modulo {i}\n" + "x = 1\n" * 40)
+            os.utime(ruta, ns=(HACE_UNA_HORA, HACE_UNA_HORA))
+            rutas.append(ruta)
+
+        servicio = IncrementalBackupService(backup, ChangeTracker(str(tmp_path / "estado.json")))
+        s_base, _ = _medir(servicio.create_incremental_backup)
+
+        s_anterior, _ = _medir(_anterior, servicio)
+        servicio = IncrementalBackupService(backup, ChangeTracker(str(tmp_path / "estado.json")))
+        s_journal, resultado = _medir(servicio.create_incremental_backup)
+        assert resultado["message"] == "No changes detected"
+
+        for ruta in rutas[::100]:
+            ruta.write_text(ruta.read_text() + "y = 2\n")
+            os.utime(ruta, ns=(HACE_UNA_HORA, HACE_UNA_HORA + 1))
+        s_cambios, resultado = _medir(servicio.create_incremental_backup)
+        assert resultado["total_changes"] == ARCHIVOS // 100
+
+        print()
+        print(f"{ARCHIVOS} files, baseline full backup + journal: {s_base:.2f} s")
+        print(f"unchanged: previous (read + hash all) {s_anterior:.2f} s, journal {s_journal:.2f} s")
+        print(f"1% edited: journal + incremental backup {s_cambios:.2f} s")
+        assert s_journal < 1.0
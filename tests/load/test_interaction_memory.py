@@ -0,0 +1,60 @@
+"""
+Memory report: bytes per stored interaction
+
+Compares the former list of InteraccionCliente dataclasses against the
+columnar HistorialInteracciones, measured with tracemalloc.
+"""
+
+import datetime
+import tracemalloc
+from decimal import Decimal
+
+import pytest
+
+from base_conocimiento_dinamica import HistorialInteracciones, InteraccionCliente
+
+CANTIDAD = 50_000
+MENSAJES = [
+    "Hola, quiero cotizar isodec de 100mm para un techo de 10x5",
+    "¿Cuánto sale el isoroof con terminación de gotero?",
+    "Necesito el precio del panel para una cámara de frío",
+]
+
+
+def _interacciones():
+    inicio = datetime.datetime(2025, 1, 1)
+    for i in range(CANTIDAD):
+        yield InteraccionCliente(
+            id=f"ia_{i:012d}",
+            timestamp=inicio + datetime.timedelta(seconds=i * 37),
+            cliente_id=f"+5989{i % 500:07d}",
+            tipo_interaccion=("consulta", "cotizacion", "venta")[i % 3],
+            mensaje_cliente=f"{MENSAJES[i % 3]} (#{i})",
+            respuesta_agente=f"Perfecto, te preparo la cotización número {i}.",
+            contexto={"producto": ("isodec", "isoroof")[i % 2], "espesor": "100mm"},
+            resultado=("exitoso", "pendiente")[i % 2],
+            valor_venta=Decimal("1500") if i % 3 == 2 else None,
+            satisfaccion_cliente=i % 5 + 1,
+        )
+
+
+def _medir(construir):
+    tracemalloc.start()
+    resultado = construir()
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del resultado
+    return memoria / CANTIDAD
+
+
+class TestInteractionMemory:
+    @pytest.mark.slow
+    def test_columnar_history_uses_less_memory(self):
+        antes = _medir(lambda: list(_interacciones()))
+        despues = _medir(lambda: HistorialInteracciones(_interacciones()))
+
+        print(
+            f"\n{CANTIDAD} interactions: list of dataclasses {antes:,.0f} bytes/interaction, "
+            f"columnar {despues:,.0f} bytes/interaction ({antes / despues:.1f}x)"
+        )
+        assert despues < antes / 3
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark: keyword lookup over 100k imported interactions
+
+The interactions of conocimiento_consolidado.json are replicated up to
+100k records and imported. The inverted index lookup is compared with the
+previous linear scan over all interactions.
+"""
+
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from base_conocimiento_dinamica import BaseConocimientoDinamica
+
+ARCHIVO = Path(__file__).resolve().parent.parent.parent / "conocimiento_consolidado.json"
+TOTAL_INTERACCIONES = 100_000
+CONSULTAS = [
+    "necesito precio de aislamiento térmico",
+    "cuál es el costo de entrega",
+    "quiero la mejor calidad con garantía",
+    "es urgente, necesito presupuesto",
+]
+
+
+def _escaneo_lineal(base, palabras_clave):
+    palabras = [p.split(":", 1)[1] for p in palabras_clave]
+    for interaccion in base.interacciones:
+        if interaccion.resultado == "exitoso" and any(
+            palabra in interaccion.mensaje_cliente.lower() for palabra in palabras
+        ):
+            return interaccion
+    return None
+
+
+class TestKeywordIndexBenchmark:
+    @pytest.mark.slow
+    def test_index_lookup_over_100k_interactions(self):
+        with open(ARCHIVO, encoding="utf-8") as f:
+            originales = json.load(f)["interacciones"]
+        assert originales
+
+        datos = []
+        for i in range(TOTAL_INTERACCIONES):
+            copia = dict(originales[i % len(originales)])
+            copia["id"] = f"bench_{i}"
+            # Solo las últimas son exitosas: el escaneo lineal recorre casi todo
+            copia["resultado"] = "exitoso" if i >= TOTAL_INTERACCIONES - 100 else "pendiente"
+            datos.append(copia)
+
+        base = BaseConocimientoDinamica()
+        inicio = time.perf_counter()
+        base._importar_interacciones(datos)
+        importacion = time.perf_counter() - inicio
+
+        claves = [base._extraer_palabras_clave(c) for c in CONSULTAS]
+        inicio = time.perf_counter()
+        for palabras_clave in claves:
+            _escaneo_lineal(base, palabras_clave)
+        lineal = (time.perf_counter() - inicio) / len(claves)
+
+        inicio = time.perf_counter()
+        for _ in range(100):
+            for palabras_clave in claves:
+                base.buscar_interacciones_similares(palabras_clave, k=5)
+                base.buscar_patrones_similares(palabras_clave, k=5)
+        indice = (time.perf_counter() - inicio) / (100 * len(claves))
+
+        print(
+            f"\nimport {len(base.interacciones):,} interactions: {importacion:.2f}s; "
+            f"linear scan {lineal * 1000:.2f} ms/query, index {indice * 1000:.3f} ms/query"
+        )
+        assert indice < lineal / 10
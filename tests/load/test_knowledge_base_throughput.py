@@ -0,0 +1,51 @@
+"""
+Load benchmark: BaseConocimientoDinamica.registrar_interaccion throughput
+
+Per-message cost must not depend on the number of stored interactions.
+The history is filled with one shared record so that 1M entries stay cheap
+in memory; only the length of the history matters for this benchmark.
+"""
+
+import datetime
+import time
+
+import pytest
+
+from base_conocimiento_dinamica import BaseConocimientoDinamica, InteraccionCliente
+
+MENSAJES_MEDIDOS = 2000
+
+
+def _interaccion(indice):
+    return InteraccionCliente(
+        id=f"bench_{indice}",
+        timestamp=datetime.datetime.now(),
+        cliente_id="cliente_bench",
+        tipo_interaccion="consulta",
+        mensaje_cliente="Necesito precio de aislamiento térmico para el techo",
+        respuesta_agente="Te ayudo con la cotización",
+        contexto={"producto": "isodec"},
+        resultado="exitoso",
+        satisfaccion_cliente=4,
+    )
+
+
+def _medir_throughput(historial):
+    base = BaseConocimientoDinamica()
+    base.interacciones = [_interaccion(0)] * historial
+    base.actualizar_conocimiento()
+
+    inicio = time.perf_counter()
+    for i in range(MENSAJES_MEDIDOS):
+        base.registrar_interaccion(_interaccion(i))
+    return MENSAJES_MEDIDOS / (time.perf_counter() - inicio)
+
+
+class TestKnowledgeBaseThroughput:
+    @pytest.mark.slow
+    def test_throughput_is_flat_with_history_size(self):
+        resultados = {n: _medir_throughput(n) for n in (1_000, 100_000, 1_000_000)}
+        for historial, throughput in resultados.items():
+            print(f"\n{historial:>9} stored interactions: {throughput:,.0f} msgs/s")
+
+        assert resultados[1_000_000] > resultados[1_000] / 3
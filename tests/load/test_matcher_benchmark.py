@@ -0,0 +1,138 @@
+"""
+Load benchmark: messages per second through intent + entity matching
+
+Compares the compiled matcher with the previous approach (keyword dict
+rebuilt per message, substring checks for every keyword, regexes compiled
+on each call) on a mix of realistic messages, and how both scale with the size of the
+keyword vocabulary (e.g. a full product catalogue).
+"""
+
+import re
+import time
+
+import pytest
+
+from ia_conversacional_integrada import PATRONES_INTENCION, IAConversacionalIntegrada
+from keyword_matcher import CompiledMatcher
+from language_processor import EntityExtractor, IntentClassifier, Language
+
+MENSAJES = [
+    "Hola, buenas tardes",
+    "¿Cuánto cuesta isodec 100mm para un techo de 10 x 5 metros?",
+    "necesito información sobre aislamiento de lana de roca 50mm color gris",
+    "me llamo Juan Perez, mi teléfono es 099 123 456",
+    "es muy caro, no estoy seguro, lo voy a pensar",
+    "quiero cotizar 60 m2 de poliestireno con instalación y flete a Maldonado",
+    "gracias, hasta luego",
+    "¿hacen montaje? ¿qué garantía tiene el servicio?",
+]
+REPETICIONES = 2000
+
+
+def _intencion_anterior(mensaje):
+    mensaje_lower = mensaje.lower()
+    patrones = {k: [p.rstrip("*") for p in v] for k, v in PATRONES_INTENCION.items()}
+    puntuaciones = {i: sum(1 for p in palabras if p in mensaje_lower) for i, palabras in patrones.items()}
+    mejor = max(puntuaciones, key=puntuaciones.get)
+    return mejor if puntuaciones[mejor] > 0 else "general"
+
+
+def _entidades_anteriores(ia, mensaje):
+    mensaje_lower = mensaje.lower()
+    entidades = {}
+    for tipo in ("productos", "espesores", "colores"):
+        encontrados = [v for v in ia.entidades_reconocidas[tipo] if v in mensaje_lower]
+        if encontrados:
+            entidades[tipo] = encontrados
+    for patron in (
+        r"(\d+(?:\.\d+)?)\s*[x×]\s*(\d+(?:\.\d+)?)",
+        r"(\d+(?:\.\d+)?)\s*metros?\s*[x×]\s*(\d+(?:\.\d+)?)\s*metros?",
+        r"(\d+(?:\.\d+)?)\s*m\s*[x×]\s*(\d+(?:\.\d+)?)\s*m",
+    ):
+        match = re.search(patron, mensaje, re.IGNORECASE)
+        if match:
+            entidades["dimensiones"] = {"largo": float(match.group(1)), "ancho": float(match.group(2))}
+            break
+    match = re.search(r"(\+?598\s?)?(\d{2,3}\s?\d{3}\s?\d{3})", mensaje)
+    if match:
+        entidades["telefono"] = match.group(0).replace(" ", "")
+    return entidades
+
+
+def _clasificar_anterior(clasificador, texto):
+    texto_lower = texto.lower()
+    puntuaciones = {}
+    for intent, palabras in clasificador.patterns[Language.SPANISH].items():
+        for palabra in palabras:
+            if palabra in texto_lower:
+                puntuaciones[intent] = puntuaciones.get(intent, 0.0) + len(palabra) / 10.0
+    return max(puntuaciones, key=puntuaciones.get) if puntuaciones else None
+
+
+def _mensajes_por_segundo(funcion):
+    inicio = time.perf_counter()
+    for _ in range(REPETICIONES):
+        for mensaje in MENSAJES:
+            funcion(mensaje)
+    return REPETICIONES * len(MENSAJES) / (time.perf_counter() - inicio)
+
+
+class TestMatcherBenchmark:
+    @pytest.mark.slow
+    def test_messages_per_second(self):
+        ia = IAConversacionalIntegrada()
+        ia.use_shared_context = False
+        clasificador = IntentClassifier()
+        extractor = EntityExtractor()
+
+        def ia_compilado(mensaje):
+            ia._analizar_intencion(mensaje)
+            ia._extraer_entidades(mensaje)
+
+        def ia_anterior(mensaje):
+            _intencion_anterior(mensaje)
+            _entidades_anteriores(ia, mensaje)
+
+        def lp_compilado(mensaje):
+            intent, _ = clasificador.classify(mensaje, Language.SPANISH)
+            extractor.extract(mensaje, intent)
+
+        def lp_anterior(mensaje):
+            _clasificar_anterior(clasificador, mensaje)
+
+        resultados = {
+            "IA compiled (intent + entities)": _mensajes_por_segundo(ia_compilado),
+            "IA previous (intent + entities)": _mensajes_por_segundo(ia_anterior),
+            "LanguageProcessor compiled (intent + entities)": _mensajes_por_segundo(lp_compilado),
+            "LanguageProcessor previous (intent only)": _mensajes_por_segundo(lp_anterior),
+        }
+        print()
+        for nombre, valor in resultados.items():
+            print(f"{nombre:<48} {valor:>10,.0f} msg/s")
+
+        assert resultados["IA compiled (intent + entities)"] > 1000
+
+    @pytest.mark.slow
+    def test_vocabulary_scaling(self):
+        print()
+        for tamano in (100, 1000, 5000):
+            vocabulario = [f"producto{i} modelo{i % 97}" for i in range(tamano)]
+            matcher = CompiledMatcher().add_keywords("catalogo", vocabulario)
+            mensajes = [m + f" producto{tamano // 2} modelo{(tamano // 2) % 97}" for m in MENSAJES]
+
+            inicio = time.perf_counter()
+            for _ in range(200):
+                for mensaje in mensajes:
+                    matcher._last = (None, None)
+                    matcher.match(mensaje)
+            compilado = 200 * len(mensajes) / (time.perf_counter() - inicio)
+
+            inicio = time.perf_counter()
+            for _ in range(200):
+                for mensaje in mensajes:
+                    texto = mensaje.lower()
+                    [p for p in vocabulario if p in texto]
+            anterior = 200 * len(mensajes) / (time.perf_counter() - inicio)
+
+            print(f"{tamano:>5} keywords: compiled {compilado:>10,.0f} msg/s   substring {anterior:>10,.0f} msg/s")
+            assert matcher.match(mensajes[0]).scores["catalogo"] == 1.0
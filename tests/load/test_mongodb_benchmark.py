@@ -0,0 +1,87 @@
+"""
+Load benchmark: MongoDB operations per second, pooled manager vs previous pattern
+
+The previous pattern pinged the server (server_info) and built a new
+MongoDBService wrapper on every ensure_mongodb_connected() /
+get_mongodb_service() call. The pooled manager answers both from cached
+heartbeat state. Runs against mongomock; every server round trip (ping or
+query) optionally sleeps RTT seconds to model a network hop to mongod.
+"""
+
+import time
+
+import mongomock
+import pytest
+
+from mongodb_service import MongoClientManager, MongoDBService
+
+URI = "mongodb://localhost:27017/bmc_bench"
+OPERACIONES = 2000
+
+
+class _ClienteConLatencia(mongomock.MongoClient):
+    rtt = 0.0
+
+    def __init__(self, uri, **opciones):
+        super().__init__(uri)
+
+    def server_info(self):
+        time.sleep(self.rtt)
+        return super().server_info()
+
+    @property
+    def admin(self):
+        cliente = self
+
+        class _Admin:
+            def command(self, nombre, *args, **kwargs):
+                time.sleep(cliente.rtt)
+                return {"ok": 1.0}
+
+        return _Admin()
+
+
+def _find_one(coleccion, i, rtt):
+    time.sleep(rtt)
+    return coleccion.find_one({"session_id": f"s{i % 100}"})
+
+
+def _ops_por_segundo(operacion):
+    inicio = time.perf_counter()
+    for i in range(OPERACIONES):
+        operacion(i)
+    return OPERACIONES / (time.perf_counter() - inicio)
+
+
+class TestMongoDBBenchmark:
+    @pytest.mark.slow
+    @pytest.mark.parametrize("rtt", [0.0, 0.0005])
+    def test_ops_per_second(self, monkeypatch, rtt):
+        monkeypatch.setattr(_ClienteConLatencia, "rtt", rtt)
+        manager = MongoClientManager(URI, heartbeat_interval=3600, client_factory=_ClienteConLatencia)
+        manager.connect()
+        manager.get_collection("context").insert_many(
+            [{"session_id": f"s{i}", "intent": "cotizacion"} for i in range(100)]
+        )
+        cliente_anterior = _ClienteConLatencia(URI)
+        cliente_anterior.bmc_bench.context.insert_many(
+            [{"session_id": f"s{i}", "intent": "cotizacion"} for i in range(100)]
+        )
+
+        def anterior(i):
+            cliente_anterior.server_info()  # ensure_mongodb_connected()
+            servicio = MongoDBService(cliente_anterior.bmc_bench)  # get_mongodb_service()
+            assert _find_one(servicio.get_collection("context"), i, rtt)
+
+        def pool(i):
+            assert manager.is_healthy()
+            assert _find_one(manager.get_collection("context"), i, rtt)
+
+        resultados = {"previous": _ops_por_segundo(anterior), "pooled": _ops_por_segundo(pool)}
+        manager.close()
+
+        print()
+        for nombre, valor in resultados.items():
+            print(f"rtt={rtt * 1000:.1f}ms {nombre:<10} {valor:>10,.0f} ops/s")
+        assert manager.stats["pings"] == 1
+        assert resultados["pooled"] > resultados["previous"]
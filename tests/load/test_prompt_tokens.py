@@ -0,0 +1,83 @@
+"""
+Load benchmark: prompt tokens and assembly time per message
+
+Compares the budgeted prompt with the untrimmed one (every section and the
+last five messages in full, as before) while the conversation context grows.
+"""
+
+import datetime
+import time
+
+import pytest
+
+from ia_conversacional_integrada import ContextoConversacion, IAConversacionalIntegrada
+from presupuesto_prompt import PresupuestoTokens
+
+REPETICIONES = 500
+
+
+def _contexto(escala):
+    respuesta = "Te detallo la cotización: paneles, fijaciones, flete y colocación. " * escala
+    return ContextoConversacion(
+        cliente_id="099",
+        sesion_id="s1",
+        mensajes_intercambiados=[
+            {"tipo": "cliente" if i % 2 == 0 else "ia",
+             "mensaje": "quiero isodec 100mm para 60m2" if i % 2 == 0 else respuesta}
+            for i in range(20)
+        ],
+        intencion_actual="cotizacion",
+        entidades_extraidas={},
+        estado_cotizacion="recopilando_datos",
+        datos_cliente={"nombre": "Cliente", "telefono": "099"},
+        datos_producto={"producto": "isodec", "espesor": "100mm"},
+        historial_interacciones=[],
+        confianza_respuesta=0.8,
+        timestamp_inicio=datetime.datetime.now(),
+        timestamp_ultima_actividad=datetime.datetime.now(),
+        resumen_historial="user: consulta anterior\n" * (5 * escala),
+    )
+
+
+def _tokens_sin_presupuesto(ia, contexto, mensaje):
+    contenidos = [
+        ia._obtener_prompt_sistema(),
+        ia._obtener_estado_cotizacion_para_prompt(contexto),
+        "Resumen de la conversación anterior:\n" + contexto.resumen_historial,
+        *(m["mensaje"] for m in contexto.mensajes_intercambiados[-5:]),
+        mensaje,
+    ]
+    return PresupuestoTokens(0).contar([{"content": c} for c in contenidos if c])
+
+
+class TestPromptTokens:
+    @pytest.mark.slow
+    def test_prompt_tokens_are_bounded(self):
+        ia = IAConversacionalIntegrada()
+        ia.use_shared_context = False
+        mensaje = "cuanto sale con flete incluido?"
+
+        for escala in (1, 10, 100):
+            contexto = _contexto(escala)
+            ia.conversaciones_activas["099_s1"] = contexto
+            mensajes = ia._preparar_mensajes_openai(mensaje, "099", "s1")[1]
+            con_presupuesto = ia.presupuesto_prompt.contar(mensajes)
+            sin_presupuesto = _tokens_sin_presupuesto(ia, contexto, mensaje)
+            print(f"\ncontext x{escala:<3}: {sin_presupuesto:>6} tokens untrimmed, "
+                  f"{con_presupuesto:>5} budgeted")
+            assert con_presupuesto <= min(ia.prompt_max_tokens, sin_presupuesto)
+
+        assert con_presupuesto < sin_presupuesto / 5
+
+        ia.conversaciones_activas["099_s1"] = _contexto(1)
+        inicio = time.perf_counter()
+        for _ in range(REPETICIONES):
+            ia._prompts_compilados = {}
+            ia._preparar_mensajes_openai(mensaje, "099", "s1")
+        reconstruyendo = (time.perf_counter() - inicio) / REPETICIONES
+
+        inicio = time.perf_counter()
+        for _ in range(REPETICIONES):
+            ia._preparar_mensajes_openai(mensaje, "099", "s1")
+        compilado = (time.perf_counter() - inicio) / REPETICIONES
+        print(f"assembly: {reconstruyendo * 1e6:.0f} µs rebuilding, {compilado * 1e6:.0f} µs compiled")
@@ -0,0 +1,116 @@
+"""
+Load benchmark: scanning and duplicate detection on a synthetic 100k-file tree
+
+Compares the previous StorageAnalyzer walk (rglob, several stat() calls and
+datetime.now() per file) with the single os.scandir pass, and the previous
+find_duplicates (read and hash every file whole) with size -> partial hash
+-> full hash on the worker pool, cold and with a warm signature cache.
+"""
+
+import hashlib
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "backup_system"))
+sys.path.append(str(Path(__file__).parent.parent.parent))
+from file_scanner import FileScanner
+from storage_cleanup_assistant import StorageAnalyzer
+
+ARCHIVOS = 100_000
+GRANDES = 200
+COPIAS = 1000
+HACE_UNA_HORA = time.time() - 3600
+
+
+def _crear_arbol(raiz):
+    rnd = random.Random(11)
+    rutas = []
+    for i in range(ARCHIVOS):
+        ruta = raiz / f"d{i // 500:03d}" / f"archivo_{i:06d}.txt"
+        if i % 500 == 0:
+            ruta.parent.mkdir(parents=True)
+        rutas.append(ruta)
+    for ruta in rutas[:-GRANDES - COPIAS]:
+        ruta.write_bytes(rnd.randbytes(rnd.randint(100, 4000)))
+    # Large files of distinct sizes, except every tenth pair: same size and
+    # first block, different tail
+    for n, ruta in enumerate(rutas[-GRANDES - COPIAS:-COPIAS]):
+        if n % 20 < 2:
+            semilla = random.Random(n // 2).randbytes(2 * 2**20)
+            ruta.write_bytes(semilla[:-1] + bytes([n % 2]))
+        else:
+            ruta.write_bytes(rnd.randbytes(2**20 + n * 8192))
+    for ruta in rutas[-COPIAS:]:
+        ruta.write_bytes(rutas[rnd.randrange(ARCHIVOS - GRANDES - COPIAS)].read_bytes())
+    for ruta in rutas:
+        os.utime(ruta, (HACE_UNA_HORA, HACE_UNA_HORA))
+    return [str(ruta.relative_to(raiz)) for ruta in rutas]
+
+
+def _analisis_anterior(raiz):
+    resultados = {'total_size': 0, 'file_count': 0, 'old_files': [], 'file_types': defaultdict(int)}
+    for item in raiz.rglob('*'):
+        if item.is_file():
+            resultados['file_count'] += 1
+            size = item.stat().st_size
+            resultados['total_size'] += size
+            resultados['file_types'][item.suffix.lower()] += 1
+            mtime = datetime.fromtimestamp(item.stat().st_mtime)
+            if mtime < datetime.now() - timedelta(days=90):
+                resultados['old_files'].append(str(item.relative_to(raiz)))
+    return resultados
+
+
+def _duplicados_anteriores(raiz, rutas):
+    mapa = defaultdict(list)
+    for ruta in rutas:
+        with open(raiz / ruta, 'rb') as f:
+            mapa[hashlib.sha256(f.read()).hexdigest()].append(ruta)
+    return sorted(sorted(grupo) for grupo in mapa.values() if len(grupo) > 1)
+
+
+def _medir(funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    return time.perf_counter() - inicio, resultado
+
+
+class TestScanEngineBenchmark:
+    @pytest.mark.slow
+    def test_100k_file_tree(self, tmp_path):
+        raiz = tmp_path / "arbol"
+        rutas = _crear_arbol(raiz)
+        total_mb = sum(os.path.getsize(raiz / r) for r in rutas) / 2**20
+
+        s_walk_anterior, anterior = _medir(_analisis_anterior, raiz)
+        s_walk, resultados = _medir(StorageAnalyzer(str(raiz)).analyze_storage)
+        assert resultados['file_count'] == anterior['file_count'] == ARCHIVOS
+        assert resultados['total_size'] == anterior['total_size']
+
+        s_dup_anterior, esperados = _medir(_duplicados_anteriores, raiz, rutas)
+        config = {"scanner": {"cache_file": str(tmp_path / "hashes.json")}}
+        scanner = FileScanner(str(raiz), config)
+        s_dup, grupos = _medir(scanner.find_duplicates, rutas)
+        leidos_mb = scanner.engine.bytes_hashed / 2**20
+        assert sorted(g.files for g in grupos) == esperados
+
+        s_dup_cache, grupos = _medir(FileScanner(str(raiz), config).find_duplicates, rutas)
+        assert sorted(g.files for g in grupos) == esperados
+
+        print()
+        print(f"{ARCHIVOS} files, {total_mb:.0f} MB, {scanner.engine.workers} hashing workers")
+        print(f"walk: previous {s_walk_anterior:.2f} s ({ARCHIVOS / s_walk_anterior:,.0f} files/s), "
+              f"scandir {s_walk:.2f} s ({ARCHIVOS / s_walk:,.0f} files/s)")
+        print(f"duplicates: previous {s_dup_anterior:.2f} s ({total_mb:.0f} MB read), "
+              f"staged {s_dup:.2f} s ({leidos_mb:.0f} MB read), cached {s_dup_cache:.2f} s (nothing read)")
+        print(f"{len(esperados)} duplicate groups")
+        assert s_walk < s_walk_anterior
+        assert leidos_mb < total_mb / 2
+        assert s_dup_cache < s_dup_anterior
@@ -0,0 +1,63 @@
+"""
+Startup benchmark: import time and BaseConocimientoDinamica construction
+
+Each scenario runs in a fresh interpreter so that nothing is shared with the
+test process:
+- cold: no snapshot on disk, the knowledge JSON is parsed and compiled
+- snapshot: the on-disk snapshot is loaded instead of the JSON
+- shared: second construction in the same process (in-memory snapshot)
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parents[2]
+SCRIPT = """
+import contextlib, io, json, time
+inicio = time.perf_counter()
+import base_conocimiento_dinamica as modulo
+importacion = time.perf_counter() - inicio
+with contextlib.redirect_stdout(io.StringIO()):
+    inicio = time.perf_counter()
+    modulo.BaseConocimientoDinamica()
+    primera = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    modulo.BaseConocimientoDinamica()
+    segunda = time.perf_counter() - inicio
+print(json.dumps({"importacion": importacion, "primera": primera, "segunda": segunda}))
+"""
+
+
+def _medir():
+    salida = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        cwd=RAIZ,
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+class TestStartupBenchmark:
+    @pytest.mark.slow
+    def test_snapshot_speeds_up_startup(self):
+        shutil.rmtree(RAIZ / ".knowledge_cache", ignore_errors=True)
+        cold = _medir()
+        snapshot = _medir()
+
+        print(
+            f"\nimport: {cold['importacion'] * 1000:.1f} ms"
+            f"\ncold start (JSON -> snapshot): {cold['primera'] * 1000:.1f} ms"
+            f"\nstart from disk snapshot: {snapshot['primera'] * 1000:.1f} ms"
+            f"\nshared in-process construction: {snapshot['segunda'] * 1000:.1f} ms"
+        )
+        assert snapshot["primera"] < cold["primera"]
+        assert snapshot["segunda"] < cold["primera"]
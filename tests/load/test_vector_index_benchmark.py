@@ -0,0 +1,59 @@
+"""
+Load benchmark: local vector index recall and latency
+
+Clustered synthetic embeddings (like conversations grouped by topic);
+IVF at several nprobe values against exact flat search.
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from AI_AGENTS.EXECUTOR.vector_index import IndiceVectorial
+
+N_VECTORES = 50_000
+DIMENSION = 256
+N_CONSULTAS = 100
+K = 10
+
+
+def _datos(generador):
+    centros = generador.normal(size=(200, DIMENSION))
+    asignacion = generador.integers(0, len(centros), N_VECTORES)
+    vectores = centros[asignacion] + 1.5 * generador.normal(size=(N_VECTORES, DIMENSION))
+    consultas = centros[generador.integers(0, len(centros), N_CONSULTAS)]
+    consultas = consultas + 1.5 * generador.normal(size=consultas.shape)
+    return vectores.astype(np.float32), consultas.astype(np.float32)
+
+
+def _medir(indice, consultas, nprobe=None):
+    inicio = time.perf_counter()
+    resultados = [{r[0] for r in indice.buscar(c, k=K, nprobe=nprobe)} for c in consultas]
+    return resultados, (time.perf_counter() - inicio) / len(consultas)
+
+
+class TestVectorIndexBenchmark:
+    @pytest.mark.slow
+    def test_ivf_recall_and_latency(self, tmp_path):
+        vectores, consultas = _datos(np.random.default_rng(0))
+        indice = IndiceVectorial(DIMENSION)
+        indice.agregar([str(i) for i in range(N_VECTORES)], vectores)
+
+        inicio = time.perf_counter()
+        indice.entrenar_ivf(128)
+        entrenamiento = time.perf_counter() - inicio
+        indice.guardar(tmp_path)
+        indice = IndiceVectorial.cargar(tmp_path)
+
+        exactos, latencia_exacta = _medir(indice, consultas)
+        print(f"\n{N_VECTORES} x {DIMENSION}d, IVF training {entrenamiento:.2f}s")
+        print(f"exact: {latencia_exacta * 1e3:.2f} ms/query")
+
+        for nprobe in (1, 4, 8, 16):
+            aproximados, latencia = _medir(indice, consultas, nprobe)
+            recall = np.mean([len(a & e) / K for a, e in zip(aproximados, exactos)])
+            print(f"nprobe={nprobe:<3}: recall@{K} {recall:.3f}, {latencia * 1e3:.2f} ms/query")
+            if nprobe == 16:
+                assert recall >= 0.9
+                assert latencia < latencia_exacta
@@ -0,0 +1,29 @@
+"""
+Shared fixtures for the unit tests
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parents[2]
+
+
+@pytest.fixture(scope="session")
+def app_integrada():
+    """
+    FastAPI app of the root sistema_completo_integrado.py
+
+    Some test modules put python-scripts/ first on sys.path, and it holds an
+    older module with the same name, so the root one is loaded by path.
+    """
+    ruta = RAIZ / "sistema_completo_integrado.py"
+    modulo = sys.modules.get("sistema_completo_integrado")
+    if modulo is None or Path(modulo.__file__).resolve() != ruta:
+        spec = importlib.util.spec_from_file_location("sistema_completo_integrado", ruta)
+        modulo = importlib.util.module_from_spec(spec)
+        sys.modules["sistema_completo_integrado"] = modulo
+        spec.loader.exec_module(modulo)
+    return modulo.app
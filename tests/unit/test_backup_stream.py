@@ -0,0 +1,159 @@
+"""
+Unit tests for the streaming chunked backup format and its use by
+BackupService / RecoveryService
+"""
+
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "backup_system"))
+import backup_service as modulo_backup
+import recovery_service as modulo_recovery
+from backup_stream import BackupIntegrityError, ChunkedBackupReader, ChunkedBackupWriter
+from backup_service import BackupService
+from recovery_service import RecoveryService, RestoreOptions
+from storage_manager import StorageManager
+
+
+class _MongoFalso:
+    def __init__(self):
+        self.db = mongomock.MongoClient().db
+
+    def get_collection(self, nombre):
+        return self.db[nombre]
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    falso = _MongoFalso()
+    for modulo in (modulo_backup, modulo_recovery):
+        monkeypatch.setattr(modulo, "ensure_mongodb_connected", lambda: True)
+        monkeypatch.setattr(modulo, "get_mongodb_service", lambda: falso)
+    return falso
+
+
+@pytest.fixture
+def servicios(tmp_path, mongo):
+    config = {
+        "backup": {"metadata_dir": str(tmp_path / "metadata")},
+        "storage": {"primary": "local", "local": {"path": str(tmp_path / "backups")},
+                    "chunking": {"records": 100}},
+        "mongodb": {"batch_size": 50, "collections": ["conversations", "quotes"]},
+        "filesystem": {"patterns": [], "directories": []},
+    }
+    ruta_config = tmp_path / "backup_config.json"
+    ruta_config.write_text(json.dumps(config))
+    storage = StorageManager(config["storage"])
+    backup = BackupService(storage, str(ruta_config))
+    recovery = RecoveryService(storage, config)
+    recovery.base_dir = str(tmp_path / "restaurado")
+    return backup, recovery, storage
+
+
+class TestBackupStream:
+    def test_round_trip_in_chunks(self, tmp_path):
+        documentos = [{"_id": ObjectId(), "n": i, "fecha": datetime(2024, 1, 1, 12, i % 60)} for i in range(250)]
+        with ChunkedBackupWriter(str(tmp_path / "b1"), chunk_records=100) as writer:
+            stream = writer.write_stream("mongodb.conversations", iter(documentos), kind="collection")
+
+        assert [c["count"] for c in stream["chunks"]] == [100, 100, 50]
+        lector = ChunkedBackupReader(str(tmp_path / "b1"))
+        assert lector.verify() == []
+        assert list(lector.iter_records("mongodb.conversations")) == documentos
+
+    def test_corrupted_chunk_is_detected(self, tmp_path):
+        with ChunkedBackupWriter(str(tmp_path / "b1"), chunk_records=10) as writer:
+            writer.write_stream("filesystem", ({"path": f"f{i}", "content": "x" * i} for i in range(30)))
+        chunk = tmp_path / "b1" / "filesystem.00001.ndjson.gz"
+        datos = bytearray(chunk.read_bytes())
+        datos[-5] ^= 0xFF
+        chunk.write_bytes(bytes(datos))
+
+        lector = ChunkedBackupReader(str(tmp_path / "b1"))
+        assert len(lector.verify()) == 1
+        lotes = lector.iter_batches("filesystem")
+        assert len(next(lotes)) == 10
+        with pytest.raises(BackupIntegrityError):
+            next(lotes)
+
+    def test_failed_backup_has_no_manifest(self, tmp_path):
+        def registros():
+            yield {"a": 1}
+            raise RuntimeError("cursor perdido")
+
+        with pytest.raises(RuntimeError):
+            with ChunkedBackupWriter(str(tmp_path / "b1")) as writer:
+                writer.write_stream("mongodb.x", registros())
+        assert not (tmp_path / "b1" / "manifest.json").exists()
+
+    def test_backup_verify_and_restore(self, servicios, mongo, monkeypatch):
+        backup, recovery, storage = servicios
+        mongo.db.conversations.insert_many([{"sesion": f"s{i}", "n": i} for i in range(230)])
+        mongo.db.quotes.insert_one({"cliente": "Ana", "total": 10.5})
+        monkeypatch.setattr(backup, "_iter_files", lambda scope: iter([("docs/a.md", "hola"), ("b.json", "{}")]))
+
+        resultado = backup.create_backup(scope=["mongodb", "filesystem"])
+        assert resultado.success, resultado.error
+        assert resultado.collections == {"conversations": 230, "quotes": 1}
+        assert resultado.files["count"] == 2
+        metadata = backup.get_backup_metadata(resultado.backup_id)
+        assert "documents" not in json.dumps(metadata) and "content" not in json.dumps(metadata)
+        assert backup.verify_backup(resultado.backup_id).verified
+        assert resultado.backup_id in storage.list_backups()
+
+        vista = recovery.preview_restore(resultado.backup_id, RestoreOptions())
+        assert sorted(vista.collections_to_restore) == ["conversations", "quotes"]
+        assert vista.files_to_restore == ["docs/a.md", "b.json"]
+
+        mongo.db.conversations.delete_many({})
+        restauracion = recovery.restore_from_backup(
+            resultado.backup_id,
+            RestoreOptions(scope=["mongodb", "filesystem"], conflict_resolution="overwrite"),
+        )
+        assert restauracion.errors == []
+        assert restauracion.restored == 230 + 1 + 2
+        assert mongo.db.conversations.count_documents({}) == 230
+        assert (Path(recovery.base_dir) / "docs" / "a.md").read_text() == "hola"
+
+        assert storage.delete_backup(resultado.backup_id)
+        assert resultado.backup_id not in storage.list_backups()
+
+    def test_overwrite_keeps_live_collection_on_corrupted_chunk(self, servicios, mongo):
+        backup, recovery, storage = servicios
+        mongo.db.conversations.insert_many([{"sesion": f"s{i}", "n": i} for i in range(230)])
+        mongo.db.conversations.create_index("sesion", name="sesion_1")
+        storage.dedup["enabled"] = False
+        resultado = backup.create_backup(scope=["mongodb"])
+        assert resultado.success, resultado.error
+
+        lector = storage.open_backup_reader(resultado.backup_id)
+        chunk = Path(lector.directory) / lector.stream_info("mongodb.conversations")["chunks"][2]["file"]
+        datos = bytearray(chunk.read_bytes())
+        datos[-5] ^= 0xFF
+        chunk.write_bytes(bytes(datos))
+
+        mongo.db.conversations.delete_many({})
+        mongo.db.conversations.insert_many([{"vivo": i} for i in range(10)])
+        restauracion = recovery.restore_from_backup(
+            resultado.backup_id, RestoreOptions(scope=["mongodb"], conflict_resolution="overwrite")
+        )
+        assert restauracion.failed == 1 and restauracion.restored == 0
+        assert "Checksum mismatch" in restauracion.errors[0]
+        assert mongo.db.conversations.count_documents({"vivo": {"$exists": True}}) == 10
+        assert mongo.db.list_collection_names() == ["conversations"]
+
+        # An intact backup replaces the collection and keeps its indexes
+        datos[-5] ^= 0xFF
+        chunk.write_bytes(bytes(datos))
+        restauracion = recovery.restore_from_backup(
+            resultado.backup_id, RestoreOptions(scope=["mongodb"], conflict_resolution="overwrite")
+        )
+        assert restauracion.errors == [] and restauracion.restored == 230
+        assert mongo.db.conversations.count_documents({}) == 230
+        assert "sesion_1" in mongo.db.conversations.index_information()
@@ -0,0 +1,119 @@
+"""
+Unit tests for vectorized batch quote pricing
+"""
+
+import asyncio
+import random
+from decimal import Decimal
+
+import httpx
+import pytest
+
+import sistema_cotizaciones
+from repositorio_cotizaciones import RepositorioCotizacionesSQLite
+from sistema_cotizaciones import EspecificacionCotizacion, SistemaCotizacionesBMC
+
+TERMINACIONES = ["", "Gotero", "Hormigón"]
+SERVICIOS = ["", "incluido", "no incluido", "Incluido"]
+
+
+def _especificaciones(cantidad, semilla=7):
+    azar = random.Random(semilla)
+    return [
+        EspecificacionCotizacion(
+            producto=azar.choice(["isodec", "poliestireno", "lana_roca"]),
+            espesor=azar.choice(["50mm", "75mm", "100mm", "125mm", "150mm", "200mm"]),
+            relleno="EPS",
+            largo_metros=Decimal(azar.randint(1, 5000)) / Decimal(100),
+            ancho_metros=Decimal(azar.randint(1, 3000)) / Decimal(azar.choice([10, 100, 1000])),
+            color=azar.choice(["Blanco", "Gris", "Personalizado", "Negro"]),
+            termina_front=azar.choice(TERMINACIONES),
+            termina_sup=azar.choice(TERMINACIONES),
+            termina_lat_1=azar.choice(TERMINACIONES),
+            termina_lat_2=azar.choice(TERMINACIONES),
+            anclajes=azar.choice(SERVICIOS),
+            traslado=azar.choice(SERVICIOS),
+        )
+        for _ in range(cantidad)
+    ]
+
+
+@pytest.fixture
+def sistema():
+    sistema = SistemaCotizacionesBMC(repositorio=RepositorioCotizacionesSQLite(":memory:"))
+    sistema.actualizar_precio_producto("isodec", Decimal("150.00"))
+    sistema.actualizar_precio_producto("poliestireno", Decimal("120.00"))
+    sistema.actualizar_precio_producto("lana_roca", Decimal("140.37"))
+    return sistema
+
+
+class TestBatchPricing:
+    def test_matches_scalar_path_to_the_cent(self, sistema):
+        especificaciones = _especificaciones(20_000)
+
+        esperado = [sistema.calcular_precio_cotizacion(e) for e in especificaciones]
+        assert sistema.calcular_precios_lote(especificaciones) == esperado
+
+    def test_exact_half_cents_round_half_up(self, sistema):
+        sistema.actualizar_precio_producto("isodec", Decimal("0.01"))
+        especificacion = EspecificacionCotizacion(
+            producto="isodec", espesor="100mm", relleno="EPS",
+            largo_metros=Decimal("0.5"), ancho_metros=Decimal("1"), color="Blanco",
+        )
+
+        assert sistema.calcular_precios_lote([especificacion])[0][0] == Decimal("0.01")
+
+    def test_price_change_invalidates_factor_table(self, sistema):
+        especificaciones = _especificaciones(100)
+        sistema.calcular_precios_lote(especificaciones)
+
+        sistema.actualizar_precio_producto("isodec", Decimal("199.99"))
+        esperado = [sistema.calcular_precio_cotizacion(e) for e in especificaciones]
+        assert sistema.calcular_precios_lote(especificaciones) == esperado
+
+    def test_without_numpy(self, sistema, monkeypatch):
+        monkeypatch.setattr(sistema_cotizaciones, "NUMPY_AVAILABLE", False)
+        especificaciones = _especificaciones(500)
+
+        esperado = [sistema.calcular_precio_cotizacion(e) for e in especificaciones]
+        assert sistema.calcular_precios_lote(especificaciones) == esperado
+
+    def test_unknown_product_raises(self, sistema):
+        especificacion = _especificaciones(1)[0]
+        especificacion.producto = "inexistente"
+
+        with pytest.raises(ValueError):
+            sistema.calcular_precios_lote([especificacion])
+        assert sistema.calcular_precios_lote([]) == []
+
+
+class TestBatchPriceEndpoint:
+    def test_batch_price(self, sistema, app_integrada):
+        app = app_integrada
+        app.state.cotizaciones = sistema
+        items = [
+            {"product": "isodec", "thickness": "100mm", "length": 10, "width": 5},
+            {"product": "lana_roca", "thickness": "50mm", "length": 3.5, "width": 2.25,
+             "color": "Gris", "finish_front": "Gotero", "transport": "no incluido"},
+        ]
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                ok = await client.post("/api/quotes/batch-price", json={"items": items})
+                error = await client.post(
+                    "/api/quotes/batch-price",
+                    json={"items": [{**items[0], "product": "inexistente"}]},
+                )
+                return ok, error
+
+        try:
+            ok, error = asyncio.run(run())
+        finally:
+            app.state.cotizaciones = None
+
+        assert ok.status_code == 200
+        datos = ok.json()
+        assert datos["count"] == 2
+        assert datos["results"][0] == {"total": 7500.0, "price_per_m2": 150.0, "area": 50.0}
+        assert error.status_code == 400
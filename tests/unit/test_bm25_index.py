@@ -0,0 +1,137 @@
+"""
+Unit tests for the BM25 index and its use in KnowledgeManager
+"""
+
+import json
+import os
+
+import pytest
+
+from AI_AGENTS.EXECUTOR.bm25_index import IndiceBM25, fusionar_rrf, raiz, tokenizar
+from AI_AGENTS.EXECUTOR.knowledge_manager import KnowledgeManager
+
+
+@pytest.fixture
+def indice():
+    indice = IndiceBM25()
+    indice.agregar("p1", "Panel Isodec para techos, aislación térmica", {"fuente": "producto"})
+    indice.agregar("p2", "Isopanel para paredes y fachadas", {"fuente": "producto"})
+    indice.agregar("d1", "Guía de instalación del panel en techo liviano. Techo, techo.", {"fuente": "documento"})
+    indice.agregar("c1", "cuánto sale el flete a Maldonado", {"fuente": "conversacion"})
+    return indice
+
+
+class TestBM25Index:
+    def test_spanish_tokenization(self):
+        assert tokenizar("Los PANELES para el Techo") == tokenizar("panel techos")
+        assert tokenizar("aislación") == tokenizar("aislacion")
+        assert raiz("instalaciones") == raiz("instalacion")
+        assert tokenizar("de la y el") == []
+        assert tokenizar("isodec 100mm") == ["isodec", "100mm"]
+
+    def test_ranking_and_filters(self, indice):
+        resultado = indice.buscar("techo", k=3)
+        assert [r[0] for r in resultado] == ["d1", "p1"]
+        assert resultado[0][1] > resultado[1][1] > 0
+
+        assert [r[0] for r in indice.buscar("techo", filtro={"fuente": "producto"})] == ["p1"]
+        assert [r[0] for r in indice.buscar("panel", filtro=lambda m: m["fuente"] != "documento")] == ["p1"]
+        assert indice.buscar("inexistente") == []
+
+    def test_replace_delete_and_persist(self, indice, tmp_path):
+        indice.agregar("p1", "Isoroof para cubiertas", {"fuente": "producto"}, firma=(1, 2))
+        assert "p1" not in {r[0] for r in indice.buscar("techo")}
+        assert indice.eliminar("d1") and not indice.eliminar("d1")
+        assert indice.buscar("techo") == []
+
+        ruta = tmp_path / "bm25.pkl"
+        indice.guardar(ruta)
+        cargado = IndiceBM25.cargar(ruta)
+        assert len(cargado) == 3 and cargado.firma("p1") == (1, 2)
+        assert cargado.buscar("cubierta") == indice.buscar("cubierta")
+        cargado.eliminar("p1")
+        assert cargado.buscar("cubierta") == []
+        assert IndiceBM25.cargar(tmp_path / "no_existe.pkl") is None
+
+    def test_reciprocal_rank_fusion(self):
+        fusion = fusionar_rrf([["a", "b", "c"], ["c", "a"]])
+        assert [clave for clave, _ in fusion] == ["a", "c", "b"]
+
+    def test_knowledge_manager_updates_documents_by_mtime(self, tmp_path, monkeypatch):
+        (tmp_path / "conocimiento_consolidado.json").write_text(json.dumps({
+            "conocimiento_productos": [{"nombre": "Isodec", "descripcion": "panel para techos"}],
+        }), encoding="utf-8")
+        guia = tmp_path / "docs" / "guia.md"
+        guia.parent.mkdir()
+        guia.write_text("# Instalación\nColocar los paneles sobre correas.", encoding="utf-8")
+        (tmp_path / "node_modules").mkdir()
+        (tmp_path / "node_modules" / "x.md").write_text("correas", encoding="utf-8")
+
+        km = KnowledgeManager(project_root=tmp_path, vector_backend="none")
+        resultados = km.buscar_informacion_relevante("correas del panel")
+        assert [d["archivo"] for d in resultados["documentacion"]] == ["docs/guia.md"]
+        assert resultados["documentacion"][0]["titulo"] == "Instalación"
+        assert [p["nombre"] for p in km.buscar_informacion_relevante("techos")["productos"]] == ["Isodec"]
+        assert len(km.cargar_documentacion_proyecto()) == 1
+
+        # A new manager reuses the saved index and only re-reads changed files
+        km = KnowledgeManager(project_root=tmp_path, vector_backend="none")
+        assert km.actualizar_indice_bm25() == 0
+
+        guia.write_text("# Instalación\nFijar con tornillos autoperforantes.", encoding="utf-8")
+        os.utime(guia, ns=(guia.stat().st_atime_ns, guia.stat().st_mtime_ns + 10**9))
+        (tmp_path / "docs" / "nueva.txt").write_text("tornillos", encoding="utf-8")
+        assert km.actualizar_indice_bm25() == 2
+        assert {d["archivo"] for d in km.buscar_informacion_relevante("tornillos")["documentacion"]} == {
+            "docs/guia.md", "docs/nueva.txt"
+        }
+
+        guia.unlink()
+        assert km.actualizar_indice_bm25() == 1
+        assert len(km.cargar_documentacion_proyecto()) == 1
+
+    def test_resync_after_ttl_and_conversation_cap(self, tmp_path, monkeypatch):
+        (tmp_path / "docs").mkdir()
+        km = KnowledgeManager(project_root=tmp_path, vector_backend="none")
+        km.bm25_max_conversaciones = 3
+        consultas = []
+
+        def conversaciones(limit=100):
+            consultas.append(limit)
+            # Newest first, like the MongoDB query
+            return [
+                {"id": str(i), "mensaje_cliente": f"flete {i}", "respuesta_bot": "gratis"}
+                for i in reversed(range(len(consultas) * 2))
+            ]
+
+        monkeypatch.setattr(km, "cargar_conversaciones_historicas", conversaciones)
+        indice = km.obtener_indice_bm25()
+        assert sorted(i for i in indice.ids() if i.startswith("conversacion:")) == [
+            "conversacion:0", "conversacion:1"
+        ]
+
+        (tmp_path / "docs" / "nueva.md").write_text("tornillos", encoding="utf-8")
+        km.obtener_indice_bm25()
+        assert len(consultas) == 1 and "documento:docs/nueva.md" not in indice
+
+        km._bm25_sincronizado_en -= km.bm25_ttl
+        km.obtener_indice_bm25()
+        assert len(consultas) == 2 and "documento:docs/nueva.md" in indice
+        # Only the newest conversations are kept
+        assert [i for i in indice.ids() if i.startswith("conversacion:")] == [
+            "conversacion:1", "conversacion:2", "conversacion:3"
+        ]
+
+    def test_hybrid_fusion_of_conversations(self):
+        semanticas = [
+            {"mensaje_cliente": "Precio Isodec", "respuesta_bot": "USD 40", "score": 0.9},
+            {"mensaje_cliente": "flete", "respuesta_bot": "gratis", "score": 0.7},
+        ]
+        por_palabras = [
+            {"mensaje_cliente": "precio isodec", "respuesta_bot": "USD 40", "id": "1"},
+            {"mensaje_cliente": "colocación", "respuesta_bot": "sí", "id": "2"},
+        ]
+        fusion = KnowledgeManager._fusionar_conversaciones(semanticas, por_palabras, 3)
+
+        assert [c["mensaje_cliente"] for c in fusion] == ["Precio Isodec", "flete", "colocación"]
+        assert fusion[0]["score"] == 0.9 and fusion[0]["score_fusion"] > fusion[1]["score_fusion"]
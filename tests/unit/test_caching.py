@@ -8,7 +8,7 @@ from pathlib import Path
 
 import pytest
 
-sys.path.insert(0, str(Path(__file__).parent.parent.parent / "python-scripts"))
+sys.path.append(str(Path(__file__).parent.parent.parent / "python-scripts"))
 from cache_manager import get_cache_manager
 
 
@@ -0,0 +1,56 @@
+"""
+Unit tests for session handling in /api/chat and /api/chat/stream
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+class _IAFalsa:
+    def __init__(self):
+        self.sesiones = []
+
+    async def procesar_mensaje_usuario_async(self, mensaje, telefono, sesion):
+        self.sesiones.append(sesion)
+        return {"mensaje": "Hola", "tipo": "general"}
+
+    async def procesar_mensaje_usuario_stream(self, mensaje, telefono, sesion, integrador):
+        self.sesiones.append(sesion)
+        yield {"type": "token", "content": "Hola"}
+        yield {"type": "done", "mensaje": "Hola", "tipo": "general"}
+
+
+@pytest.fixture
+def cliente(app_integrada):
+    ia = _IAFalsa()
+    app_integrada.state.ia = ia
+    app_integrada.state.model_integrator = None
+    try:
+        yield TestClient(app_integrada), ia
+    finally:
+        app_integrada.state.ia = None
+
+
+class TestChatSessions:
+    def test_anonymous_requests_get_their_own_session(self, cliente):
+        cliente, ia = cliente
+        primera = cliente.post("/api/chat", json={"message": "hola"}).json()
+        segunda = cliente.post("/api/chat", json={"message": "hola"}).json()
+
+        assert primera["session_id"].startswith("sesion_")
+        assert primera["session_id"] != segunda["session_id"]
+        assert ia.sesiones == [primera["session_id"], segunda["session_id"]]
+
+        cliente.post("/api/chat", json={"message": "hola", "session_id": "s1"})
+        assert ia.sesiones[-1] == "s1"
+
+    def test_stream_returns_the_generated_session(self, cliente):
+        cliente, ia = cliente
+        respuesta = cliente.post("/api/chat/stream", json={"message": "hola"})
+
+        done = [b for b in respuesta.text.split("\n\n") if b.startswith("event: done")][0]
+        datos = json.loads(done.split("data: ", 1)[1])
+        assert datos["session_id"].startswith("sesion_")
+        assert ia.sesiones == [datos["session_id"]]
@@ -0,0 +1,98 @@
+"""
+Unit tests for the content-defined chunker and the deduplicating chunk store
+"""
+
+import os
+import random
+import sys
+import zlib
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "backup_system"))
+from backup_stream import BackupIntegrityError
+from chunk_store import ContentDefinedChunker, DedupBackupReader
+from storage_manager import StorageManager
+
+
+def _registros(n, cambiar=None):
+    for i in range(n):
+        texto = f"documento {i} " * 20
+        if i == cambiar:
+            texto = "editado " + texto
+        yield {"n": i, "texto": texto}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return StorageManager({
+        "local": {"path": str(tmp_path / "backups")},
+        "dedup": {"min_size": 1024, "avg_size": 4096, "max_size": 16384, "gc_grace_seconds": 0},
+    })
+
+
+def _backup(storage, backup_id, registros):
+    with storage.open_backup_writer(backup_id) as writer:
+        writer.write_stream("mongodb.conversations", registros, kind="collection")
+    return writer
+
+
+class TestChunkStore:
+    def test_numpy_and_python_cut_at_the_same_places(self):
+        chunker = ContentDefinedChunker(min_size=1024, avg_size=4096, max_size=16384)
+        datos = random.Random(7).randbytes(300_000)
+        cortes = chunker._cut_points_python(datos, final=True)
+        assert cortes[-1] == len(datos)
+        tamanos = [b - a for a, b in zip([0] + cortes, cortes)]
+        assert all(1024 <= t <= 16384 for t in tamanos[:-1])
+        pytest.importorskip("numpy")
+        assert chunker._cut_points_numpy(datos, final=True) == cortes
+
+    def test_split_is_independent_of_block_sizes(self):
+        chunker = ContentDefinedChunker(min_size=1024, avg_size=4096, max_size=16384)
+        datos = os.urandom(200_000)
+        enteros = list(chunker.split([datos]))
+        en_bloques = list(chunker.split(datos[i:i + 777] for i in range(0, len(datos), 777)))
+        assert enteros == en_bloques
+        assert b"".join(enteros) == datos
+
+    def test_second_backup_only_stores_changed_chunks(self, storage):
+        primero = _backup(storage, "b1", _registros(2000))
+        segundo = _backup(storage, "b2", _registros(2000, cambiar=1000))
+
+        assert primero.stored_size == primero.compressed_size
+        assert 0 < segundo.new_chunks <= 2
+        assert segundo.stored_size < primero.stored_size / 10
+        lector = storage.open_backup_reader("b2")
+        assert isinstance(lector, DedupBackupReader)
+        assert lector.verify() == []
+        assert list(lector.iter_records("mongodb.conversations")) == list(_registros(2000, cambiar=1000))
+
+    def test_gc_keeps_shared_chunks(self, storage):
+        _backup(storage, "b1", _registros(2000))
+        _backup(storage, "b2", _registros(2000, cambiar=1000))
+        assert storage.collect_garbage()["removed"] == 0
+
+        storage.delete_backup("b1")
+        resultado = storage.collect_garbage()
+        assert 0 < resultado["removed"] <= 2
+        assert storage.open_backup_reader("b2").verify() == []
+        assert storage.chunk_store.verify() == []
+
+    def test_gc_rebuilds_lost_refcounts(self, storage):
+        _backup(storage, "b1", _registros(500))
+        os.remove(storage.chunk_store.refcounts_path)
+        assert storage.collect_garbage()["removed"] == 0
+        assert storage.open_backup_reader("b1").verify() == []
+
+    def test_corrupted_chunk_is_detected(self, storage):
+        _backup(storage, "b1", _registros(500))
+        lector = storage.open_backup_reader("b1")
+        chunk_id = lector.stream_info("mongodb.conversations")["chunks"][1]["id"]
+        ruta = Path(storage.chunk_store.chunk_path(chunk_id))
+        ruta.write_bytes(zlib.compress(storage.chunk_store.get(chunk_id).replace(b"documento", b"Documento", 1)))
+
+        assert len(lector.verify()) == 1
+        with pytest.raises(BackupIntegrityError):
+            list(lector.iter_batches("mongodb.conversations"))
@@ -0,0 +1,144 @@
+"""
+Unit tests for the batched, cached embedding service and the resumable backfill
+"""
+
+import threading
+
+import mongomock
+import pytest
+
+from scripts.backfill_embeddings import backfill_embeddings
+from utils.embedding_service import DEFAULT_EMBEDDING_MODEL, EmbeddingService, FakeEmbedder, embedding_key
+
+
+class _ColeccionBulk:
+    """mongomock collection whose bulk_write applies pymongo UpdateOne ops"""
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.bulk_writes = 0
+
+    def bulk_write(self, operaciones, ordered=True):
+        self.bulk_writes += 1
+        for operacion in operaciones:
+            self.coleccion.update_one(operacion._filter, operacion._doc, upsert=operacion._upsert)
+
+    def __getattr__(self, nombre):
+        return getattr(self.coleccion, nombre)
+
+
+class _EmbedderQueFalla(FakeEmbedder):
+    def __init__(self, fallar_en):
+        super().__init__(dimension=8)
+        self.fallar_en = fallar_en
+
+    def embed_batch(self, textos, modelo):
+        if len(self.calls) == self.fallar_en:
+            self.calls.append(list(textos))
+            raise RuntimeError("rate limited")
+        return super().embed_batch(textos, modelo)
+
+
+@pytest.fixture
+def coleccion():
+    coleccion = mongomock.MongoClient().db["kb_interactions"]
+    coleccion.insert_many(
+        [{"_id": i, "mensaje_cliente": f"precio isodec {i} mm"} for i in range(25)]
+        + [{"_id": 100, "mensaje_cliente": ""}, {"_id": 101, "mensaje_cliente": "ya", "embedding": [1.0]}]
+    )
+    return _ColeccionBulk(coleccion)
+
+
+class TestEmbeddingService:
+    def test_fake_embedder_is_deterministic_and_similar_for_shared_words(self):
+        a, b, c = FakeEmbedder().embed_batch(["precio isodec", "precio isodec 100", "hola"], "m")
+
+        assert FakeEmbedder().embed_batch(["precio isodec"], "m")[0] == a
+        similitud = lambda x, y: sum(i * j for i, j in zip(x, y))
+        assert similitud(a, b) > similitud(a, c)
+
+    def test_cache_is_content_addressed_and_persistent(self, tmp_path):
+        ruta = str(tmp_path / "emb.sqlite")
+        servicio = EmbeddingService(FakeEmbedder(), cache_path=ruta, batch_size=2)
+        vectores = servicio.embed_many(["uno", "dos", "tres", "uno", "dos\n"])
+
+        assert servicio.embedder.calls == [["uno", "dos"], ["tres"]]
+        assert vectores[0] == vectores[3] and vectores[1] == vectores[4]
+        servicio.close()
+
+        reabierto = EmbeddingService(FakeEmbedder(), cache_path=ruta)
+        assert reabierto.embed_many(["tres"]) == [pytest.approx(vectores[2])]
+        assert reabierto.embedder.calls == []
+        assert reabierto.stats["hits"] == 1
+        assert embedding_key("m", "a  b") == embedding_key("m", "a\nb") != embedding_key("n", "a b")
+
+    def test_concurrent_embed_calls_share_a_request(self):
+        servicio = EmbeddingService(FakeEmbedder(), batch_size=16, linger=0.2)
+        resultados = {}
+
+        def embeber(texto):
+            resultados[texto] = servicio.embed(texto)
+
+        hilos = [threading.Thread(target=embeber, args=(f"texto {i}",)) for i in range(10)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        assert len(servicio.embedder.calls) == 1
+        assert resultados["texto 3"] == FakeEmbedder().embed_batch(["texto 3"], "m")[0]
+        servicio.close()
+
+    def test_embed_propagates_provider_errors(self):
+        servicio = EmbeddingService(_EmbedderQueFalla(fallar_en=0), linger=0)
+        with pytest.raises(RuntimeError):
+            servicio.embed("hola")
+        assert servicio.embed("hola")
+        servicio.close()
+
+    def test_backfill_streams_in_batches_and_resumes(self, coleccion, tmp_path):
+        checkpoint = tmp_path / "checkpoint.json"
+        servicio = EmbeddingService(_EmbedderQueFalla(fallar_en=1), batch_size=10)
+
+        with pytest.raises(RuntimeError):
+            backfill_embeddings(coleccion, servicio, batch_size=10, checkpoint_path=checkpoint)
+        assert coleccion.count_documents({"embedding": {"$exists": True}}) == 11
+        assert checkpoint.exists()
+
+        servicio.embedder.fallar_en = None
+        actualizados = backfill_embeddings(coleccion, servicio, batch_size=10, checkpoint_path=checkpoint)
+
+        assert actualizados == 15
+        assert coleccion.count_documents({"embedding": {"$exists": True}}) == 26
+        assert coleccion.find_one({"_id": 100}).get("embedding") is None
+        assert coleccion.find_one({"_id": 101})["embedding"] == [1.0]
+        assert coleccion.bulk_writes == 3
+        assert backfill_embeddings(coleccion, servicio, batch_size=10, checkpoint_path=checkpoint) == 0
+
+    def test_fake_backfill_is_a_dry_run_with_its_own_model(self, coleccion, tmp_path, monkeypatch):
+        import scripts.backfill_embeddings as backfill
+
+        class _Manager:
+            def connect(self):
+                return True
+
+            def get_collection(self, nombre):
+                return coleccion
+
+        servicios = []
+        original = backfill.EmbeddingService
+        monkeypatch.setattr(backfill, "EmbeddingService",
+                            lambda *args, **kwargs: servicios.append(original(*args, **kwargs)) or servicios[-1])
+        monkeypatch.setattr(backfill, "get_client_manager", lambda uri: _Manager())
+        cache = tmp_path / "embeddings.sqlite"
+        checkpoint = tmp_path / "checkpoint.json"
+        monkeypatch.setenv("MONGODB_URI", "mongodb://localhost/bmc_test")
+        monkeypatch.setenv("KNOWLEDGE_EMBEDDING_CACHE", str(cache))
+        monkeypatch.setattr("sys.argv", ["backfill_embeddings.py", "--fake", "--checkpoint", str(checkpoint)])
+        backfill.main()
+
+        assert servicios[0].model == "fake-hash-64" != DEFAULT_EMBEDDING_MODEL
+        assert servicios[0].embedder.calls
+        assert coleccion.bulk_writes == 0
+        assert coleccion.count_documents({"embedding": {"$exists": True}}) == 1
+        assert not cache.exists() and not checkpoint.exists()
@@ -0,0 +1,111 @@
+"""
+Unit tests for hedged multi-provider dispatch in UnifiedModelIntegrator
+
+Providers are local fakes that inject latency and errors.
+"""
+
+import time
+
+import pytest
+
+from model_integrator import ModelConfig, ModelProvider, UnifiedModelIntegrator
+
+
+class _ProveedorFalso:
+    """Stands in for a _generate_<provider> method"""
+
+    def __init__(self, nombre, latencia=0.0, error=None):
+        self.nombre = nombre
+        self.latencia = latencia
+        self.error = error
+        self.llamadas = 0
+
+    def __call__(self, prompt, system_prompt, model, temperature, max_tokens, **kwargs):
+        self.llamadas += 1
+        time.sleep(self.latencia)
+        if self.error:
+            raise RuntimeError(self.error)
+        return {"content": f"{self.nombre}: {prompt}", "tokens_input": 10, "tokens_output": 5}
+
+
+@pytest.fixture
+def integrador(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    for variable in ("OPENAI_API_KEY", "GROQ_API_KEY", "GEMINI_API_KEY", "GROK_API_KEY"):
+        monkeypatch.delenv(variable, raising=False)
+    integrador = UnifiedModelIntegrator()
+    integrador.response_cache = None
+    integrador.models = {
+        "openai_fake": ModelConfig(
+            provider=ModelProvider.OPENAI, model_name="fake-openai", api_key="test",
+            quality_rating=9, speed_rating=5,
+        ),
+        "groq_fake": ModelConfig(
+            provider=ModelProvider.GROQ, model_name="fake-groq", api_key="test",
+            quality_rating=6, speed_rating=9,
+        ),
+    }
+    integrador.primario = integrador._generate_openai = _ProveedorFalso("openai")
+    integrador.respaldo = integrador._generate_groq = _ProveedorFalso("groq")
+    return integrador
+
+
+class TestHedgedDispatch:
+    @pytest.mark.asyncio
+    async def test_fast_primary_does_not_hedge(self, integrador):
+        resultado = await integrador.generate_hedged("hola", hedge_delay=0.5)
+
+        assert resultado["model_used"] == "openai_fake"
+        assert resultado["hedged"] is False
+        assert integrador.respaldo.llamadas == 0
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_is_hedged(self, integrador):
+        integrador.primario.latencia = 0.5
+        inicio = time.perf_counter()
+        resultado = await integrador.generate_hedged("hola", hedge_delay=0.05)
+        transcurrido = time.perf_counter() - inicio
+
+        assert resultado["model_used"] == "groq_fake"
+        assert resultado["hedged"] is True
+        assert transcurrido < 0.4
+        assert integrador.hedge_stats["hedges"] == 1
+        assert integrador.hedge_stats["hedge_wins"] == 1
+
+    @pytest.mark.asyncio
+    async def test_primary_error_fails_over_without_waiting(self, integrador):
+        integrador.primario.error = "503 Service Unavailable"
+        inicio = time.perf_counter()
+        resultado = await integrador.generate_hedged("hola", hedge_delay=5)
+
+        assert resultado["success"] is True
+        assert resultado["model_used"] == "groq_fake"
+        assert time.perf_counter() - inicio < 1
+        assert integrador.hedge_stats["failovers"] == 1
+
+    @pytest.mark.asyncio
+    async def test_both_failing_returns_error(self, integrador):
+        integrador.primario.error = "timeout"
+        integrador.respaldo.error = "rate limited"
+        resultado = await integrador.generate_hedged("hola", hedge_delay=5)
+
+        assert resultado["success"] is False
+        assert integrador.primario.llamadas == 1
+        assert integrador.respaldo.llamadas == 1
+
+    @pytest.mark.asyncio
+    async def test_delay_follows_live_p95(self, integrador):
+        assert integrador._hedge_delay("openai_fake") == integrador.hedge_default_delay
+
+        integrador.primario.latencia = 0.02
+        for _ in range(10):
+            integrador.generate("hola", use_cache=False)
+        p95 = integrador.get_latency_percentile("openai_fake", 95)
+
+        assert integrador._hedge_delay("openai_fake") == pytest.approx(p95)
+        assert 0.02 <= p95 < 0.5
+        assert integrador.usage_stats["openai_fake"].p95_response_time == pytest.approx(p95)
+
+        integrador.primario.latencia = 0.5
+        resultado = await integrador.generate_hedged("hola")
+        assert resultado["model_used"] == "groq_fake"
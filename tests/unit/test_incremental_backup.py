@@ -0,0 +1,192 @@
+"""
+Unit tests for the incremental backup change journal
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import mongomock
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "backup_system"))
+import backup_service as modulo_backup
+import incremental_backup as modulo_incremental
+from backup_service import BackupService
+from incremental_backup import ChangeTracker, IncrementalBackupService
+from storage_manager import StorageManager
+
+HACE_UNA_HORA = time.time_ns() - 3600 * 10**9
+
+
+class _MongoFalso:
+    def __init__(self):
+        self.db = mongomock.MongoClient().db
+        self.colecciones = {}
+
+    def get_collection(self, nombre):
+        return self.colecciones.get(nombre) or self.db[nombre]
+
+
+class _StreamFalso:
+    def __init__(self, eventos, token):
+        self.eventos = list(eventos)
+        self.resume_token = token
+
+    def try_next(self):
+        if not self.eventos:
+            return None
+        evento = self.eventos.pop(0)
+        self.resume_token = evento["_id"]
+        return evento
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class _ColeccionConStream:
+    """mongomock collection plus a change stream fed from a list of events"""
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.eventos = []
+
+    def __getattr__(self, nombre):
+        return getattr(self.coleccion, nombre)
+
+    def registrar(self, operacion, documento_id):
+        self.eventos.append({"_id": {"_data": str(len(self.eventos) + 1)}, "operationType": operacion,
+                             "documentKey": {"_id": documento_id}})
+
+    def watch(self, resume_after=None):
+        posicion = int(resume_after["_data"]) if resume_after else len(self.eventos)
+        return _StreamFalso(self.eventos[posicion:], {"_data": str(posicion)})
+
+
+def _escribir(ruta, texto):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.write_text(texto)
+    os.utime(ruta, ns=(HACE_UNA_HORA, HACE_UNA_HORA + len(texto)))
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    mongo = _MongoFalso()
+    for modulo in (modulo_backup, modulo_incremental):
+        monkeypatch.setattr(modulo, "ensure_mongodb_connected", lambda: True)
+        monkeypatch.setattr(modulo, "get_mongodb_service", lambda: mongo)
+
+    config = {
+        "backup": {"metadata_dir": str(tmp_path / "metadata")},
+        "storage": {"local": {"path": str(tmp_path / "backups")}},
+        "mongodb": {"collections": ["conversations"]},
+        "filesystem": {"patterns": [], "directories": ["ws"]},
+    }
+    ruta_config = tmp_path / "backup_config.json"
+    ruta_config.write_text(json.dumps(config))
+    backup = BackupService(StorageManager(config["storage"]), str(ruta_config))
+    backup.base_dir = str(tmp_path)
+    for i in range(20):
+        _escribir(tmp_path / "ws" / f"archivo_{i}.txt", f"contenido {i}")
+    mongo.db.conversations.insert_many([{"_id": i, "texto": f"hola {i}"} for i in range(10)])
+
+    tracker = ChangeTracker(str(tmp_path / "estado.json"))
+    servicio = IncrementalBackupService(backup, tracker)
+    servicio.create_incremental_backup()
+    return servicio, mongo, tmp_path
+
+
+def _hashes(monkeypatch):
+    llamadas = []
+    original = modulo_incremental.file_checksum
+    monkeypatch.setattr(modulo_incremental, "file_checksum", lambda ruta: llamadas.append(ruta) or original(ruta))
+    return llamadas
+
+
+class TestIncrementalBackup:
+    def test_unchanged_workspace_hashes_nothing(self, entorno, monkeypatch):
+        servicio, _, _ = entorno
+        llamadas = _hashes(monkeypatch)
+        resultado = servicio.create_incremental_backup()
+        assert resultado["message"] == "No changes detected"
+        assert llamadas == []
+
+    def test_only_changed_files_are_hashed_and_backed_up(self, entorno, monkeypatch):
+        servicio, _, tmp_path = entorno
+        _escribir(tmp_path / "ws" / "archivo_3.txt", "contenido nuevo")
+        os.remove(tmp_path / "ws" / "archivo_4.txt")
+        ruta_tocada = tmp_path / "ws" / "archivo_5.txt"
+        os.utime(ruta_tocada, ns=(HACE_UNA_HORA, HACE_UNA_HORA + 1))
+        llamadas = _hashes(monkeypatch)
+
+        resultado = servicio.create_incremental_backup()
+        cambios = {(c["path"], c["action"]) for c in resultado["changes"]}
+        assert cambios == {("ws/archivo_3.txt", "modified"), ("ws/archivo_4.txt", "deleted")}
+        assert sorted(Path(r).name for r in llamadas) == ["archivo_3.txt", "archivo_5.txt"]
+
+        backup_id = resultado["backup_result"].backup_id
+        lector = servicio.backup_service.storage_manager.open_backup_reader(backup_id)
+        assert [r["path"] for r in lector.iter_records("filesystem")] == ["ws/archivo_3.txt"]
+        assert list(lector.iter_records("deletions")) == [{"type": "file", "path": "ws/archivo_4.txt"}]
+        assert servicio.backup_service.verify_backup(backup_id).verified
+        assert servicio.create_incremental_backup()["message"] == "No changes detected"
+
+    def test_collections_use_high_water_marks(self, entorno):
+        servicio, mongo, _ = entorno
+        mongo.db.conversations.insert_one({"_id": 10, "texto": "nuevo"})
+        mongo.db.conversations.update_one({"_id": 2}, {"$set": {"texto": "editado", "updated_at": datetime.now()}})
+
+        resultado = servicio.create_incremental_backup()
+        lector = servicio.backup_service.storage_manager.open_backup_reader(resultado["backup_result"].backup_id)
+        assert sorted(d["_id"] for d in lector.iter_records("mongodb.conversations")) == [2, 10]
+        assert servicio.create_incremental_backup()["message"] == "No changes detected"
+
+        mongo.db.conversations.delete_one({"_id": 7})
+        resultado = servicio.create_incremental_backup()
+        lector = servicio.backup_service.storage_manager.open_backup_reader(resultado["backup_result"].backup_id)
+        assert lector.stream_info("mongodb.conversations")["count"] == 10
+
+    def test_change_stream_events(self, entorno):
+        servicio, mongo, _ = entorno
+        coleccion = _ColeccionConStream(mongo.db.conversations)
+        mongo.colecciones["conversations"] = coleccion
+        servicio.change_tracker = ChangeTracker(servicio.change_tracker.state_file)
+        # First run only records a resume token
+        assert servicio.create_incremental_backup()["message"] == "No changes detected"
+        assert servicio.change_tracker.state["collections"]["conversations"]["resume_token"]
+
+        coleccion.insert_one({"_id": 20, "texto": "nuevo"})
+        coleccion.registrar("insert", 20)
+        coleccion.delete_one({"_id": 1})
+        coleccion.registrar("delete", 1)
+        resultado = servicio.create_incremental_backup()
+        lector = servicio.backup_service.storage_manager.open_backup_reader(resultado["backup_result"].backup_id)
+        assert [d["_id"] for d in lector.iter_records("mongodb.conversations")] == [20]
+        assert list(lector.iter_records("deletions")) == [{"type": "document", "collection": "conversations", "_id": 1}]
+
+    def test_per_collection_updated_field_and_checksum_fallback(self, entorno):
+        servicio, mongo, tmp_path = entorno
+        servicio.backup_service.config["mongodb"]["collections"] = ["conversations", "context", "quotes"]
+        mongo.db.context.insert_many([{"_id": f"s{i}", "messages": [], "last_updated": datetime(2024, 1, 1, 0, i)}
+                                      for i in range(3)])
+        mongo.db.quotes.insert_many([{"_id": i, "total": i} for i in range(3)])
+        servicio.change_tracker = ChangeTracker(servicio.change_tracker.state_file,
+                                                updated_fields={"context": "last_updated"})
+        assert servicio.create_incremental_backup()["total_changes"] == 2
+        assert servicio.create_incremental_backup()["message"] == "No changes detected"
+
+        # Appending a message bumps last_updated; quotes carry no update field at all
+        mongo.db.context.update_one({"_id": "s1"}, {"$push": {"messages": {"texto": "hola"}},
+                                                    "$set": {"last_updated": datetime(2024, 1, 2)}})
+        mongo.db.quotes.update_one({"_id": 2}, {"$set": {"total": 99}})
+        resultado = servicio.create_incremental_backup()
+        lector = servicio.backup_service.storage_manager.open_backup_reader(resultado["backup_result"].backup_id)
+        assert [d["_id"] for d in lector.iter_records("mongodb.context")] == ["s1"]
+        assert [d["total"] for d in lector.iter_records("mongodb.quotes")] == [0, 1, 99]
+        assert servicio.create_incremental_backup()["message"] == "No changes detected"
@@ -0,0 +1,75 @@
+"""
+Unit tests for the columnar interaction history
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from base_conocimiento_dinamica import (
+    BaseConocimientoDinamica,
+    HistorialInteracciones,
+    InteraccionCliente,
+)
+
+
+def _interaccion(indice, **cambios):
+    datos = dict(
+        id=f"test_{indice}",
+        timestamp=datetime.datetime(2025, 1, 1, 12, 30, 15, 123456) + datetime.timedelta(hours=indice),
+        cliente_id=f"cliente_{indice % 3}",
+        tipo_interaccion="consulta",
+        mensaje_cliente="Necesito el precio de aislamiento térmico ñandú",
+        respuesta_agente="Te paso la cotización",
+        contexto={"producto": "isodec", "espesor": "100mm"},
+        resultado="exitoso",
+    )
+    datos.update(cambios)
+    return InteraccionCliente(**datos)
+
+
+class TestHistorialInteracciones:
+    def test_roundtrip_preserves_every_field(self):
+        originales = [
+            _interaccion(0),
+            _interaccion(1, tipo_interaccion="venta", valor_venta=Decimal("1500.50"), satisfaccion_cliente=5),
+            _interaccion(2, valor_cotizacion=Decimal("99.99"), lecciones_aprendidas=["seguir"]),
+            _interaccion(3, lecciones_aprendidas=None, contexto={}),
+        ]
+        historial = HistorialInteracciones(originales)
+
+        assert len(historial) == 4
+        assert list(historial) == originales
+        assert historial[-1] == originales[-1]
+        assert historial[1:3] == originales[1:3]
+
+    def test_values_outside_compact_columns_are_kept(self):
+        con_zona = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        originales = [
+            _interaccion(0, timestamp=con_zona),
+            _interaccion(1, contexto={"fecha": con_zona}),
+            _interaccion(2, satisfaccion_cliente=4.5),
+        ]
+        historial = HistorialInteracciones(originales)
+
+        assert list(historial) == originales
+
+    def test_repeated_values_are_interned(self):
+        historial = HistorialInteracciones(_interaccion(i) for i in range(300))
+
+        assert len(historial._vocabulario_clientes.valores) == 3
+        assert len(historial._vocabulario_contextos.valores) == 1
+        assert list(historial.columna("cliente_id")) == [f"cliente_{i % 3}" for i in range(300)]
+
+    def test_index_out_of_range(self):
+        with pytest.raises(IndexError):
+            HistorialInteracciones([_interaccion(0)])[1]
+
+    def test_knowledge_base_wraps_assigned_lists(self):
+        base = BaseConocimientoDinamica()
+        base.interacciones = [_interaccion(0)]
+        base.registrar_interaccion(_interaccion(1))
+
+        assert isinstance(base.interacciones, HistorialInteracciones)
+        assert [i.id for i in base.interacciones] == ["test_0", "test_1"]
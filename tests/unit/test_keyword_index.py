@@ -0,0 +1,88 @@
+"""
+Unit tests for the inverted keyword index of the knowledge base
+"""
+
+import datetime
+
+import pytest
+
+from base_conocimiento_dinamica import (
+    BaseConocimientoDinamica,
+    IndiceInvertido,
+    InteraccionCliente,
+)
+
+
+class TestIndiceInvertido:
+    def test_top_k_ranks_by_overlap(self):
+        indice = IndiceInvertido()
+        indice.agregar("a", ["negocio:precio"])
+        indice.agregar("b", ["negocio:precio", "tecnico:aislamiento"])
+        indice.agregar("c", ["emocional:urgente"])
+
+        resultado = indice.top_k(["negocio:precio", "tecnico:aislamiento"], k=5)
+        assert resultado == [("b", 2), ("a", 1)]
+        assert indice.contar(["negocio:precio"]) == 2
+
+    def test_tie_break_and_removal(self):
+        indice = IndiceInvertido()
+        puntajes = {"a": 0.2, "b": 0.9}
+        indice.agregar("a", ["negocio:precio"])
+        indice.agregar("b", ["negocio:precio", "negocio:costo"])
+
+        resultado = indice.top_k(["negocio:precio"], k=1, desempate=puntajes.get)
+        assert resultado == [("b", 1)]
+
+        indice.eliminar("b")
+        assert indice.top_k(["negocio:precio"], k=5) == [("a", 1)]
+        assert indice.contar(["negocio:costo"]) == 0
+        assert len(indice) == 1
+
+
+class TestRespuestaConIndice:
+    @pytest.fixture
+    def base(self):
+        base = BaseConocimientoDinamica()
+        base.interacciones = []
+        base.patrones_venta = []
+        base.actualizar_conocimiento()
+        return base
+
+    def _interaccion(self, indice, mensaje, respuesta, resultado="exitoso"):
+        return InteraccionCliente(
+            id=f"idx_{indice}",
+            timestamp=datetime.datetime.now(),
+            cliente_id="cliente_idx",
+            tipo_interaccion="consulta",
+            mensaje_cliente=mensaje,
+            respuesta_agente=respuesta,
+            contexto={},
+            resultado=resultado,
+        )
+
+    def test_successful_interaction_with_most_overlap_is_used(self, base):
+        base.registrar_interaccion(self._interaccion(0, "precio", "respuesta precio"))
+        base.registrar_interaccion(
+            self._interaccion(1, "precio con descuento", "respuesta precio y descuento")
+        )
+        base.registrar_interaccion(
+            self._interaccion(2, "precio con descuento urgente", "fallida", resultado="fallido")
+        )
+
+        respuesta = base.obtener_respuesta_inteligente("¿Hay descuento en el precio?", {})
+        assert respuesta == "respuesta precio y descuento"
+
+    def test_pattern_is_preferred_over_interactions(self, base):
+        base.registrar_interaccion(self._interaccion(0, "precio", "respuesta precio"))
+        base._importar_patrones([{
+            "id": "patron_precio",
+            "frecuencia": 4,
+            "tasa_exito": 0.8,
+            "palabras_clave": ["negocio:precio"],
+            "estrategia_recomendada": "Destacar el ahorro energético",
+            "fecha_creacion": datetime.datetime.now().isoformat(),
+            "fecha_ultima_actualizacion": datetime.datetime.now().isoformat(),
+        }])
+
+        respuesta = base.obtener_respuesta_inteligente("precio del panel", {})
+        assert "Destacar el ahorro energético" in respuesta
@@ -0,0 +1,103 @@
+"""
+Unit tests for the compiled keyword/entity matcher and both NLU paths using it
+"""
+
+import pytest
+
+from ia_conversacional_integrada import IAConversacionalIntegrada
+from keyword_matcher import CompiledMatcher, KeywordAutomaton, fold
+from language_processor import EntityExtractor, Intent, IntentClassifier, Language
+
+
+@pytest.fixture(scope="module")
+def ia():
+    instancia = IAConversacionalIntegrada()
+    instancia.use_shared_context = False
+    return instancia
+
+
+class TestKeywordMatcher:
+    def test_fold_keeps_offsets(self):
+        texto = "¿CUÁNTO sale la Instalación?"
+        assert fold(texto) == "¿cuanto sale la instalacion?"
+        assert len(fold(texto)) == len(texto)
+
+    def test_automaton_finds_overlapping_keywords(self):
+        automata = KeywordAutomaton()
+        for palabra, etiqueta in [("buen dia", "a"), ("dia de semana", "b"), ("dia", "c"), ("de", "d")]:
+            automata.add(palabra, etiqueta)
+        assert not automata.add("Buen Día", "a")
+
+        encontrados = [(inicio, fin, etiqueta) for inicio, fin, etiqueta, _, _ in
+                       automata.scan(["buen", "dia", "de", "semana"])]
+        assert sorted(encontrados) == [(0, 1, "a"), (1, 1, "c"), (1, 3, "b"), (2, 2, "d")]
+
+    def test_stem_keywords_match_word_prefixes(self):
+        automata = KeywordAutomaton()
+        for palabra, etiqueta in [("cotizar*", "a"), ("precio*", "b"), ("lana de roca*", "c"), ("de", "d")]:
+            automata.add(palabra, etiqueta)
+        assert not automata.add("Precio*", "b")
+        assert automata.add("precio", "b")
+
+        encontrados = [(inicio, fin, etiqueta) for inicio, fin, etiqueta, _, _ in
+                       automata.scan(["quiero", "cotizarlo", "lana", "de", "rocas", "precios", "aprecio"])]
+        assert sorted(encontrados) == [(1, 1, "a"), (2, 4, "c"), (3, 3, "d"), (5, 5, "b")]
+
+    def test_scores_spans_and_entities(self):
+        matcher = (
+            CompiledMatcher()
+            .add_keywords("saludo", ["hola", "hi", "buen día"])
+            .add_keywords("cotizacion", ["cuanto", "cuanto cuesta"], weight=lambda k: len(k) / 10)
+            .add_pattern("telefono", r"\d{3} \d{3} \d{3}")
+            .add_pattern("medidas", r"(\d+)x(\d+)")
+            .add_pattern("medidas", r"(\d+) por (\d+)")
+        )
+        texto = "Hola hola, buen dia! chico: ¿Cuánto cuesta 10 por 5? 099 123 456"
+        resultado = matcher.match(texto)
+
+        assert resultado.scores == {"saludo": 2.0, "cotizacion": pytest.approx(1.9)}
+        assert resultado.labels() == ["saludo", "cotizacion"]
+        cuanto = [m for m in resultado.keywords if m.keyword == "cuanto cuesta"][0]
+        assert texto[cuanto.start:cuanto.end] == "Cuánto cuesta"
+        assert resultado.first("telefono").text == "099 123 456"
+        assert resultado.first("medidas").groups == ("10", "5")
+        assert matcher.match(texto) is resultado
+
+    def test_ia_uses_word_boundaries_and_accents(self, ia):
+        assert ia._analizar_intencion("¿Cuánto sale?") == "cotizacion"
+        assert ia._analizar_intencion("el chico de la esquina") == "general"
+        assert ia._analizar_intencion("hola, necesito información sobre techos") == "informacion"
+
+        entidades = ia._extraer_entidades("isodec 150mm blanco, 10 x 5 metros, tel 099 123 456")
+        assert entidades["productos"] == ["isodec"]
+        assert entidades["espesores"] == ["150mm"]
+        assert entidades["colores"] == ["blanco"]
+        assert entidades["dimensiones"] == {"largo": 10.0, "ancho": 5.0}
+        assert entidades["telefono"] == "099123456"
+        assert ia._extraer_nombre_apellido("Juan Perez") == {"nombre": "Juan", "apellido": "Perez"}
+        assert ia._extraer_nombre_apellido("Precios Isodec") is None
+
+    @pytest.mark.parametrize("mensaje, intencion", [
+        ("cuales son los precios del isodec?", "cotizacion"),
+        ("me pasas los costos", "cotizacion"),
+        ("quiero cotizarlo", "cotizacion"),
+        ("necesitan instalarlo?", "instalacion"),
+        ("qué servicios tienen?", "servicio"),
+        ("hay otros productos?", "producto"),
+    ])
+    def test_ia_keyword_stems_match_inflections(self, ia, mensaje, intencion):
+        assert ia._analizar_intencion(mensaje) == intencion
+
+    def test_language_processor_paths(self):
+        clasificador = IntentClassifier()
+        assert clasificador.classify("no estoy seguro, es muy caro, no tengo dinero", Language.SPANISH)[0] == Intent.OBJECION
+        assert clasificador.classify("thanks, thank you, goodbye, see you later", Language.ENGLISH)[0] == Intent.DESPEDIDA
+
+        entidades = EntityExtractor().extract(
+            "lana de roca 50mm gris, 40 m2, con instalación y flete", Intent.COTIZACION
+        )
+        assert [p["id"] for p in entidades["products"]] == ["lana_roca"]
+        assert entidades["thickness"]["value"] == "50mm"
+        assert entidades["color"]["value"] == "gris"
+        assert entidades["dimensions"]["area_m2"] == 40.0
+        assert entidades["services"] == {"flete": True, "instalacion": True, "accesorios": False}
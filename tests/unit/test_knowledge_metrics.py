@@ -0,0 +1,87 @@
+"""
+Unit tests for incremental knowledge base metrics
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from base_conocimiento_dinamica import BaseConocimientoDinamica, InteraccionCliente
+
+
+def _interaccion(indice, dias_atras=0, tipo="consulta", resultado="exitoso", satisfaccion=None):
+    return InteraccionCliente(
+        id=f"test_{indice}",
+        timestamp=datetime.datetime.now() - datetime.timedelta(days=dias_atras),
+        cliente_id=f"cliente_{indice % 3}",
+        tipo_interaccion=tipo,
+        mensaje_cliente="Necesito el precio de aislamiento con garantía",
+        respuesta_agente="Te paso la cotización",
+        contexto={"producto": "isodec"},
+        resultado=resultado,
+        valor_venta=Decimal("1000") if tipo == "venta" else None,
+        satisfaccion_cliente=satisfaccion,
+    )
+
+
+class TestIncrementalMetrics:
+    @pytest.fixture
+    def base(self):
+        base = BaseConocimientoDinamica()
+        base.interacciones = []
+        base.actualizar_conocimiento()
+        return base
+
+    def test_incremental_metrics_match_full_recompute(self, base):
+        casos = [
+            _interaccion(0, 0, "venta", satisfaccion=5),
+            _interaccion(1, 0, "consulta", satisfaccion=3),
+            _interaccion(2, 3, "venta", resultado="fallido"),
+            _interaccion(3, 6, "consulta", satisfaccion=4),
+            _interaccion(4, 20, "venta", satisfaccion=2),
+        ]
+        for interaccion in casos:
+            base.registrar_interaccion(interaccion)
+
+        incrementales = dict(base.metricas_evolucion)
+        base.actualizar_conocimiento()
+        completas = base.metricas_evolucion
+
+        for clave in ("interacciones_hoy", "interacciones_semana", "ventas_hoy",
+                      "ventas_semana", "satisfaccion_promedio", "total_interacciones"):
+            assert incrementales[clave] == completas[clave], clave
+        assert incrementales["interacciones_hoy"] == 2
+        assert incrementales["interacciones_semana"] == 4
+        assert incrementales["ventas_semana"] == 2
+        assert incrementales["satisfaccion_promedio"] == pytest.approx(3.5)
+
+    def test_pattern_success_rate_is_incremental(self, base):
+        base.registrar_interaccion(_interaccion(0))
+        base.registrar_interaccion(_interaccion(1, resultado="fallido"))
+        patron = base._crear_patron_desde_dict({
+            "id": "patron_precio",
+            "frecuencia": 5,
+            "tasa_exito": 0.5,
+            "palabras_clave": ["precio"],
+            "fecha_creacion": datetime.datetime.now().isoformat(),
+            "fecha_ultima_actualizacion": datetime.datetime.now().isoformat(),
+        })
+        base.patrones_venta.append(patron)
+
+        assert base._calcular_tasa_exito_patron(patron) == pytest.approx(0.5)
+        base.registrar_interaccion(_interaccion(2))
+        assert base._calcular_tasa_exito_patron(patron) == pytest.approx(2 / 3)
+
+    def test_reassigning_history_rebuilds_indexes(self, base):
+        for i in range(6):
+            base.registrar_interaccion(_interaccion(i, dias_atras=i * 10))
+        claves = base._extraer_palabras_clave("Necesito el precio de aislamiento con garantía")
+        assert len(base.buscar_interacciones_similares(claves, k=10)) == 6
+
+        # Como en _limpiar_datos_obsoletos: se reemplaza la lista por una más corta
+        base.interacciones = [i for i in base.interacciones if i.id in ("test_4", "test_5")]
+        similares = base.buscar_interacciones_similares(claves, k=10)
+        assert sorted(i.id for i, _ in similares) == ["test_4", "test_5"]
+        base.actualizar_conocimiento()
+        assert base.metricas_evolucion["total_interacciones"] == 2
@@ -0,0 +1,100 @@
+"""
+Unit tests for the compiled knowledge snapshot
+"""
+
+import io
+import json
+import os
+import pickle
+import contextlib
+
+import pytest
+
+import base_conocimiento_dinamica as modulo
+from base_conocimiento_dinamica import BaseConocimientoDinamica
+
+
+def _conocimiento(mensaje):
+    return {
+        "interacciones": [
+            {
+                "id": "snap_1",
+                "timestamp": "2025-01-01T10:00:00",
+                "cliente_id": "cliente_1",
+                "tipo_interaccion": "consulta",
+                "mensaje_cliente": mensaje,
+                "respuesta_agente": "Te paso la cotización",
+                "contexto": {},
+                "resultado": "exitoso",
+            }
+        ],
+        "insights_automaticos": [{"tipo": "demo", "timestamp": "2025-01-01 10:00:00"}],
+    }
+
+
+def _base_vacia(directorio):
+    with contextlib.redirect_stdout(io.StringIO()):
+        base = BaseConocimientoDinamica()
+    base.interacciones = []
+    base.insights_automaticos = []
+    base.directorio_base = directorio
+    return base
+
+
+@pytest.fixture
+def fuente(tmp_path):
+    modulo.limpiar_snapshots_en_memoria()
+    ruta = tmp_path / "conocimiento.json"
+    ruta.write_text(json.dumps(_conocimiento("precio de aislamiento")), encoding="utf-8")
+    yield ruta
+    modulo.limpiar_snapshots_en_memoria()
+
+
+class TestKnowledgeSnapshot:
+    def test_snapshot_is_written_and_reused(self, fuente, tmp_path):
+        _base_vacia(tmp_path).importar_conocimiento(str(fuente))
+        archivo_snapshot = tmp_path / ".knowledge_cache" / "conocimiento.json.snapshot"
+        assert archivo_snapshot.exists()
+
+        modulo.limpiar_snapshots_en_memoria()
+        base = _base_vacia(tmp_path)
+        base._compilar_conocimiento = lambda conocimiento: pytest.fail("snapshot should be reused")
+        base.importar_conocimiento(str(fuente))
+
+        assert [i.mensaje_cliente for i in base.interacciones] == ["precio de aislamiento"]
+        assert base.insights_automaticos[0]["timestamp"].year == 2025
+
+    def test_instances_do_not_share_mutable_state(self, fuente, tmp_path):
+        primera = _base_vacia(tmp_path)
+        segunda = _base_vacia(tmp_path)
+        primera.importar_conocimiento(str(fuente))
+        segunda.importar_conocimiento(str(fuente))
+
+        primera.insights_automaticos[0]["tipo"] = "modificado"
+        assert segunda.insights_automaticos[0]["tipo"] == "demo"
+        assert primera.interacciones is not segunda.interacciones
+
+    def test_snapshot_is_regenerated_when_source_changes(self, fuente, tmp_path):
+        _base_vacia(tmp_path).importar_conocimiento(str(fuente))
+
+        fuente.write_text(json.dumps(_conocimiento("cotizar isodec")), encoding="utf-8")
+        os.utime(fuente, ns=(1, 1))
+        base = _base_vacia(tmp_path)
+        base.importar_conocimiento(str(fuente))
+
+        assert [i.mensaje_cliente for i in base.interacciones] == ["cotizar isodec"]
+
+    def test_snapshot_with_other_schema_version_is_ignored(self, fuente, tmp_path):
+        _base_vacia(tmp_path).importar_conocimiento(str(fuente))
+        archivo_snapshot = tmp_path / ".knowledge_cache" / "conocimiento.json.snapshot"
+        datos = pickle.loads(archivo_snapshot.read_bytes())
+        datos["version"] = modulo.SNAPSHOT_SCHEMA_VERSION + 1
+        datos["conocimiento"]["insights_automaticos"] = []
+        archivo_snapshot.write_bytes(pickle.dumps(datos))
+
+        modulo.limpiar_snapshots_en_memoria()
+        base = _base_vacia(tmp_path)
+        base.importar_conocimiento(str(fuente))
+
+        assert len(base.insights_automaticos) == 1
+        assert pickle.loads(archivo_snapshot.read_bytes())["version"] == modulo.SNAPSHOT_SCHEMA_VERSION
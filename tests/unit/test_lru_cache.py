@@ -0,0 +1,115 @@
+"""
+Unit tests for the shared LRU/TTL cache and the language processor cache
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "python-scripts"))
+from cache_manager import LRUCache
+from language_processor import LanguageProcessor
+
+
+class MonitorFalso:
+    """Same cache interface as PerformanceMonitor, without Prometheus registration"""
+
+    def __init__(self):
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+
+    def record_cache_hit(self, cache_type):
+        self.cache_hits[cache_type] += 1
+
+    def record_cache_miss(self, cache_type):
+        self.cache_misses[cache_type] += 1
+
+
+class TestLRUCache:
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=3, max_bytes=None)
+        for key in "abc":
+            cache.set(key, key.upper())
+        assert cache.get("a") == "A"  # "b" is now the oldest
+        cache.set("d", "D")
+        assert "b" not in cache
+        assert [cache.get(k) for k in "acd"] == ["A", "C", "D"]
+        assert cache.stats["evictions"] == 1
+
+    def test_ttl_per_entry(self):
+        cache = LRUCache(ttl=60)
+        cache.set("corto", 1, ttl=0.05)
+        cache.set("largo", 2)
+        time.sleep(0.1)
+        assert cache.get("corto") is None
+        assert cache.get("largo") == 2
+        assert cache.stats["expirations"] == 1
+
+    def test_byte_limit(self):
+        cache = LRUCache(max_entries=100, max_bytes=1000, sizeof=lambda v: len(v) if isinstance(v, str) else 0)
+        for i in range(5):
+            cache.set(f"k{i}", "x" * 300)
+        assert cache.size_bytes <= 1000
+        assert len(cache) == 3
+        cache.set("enorme", "x" * 5000)
+        assert "enorme" not in cache
+
+    def test_negative_caching(self):
+        cache = LRUCache(negative_ttl=60)
+        llamadas = []
+
+        def cargar():
+            llamadas.append(1)
+            return None
+
+        assert cache.get_or_load("inexistente", cargar) is None
+        assert cache.get_or_load("inexistente", cargar) is None
+        assert len(llamadas) == 1
+        assert cache.stats["negative_hits"] == 1
+        assert cache.get("inexistente", "defecto") == "defecto"
+
+    def test_async_loads_are_coalesced(self):
+        cache = LRUCache()
+        llamadas = []
+
+        async def cargar():
+            llamadas.append(1)
+            await asyncio.sleep(0.01)
+            return "valor"
+
+        async def escenario():
+            return await asyncio.gather(*(cache.aget_or_load("k", cargar) for _ in range(10)))
+
+        assert asyncio.run(escenario()) == ["valor"] * 10
+        assert len(llamadas) == 1
+
+    def test_thread_safety(self):
+        cache = LRUCache(max_entries=50, max_bytes=None)
+
+        def trabajar(n):
+            for i in range(2000):
+                cache.set((n, i % 80), i)
+                cache.get((n, (i * 7) % 80))
+
+        hilos = [threading.Thread(target=trabajar, args=(n,)) for n in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        assert len(cache) == 50
+        assert cache.size_bytes == sum(entry[1] for entry in cache._entries.values())
+
+    def test_language_processor_reports_metrics(self):
+        monitor = MonitorFalso()
+        procesador = LanguageProcessor(enable_context=False)
+        procesador.cache.cache.monitor = monitor
+        primero = procesador.process_message("quiero cotizar isodec", session_id="a")
+        segundo = procesador.process_message("quiero cotizar isodec", session_id="b")
+
+        assert monitor.cache_misses["language_processor"] == 1
+        assert monitor.cache_hits["language_processor"] == 1
+        assert (primero.session_id, segundo.session_id) == ("a", "b")
+        assert procesador.export_stats()["cache_size"] == 1
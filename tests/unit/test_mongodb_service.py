@@ -0,0 +1,143 @@
+"""
+Unit tests for the pooled MongoDB client manager (mongomock stand-in)
+"""
+
+import mongomock
+import pytest
+from pymongo.errors import DuplicateKeyError, ServerSelectionTimeoutError
+
+import mongodb_service
+from mongodb_service import MongoClientManager
+
+URI = "mongodb://localhost:27017/bmc_test"
+
+
+class _AdminFalso:
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def command(self, nombre, *args, **kwargs):
+        self.cliente.pings += 1
+        if type(self.cliente).caido:
+            raise mongomock.ServerSelectionTimeoutError("servidor caído")
+        return {"ok": 1.0}
+
+
+class _ClienteFalso(mongomock.MongoClient):
+    """mongomock client whose ping can be made to fail and is counted"""
+
+    caido = False
+    creados = 0
+
+    def __init__(self, uri, **opciones):
+        super().__init__(uri)
+        self.opciones = opciones
+        self.pings = 0
+        type(self).creados += 1
+
+    @property
+    def admin(self):
+        return _AdminFalso(self)
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(_ClienteFalso, "caido", False)
+    monkeypatch.setattr(_ClienteFalso, "creados", 0)
+    return _ClienteFalso
+
+
+@pytest.fixture
+def manager(cliente):
+    manager = MongoClientManager(URI, heartbeat_interval=3600, client_factory=cliente)
+    yield manager
+    manager.close()
+
+
+class TestMongoClientManager:
+    def test_health_is_cached_and_handles_reused(self, manager):
+        assert manager.connect()
+        for _ in range(100):
+            assert manager.is_healthy()
+            coleccion = manager.get_collection("conversations")
+        assert manager.get_collection("conversations") is coleccion
+        assert manager.get_database().name == "bmc_test"
+        assert manager._client.pings == 1
+        assert manager._client.opciones["maxPoolSize"] == 50
+
+    def test_degraded_mode_and_recovery(self, manager, cliente):
+        cliente.caido = True
+        assert not manager.connect()
+        assert manager.degraded
+        assert manager.health()["last_error"]
+
+        cliente.caido = False
+        assert manager.ping()
+        assert not manager.degraded
+
+        manager.report_failure("timeout")
+        assert manager.degraded
+        manager.ping()
+        manager.set_degraded(True)
+        assert manager.degraded and manager.health()["forced_degraded"]
+
+    def test_fork_rebuilds_client(self, manager, cliente):
+        manager.connect()
+        original = manager._client
+        manager._pid = -1  # as seen from a forked child
+        assert manager.is_healthy()
+        assert manager._client is not original
+        assert cliente.creados == 2
+        assert manager.stats["forks"] == 1
+
+    def test_module_api_shares_one_service(self, monkeypatch, cliente):
+        monkeypatch.setenv("MONGODB_URI", URI)
+        monkeypatch.setattr(mongodb_service, "_managers", {})
+        monkeypatch.setattr(mongodb_service, "_services", {})
+        mongodb_service.get_client_manager(client_factory=cliente, heartbeat_interval=3600)
+
+        assert mongodb_service.ensure_mongodb_connected()
+        servicio = mongodb_service.get_mongodb_service()
+        assert servicio is mongodb_service.get_mongodb_service()
+        servicio.get_collection("context").insert_one({"a": 1})
+        assert servicio.get_collection("context").count_documents({}) == 1
+        assert cliente.creados == 1
+
+        cliente.caido = True
+        mongodb_service.get_client_manager().ping()
+        assert mongodb_service.get_mongodb_service() is None
+        mongodb_service.close_mongodb()
+
+    def test_failed_operations_switch_to_degraded_right_away(self, monkeypatch, cliente):
+        monkeypatch.setenv("MONGODB_URI", URI)
+        monkeypatch.setattr(mongodb_service, "_managers", {})
+        monkeypatch.setattr(mongodb_service, "_services", {})
+        manager = mongodb_service.get_client_manager(client_factory=cliente, heartbeat_interval=3600)
+        assert manager.connect()
+
+        assert not mongodb_service.report_failure(DuplicateKeyError("duplicado"))
+        assert not manager.degraded
+        assert mongodb_service.report_failure(ServerSelectionTimeoutError("sin servidor"))
+        assert manager.degraded and mongodb_service.get_mongodb_service() is None
+        mongodb_service.close_mongodb()
+
+    def test_knowledge_base_loads_through_the_shared_client(self, monkeypatch, cliente):
+        from base_conocimiento_dinamica import BaseConocimientoDinamica
+
+        monkeypatch.setattr(mongodb_service, "_managers", {})
+        manager = mongodb_service.get_client_manager(URI, client_factory=cliente, heartbeat_interval=3600)
+        manager.get_collection("kb_interactions").insert_one(
+            {"cliente_id": "099", "mensaje_cliente": "precio isodec", "timestamp": "2024-01-01T10:00:00"}
+        )
+
+        base = BaseConocimientoDinamica()
+        assert base._cargar_desde_mongodb(URI)
+        assert any(i.mensaje_cliente == "precio isodec" for i in base.interacciones)
+        assert cliente.creados == 1 and manager._client is not None
+        mongodb_service.close_mongodb()
+
+    def test_missing_uri_is_degraded(self, monkeypatch):
+        monkeypatch.delenv("MONGODB_URI", raising=False)
+        assert mongodb_service.get_client_manager() is None
+        assert not mongodb_service.ensure_mongodb_connected()
+        assert mongodb_service.get_mongodb_service() is None
@@ -0,0 +1,125 @@
+"""
+Unit tests for prompt assembly: compiled system prompt and token budget
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from ia_conversacional_integrada import ContextoConversacion, IAConversacionalIntegrada
+from presupuesto_prompt import PresupuestoExcedido, PresupuestoTokens, contar_tokens
+
+
+def _contexto(mensajes, resumen="", estado="inicial", datos_producto=None):
+    return ContextoConversacion(
+        cliente_id="099",
+        sesion_id="s1",
+        mensajes_intercambiados=[
+            {"tipo": "cliente" if i % 2 == 0 else "ia", "mensaje": texto}
+            for i, texto in enumerate(mensajes)
+        ],
+        intencion_actual="cotizacion",
+        entidades_extraidas={},
+        estado_cotizacion=estado,
+        datos_cliente={},
+        datos_producto=datos_producto or {},
+        historial_interacciones=[],
+        confianza_respuesta=0.8,
+        timestamp_inicio=datetime.datetime.now(),
+        timestamp_ultima_actividad=datetime.datetime.now(),
+        resumen_historial=resumen,
+    )
+
+
+@pytest.fixture(scope="module")
+def ia():
+    instancia = IAConversacionalIntegrada()
+    instancia.use_shared_context = False
+    return instancia
+
+
+class TestPromptBudget:
+    def _preparar(self, ia, contexto, mensaje="cuanto sale isodec 100mm?"):
+        ia.conversaciones_activas["099_s1"] = contexto
+        return ia._preparar_mensajes_openai(mensaje, "099", "s1")[1]
+
+    def test_static_prompt_is_compiled_once_per_catalog_version(self, ia, monkeypatch):
+        llamadas = []
+        original = ia._obtener_info_productos_para_prompt
+        monkeypatch.setattr(
+            ia, "_obtener_info_productos_para_prompt",
+            lambda: llamadas.append(1) or original(),
+        )
+        ia._prompts_compilados = {}
+        ia._version_prompts = None
+
+        primero = self._preparar(ia, _contexto(["hola"]))[0]["content"]
+        segundo = self._preparar(ia, _contexto(["otra conversación", "respuesta"]))[0]["content"]
+        assert primero == segundo
+        assert len(llamadas) == 1
+
+        ia.sistema_cotizaciones.actualizar_precio_producto("isodec", Decimal("175.00"))
+        tercero = self._preparar(ia, _contexto(["hola"]))[0]["content"]
+        assert len(llamadas) == 2
+        assert "175.00" in tercero and tercero != primero
+
+    def test_dynamic_sections_come_after_the_stable_prefix(self, ia):
+        mensajes = self._preparar(
+            ia,
+            _contexto(["hola", "buenas"], resumen="user: quiero techo",
+                      estado="recopilando_datos", datos_producto={"producto": "isodec"}),
+        )
+        assert "ESTADO ACTUAL" not in mensajes[0]["content"]
+        assert mensajes[1]["content"].startswith("ESTADO ACTUAL DE LA COTIZACIÓN")
+        assert mensajes[2]["content"].startswith("Resumen de la conversación anterior")
+        assert mensajes[-1] == {"role": "user", "content": "cuanto sale isodec 100mm?"}
+
+    def test_prompt_stays_within_budget(self, ia, monkeypatch):
+        monkeypatch.setattr(ia.presupuesto_prompt, "max_tokens", 900)
+        largo = "detalle de la cotización " * 400
+        mensajes = self._preparar(
+            ia,
+            _contexto([largo] * 5, resumen=largo, estado="recopilando_datos",
+                      datos_producto={"producto": "isodec", "notas": "x" * 200}),
+        )
+
+        assert ia.presupuesto_prompt.contar(mensajes) <= 900
+        # The most recent turns and the quote state survive; the summary goes first
+        assert not any(m["content"].startswith("Resumen") for m in mensajes)
+        assert any(m["content"].startswith("ESTADO ACTUAL") for m in mensajes)
+        assert mensajes[-1]["content"] == "cuanto sale isodec 100mm?"
+
+    def test_budgeter_drops_lowest_priority_then_truncates(self):
+        presupuesto = PresupuestoTokens(60)
+        mensajes = [
+            ({"role": "system", "content": "s" * 80}, None),
+            ({"role": "user", "content": "a" * 80}, 1),
+            ({"role": "assistant", "content": "b" * 80}, 2),
+            ({"role": "user", "content": "c" * 40}, None),
+        ]
+        resultado, tokens, descartados = presupuesto.ajustar(mensajes)
+
+        assert [m["content"][0] for m in resultado] == ["s", "c"]
+        assert descartados == 2
+        assert tokens <= 60
+
+        # Last resort trims the current message, never the system prompt
+        resultado, tokens, _ = PresupuestoTokens(34).ajustar(mensajes)
+        assert tokens <= 34
+        assert resultado[0]["content"] == "s" * 80
+        assert resultado[-1]["content"].startswith("c") and contar_tokens(resultado[-1]["content"]) < 10
+
+        with pytest.raises(PresupuestoExcedido):
+            PresupuestoTokens(28).ajustar(mensajes)
+
+    def test_oversized_system_prompt_falls_back_to_patterns(self, ia, monkeypatch):
+        monkeypatch.setattr(ia.presupuesto_prompt, "max_tokens", 50)
+        ia.conversaciones_activas["099_s1"] = _contexto(["hola"])
+        with pytest.raises(PresupuestoExcedido):
+            ia._preparar_mensajes_openai("cuanto sale isodec 100mm?", "099", "s1")
+
+        monkeypatch.setattr(ia, "use_ai", True)
+        monkeypatch.setattr(ia, "openai_client", object())
+        resultado = ia.procesar_mensaje_usuario("cuanto sale isodec 100mm?", "099", "s1")
+        assert resultado["mensaje"]
@@ -0,0 +1,234 @@
+"""
+Unit tests for the persistent quote repository
+"""
+
+import asyncio
+import datetime
+from decimal import Decimal
+
+import httpx
+import mongomock
+import pytest
+
+import mongodb_service
+from repositorio_cotizaciones import (
+    COLECCION_MONGODB,
+    RepositorioCotizaciones,
+    RepositorioCotizacionesMongoDB,
+    RepositorioCotizacionesSQLite,
+    normalizar_nombre,
+    crear_repositorio_cotizaciones,
+    normalizar_telefono,
+)
+from sistema_cotizaciones import Cliente, Cotizacion, EspecificacionCotizacion, SistemaCotizacionesBMC
+
+
+def _especificaciones():
+    return EspecificacionCotizacion(
+        producto="isodec",
+        espesor="100mm",
+        relleno="EPS",
+        largo_metros=Decimal("10.0"),
+        ancho_metros=Decimal("5.0"),
+        color="Blanco",
+    )
+
+
+def _crear(sistema, nombre, telefono, id_cotizacion):
+    especificaciones = _especificaciones()
+    precio_total, precio_metro_cuadrado = sistema.calcular_precio_cotizacion(especificaciones)
+    cotizacion = Cotizacion(
+        id=id_cotizacion,
+        cliente=Cliente(nombre, telefono, "Maldonado"),
+        especificaciones=especificaciones,
+        fecha=datetime.datetime.now(),
+        estado="Pendiente",
+        asignado_a="",
+        precio_total=precio_total,
+        precio_metro_cuadrado=precio_metro_cuadrado,
+    )
+    sistema.agregar_cotizacion(cotizacion)
+    return cotizacion
+
+
+@pytest.fixture(params=["sqlite", "mongodb"])
+def repositorio(request, tmp_path):
+    if request.param == "sqlite":
+        return RepositorioCotizacionesSQLite(tmp_path / "cotizaciones.sqlite3")
+    coleccion = mongomock.MongoClient().db.quotes
+    return RepositorioCotizacionesMongoDB(coleccion)
+
+
+@pytest.fixture
+def sistema(repositorio):
+    sistema = SistemaCotizacionesBMC(repositorio=repositorio)
+    sistema.actualizar_precio_producto("isodec", Decimal("150.00"))
+    return sistema
+
+
+class TestQuoteRepository:
+    def test_incomplete_backend_fails_at_instantiation(self):
+        class _SoloGuardar(RepositorioCotizaciones):
+            def guardar(self, cotizacion):
+                pass
+
+        with pytest.raises(TypeError):
+            _SoloGuardar()
+
+    def test_normalization(self):
+        assert normalizar_telefono("+598 94-807 926") == "94807926"
+        assert normalizar_telefono("094 807 926") == "94807926"
+        assert normalizar_telefono("2 901 1234") == "29011234"
+        assert normalizar_nombre("  María   PÉREZ ") == "maria perez"
+
+    def test_create_and_get_roundtrip(self, sistema):
+        cotizacion = _crear(sistema, "Gabriel", "094 807 926", "COT-1")
+
+        guardada = sistema.obtener_cotizacion("COT-1")
+        assert guardada == cotizacion
+        assert guardada.precio_total == Decimal("7500.00")
+        assert sistema.obtener_cotizacion("COT-inexistente") is None
+
+    def test_search_by_phone_name_and_date(self, sistema):
+        _crear(sistema, "María Pérez", "094 807 926", "COT-1")
+        _crear(sistema, "Mario Gómez", "099 111 222", "COT-2")
+
+        assert [c.id for c in sistema.buscar_cotizaciones_por_cliente(telefono="094807926")] == ["COT-1"]
+        assert {c.id for c in sistema.buscar_cotizaciones_por_cliente(nombre="mari")} == {"COT-1", "COT-2"}
+        assert [c.id for c in sistema.buscar_cotizaciones_por_cliente(nombre="MARÍA")] == ["COT-1"]
+
+        ahora = datetime.datetime.now()
+        rango = sistema.buscar_cotizaciones_por_fecha(ahora - datetime.timedelta(hours=1), ahora)
+        assert {c.id for c in rango} >= {"COT-1", "COT-2"}
+        assert sistema.buscar_cotizaciones_por_fecha(ahora + datetime.timedelta(days=1),
+                                                     ahora + datetime.timedelta(days=2)) == []
+
+    def test_search_by_surname_and_national_number(self, sistema):
+        _crear(sistema, "Juan Pérez", "+598 99 123 456", "COT-1")
+        _crear(sistema, "Pereira Gómez", "2 901 1234", "COT-2")
+
+        assert {c.id for c in sistema.buscar_cotizaciones_por_cliente(nombre="Perez")} == {"COT-1"}
+        assert {c.id for c in sistema.buscar_cotizaciones_por_cliente(nombre="pere")} == {"COT-1", "COT-2"}
+        assert [c.id for c in sistema.buscar_cotizaciones_por_cliente(nombre="juan perez")] == ["COT-1"]
+        # No word starts with it: falls back to a substring match
+        assert [c.id for c in sistema.buscar_cotizaciones_por_cliente(nombre="ome")] == ["COT-2"]
+        assert sistema.buscar_cotizaciones_por_cliente(nombre="lopez") == []
+
+        assert [c.id for c in sistema.buscar_cotizaciones_por_cliente(telefono="099123456")] == ["COT-1"]
+        assert [c.id for c in sistema.buscar_cotizaciones_por_cliente(telefono="123 456")] == ["COT-1"]
+        assert [c.id for c in sistema.buscar_cotizaciones_por_cliente(telefono="+598 2901 1234")] == ["COT-2"]
+
+    def test_update_status(self, sistema):
+        _crear(sistema, "Gabriel", "094 807 926", "COT-1")
+
+        assert sistema.actualizar_estado_cotizacion("COT-1", "Enviado")
+        assert not sistema.actualizar_estado_cotizacion("COT-X", "Enviado")
+        assert sistema.obtener_cotizacion("COT-1").estado == "Enviado"
+
+    def test_count_and_limit_without_full_listing(self, sistema, monkeypatch):
+        for i in range(3):
+            _crear(sistema, "Gabriel", "094 807 926", f"COT-{i}")
+        limites = []
+        listar = sistema.repositorio.listar
+        monkeypatch.setattr(sistema.repositorio, "listar", lambda limite=None: limites.append(limite) or listar(limite))
+
+        assert sistema.contar_cotizaciones() == 3
+        assert len(sistema.listar_cotizaciones(2)) == 2
+        assert limites == [2]
+
+
+class TestSQLitePersistence:
+    def test_quotes_survive_new_instances(self, tmp_path):
+        ruta = tmp_path / "cotizaciones.sqlite3"
+        sistema = SistemaCotizacionesBMC(repositorio=RepositorioCotizacionesSQLite(ruta))
+        _crear(sistema, "Gabriel", "094 807 926", "COT-1")
+
+        otro = SistemaCotizacionesBMC(repositorio=RepositorioCotizacionesSQLite(ruta))
+        assert otro.obtener_cotizacion("COT-1").cliente.nombre == "Gabriel"
+        assert len(otro.cotizaciones) == 1
+
+    def test_lookups_use_indexes(self, tmp_path):
+        repositorio = RepositorioCotizacionesSQLite(tmp_path / "cotizaciones.sqlite3")
+        consultas = {
+            "id": "SELECT * FROM cotizaciones WHERE id = 'x'",
+            "telefono": "SELECT * FROM cotizaciones WHERE telefono_normalizado = 'x'",
+            "nombre": "SELECT id FROM cotizaciones_palabras WHERE palabra >= 'a' AND palabra < 'b'",
+            "fecha": "SELECT * FROM cotizaciones WHERE fecha >= 'a' AND fecha <= 'b'",
+        }
+        for campo, consulta in consultas.items():
+            plan = " ".join(str(fila) for fila in repositorio.conn.execute(f"EXPLAIN QUERY PLAN {consulta}"))
+            assert "SEARCH" in plan and "USING" in plan, (campo, plan)
+
+
+    def test_existing_rows_are_migrated(self, tmp_path):
+        ruta = tmp_path / "cotizaciones.sqlite3"
+        sistema = SistemaCotizacionesBMC(repositorio=RepositorioCotizacionesSQLite(ruta))
+        _crear(sistema, "Juan Pérez", "+598 99 123 456", "COT-1")
+        # As written by the previous schema: all digits and no word index
+        with sistema.repositorio.conn as conn:
+            conn.execute("UPDATE cotizaciones SET telefono_normalizado = '59899123456'")
+            conn.execute("DELETE FROM cotizaciones_palabras")
+            conn.execute("PRAGMA user_version = 0")
+
+        otro = SistemaCotizacionesBMC(repositorio=RepositorioCotizacionesSQLite(ruta))
+        assert [c.id for c in otro.buscar_cotizaciones_por_cliente(telefono="099123456")] == ["COT-1"]
+        assert [c.id for c in otro.buscar_cotizaciones_por_cliente(nombre="Perez")] == ["COT-1"]
+
+
+class TestMongoDBCollection:
+    def test_does_not_touch_the_dashboard_quotes_collection(self, monkeypatch):
+        db = mongomock.MongoClient().bmc_test
+        db.quotes.create_index("arg", unique=True)
+        db.quotes.insert_one({"arg": "ARG-1", "cliente": "Ana", "telefono": "099111222"})
+
+        class _Servicio:
+            def get_collection(self, nombre):
+                return db[nombre]
+
+        monkeypatch.setenv("MONGODB_URI", "mongodb://localhost:27017/bmc_test")
+        monkeypatch.setattr(mongodb_service, "get_mongodb_service", lambda: _Servicio())
+        sistema = SistemaCotizacionesBMC(repositorio=crear_repositorio_cotizaciones())
+        sistema.actualizar_precio_producto("isodec", Decimal("150.00"))
+        _crear(sistema, "Gabriel", "094 807 926", "COT-1")
+        _crear(sistema, "María", "099 111 222", "COT-2")
+
+        assert COLECCION_MONGODB != "quotes"
+        assert sistema.contar_cotizaciones() == 2
+        assert list(db.quotes.find({}, {"_id": 0})) == [{"arg": "ARG-1", "cliente": "Ana", "telefono": "099111222"}]
+        assert set(db.quotes.index_information()) == {"_id_", "arg_1"}
+
+
+class TestQuoteEndpoints:
+    def test_created_quote_can_be_fetched(self, tmp_path, app_integrada):
+        app = app_integrada
+        app.state.cotizaciones = SistemaCotizacionesBMC(
+            repositorio=RepositorioCotizacionesSQLite(tmp_path / "cotizaciones.sqlite3")
+        )
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                creada = await client.post(
+                    "/api/quotes",
+                    json={
+                        "customer_name": "Gabriel",
+                        "phone": "094 807 926",
+                        "product": "isodec",
+                        "thickness": "100mm",
+                        "length": 10,
+                        "width": 5,
+                    },
+                )
+                obtenida = await client.get(f"/api/quotes/{creada.json()['quote_id']}")
+                faltante = await client.get("/api/quotes/COT-inexistente")
+                return creada, obtenida, faltante
+
+        try:
+            creada, obtenida, faltante = asyncio.run(run())
+        finally:
+            app.state.cotizaciones = None
+
+        assert creada.status_code == 200
+        assert obtenida.status_code == 200
+        assert obtenida.json()["customer"]["phone"] == "094 807 926"
+        assert faltante.status_code == 404
@@ -0,0 +1,138 @@
+"""
+Unit tests for the UnifiedModelIntegrator response cache and single-flight
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from model_integrator import ModelConfig, ModelProvider, UnifiedModelIntegrator
+from utils.response_cache import ResponseCache, make_cache_key
+
+
+@pytest.fixture
+def integrador(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    for variable in ("OPENAI_API_KEY", "GROQ_API_KEY", "GEMINI_API_KEY", "GROK_API_KEY",
+                     "MODEL_RESPONSE_CACHE_PATH"):
+        monkeypatch.delenv(variable, raising=False)
+    integrador = UnifiedModelIntegrator()
+    integrador.models = {
+        "openai_fake": ModelConfig(
+            provider=ModelProvider.OPENAI,
+            model_name="fake",
+            api_key="test",
+            cost_per_1k_tokens_input=0.001,
+            cost_per_1k_tokens_output=0.002,
+        )
+    }
+    integrador.llamadas = []
+
+    def proveedor_falso(prompt, system_prompt, model, temperature, max_tokens, **kwargs):
+        integrador.llamadas.append(prompt)
+        time.sleep(getattr(integrador, "demora", 0))
+        return {"content": f"respuesta a {prompt}", "tokens_input": 100, "tokens_output": 50}
+
+    integrador._generate_openai = proveedor_falso
+    return integrador
+
+
+class TestResponseCache:
+    def test_repeated_prompt_is_served_from_cache(self, integrador):
+        primera = integrador.generate("Precio Isodec 100mm", system_prompt="sistema")
+        segunda = integrador.generate("  precio   isodec 100mm ", system_prompt="sistema")
+
+        assert integrador.llamadas == ["Precio Isodec 100mm"]
+        assert segunda["content"] == primera["content"]
+        assert segunda["cached"] is True
+        assert segunda["cost"] == 0.0
+
+        stats = integrador.get_usage_summary()["response_cache"]
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_rate"] == pytest.approx(0.5)
+        assert stats["saved_tokens"] == 150
+
+    def test_key_includes_generation_parameters(self, integrador):
+        integrador.generate("que es lana de roca", temperature=0.2)
+        integrador.generate("que es lana de roca", temperature=0.9)
+        integrador.generate("que es lana de roca", temperature=0.2, max_tokens=10)
+        integrador.generate("que es lana de roca", system_prompt="otro sistema", temperature=0.2)
+        integrador.generate("que es lana de roca", temperature=0.2, use_cache=False)
+
+        assert len(integrador.llamadas) == 5
+
+    def test_concurrent_identical_requests_share_one_call(self, integrador):
+        integrador.demora = 0.1
+        resultados = []
+        hilos = [
+            threading.Thread(target=lambda: resultados.append(integrador.generate("hola")))
+            for _ in range(8)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        assert integrador.llamadas == ["hola"]
+        assert len(resultados) == 8
+        assert {r["content"] for r in resultados} == {"respuesta a hola"}
+        assert integrador.get_response_cache_stats()["coalesced"] == 7
+
+    def test_catalog_change_invalidates(self, integrador):
+        catalogo = {"version": 1}
+        integrador.catalog_version_source = lambda: catalogo["version"]
+        integrador.generate("precio isodec")
+        integrador.generate("precio isodec")
+        catalogo["version"] = 2
+        integrador.generate("precio isodec")
+
+        assert len(integrador.llamadas) == 2
+
+    def test_failed_responses_are_not_cached(self, integrador):
+        def proveedor_roto(*args, **kwargs):
+            integrador.llamadas.append("error")
+            raise RuntimeError("timeout")
+
+        integrador._generate_openai = proveedor_roto
+        assert integrador.generate("hola")["success"] is False
+        assert integrador.generate("hola")["success"] is False
+        assert integrador.llamadas == ["error", "error"]
+
+    def test_stats_are_saved_with_usage_stats(self, integrador, tmp_path):
+        integrador.generate("hola")
+        integrador.generate("hola")
+        integrador.save_usage_stats()
+
+        datos = json.loads((tmp_path / "model_usage_stats.json").read_text())
+        assert datos["_response_cache"]["saved_tokens"] == 150
+
+        recargado = UnifiedModelIntegrator()
+        assert recargado.get_response_cache_stats()["saved_tokens"] == 150
+        assert "_response_cache" not in recargado.usage_stats
+
+    def test_size_limits_and_ttl(self):
+        cache = ResponseCache(ttl=3600, max_entries=3)
+        for i in range(5):
+            cache.put(f"k{i}", {"content": "x"})
+        assert len(cache) == 3
+        assert cache.get("k0") is None and cache.get("k4") is not None
+
+        cache = ResponseCache(ttl=3600, max_bytes=100)
+        for i in range(5):
+            cache.put(f"k{i}", {"content": "x" * 30})
+        assert cache.size_bytes <= 100
+
+        cache = ResponseCache(ttl=-1)
+        cache.put("k", {"content": "x"})
+        assert cache.get("k") is None
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        ruta = str(tmp_path / "respuestas.sqlite3")
+        clave = make_cache_key("m", [{"role": "user", "content": "hola"}], 0.7, 100)
+        ResponseCache(disk_path=ruta).put(clave, {"content": "guardado"})
+
+        cache = ResponseCache(disk_path=ruta)
+        assert cache.get(clave) == {"content": "guardado"}
+        assert cache.stats["disk_hits"] == 1
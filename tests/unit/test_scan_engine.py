@@ -0,0 +1,113 @@
+"""
+Unit tests for the shared scan engine (walk, hashing pool, duplicate detection)
+"""
+
+import glob
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "backup_system"))
+sys.path.append(str(Path(__file__).parent.parent.parent))
+import scan_engine as modulo_scan
+from file_scanner import FileScanner
+from scan_engine import ScanEngine, compile_patterns
+from storage_cleanup_assistant import StorageAnalyzer
+
+HACE_UN_ANO = time.time() - 365 * 86400
+
+
+def _escribir(ruta, datos):
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.write_bytes(datos)
+    os.utime(ruta, (HACE_UN_ANO, HACE_UN_ANO))
+
+
+@pytest.fixture
+def arbol(tmp_path):
+    comun = os.urandom(200_000)
+    _escribir(tmp_path / "a" / "copia_1.bin", comun)
+    _escribir(tmp_path / "b" / "c" / "copia_2.bin", comun)
+    # Same size and first block as the copies, different tail
+    _escribir(tmp_path / "b" / "casi.bin", comun[:-1] + b"\0")
+    _escribir(tmp_path / "unico.bin", os.urandom(150_000))
+    _escribir(tmp_path / "a" / "chico_1.txt", b"hola")
+    _escribir(tmp_path / "b" / "chico_2.txt", b"hola")
+    _escribir(tmp_path / "a" / "config.json", b"{}")
+    _escribir(tmp_path / ".oculto" / "config.json", b"{\"a\": 1}")
+    _escribir(tmp_path / "node_modules" / "lib" / "copia.bin", comun)
+    return tmp_path
+
+
+def _hashes(monkeypatch):
+    llamadas = []
+    original = modulo_scan.file_checksum
+    monkeypatch.setattr(modulo_scan, "file_checksum",
+                        lambda ruta, limit=None: llamadas.append((Path(ruta).name, limit)) or original(ruta, limit))
+    return llamadas
+
+
+class TestScanEngine:
+    @pytest.mark.parametrize("patron", ["*.bin", "**/*.json", "a/*", "b/**/*.bin", "**/copia_?.bin", "*/[ab]*"])
+    def test_patterns_match_like_glob(self, arbol, patron):
+        esperado = sorted(os.path.relpath(r, arbol) for r in glob.glob(str(arbol / patron), recursive=True)
+                          if os.path.isfile(r))
+        coincide = compile_patterns([patron])
+        encontrado = sorted(e.rel_path for e in ScanEngine().walk(str(arbol)) if coincide(e.rel_path))
+        assert encontrado == esperado
+
+    def test_duplicates_only_hash_colliding_files_in_full(self, arbol, monkeypatch):
+        llamadas = _hashes(monkeypatch)
+        motor = ScanEngine(workers=4)
+        grupos = motor.find_duplicates(motor.walk(str(arbol)))
+
+        assert [(g.files, g.size) for g in grupos] == [
+            (["a/copia_1.bin", "b/c/copia_2.bin", "node_modules/lib/copia.bin"], 200_000),
+            (["a/chico_1.txt", "b/chico_2.txt"], 4),
+        ]
+        completos = sorted(nombre for nombre, limite in llamadas if limite is None)
+        # unico.bin has a unique size and is never read; small files are hashed whole once
+        assert "unico.bin" not in {nombre for nombre, _ in llamadas}
+        assert completos == ["casi.bin", "chico_1.txt", "chico_2.txt", "copia.bin", "copia_1.bin", "copia_2.bin"]
+
+    def test_cache_skips_unchanged_files(self, arbol, monkeypatch, tmp_path_factory):
+        cache = str(tmp_path_factory.mktemp("cache") / "hashes.json")
+        motor = ScanEngine(cache_file=cache)
+        primero = motor.find_duplicates(motor.walk(str(arbol)))
+        motor.save_cache()
+
+        llamadas = _hashes(monkeypatch)
+        motor = ScanEngine(cache_file=cache)
+        assert motor.find_duplicates(motor.walk(str(arbol))) == primero
+        assert llamadas == []
+
+        editado = arbol / "b" / "c" / "copia_2.bin"
+        _escribir(editado, os.urandom(200_000))
+        os.utime(editado, (HACE_UN_ANO, HACE_UN_ANO + 1))
+        grupos = motor.find_duplicates(motor.walk(str(arbol)))
+        assert grupos[0].files == ["a/copia_1.bin", "node_modules/lib/copia.bin"]
+        assert {nombre for nombre, _ in llamadas} == {"copia_2.bin"}
+
+    def test_file_scanner_uses_the_engine(self, arbol):
+        scanner = FileScanner(str(arbol))
+        encontrados = scanner.scan_directory("b", ["**/*.bin", "*.txt"])
+        assert sorted(f.path for f in encontrados) == ["b/c/copia_2.bin", "b/casi.bin", "b/chico_2.txt"]
+        assert all(f.exists and f.size for f in encontrados)
+        assert [f.path for f in scanner.scan_directory("b", ["*.bin"])] == ["b/casi.bin"]
+
+        grupos = scanner.find_duplicates(["a/copia_1.bin", "b/c/copia_2.bin", "b/casi.bin", "no_existe.bin"])
+        assert [g.files for g in grupos] == [["a/copia_1.bin", "b/c/copia_2.bin"]]
+
+    def test_storage_analyzer_single_pass(self, arbol):
+        resultados = StorageAnalyzer(str(arbol)).analyze_storage(find_duplicates=True)
+        assert resultados['file_count'] == 9
+        assert resultados['directory_count'] == 6
+        assert resultados['node_modules'][0]['size'] == 200_000
+        assert len(resultados['old_files']) == 9
+        # node_modules is excluded from duplicate candidates
+        assert [d['files'] for d in resultados['duplicate_candidates']] == [
+            ["a/copia_1.bin", "b/c/copia_2.bin"], ["a/chico_1.txt", "b/chico_2.txt"]]
+        assert resultados['duplicate_candidates'][0]['size'] == 200_000
@@ -0,0 +1,235 @@
+"""
+Unit tests for the SharedContextService cache, write-behind queue and
+bounded message log
+"""
+
+import sys
+from pathlib import Path
+
+import mongomock
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "python-scripts"))
+
+import shared_context_service as modulo  # noqa: E402
+from shared_context_service import SharedContextService  # noqa: E402
+
+
+class _ColeccionContada:
+    """Wraps a mongomock collection and counts calls that hit the server"""
+
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.llamadas = []
+
+    def bulk_write(self, operaciones, ordered=True):
+        # mongomock's bulk_write does not accept current pymongo UpdateOne
+        # objects, so apply them one by one while counting a single call
+        self.llamadas.append("bulk_write")
+        for operacion in operaciones:
+            self.coleccion.update_one(operacion._filter, operacion._doc, upsert=operacion._upsert)
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self.coleccion, nombre)
+        if nombre in ("find_one", "find", "update_one", "insert_one"):
+            def contada(*args, **kwargs):
+                self.llamadas.append(nombre)
+                return atributo(*args, **kwargs)
+            return contada
+        return atributo
+
+
+class _MongoFalso:
+    def __init__(self):
+        self.db = mongomock.MongoClient().db
+        self.colecciones = {}
+        self.health_checks = 0
+
+    def get_collection(self, nombre):
+        if nombre not in self.colecciones:
+            self.colecciones[nombre] = _ColeccionContada(self.db[nombre])
+        return self.colecciones[nombre]
+
+    def ensure_connected(self):
+        self.health_checks += 1
+        return True
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    falso = _MongoFalso()
+    monkeypatch.setattr(modulo, "MONGODB_AVAILABLE", True)
+    monkeypatch.setattr(modulo, "ensure_mongodb_connected", falso.ensure_connected)
+    monkeypatch.setattr(modulo, "get_mongodb_service", lambda: falso)
+    return falso
+
+
+@pytest.fixture
+def servicio(mongo):
+    servicio = SharedContextService(flush_interval=3600)
+    yield servicio
+    servicio.close()
+
+
+def _turno(servicio, sesion, telefono, texto):
+    """Same calls IAConversacionalIntegrada.procesar_mensaje makes per message"""
+    servicio.get_context(sesion, telefono)
+    servicio.save_context(sesion, {"user_phone": telefono, "intent": "cotizacion"})
+    servicio.add_message(sesion, texto, "user")
+    servicio.add_message(sesion, f"respuesta a {texto}", "assistant")
+
+
+class TestSharedContextCache:
+    def test_writes_are_coalesced_into_one_bulk_write(self, servicio, mongo):
+        for i in range(20):
+            _turno(servicio, "s1", "099", f"mensaje {i}")
+
+        coleccion = mongo.get_collection("context")
+        assert coleccion.llamadas == ["find_one"]
+        assert servicio.flush() > 0
+        assert coleccion.llamadas == ["find_one", "bulk_write"]
+        assert mongo.health_checks == 1
+
+        documento = coleccion.coleccion.find_one({"session_id": "s1"})
+        assert documento["intent"] == "cotizacion"
+        assert documento["messages"][-1]["content"] == "respuesta a mensaje 19"
+        assert documento["message_count"] == 40
+
+    def test_at_most_one_round_trip_per_message(self, servicio, mongo):
+        mensajes = 50
+        for i in range(mensajes):
+            _turno(servicio, f"s{i % 5}", "099", f"mensaje {i}")
+            if i % 10 == 9:
+                servicio.flush()
+
+        assert len(mongo.get_collection("context").llamadas) <= mensajes
+
+    def test_reads_see_queued_writes_after_eviction(self, mongo):
+        servicio = SharedContextService(cache_size=1, flush_interval=3600)
+        servicio.save_context("s1", {"user_phone": "099", "intent": "saludo"})
+        servicio.save_context("s2", {"user_phone": "098", "intent": "otro"})
+
+        assert servicio.get_context("s1", "099")["intent"] == "saludo"
+        servicio.close()
+
+    def test_expired_entries_are_reloaded(self, mongo):
+        servicio = SharedContextService(cache_ttl=0.000001, flush_interval=3600)
+        servicio.save_context("s1", {"user_phone": "099", "intent": "saludo"})
+        servicio.flush()
+
+        assert servicio.get_context("s1", "099")["intent"] == "saludo"
+        assert servicio.stats["cache_misses"] == 1
+        servicio.close()
+
+    def test_failed_flush_keeps_writes_queued(self, servicio, mongo, monkeypatch):
+        servicio.save_context("s1", {"user_phone": "099", "intent": "saludo"})
+        monkeypatch.setattr(modulo, "get_mongodb_service", lambda: None)
+        assert servicio.flush() == 0
+
+        monkeypatch.setattr(modulo, "get_mongodb_service", lambda: mongo)
+        assert servicio.flush() == 1
+        assert mongo.get_collection("context").coleccion.count_documents({}) == 1
+
+    def test_background_writer_flushes(self, mongo):
+        servicio = SharedContextService(flush_interval=0.01)
+        servicio.save_context("s1", {"user_phone": "099", "intent": "saludo"})
+        servicio._writer.join(timeout=0.2)
+
+        assert mongo.get_collection("context").coleccion.count_documents({}) == 1
+        servicio.close()
+
+
+class TestBoundedMessageLog:
+    @pytest.fixture
+    def servicio(self, mongo):
+        servicio = SharedContextService(flush_interval=3600, max_messages=6)
+        yield servicio
+        servicio.close()
+
+    def test_window_is_bounded_and_summarized(self, servicio, mongo):
+        for i in range(10):
+            _turno(servicio, "s1", "099", f"mensaje {i}")
+        servicio.flush()
+
+        documento = mongo.get_collection("context").coleccion.find_one({"session_id": "s1"})
+        assert [m["content"] for m in documento["messages"]] == [
+            "mensaje 7", "respuesta a mensaje 7",
+            "mensaje 8", "respuesta a mensaje 8",
+            "mensaje 9", "respuesta a mensaje 9",
+        ]
+        assert documento["message_count"] == 20
+
+        # Another worker reads the summary from MongoDB, not from its cache
+        otro = SharedContextService(flush_interval=3600, max_messages=6)
+        leido = otro.get_context("s1", "099")
+        assert leido["summary"].startswith("user: mensaje 0\n")
+        assert leido["summary"].endswith("assistant: respuesta a mensaje 6")
+        assert "summary_lines" not in leido
+
+        cacheado = servicio.get_context("s1", "099")
+        assert [m["content"] for m in cacheado["messages"]] == [
+            m["content"] for m in documento["messages"]
+        ]
+        assert cacheado["summary"] == leido["summary"]
+
+    def test_uncached_sessions_are_summarized(self, servicio, mongo):
+        servicio.save_context("s1", {"user_phone": "099", "intent": "saludo"})
+        servicio.flush()
+        # Two workers, neither holding the session in cache
+        otro = SharedContextService(flush_interval=3600, max_messages=6)
+        for i in range(10):
+            (servicio if i % 2 else otro).add_message("s1", f"mensaje {i}", "user")
+            (servicio if i % 2 else otro).flush()
+
+        contexto = SharedContextService(max_messages=6).get_context("s1", "099")
+        assert [m["content"] for m in contexto["messages"]] == [f"mensaje {i}" for i in range(4, 10)]
+        assert contexto["summary"] == "\n".join(f"user: mensaje {i}" for i in range(4))
+
+    def test_save_context_never_rewrites_history(self, servicio, mongo):
+        _turno(servicio, "s1", "099", "hola")
+        servicio.save_context("s1", {"user_phone": "099", "messages": [], "summary": "x"})
+        servicio.flush()
+
+        documento = mongo.get_collection("context").coleccion.find_one({"session_id": "s1"})
+        assert len(documento["messages"]) == 2
+        assert "summary" not in documento
+
+    def test_write_size_does_not_grow_with_history(self, servicio, mongo):
+        enviados = []
+        coleccion = mongo.get_collection("context")
+        original = coleccion.bulk_write
+
+        def registrar(operaciones, ordered=True):
+            enviados.append(sum(len(repr(op._doc)) for op in operaciones))
+            return original(operaciones, ordered=ordered)
+
+        coleccion.bulk_write = registrar
+        for i in range(200):
+            _turno(servicio, "s1", "099", "mensaje de largo fijo")
+            servicio.flush()
+
+        # Once the summary is at its size limit, every turn sends the same bytes
+        assert max(enviados[-50:]) <= enviados[-50] + 20
+
+    def test_summary_is_capped(self, servicio):
+        servicio.summary_max_chars = 200
+        contexto = {}
+        for i in range(100):
+            servicio._append_to_window(contexto, [{"role": "user", "content": "x" * 500}])
+
+        assert len(contexto["summary"]) <= 200
+        assert len(contexto["messages"]) == 6
+        assert contexto["message_count"] == 100
+
+    def test_in_memory_fallback_is_bounded(self, monkeypatch):
+        monkeypatch.setattr(modulo, "MONGODB_AVAILABLE", False)
+        servicio = SharedContextService(max_messages=3)
+        servicio.save_context("s1", {"user_phone": "099", "intent": "saludo"})
+        for i in range(5):
+            servicio.add_message("s1", f"mensaje {i}", "user")
+        servicio.save_context("s1", {"user_phone": "099", "intent": "cotizacion"})
+
+        contexto = servicio.get_context("s1", "099")
+        assert [m["content"] for m in contexto["messages"]] == ["mensaje 2", "mensaje 3", "mensaje 4"]
+        assert contexto["summary"] == "user: mensaje 0\nuser: mensaje 1"
+        assert contexto["intent"] == "cotizacion"
@@ -0,0 +1,133 @@
+"""
+Unit tests for the journaled context/state storage (system/context)
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "system" / "context"))
+import state_journal as modulo_journal
+from context_service import ContextService
+from snapshot_manager import SnapshotManager
+from state_journal import SEQ_KEY
+from state_manager import StateManager
+from state_persistence import StatePersistence
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return str(tmp_path / "shared_context.json")
+
+
+class TestStateJournal:
+    def test_recovery_replays_snapshot_and_journal(self, ruta):
+        servicio = ContextService(ruta)
+        servicio.set_agent_context("ventas", {"cliente": "Ana"})
+        servicio.set_shared_data("cotizacion", {"total": 1500})
+        for i in range(120):
+            servicio.emit_event("mensaje", {"n": i})
+        tamano_snapshot = os.path.getsize(ruta)
+        servicio.close()
+
+        # Writes only append to the journal; the snapshot is not rewritten
+        assert os.path.getsize(ruta) == tamano_snapshot
+        recuperado = ContextService(ruta)
+        assert recuperado.get_agent_context("ventas") == {"cliente": "Ana"}
+        assert recuperado.get_shared_data("cotizacion") == {"total": 1500}
+        eventos = recuperado.get_recent_events(limit=200)
+        assert [e["data"]["n"] for e in eventos] == list(range(20, 120))
+
+    def test_torn_tail_is_discarded(self, ruta):
+        servicio = ContextService(ruta)
+        servicio.set_shared_data("a", 1)
+        servicio.set_shared_data("b", 2)
+        servicio.close()
+        with open(ruta + ".journal", "ab") as f:
+            f.write(b'{"seq":3,"ops":[["set",["shared_data","c"],{"val')
+
+        recuperado = ContextService(ruta)
+        assert recuperado.get_shared_data("b") == 2
+        assert recuperado.get_shared_data("c") is None
+        recuperado.set_shared_data("c", 3)
+        recuperado.close()
+        assert ContextService(ruta).get_shared_data("c") == 3
+
+    def test_compaction_is_atomic_and_idempotent(self, ruta):
+        servicio = ContextService(ruta)
+        servicio.journal.compact_min_bytes = 0
+        for i in range(5):
+            servicio.emit_event("mensaje", {"n": i})
+        with open(ruta + ".journal", "rb") as f:
+            registros = f.read()
+
+        servicio.compact()
+        assert servicio.journal.stats()["journal_bytes"] == 0
+        with open(ruta, encoding="utf-8") as f:
+            assert json.load(f)[SEQ_KEY] == servicio.journal.stats()["seq"]
+        assert not os.path.exists(ruta + ".tmp")
+        servicio.close()
+
+        # Crash after the rename but before truncating: old records are skipped
+        with open(ruta + ".journal", "wb") as f:
+            f.write(registros)
+        recuperado = ContextService(ruta)
+        assert len(recuperado.get_recent_events(limit=100)) == 5
+
+    def test_fsync_is_batched(self, ruta, monkeypatch):
+        servicio = ContextService(ruta, sync_every=10, sync_interval=3600)
+        llamadas = []
+        original = modulo_journal.os.fsync
+        monkeypatch.setattr(modulo_journal.os, "fsync", lambda fd: llamadas.append(fd) or original(fd))
+        for i in range(25):
+            servicio.set_shared_data(f"clave_{i}", i)
+        assert len(llamadas) == 2
+        servicio.flush()
+        assert len(llamadas) == 3
+        servicio.close()
+
+    def test_pending_tail_is_synced_after_the_interval(self, ruta, monkeypatch):
+        servicio = ContextService(ruta, sync_every=10, sync_interval=0.05)
+        llamadas = []
+        original = modulo_journal.os.fsync
+        monkeypatch.setattr(modulo_journal.os, "fsync", lambda fd: llamadas.append(fd) or original(fd))
+        servicio.set_shared_data("a", 1)
+        assert servicio.journal.stats()["unsynced_records"] == 1
+
+        limite = time.monotonic() + 2
+        while servicio.journal.stats()["unsynced_records"] and time.monotonic() < limite:
+            time.sleep(0.01)
+        assert servicio.journal.stats()["unsynced_records"] == 0
+        assert len(llamadas) == 1
+        servicio.close()
+
+    def test_writes_after_close_raise(self, ruta):
+        servicio = ContextService(ruta)
+        servicio.set_shared_data("a", 1)
+        servicio.close()
+        servicio.flush()
+        with pytest.raises(ValueError, match="cerrado"):
+            servicio.set_shared_data("b", 2)
+        with pytest.raises(ValueError, match="cerrado"):
+            servicio.compact()
+        assert ContextService(ruta).get_shared_data("a") == 1
+
+    def test_state_persistence_uses_the_journal(self, tmp_path):
+        manager = StateManager(str(tmp_path / "state.json"))
+        manager.set_phase_state(1, "completed")
+        persistence = StatePersistence(manager, str(tmp_path / "snapshots"))
+        persistence.create_snapshot("antes")
+        manager.set_task_state("T1.1", "completed")
+
+        snapshots = SnapshotManager(persistence)
+        assert snapshots.get_latest_snapshot() == "antes"
+        assert snapshots.restore_from_snapshot("antes")
+        assert manager.get_all_tasks() == {}
+
+        recuperado = StateManager(str(tmp_path / "state.json"))
+        assert recuperado.get_phase_state(1)["state"] == "completed"
+        assert recuperado.get_all_tasks() == {}
@@ -0,0 +1,182 @@
+"""
+Unit tests for streaming generation (generate_stream) and /api/chat/stream
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from model_integrator import ModelConfig, ModelProvider, UnifiedModelIntegrator
+
+
+def _chunk(texto=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=texto))] if texto is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class _ClienteFalso:
+    """OpenAI-compatible client whose stream injects latency per chunk"""
+
+    def __init__(self, textos, demora=0.0, error_en=None):
+        self.textos = textos
+        self.demora = demora
+        self.error_en = error_en
+        self.peticiones = []
+        self.cerrado = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.peticiones.append(kwargs)
+        return self._stream()
+
+    def _stream(self):
+        try:
+            for indice, texto in enumerate(self.textos):
+                if indice == self.error_en:
+                    raise RuntimeError("connection reset")
+                time.sleep(self.demora)
+                yield _chunk(texto)
+            yield _chunk(usage=SimpleNamespace(prompt_tokens=12, completion_tokens=len(self.textos)))
+        finally:
+            self.cerrado = True
+
+
+@pytest.fixture
+def integrador(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    for variable in ("OPENAI_API_KEY", "GROQ_API_KEY", "GEMINI_API_KEY", "GROK_API_KEY"):
+        monkeypatch.delenv(variable, raising=False)
+    integrador = UnifiedModelIntegrator()
+    integrador.models = {
+        "openai_fake": ModelConfig(
+            provider=ModelProvider.OPENAI, model_name="fake", api_key="test",
+            cost_per_1k_tokens_input=0.001, cost_per_1k_tokens_output=0.002,
+        )
+    }
+    integrador.clients["openai"] = _ClienteFalso(["Hola", ", ", "te ", "ayudo"], demora=0.02)
+    return integrador
+
+
+async def _recolectar(iterador):
+    return [evento async for evento in iterador]
+
+
+class TestStreaming:
+    @pytest.mark.asyncio
+    async def test_tokens_then_done_with_usage(self, integrador):
+        eventos = await _recolectar(integrador.generate_stream(
+            "precio isodec", system_prompt="sistema",
+            history=[{"role": "assistant", "content": "hola"}],
+        ))
+
+        assert [e["content"] for e in eventos if e["type"] == "token"] == ["Hola", ", ", "te ", "ayudo"]
+        final = eventos[-1]
+        assert final["type"] == "done"
+        assert final["content"] == "Hola, te ayudo"
+        assert final["tokens_input"] == 12 and final["tokens_output"] == 4
+        assert 0 < final["time_to_first_token"] < final["response_time"]
+
+        peticion = integrador.clients["openai"].peticiones[0]
+        assert peticion["stream"] is True
+        assert [m["role"] for m in peticion["messages"]] == ["system", "assistant", "user"]
+
+        stats = integrador.usage_stats["openai_fake"]
+        assert stats.streamed_requests == 1
+        assert stats.avg_time_to_first_token == pytest.approx(final["time_to_first_token"])
+
+    @pytest.mark.asyncio
+    async def test_repeated_stream_is_served_from_cache(self, integrador):
+        await _recolectar(integrador.generate_stream("precio isodec"))
+        eventos = await _recolectar(integrador.generate_stream("precio isodec"))
+
+        assert len(integrador.clients["openai"].peticiones) == 1
+        assert eventos[0] == {"type": "token", "content": "Hola, te ayudo"}
+        assert eventos[-1]["cached"] is True
+
+    @pytest.mark.asyncio
+    async def test_provider_error_ends_with_error_event(self, integrador):
+        integrador.clients["openai"] = _ClienteFalso(["Hola", "mundo"], error_en=1)
+        eventos = await _recolectar(integrador.generate_stream("hola", use_cache=False))
+
+        assert eventos[0] == {"type": "token", "content": "Hola"}
+        assert eventos[-1]["type"] == "error"
+        assert "connection reset" in eventos[-1]["error"]
+
+    @pytest.mark.asyncio
+    async def test_cancelled_consumer_closes_provider_stream(self, integrador):
+        cliente = _ClienteFalso(["Hola", "mundo", "de", "nuevo"], demora=0.05)
+        integrador.clients["openai"] = cliente
+        recibidos = []
+
+        async def consumir():
+            async for evento in integrador.generate_stream("hola", use_cache=False):
+                recibidos.append(evento)
+
+        tarea = asyncio.create_task(consumir())
+        await asyncio.sleep(0.08)
+        # Cancelled while the worker thread is inside next()
+        tarea.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await tarea
+        for _ in range(50):
+            if cliente.cerrado:
+                break
+            await asyncio.sleep(0.01)
+
+        assert recibidos == [{"type": "token", "content": "Hola"}]
+        assert cliente.cerrado
+
+    @pytest.mark.asyncio
+    async def test_model_failure_after_tokens_does_not_fall_back(self, integrador):
+        from ia_conversacional_integrada import IAConversacionalIntegrada
+
+        ia = IAConversacionalIntegrada()
+        ia.use_shared_context = False
+        try:
+            integrador.clients["openai"] = _ClienteFalso(["El isodec", " cuesta"], error_en=1)
+            eventos = await _recolectar(ia.procesar_mensaje_usuario_stream(
+                "precio del isodec", "099", "s1", integrador
+            ))
+            assert [e["type"] for e in eventos] == ["token", "error", "done"]
+            assert "connection reset" in eventos[1]["error"]
+            assert eventos[-1]["mensaje"] == "El isodec"
+
+            # Nothing sent yet: the pattern-matching answer is streamed instead
+            integrador.clients["openai"] = _ClienteFalso(["El isodec"], error_en=0)
+            eventos = await _recolectar(ia.procesar_mensaje_usuario_stream(
+                "precio del isodec", "099", "s2", integrador
+            ))
+            assert [e["type"] for e in eventos] == ["token", "done"]
+            assert eventos[0]["content"] == eventos[1]["mensaje"] != ""
+        finally:
+            await ia.cerrar()
+
+    def test_sse_endpoint(self, app_integrada):
+        from fastapi.testclient import TestClient
+
+        app = app_integrada
+
+        class _IAFalsa:
+            async def procesar_mensaje_usuario_stream(self, mensaje, telefono, sesion, integrador):
+                yield {"type": "token", "content": "Ho"}
+                yield {"type": "token", "content": "la"}
+                yield {"type": "done", "mensaje": "Hola", "tipo": "general", "time_to_first_token": 0.1}
+
+        app.state.ia = _IAFalsa()
+        app.state.model_integrator = None
+        try:
+            respuesta = TestClient(app).post(
+                "/api/chat/stream", json={"message": "hola", "session_id": "s1"}
+            )
+        finally:
+            app.state.ia = None
+
+        assert respuesta.status_code == 200
+        assert respuesta.headers["content-type"].startswith("text/event-stream")
+        bloques = [b for b in respuesta.text.split("\n\n") if b]
+        assert bloques[0] == 'event: token\ndata: {"content": "Ho"}'
+        assert bloques[-1].startswith("event: done\n")
+        assert '"response": "Hola"' in bloques[-1]
+        assert '"time_to_first_token": 0.1' in bloques[-1]
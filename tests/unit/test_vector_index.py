@@ -0,0 +1,130 @@
+"""
+Unit tests for the local vector index and the KnowledgeManager "local" backend
+"""
+
+import mongomock
+import numpy as np
+import pytest
+
+from AI_AGENTS.EXECUTOR.knowledge_manager import KnowledgeManager
+from AI_AGENTS.EXECUTOR.vector_index import IndiceVectorial
+from utils.embedding_service import EmbeddingService
+
+
+def _exactos(vectores, consulta, k):
+    normalizados = vectores / np.linalg.norm(vectores, axis=1, keepdims=True)
+    scores = normalizados @ (consulta / np.linalg.norm(consulta))
+    return [str(i) for i in np.argsort(-scores)[:k]]
+
+
+@pytest.fixture
+def vectores():
+    return np.random.default_rng(7).normal(size=(500, 16)).astype(np.float32)
+
+
+@pytest.fixture
+def indice(vectores):
+    indice = IndiceVectorial(16)
+    for inicio in range(0, len(vectores), 100):
+        ids = [str(i) for i in range(inicio, inicio + 100)]
+        indice.agregar(ids, vectores[inicio:inicio + 100],
+                       [{"grupo": int(i) % 3} for i in ids])
+    return indice
+
+
+class _EmbedderFijo:
+    """Embedder returning a fixed vector per text"""
+
+    def __init__(self, vectores_por_texto):
+        self.vectores_por_texto = vectores_por_texto
+
+    def embed_batch(self, textos, modelo):
+        return [self.vectores_por_texto[texto] for texto in textos]
+
+
+class TestVectorIndex:
+    def test_top_k_matches_brute_force(self, indice, vectores):
+        consulta = vectores[42] + 0.1
+        resultado = indice.buscar(consulta, k=10)
+
+        assert [r[0] for r in resultado] == _exactos(vectores, consulta, 10)
+        assert [r[1] for r in resultado] == sorted((r[1] for r in resultado), reverse=True)
+
+    def test_delete_and_replace(self, indice, vectores):
+        assert indice.buscar(vectores[3], k=1)[0][0] == "3"
+        assert indice.eliminar("3")
+        assert not indice.eliminar("3")
+        assert indice.buscar(vectores[3], k=1)[0][0] != "3"
+
+        indice.agregar(["7"], vectores[3:4], [{"grupo": "nuevo"}])
+        assert len(indice) == 499
+        mejor = indice.buscar(vectores[3], k=1)[0]
+        assert mejor[0] == "7" and mejor[1] == pytest.approx(1.0) and mejor[2] == {"grupo": "nuevo"}
+
+    def test_filters(self, indice, vectores):
+        por_dict = indice.buscar(vectores[0], k=5, filtro={"grupo": 1})
+        por_funcion = indice.buscar(vectores[0], k=5, filtro=lambda meta: meta["grupo"] == 1)
+
+        assert len(por_dict) == 5 and all(meta["grupo"] == 1 for _, _, meta in por_dict)
+        assert por_dict == por_funcion
+        assert indice.buscar(vectores[0], k=5, filtro={"grupo": 9}) == []
+
+    def test_ivf_probes_nearest_lists(self, indice, vectores):
+        indice.entrenar_ivf(8)
+        assert indice.buscar(vectores[10], k=1, nprobe=1)[0][0] == "10"
+
+        todas = indice.buscar(vectores[10], k=10, nprobe=8)
+        assert [r[0] for r in todas] == _exactos(vectores, vectores[10], 10)
+
+        indice.agregar(["nuevo"], vectores[10:11] * 2)
+        assert {r[0] for r in indice.buscar(vectores[10], k=2, nprobe=1)} == {"10", "nuevo"}
+
+    def test_save_and_load_with_mmap(self, indice, vectores, tmp_path):
+        indice.entrenar_ivf(4)
+        indice.eliminar("0")
+        indice.guardar(tmp_path)
+
+        cargado = IndiceVectorial.cargar(tmp_path)
+        assert isinstance(cargado._base, np.memmap)
+        assert len(cargado) == 499 and "0" not in cargado
+        assert cargado.buscar(vectores[5], k=3, nprobe=2) == indice.buscar(vectores[5], k=3, nprobe=2)
+
+        cargado.agregar(["extra"], vectores[:1])
+        cargado.guardar(tmp_path)
+        assert len(IndiceVectorial.cargar(tmp_path)) == 500
+
+    def test_dimension_mismatch_raises(self, indice):
+        with pytest.raises(ValueError):
+            indice.agregar(["x"], np.zeros((1, 8)))
+
+    def test_knowledge_manager_local_backend(self, tmp_path, monkeypatch):
+        monkeypatch.delenv("KNOWLEDGE_VECTOR_BACKEND", raising=False)
+        base = np.eye(4, dtype=np.float32).tolist()
+        coleccion = mongomock.MongoClient().db["kb_interactions"]
+        coleccion.insert_many([
+            {"mensaje_cliente": "precio isodec", "respuesta_agente": "USD 40",
+             "intencion": "cotizacion", "embedding": base[0]},
+            {"mensaje_cliente": "hola", "respuesta_bot": "buenas",
+             "intencion": "saludo", "embedding": base[1]},
+            {"mensaje_cliente": "sin embedding", "intencion": "otro"},
+        ])
+
+        embeddings = EmbeddingService(_EmbedderFijo({
+            "cuanto sale isodec": [0.9, 0.1, 0, 0],
+        }), linger=0)
+        km = KnowledgeManager(project_root=tmp_path, vector_backend="local",
+                              vector_index_dir=tmp_path / "indice", embedding_service=embeddings)
+        km.mongodb_service = type("Servicio", (), {"get_database": lambda self: coleccion.database})()
+        monkeypatch.setattr(km, "cargar_base_conocimiento_productos", lambda: {})
+        monkeypatch.setattr(km, "cargar_documentacion_proyecto", lambda: [])
+
+        assert km.construir_indice_vectorial() == 2
+
+        conversaciones = km.buscar_informacion_relevante("cuanto sale isodec", max_results=1)["conversaciones"]
+        assert conversaciones[0]["mensaje_cliente"] == "precio isodec"
+        assert conversaciones[0]["respuesta_bot"] == "USD 40"
+
+        filtradas = km.buscar_informacion_relevante(
+            "cuanto sale isodec", max_results=2, filtros={"intencion": "saludo"}
+        )["conversaciones"]
+        assert [c["respuesta_bot"] for c in filtradas] == ["buenas"]
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batched, cached embedding service
+
+Embeddings are keyed by sha256(model, normalized text) and stored as
+float32 blobs in a SQLite file, so a text is only sent to the provider once
+across processes and restarts. Concurrent ``embed()`` calls are grouped into
+one provider request (up to ``batch_size`` texts, waiting at most ``linger``
+seconds for the batch to fill); ``embed_many()`` embeds a whole list in
+batches directly, for bulk jobs like the backfill script.
+"""
+
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+def normalize_text(text: str) -> str:
+    """Text as sent to the provider: NFC, newlines and runs of spaces collapsed"""
+    return unicodedata.normalize("NFC", " ".join(str(text).split()))
+
+
+def embedding_key(model: str, text: str) -> str:
+    """Content-hash key of a (model, text) pair"""
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return struct.pack(f"<{len(vector)}f", *vector)
+
+
+def _unpack(blob: bytes) -> List[float]:
+    return list(struct.unpack(f"<{len(blob) // 4}f", blob))
+
+
+class OpenAIEmbedder:
+    """Embeds a batch of texts with one OpenAI embeddings request"""
+
+    def __init__(self, client: Any):
+        self.client = client
+
+    def embed_batch(self, texts: List[str], model: str) -> List[List[float]]:
+        response = self.client.embeddings.create(input=texts, model=model)
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+class FakeEmbedder:
+    """
+    Deterministic local embedder for tests and offline runs
+
+    Each word is hashed to a fixed random direction and the text vector is
+    the normalized sum, so texts sharing words get similar vectors. Its
+    vectors are not comparable with a real model's, so it has its own model
+    id (``fake-hash-<dimension>``) to keep them apart in caches.
+    """
+
+    def __init__(self, dimension: int = 64):
+        self.dimension = dimension
+        self.model = f"fake-hash-{dimension}"
+        self.calls: List[List[str]] = []
+
+    def _word_vector(self, word: str) -> List[float]:
+        digest = b""
+        counter = 0
+        while len(digest) < self.dimension:
+            digest += hashlib.sha256(f"{word}:{counter}".encode("utf-8")).digest()
+            counter += 1
+        return [(byte - 127.5) / 127.5 for byte in digest[: self.dimension]]
+
+    def embed_batch(self, texts: List[str], model: str) -> List[List[float]]:
+        self.calls.append(list(texts))
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimension
+            for word in text.casefold().split():
+                for i, value in enumerate(self._word_vector(word)):
+                    vector[i] += value
+            norm = sum(v * v for v in vector) ** 0.5 or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+
+class EmbeddingCache:
+    """SQLite store of embeddings keyed by content hash"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(unique), 500):
+                chunk = unique[start : start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update((key, _unpack(blob)) for key, blob in rows)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Sequence[float]]):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, created_at) VALUES (?, ?, ?, ?)",
+                [(key, model, _pack(vector), now) for key, vector in items.items()],
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class EmbeddingService:
+    """
+    Shared embedding front-end: cache lookup, batching and provider calls
+
+    Args:
+        embedder: object with ``embed_batch(texts, model) -> vectors``
+        model: embedding model name (part of the cache key)
+        cache_path: SQLite file for the cache; None keeps no cache
+        batch_size: max texts per provider request
+        linger: seconds ``embed()`` waits for more texts to join a batch
+    """
+
+    def __init__(
+        self,
+        embedder: Any,
+        model: str = DEFAULT_EMBEDDING_MODEL,
+        cache_path: Optional[str] = None,
+        batch_size: int = 64,
+        linger: float = 0.01,
+    ):
+        self.embedder = embedder
+        self.model = model
+        self.batch_size = batch_size
+        self.linger = linger
+        self.cache: Optional[EmbeddingCache] = None
+        if cache_path:
+            try:
+                self.cache = EmbeddingCache(cache_path)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache disabled: {e}")
+
+        self.stats = {"hits": 0, "misses": 0, "api_calls": 0, "texts_embedded": 0}
+        self._stats_lock = threading.Lock()
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    def embed(self, text: str) -> List[float]:
+        """Embedding of one text; concurrent calls share provider requests"""
+        future: Future = Future()
+        self._queue.put((text, future))
+        self._ensure_worker()
+        return future.result()
+
+    def embed_many(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embeddings of a list of texts (cache first, then batched requests)"""
+        texts = [normalize_text(t) for t in texts]
+        keys = [embedding_key(self.model, t) for t in texts]
+        found = self.cache.get_many(keys) if self.cache is not None else {}
+
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                pending.setdefault(key, text)
+        with self._stats_lock:
+            self.stats["hits"] += sum(1 for k in keys if k in found)
+            self.stats["misses"] += len(pending)
+
+        pending_items = list(pending.items())
+        for start in range(0, len(pending_items), self.batch_size):
+            chunk = pending_items[start : start + self.batch_size]
+            vectors = self.embedder.embed_batch([text for _, text in chunk], self.model)
+            computed = {key: list(vector) for (key, _), vector in zip(chunk, vectors)}
+            with self._stats_lock:
+                self.stats["api_calls"] += 1
+                self.stats["texts_embedded"] += len(chunk)
+            if self.cache is not None:
+                try:
+                    self.cache.put_many(self.model, computed)
+                except sqlite3.Error as e:
+                    logger.warning(f"Error writing embedding cache: {e}")
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def close(self):
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    # ------------------------------------------------------------------
+    # Batching worker
+    # ------------------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            try:
+                vectors = self.embed_many([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Response Cache and Single-Flight for model completions
+
+Caches successful completions keyed by (model, normalized messages,
+temperature, max_tokens) with a TTL and size limits, optionally backed by a
+SQLite file so FAQ-style answers survive restarts. SingleFlight coalesces
+concurrent identical requests into a single provider call.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """
+    Normalize chat messages for cache keys
+
+    Whitespace is collapsed and text is NFC-normalized; user messages are
+    also case-folded so "Precio Isodec 100mm" and "precio isodec  100mm"
+    share an entry. System/assistant text keeps its case.
+    """
+    normalized = []
+    for message in messages:
+        role = message.get("role", "user")
+        content = unicodedata.normalize("NFC", " ".join(str(message.get("content") or "").split()))
+        if role == "user":
+            content = content.casefold()
+        normalized.append((role, content))
+    return normalized
+
+
+def make_cache_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    max_tokens: int,
+    extra: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Stable sha256 key for a completion request"""
+    payload = {
+        "model": model,
+        "messages": normalize_messages(messages),
+        "temperature": round(float(temperature), 4),
+        "max_tokens": int(max_tokens),
+        "extra": extra or {},
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of completion results
+
+    The memory tier is bounded by entries and by the JSON size of the stored
+    values. When ``disk_path`` is set, entries are also written to a SQLite
+    file bounded by ``max_disk_bytes`` (oldest accessed rows are dropped).
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        max_entries: int = 1000,
+        max_bytes: int = 32 * 1024 * 1024,
+        disk_path: Optional[str] = None,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "disk_hits": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+        self._db: Optional[sqlite3.Connection] = None
+        if disk_path:
+            try:
+                directory = os.path.dirname(disk_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                    "size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._db.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache disk tier disabled: {e}")
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached value, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, _, value = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return dict(value)
+                self._discard(key)
+
+            value = self._disk_get(key, now)
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+            self._store(key, value, now + self.ttl)
+            return dict(value)
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a JSON-serializable completion result"""
+        encoded = json.dumps(value, ensure_ascii=False, default=str)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, json.loads(encoded), expires_at, len(encoded))
+            self._disk_put(key, encoded, expires_at)
+
+    def clear(self):
+        """Drop every entry (memory and disk), e.g. after a catalog change"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.stats["invalidations"] += 1
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM responses")
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Error clearing response cache on disk: {e}")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # ------------------------------------------------------------------
+    # Internal helpers (called with the lock held)
+    # ------------------------------------------------------------------
+
+    def _store(self, key: str, value: Dict[str, Any], expires_at: float, size: Optional[int] = None):
+        if size is None:
+            size = len(json.dumps(value, ensure_ascii=False, default=str))
+        if size > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _disk_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading response cache from disk: {e}")
+            return None
+
+    def _disk_put(self, key: str, encoded: str, expires_at: float):
+        if self._db is None:
+            return
+        try:
+            size = len(encoded.encode("utf-8"))
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, size, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, expires_at, size, time.time()),
+            )
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_disk_bytes:
+                # Drop the least recently used rows until under the limit
+                excess = total - self.max_disk_bytes
+                rows = self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at"
+                ).fetchall()
+                doomed = []
+                for row_key, row_size in rows:
+                    if excess <= 0:
+                        break
+                    doomed.append((row_key,))
+                    excess -= row_size
+                self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error writing response cache to disk: {e}")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key
+
+    The first caller (the leader) runs the function; callers that arrive
+    while it is running wait for its result instead of repeating the call.
+    Exceptions are propagated to every waiter.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, "_Call"] = {}
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn once per key at a time; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None